@@ -3,6 +3,8 @@
 DEFAULT_PORT="80"
 DEFAULT_ADDRESS="0.0.0.0"
 DEFAULT_WORKERS=4
+DEFAULT_THREADS=8
+DEFAULT_SERVER="sync"
 
 get_address()
 {
@@ -52,3 +54,35 @@ set_workers()
 {
   snapctl set workers="$1"
 }
+
+get_threads()
+{
+  local threads
+  threads="$(snapctl get threads)"
+  if [ -z "$threads" ]; then
+    threads="$DEFAULT_THREADS"
+    set_threads $threads
+  fi
+    echo "$threads"
+}
+
+set_threads()
+{
+  snapctl set threads="$1"
+}
+
+get_server()
+{
+  local server
+  server="$(snapctl get server)"
+  if [ -z "$server" ]; then
+    server="$DEFAULT_SERVER"
+    set_server $server
+  fi
+    echo "$server"
+}
+
+set_server()
+{
+  snapctl set server="$1"
+}
@@ -4,5 +4,12 @@ source "$SNAP"/config-handler
 PORT=$(get_port)
 ADDRESS=$(get_address)
 WORKERS=$(get_workers)
+THREADS=$(get_threads)
+SERVER=$(get_server)
 
-"$SNAP"/usr/bin/gunicorn "radio_box.rest_api:create_app()" --workers "$WORKERS" --bind "$ADDRESS:$PORT"
\ No newline at end of file
+if [ "$SERVER" = "async" ]; then
+  # Single process, connections are served by asyncio and threads run the requests
+  exec "$SNAP"/bin/radio-box-web-async --threads "$THREADS" --bind "$ADDRESS:$PORT"
+fi
+
+exec "$SNAP"/usr/bin/gunicorn "radio_box.rest_api:create_app()" --workers "$WORKERS" --threads "$THREADS" --bind "$ADDRESS:$PORT"
\ No newline at end of file
@@ -0,0 +1,339 @@
+"""Catalog of stations imported in bulk, with an in-memory search index.
+
+Besides the stations in the config file, radio-box can offer stations imported from
+a dump of a public station directory (e.g. radio-browser.info JSON or CSV export).
+The importer (`radio-box-import`) normalizes the dump into a catalog file, whose
+path is set by the "catalog" config option. Service and web workers merge stations
+from the catalog with the configured ones, configured stations take precedence.
+
+StationIndex keeps stations ordered by name for pagination and indexes their name,
+tags, country and codec for search:
+
+* query words shorter than a trigram are matched as prefixes of indexed words,
+  using binary search in the sorted list of words
+* longer words are matched as substrings, candidates are found by intersecting
+  posting lists of the word's trigrams and then verified
+* "tag:", "country:" and "codec:" words must match the field exactly
+
+Stations whose name starts with the query are returned first, then all other
+matching stations, both in the order of their names.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+from bisect import bisect_left
+from pathlib import Path
+from typing import Container, Dict, Iterable, List, Optional, Set, Tuple
+
+from radio_box.config import load_config
+
+# Fields of the station that are searched
+SEARCH_FIELDS = ("name", "tags", "country", "codec")
+# Query prefixes that select stations with exact value of the field
+FILTER_FIELDS = {"tag": "tags", "country": "country", "codec": "codec"}
+# Words shorter than this are searched as prefixes, longer by their trigrams
+TRIGRAM = 3
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+WORD_SEPARATOR = re.compile(r"[\W_]+")
+
+
+def station_id(name: str, taken: Container[str]) -> str:
+    """Derive machine-friendly ID of the station from its name.
+
+    :param name: Human friendly name of the station.
+    :param taken: IDs already used by other stations.
+    """
+    base = WORD_SEPARATOR.sub("_", name.casefold()).strip("_") or "station"
+    candidate, suffix = base, 1
+    while candidate in taken:
+        suffix += 1
+        candidate = f"{base}_{suffix}"
+    return candidate
+
+
+def _tags(value: object) -> List[str]:
+    """Return list of tags, directory dumps store them as comma separated text."""
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, list):
+        return []
+    return [str(tag).strip() for tag in value if str(tag).strip()]
+
+
+def import_stations(entries: Iterable[dict]) -> Dict[str, dict]:
+    """Convert entries of a station directory dump to configuration of stations.
+
+    Entries without name or stream URL are skipped.
+
+    :param entries: Stations in the format of radio-browser.info.
+    """
+    stations: Dict[str, dict] = {}
+    for entry in entries:
+        name = str(entry.get("name") or "").strip()
+        url = entry.get("url_resolved") or entry.get("url")
+        if not name or not url:
+            continue
+        key = str(entry.get("stationuuid") or "") or station_id(name, stations)
+        stations[key] = {
+            "url": url,
+            "name": name,
+            "tags": _tags(entry.get("tags")),
+            "country": entry.get("countrycode") or entry.get("country") or "",
+            "codec": entry.get("codec") or "",
+        }
+    return stations
+
+
+def read_dump(path: Path) -> List[dict]:
+    """Read station directory dump in JSON (list of stations) or CSV format.
+
+    :param path: Path to the dump, format is selected by its suffix.
+    :raises ValueError: If the JSON dump is not a list of stations.
+    """
+    with open(path, "r", encoding="utf8", newline="") as dump:
+        if path.suffix.lower() == ".csv":
+            return list(csv.DictReader(dump))
+        entries = json.load(dump)
+    if not isinstance(entries, list):
+        raise ValueError(f"{path} does not contain list of stations.")
+    return [entry for entry in entries if isinstance(entry, dict)]
+
+
+def catalog_path(config: dict) -> Optional[Path]:
+    """Return path to the catalog file, None if catalog is not configured.
+
+    :param config: Content of the configuration file.
+    """
+    catalog = config.get("catalog")
+    return Path(catalog) if catalog else None
+
+
+def save_catalog(path: Path, stations: Dict[str, dict]) -> None:
+    """Atomically replace the catalog file.
+
+    :param path: Path to the catalog file.
+    :param stations: Imported stations.
+    """
+    descriptor, temp_path = tempfile.mkstemp(prefix=path.name, dir=path.parent)
+    try:
+        with os.fdopen(descriptor, "w", encoding="utf8") as catalog:
+            json.dump(stations, catalog, ensure_ascii=False)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def load_stations(config: dict) -> Dict[str, dict]:
+    """Return configured stations merged with stations from the catalog.
+
+    Catalog that can't be loaded is reported and skipped.
+
+    :param config: Content of the configuration file.
+    """
+    path = catalog_path(config)
+    if path is None:
+        return config["stations"]
+    try:
+        with open(path, "r", encoding="utf8") as catalog:
+            imported = json.load(catalog)
+        if not isinstance(imported, dict):
+            raise ValueError("catalog does not contain mapping of stations")
+    except (OSError, ValueError) as exc:
+        print(f"Failed to load station catalog {path}: {exc}")
+        return config["stations"]
+    return {**imported, **config["stations"]}
+
+
+def _words(text: str) -> List[str]:
+    """Split case-folded text into words."""
+    return [word for word in WORD_SEPARATOR.split(text.casefold()) if word]
+
+
+def _trigrams(text: str) -> Set[str]:
+    """Return all trigrams of the text."""
+    return {"".join(chars) for chars in zip(*(text[i:] for i in range(TRIGRAM)))}
+
+
+def _field_values(station: dict, field: str) -> List[str]:
+    """Return case-folded values of the station's field, tags have multiple values."""
+    value = station.get(field) or ""
+    values = value if isinstance(value, list) else [value]
+    return [str(item).casefold() for item in values]
+
+
+class StationIndex:  # pylint: disable=too-many-instance-attributes
+    """Immutable search index over the stations."""
+
+    def __init__(self, stations: Dict[str, dict]) -> None:
+        """Build index of the stations.
+
+        :param stations: Configuration of the stations, it must not be modified
+            while the index is in use.
+        """
+        self.stations = stations
+        # Stations are identified by their position in the order of names
+        self.ids = sorted(
+            stations,
+            key=lambda key: (str(stations[key].get("name", key)).casefold(), key),
+        )
+        self.names = [
+            str(stations[key].get("name", key)).casefold() for key in self.ids
+        ]
+        self.texts: List[str] = []
+        self.trigrams: Dict[str, Set[int]] = {}
+        self.filters: Dict[str, Dict[str, Set[int]]] = {
+            field: {} for field in FILTER_FIELDS.values()
+        }
+        words: Dict[str, Set[int]] = {}
+        for position, key in enumerate(self.ids):
+            station = stations[key]
+            text = " ".join(
+                " ".join(_field_values(station, field)) for field in SEARCH_FIELDS
+            )
+            self.texts.append(text)
+            for trigram in _trigrams(text):
+                self.trigrams.setdefault(trigram, set()).add(position)
+            for word in _words(text):
+                words.setdefault(word, set()).add(position)
+            for field, index in self.filters.items():
+                for value in _field_values(station, field):
+                    index.setdefault(value, set()).add(position)
+        self.words = sorted(words)
+        self.word_positions = [words[word] for word in self.words]
+
+    def __len__(self) -> int:
+        """Return number of indexed stations."""
+        return len(self.ids)
+
+    def page(self, offset: int = 0, limit: int = DEFAULT_PAGE_SIZE) -> List[str]:
+        """Return IDs of stations in the order of their names.
+
+        :param offset: Number of stations to skip.
+        :param limit: Maximum number of returned stations.
+        """
+        return self.ids[slice(offset, offset + limit)]
+
+    def _match(self, term: str) -> Set[int]:
+        """Return positions of the stations that match single term of the query.
+
+        :param term: Case-folded word, or "field:value" filter.
+        """
+        field, _, value = term.partition(":")
+        if value and field in FILTER_FIELDS:
+            return self.filters[FILTER_FIELDS[field]].get(value, set())
+        if len(term) < TRIGRAM:
+            matched: Set[int] = set()
+            for index in range(bisect_left(self.words, term), len(self.words)):
+                if not self.words[index].startswith(term):
+                    break
+                matched |= self.word_positions[index]
+            return matched
+        postings = sorted(
+            (self.trigrams.get(trigram, set()) for trigram in _trigrams(term)), key=len
+        )
+        candidates = postings[0].intersection(*postings[1:])
+        return {position for position in candidates if term in self.texts[position]}
+
+    def search(
+        self, query: str, offset: int = 0, limit: int = DEFAULT_PAGE_SIZE
+    ) -> Tuple[int, List[str]]:
+        """Find stations that match all words of the query.
+
+        :param query: Words to search for, "tag:", "country:" and "codec:" words
+            select exact value of the field.
+        :param offset: Number of matching stations to skip.
+        :param limit: Maximum number of returned stations.
+        :return: Total number of matching stations and IDs of the requested page.
+        """
+        terms: List[str] = []
+        text: List[str] = []
+        for word in query.casefold().split():
+            if word.partition(":")[0] in FILTER_FIELDS:
+                terms.append(word)
+            else:
+                text.append(word)
+                terms.extend(_words(word))
+        if not terms:
+            return 0, []
+        matched = self._match(terms[0])
+        for term in terms[1:]:
+            matched = matched & self._match(term)
+
+        # Stations whose name starts with the query are the most relevant
+        prefix = " ".join(text)
+        first = bisect_left(self.names, prefix) if prefix else 0
+        last = bisect_left(self.names, prefix + chr(0x10FFFF)) if prefix else 0
+        ordered = [position for position in range(first, last) if position in matched]
+        ordered.extend(
+            sorted(position for position in matched if not first <= position < last)
+        )
+        page = ordered[slice(offset, offset + limit)]
+        return len(ordered), [self.ids[position] for position in page]
+
+
+class IndexCache:  # pylint: disable=too-few-public-methods
+    """Index of the current stations, rebuilt when the stations are replaced."""
+
+    def __init__(self) -> None:
+        """Initialize cache, index is built on the first use."""
+        self._index: Optional[StationIndex] = None
+        self._lock = threading.Lock()
+
+    def get(self, stations: Dict[str, dict]) -> StationIndex:
+        """Return index of the stations.
+
+        :param stations: Current configuration of the stations.
+        """
+        index = self._index
+        if index is None or index.stations is not stations:
+            with self._lock:
+                index = self._index
+                if index is None or index.stations is not stations:
+                    index = self._index = StationIndex(stations)
+        return index
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse CLI arguments of the station importer."""
+    parser = argparse.ArgumentParser(
+        description="Import stations from station directory dumps to radio-box catalog."
+    )
+    parser.add_argument(
+        "-c", "--config", default="/etc/radio-box/conf.yaml", help="Config file path"
+    )
+    parser.add_argument(
+        "-o", "--output", help="Catalog file path, 'catalog' from the config by default"
+    )
+    parser.add_argument(
+        "dumps", nargs="+", type=Path, help="Station lists in JSON or CSV format"
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Import station lists into the catalog, replacing its previous content."""
+    args = parse_args()
+    output = Path(args.output) if args.output else None
+    if output is None:
+        output = catalog_path(load_config(Path(args.config)))
+    if output is None:
+        sys.exit("Catalog is not configured, set 'catalog' in the config file.")
+
+    entries: List[dict] = []
+    for dump in args.dumps:
+        try:
+            entries.extend(read_dump(dump))
+        except (OSError, ValueError) as exc:
+            sys.exit(f"Failed to read {dump}: {exc}")
+    stations = import_stations(entries)
+    save_catalog(output, stations)
+    print(f"Imported {len(stations)} stations to {output}.")
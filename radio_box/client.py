@@ -1,27 +1,107 @@
-"""CLI client for controlling radio-box service."""
+"""CLI client for controlling radio-box service.
+
+The client is executed for every single command, often from scripts, so its startup
+time matters. Only modules needed to send a command are imported at startup, the
+config is loaded from its compiled cache (see radio_box.config) and the client does
+not touch the pipe beyond writing the command into it.
+"""
 
 import argparse
+import sys
+import time
 from pathlib import Path
-
-import yaml
+from typing import Optional
 
 from radio_box.common import (
+    MAX_VOLUME,
+    TRANSPORT_PIPE,
+    CommandError,
+    SenderOptions,
+    ServiceUnavailableError,
     common_argument_parser,
-    create_pipe,
+    make_message_pause,
     make_message_play,
     make_message_quit,
+    make_message_record,
+    make_message_resume,
+    make_message_seek,
+    make_message_set_volume,
     make_message_stop,
-    send_message,
+    make_message_stop_recording,
+    send_command,
 )
+from radio_box.config import load_config
+from radio_box.tracing import format_trace, mark, query_traces, start_trace
 
 PLAY = "play"
 STOP = "stop"
 QUIT = "quit"
+TRACE = "trace"
+VOLUME = "volume"
+PAUSE = "pause"
+RESUME = "resume"
+SEEK = "seek"
+RECORD = "record"
+STOP_RECORDING = "stop-recording"
+
+
+def volume_level(value: str) -> int:
+    """Parse volume level argument.
+
+    :param value: Volume level from the command line.
+    :raises argparse.ArgumentTypeError: If the value is not a valid volume level.
+    """
+    try:
+        level = int(value)
+    except ValueError:
+        level = -1
+    if not 0 <= level <= MAX_VOLUME:
+        raise argparse.ArgumentTypeError(
+            f"volume must be a number between 0 and {MAX_VOLUME}"
+        )
+    return level
+
+
+def delay_seconds(value: str) -> int:
+    """Parse delay argument of the seek command.
+
+    :param value: Seconds behind the live stream from the command line.
+    :raises argparse.ArgumentTypeError: If the value is not a valid delay.
+    """
+    try:
+        delay = int(value)
+    except ValueError:
+        delay = -1
+    if delay < 0:
+        raise argparse.ArgumentTypeError("delay must be a non-negative number")
+    return delay
+
+
+def recording_minutes(value: str) -> float:
+    """Parse duration argument of the record command.
+
+    :param value: Minutes of the recording from the command line.
+    :raises argparse.ArgumentTypeError: If the value is not a valid duration.
+    """
+    try:
+        minutes = float(value)
+    except ValueError:
+        minutes = -1
+    if not 0 <= minutes < float("inf"):
+        raise argparse.ArgumentTypeError("minutes must be a non-negative number")
+    return minutes
 
 
 def parse_args() -> argparse.Namespace:
     """Parse CLI arguments of radio-box client."""
     parser = common_argument_parser("Radio-box CLI client.")
+    parser.add_argument(
+        "-z",
+        "--zone",
+        default="",
+        help="Zone controlled by playback and volume commands, default zone if "
+        "not specified",
+    )
     subparsers = parser.add_subparsers(title="commands", dest="subparser_command")
 
     play_parser = subparsers.add_parser(PLAY)
@@ -30,10 +110,62 @@ def parse_args() -> argparse.Namespace:
     subparsers.add_parser(STOP)
     subparsers.add_parser(QUIT)
 
+    volume_parser = subparsers.add_parser(VOLUME, help="Change playback volume")
+    volume_parser.add_argument(
+        "level", type=volume_level, help=f"Volume level between 0 and {MAX_VOLUME}"
+    )
+
+    subparsers.add_parser(PAUSE, help="Pause playback, requires time-shift")
+    subparsers.add_parser(RESUME, help="Resume paused playback")
+    seek_parser = subparsers.add_parser(
+        SEEK, help="Play the station with a delay behind the live stream"
+    )
+    seek_parser.add_argument(
+        "delay",
+        type=delay_seconds,
+        help="Seconds behind the live stream, 0 returns to the live stream",
+    )
+
+    record_parser = subparsers.add_parser(
+        RECORD, help="Record the station to disk, requires recorder"
+    )
+    record_parser.add_argument("station", help="Station name to record")
+    record_parser.add_argument(
+        "-m",
+        "--minutes",
+        type=recording_minutes,
+        default=0,
+        help="Stop the recording after this many minutes, records until stopped "
+        "if not specified",
+    )
+    stop_recording_parser = subparsers.add_parser(
+        STOP_RECORDING, help="Stop recording the station"
+    )
+    stop_recording_parser.add_argument("station", help="Station name to stop")
+
+    trace_parser = subparsers.add_parser(
+        TRACE, help="Show timing of recently executed commands"
+    )
+    trace_parser.add_argument(
+        "-n",
+        "--limit",
+        type=int,
+        default=20,
+        help="Number of the most recent commands to show, 0 for all",
+    )
+
     return parser.parse_args()
 
 
-def play(socket_path: Path, station: str) -> None:
+def play(  # pylint: disable=too-many-arguments
+    socket_path: Path,
+    station: str,
+    transport: str = TRANSPORT_PIPE,
+    options: Optional[SenderOptions] = None,
+    origin: Optional[float] = None,
+    *,
+    zone: str = "",
+) -> None:
     """Tell radio-box service to play selected station.
 
     Supplied station name should be key of one of the stations defined in the
@@ -44,42 +176,277 @@ def play(socket_path: Path, station: str) -> None:
 
     :param socket_path: Path to named pipe on which the radio-box service listens.
     :param station: Name of the station to play.
+    :param transport: Transport used to communicate with the service.
+    :param options: Timeouts and retries for the communication.
+    :param origin: Unix timestamp at which the CLI started, used for tracing.
+    :param zone: ID of the zone that plays the station, empty for the default zone.
     """
-    message = make_message_play(station)
-    send_message(socket_path, message)
+    message = make_message_play(station, zone)
+    start_trace(message, origin)
+    mark(message, "cli")
+    send_command(socket_path, message, transport, options)
 
 
-def stop(socket_path: Path) -> None:
+def stop(
+    socket_path: Path,
+    transport: str = TRANSPORT_PIPE,
+    options: Optional[SenderOptions] = None,
+    origin: Optional[float] = None,
+    zone: str = "",
+) -> None:
     """Tell radio-box service to stop current playback.
 
     :param socket_path: Path to named pipe on which the radio-box service listens.
+    :param transport: Transport used to communicate with the service.
+    :param options: Timeouts and retries for the communication.
+    :param origin: Unix timestamp at which the CLI started, used for tracing.
+    :param zone: ID of the zone to stop, empty for the default zone.
+    """
+    message = make_message_stop(zone)
+    start_trace(message, origin)
+    mark(message, "cli")
+    send_command(socket_path, message, transport, options)
+
+
+def volume(
+    socket_path: Path,
+    level: int,
+    transport: str = TRANSPORT_PIPE,
+    options: Optional[SenderOptions] = None,
+    zone: str = "",
+) -> None:
+    """Tell radio-box service to change playback volume.
+
+    :param socket_path: Path to named pipe on which the radio-box service listens.
+    :param level: Volume level between 0 and MAX_VOLUME.
+    :param transport: Transport used to communicate with the service.
+    :param options: Timeouts and retries for the communication.
+    :param zone: ID of the zone, empty for the default zone.
+    """
+    message = make_message_set_volume(level, zone)
+    send_command(socket_path, message, transport, options)
+
+
+def pause(
+    socket_path: Path,
+    transport: str = TRANSPORT_PIPE,
+    options: Optional[SenderOptions] = None,
+    zone: str = "",
+) -> None:
+    """Tell radio-box service to pause current playback.
+
+    :param socket_path: Path to named pipe on which the radio-box service listens.
+    :param transport: Transport used to communicate with the service.
+    :param options: Timeouts and retries for the communication.
+    :param zone: ID of the zone to pause, empty for the default zone.
+    """
+    send_command(socket_path, make_message_pause(zone), transport, options)
+
+
+def resume(
+    socket_path: Path,
+    transport: str = TRANSPORT_PIPE,
+    options: Optional[SenderOptions] = None,
+    zone: str = "",
+) -> None:
+    """Tell radio-box service to resume paused playback.
+
+    :param socket_path: Path to named pipe on which the radio-box service listens.
+    :param transport: Transport used to communicate with the service.
+    :param options: Timeouts and retries for the communication.
+    :param zone: ID of the zone to resume, empty for the default zone.
+    """
+    send_command(socket_path, make_message_resume(zone), transport, options)
+
+
+def seek(
+    socket_path: Path,
+    delay: int,
+    transport: str = TRANSPORT_PIPE,
+    options: Optional[SenderOptions] = None,
+    zone: str = "",
+) -> None:
+    """Tell radio-box service to play the station with a delay behind the live stream.
+
+    :param socket_path: Path to named pipe on which the radio-box service listens.
+    :param delay: Seconds behind the live stream, 0 returns to the live stream.
+    :param transport: Transport used to communicate with the service.
+    :param options: Timeouts and retries for the communication.
+    :param zone: ID of the zone, empty for the default zone.
+    """
+    send_command(socket_path, make_message_seek(delay, zone), transport, options)
+
+
+def timeshift(
+    socket_path: Path, args: argparse.Namespace, transport: str, options: SenderOptions
+) -> None:
+    """Send time-shift command parsed from the command line.
+
+    :param socket_path: Path to named pipe on which the radio-box service listens.
+    :param args: Parsed CLI arguments.
+    :param transport: Transport used to communicate with the service.
+    :param options: Timeouts and retries for the communication.
+    """
+    if args.subparser_command == SEEK:
+        seek(
+            socket_path,
+            delay=args.delay,
+            transport=transport,
+            options=options,
+            zone=args.zone,
+        )
+    else:
+        control = pause if args.subparser_command == PAUSE else resume
+        control(socket_path, transport=transport, options=options, zone=args.zone)
+
+
+def record(
+    socket_path: Path,
+    station: str,
+    duration: int = 0,
+    transport: str = TRANSPORT_PIPE,
+    options: Optional[SenderOptions] = None,
+) -> None:
+    """Tell radio-box service to record the station to disk.
+
+    :param socket_path: Path to named pipe on which the radio-box service listens.
+    :param station: Name of the station to record.
+    :param duration: Seconds after which the recording stops, 0 for no limit.
+    :param transport: Transport used to communicate with the service.
+    :param options: Timeouts and retries for the communication.
     """
-    message = make_message_stop()
-    send_message(socket_path, message)
+    send_command(
+        socket_path, make_message_record(station, duration), transport, options
+    )
 
 
-def quit_(socket_path: Path) -> None:
+def stop_recording(
+    socket_path: Path,
+    station: str,
+    transport: str = TRANSPORT_PIPE,
+    options: Optional[SenderOptions] = None,
+) -> None:
+    """Tell radio-box service to stop recording the station.
+
+    :param socket_path: Path to named pipe on which the radio-box service listens.
+    :param station: Name of the recorded station.
+    :param transport: Transport used to communicate with the service.
+    :param options: Timeouts and retries for the communication.
+    """
+    send_command(socket_path, make_message_stop_recording(station), transport, options)
+
+
+def recording(
+    socket_path: Path, args: argparse.Namespace, transport: str, options: SenderOptions
+) -> None:
+    """Send recorder command parsed from the command line.
+
+    :param socket_path: Path to named pipe on which the radio-box service listens.
+    :param args: Parsed CLI arguments.
+    :param transport: Transport used to communicate with the service.
+    :param options: Timeouts and retries for the communication.
+    """
+    if args.subparser_command == RECORD:
+        record(
+            socket_path,
+            station=args.station,
+            duration=round(args.minutes * 60),
+            transport=transport,
+            options=options,
+        )
+    else:
+        stop_recording(
+            socket_path, station=args.station, transport=transport, options=options
+        )
+
+
+def quit_(
+    socket_path: Path,
+    transport: str = TRANSPORT_PIPE,
+    options: Optional[SenderOptions] = None,
+) -> None:
     """Tell radio-box service to quit completely, killing the service process.
 
     :param socket_path: Path to named pipe on which the radio-box service listens.
+    :param transport: Transport used to communicate with the service.
+    :param options: Timeouts and retries for the communication.
     """
     message = make_message_quit()
-    send_message(socket_path, message)
+    send_command(socket_path, message, transport, options)
+
+
+def trace(
+    socket_path: Path,
+    limit: int,
+    transport: str = TRANSPORT_PIPE,
+    options: Optional[SenderOptions] = None,
+) -> None:
+    """Print timing of commands recently executed by the radio-box service.
+
+    :param socket_path: Path to unix domain socket on which the service listens.
+    :param limit: Number of the most recent commands to show, 0 for all.
+    :param transport: Transport used to communicate with the service.
+    :param options: Timeouts and retries for the communication.
+    """
+    for completed_trace in query_traces(socket_path, transport, limit, options):
+        print(format_trace(completed_trace))
+
+
+# Commands whose arguments are passed from the command line by a helper
+COMMAND_HELPERS = {
+    PAUSE: timeshift,
+    RESUME: timeshift,
+    SEEK: timeshift,
+    RECORD: recording,
+    STOP_RECORDING: recording,
+}
 
 
 def main() -> None:
     """Process cli command."""
+    origin = time.time()
     args = parse_args()
-    with open(args.config, "r", encoding="utf8") as conf:
-        config: dict = yaml.safe_load(conf)
+    config = load_config(Path(args.config))
 
     socket_ = args.socket or config["socket"]
-    create_pipe(socket_)
+    transport = config.get("transport", TRANSPORT_PIPE)
+    options = SenderOptions(**config.get("connection", {}))
+    # Pipe is created by the service, if it does not exist, nobody would read it
 
     command = args.subparser_command
-    if command == STOP:
-        stop(socket_)
-    elif command == PLAY:
-        play(socket_, station=args.station)
-    elif command == QUIT:
-        quit_(socket_)
+    try:
+        if command == STOP:
+            stop(
+                socket_,
+                transport=transport,
+                options=options,
+                origin=origin,
+                zone=args.zone,
+            )
+        elif command == PLAY:
+            play(
+                socket_,
+                station=args.station,
+                transport=transport,
+                options=options,
+                origin=origin,
+                zone=args.zone,
+            )
+        elif command == VOLUME:
+            volume(
+                socket_,
+                level=args.level,
+                transport=transport,
+                options=options,
+                zone=args.zone,
+            )
+        elif command in COMMAND_HELPERS:
+            COMMAND_HELPERS[command](socket_, args, transport, options)
+        elif command == QUIT:
+            quit_(socket_, transport=transport, options=options)
+        elif command == TRACE:
+            trace(socket_, args.limit, transport=transport, options=options)
+    except CommandError as exc:
+        sys.exit(f"Command failed: {exc}")
+    except ServiceUnavailableError as exc:
+        sys.exit(str(exc))
@@ -2,11 +2,87 @@
 import argparse
 import errno
 import os
+import select
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Union
+from typing import (
+    Dict,
+    Generic,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
+
+from google.protobuf.message import DecodeError, Message
 
 from radio_box.protocol import controls_pb2 as controls
 
+# Every message on the wire is prefixed with its length as 4-byte unsigned big-endian
+# integer.
+FRAME_HEADER = struct.Struct("!I")
+# Upper bound for a single message. It keeps the decoder buffers bounded and lets it
+# detect garbage in the stream instead of waiting for gigabytes of "payload".
+MAX_MESSAGE_SIZE = 64 * 1024
+# Maximum amount of data consumed from the pipe/socket by a single read
+READ_SIZE = 4096
+
+# Supported means of communication with radio-box service. Named pipe is one-way only,
+# unix domain socket provides reply for every command.
+TRANSPORT_PIPE = "pipe"
+TRANSPORT_SOCKET = "socket"
+TRANSPORTS = (TRANSPORT_PIPE, TRANSPORT_SOCKET)
+
+# Highest volume level accepted by the SET_VOLUME command (100 is unamplified output)
+MAX_VOLUME = 100
+
+# Zone of the service that has no "zones" in the config
+DEFAULT_ZONE = "default"
+
+# Number of connections to the service that are kept open by a single process
+SENDER_CACHE_SIZE = 4
+# Delay before retrying failed send, multiplied by the number of the attempt
+RETRY_BACKOFF = 0.05
+
+MessageT = TypeVar("MessageT", bound=Message)
+
+
+class FramingError(Exception):
+    """Raised when byte stream can not be split into valid message frames."""
+
+
+class CommandError(Exception):
+    """Raised when radio-box service reports failure to execute a command."""
+
+
+class ServiceUnavailableError(Exception):
+    """Raised when radio-box service can't be reached within configured limits."""
+
+
+class SenderOptions(NamedTuple):
+    """Limits for communication with radio-box service.
+
+    Values can be overridden in the "connection" section of the config file.
+    """
+
+    # Seconds to wait for the connection to the socket
+    connect_timeout: float = 0.5
+    # Seconds to wait for the pipe/socket to accept written data
+    write_timeout: float = 0.5
+    # Seconds to wait for reply from the socket
+    reply_timeout: float = 5.0
+    # Number of retries after failed attempt to connect or write
+    retries: int = 2
+
 
 def common_argument_parser(parser_description: str) -> argparse.ArgumentParser:
     """Return parser with preconfigured common CLI arguments.
@@ -29,6 +105,18 @@ def common_argument_parser(parser_description: str) -> argparse.ArgumentParser:
     return parser
 
 
+def zone_configs(config: dict) -> Dict[str, dict]:
+    """Return configuration of the zones, the first one is the default zone.
+
+    Service without "zones" in the config has a single zone that plays over the
+    default audio output.
+
+    :param config: Content of the configuration file.
+    """
+    zones = config.get("zones") or {DEFAULT_ZONE: {}}
+    return {str(name): zone or {} for name, zone in zones.items()}
+
+
 def create_pipe(pipe_path: Union[str, Path]) -> Path:
     """Create named pipe if it does not already exist.
 
@@ -45,7 +133,7 @@ def create_pipe(pipe_path: Union[str, Path]) -> Path:
     return pipe_path.absolute()
 
 
-def make_message_play(station: str) -> controls.Command:
+def make_message_play(station: str, zone: str = "") -> controls.Command:
     """Generate "Play" command for radio-box service.
 
     This returns a protobuf message that needs to be serialized and written to the
@@ -53,22 +141,121 @@ def make_message_play(station: str) -> controls.Command:
 
     :param station: ID of a radio station thatn should start playing.
         This ID must be key of a station defined in the config file.
+    :param zone: ID of the zone that should play the station, default if empty.
     """
     command = controls.Command()
     command.play.type = controls.PLAY
     command.play.station = station
+    if zone:
+        command.play.zone = zone
 
     return command
 
 
-def make_message_stop() -> controls.Command:
+def make_message_stop(zone: str = "") -> controls.Command:
     """Generate "Stop" command for radio-box service.
 
     This returns a protobuf message that needs to be serialized and written to the
     named pipe on which the radio-box service listens.
+
+    :param zone: ID of the zone that should stop playing, default if empty.
     """
     command = controls.Command()
     command.stop.type = controls.STOP
+    if zone:
+        command.stop.zone = zone
+
+    return command
+
+
+def make_message_set_volume(volume_level: int, zone: str = "") -> controls.Command:
+    """Generate "SetVolume" command for radio-box service.
+
+    This returns a protobuf message that needs to be serialized and written to the
+    named pipe on which the radio-box service listens.
+
+    :param volume_level: Requested volume, between 0 and MAX_VOLUME.
+    :param zone: ID of the zone whose volume should change, default if empty.
+    """
+    command = controls.Command()
+    command.set_volume.type = controls.SET_VOLUME
+    command.set_volume.volume_level = volume_level
+    if zone:
+        command.set_volume.zone = zone
+
+    return command
+
+
+def make_message_pause(zone: str = "") -> controls.Command:
+    """Generate "Pause" command for radio-box service.
+
+    Paused station keeps buffering, so this command requires time-shift to be
+    enabled in the service.
+
+    :param zone: ID of the zone that should pause, default if empty.
+    """
+    command = controls.Command()
+    command.pause.type = controls.PAUSE
+    if zone:
+        command.pause.zone = zone
+
+    return command
+
+
+def make_message_resume(zone: str = "") -> controls.Command:
+    """Generate "Resume" command for radio-box service.
+
+    :param zone: ID of the zone that should resume paused playback, default if empty.
+    """
+    command = controls.Command()
+    command.resume.type = controls.RESUME
+    if zone:
+        command.resume.zone = zone
+
+    return command
+
+
+def make_message_seek(delay: int, zone: str = "") -> controls.Command:
+    """Generate "Seek" command for radio-box service.
+
+    :param delay: Seconds behind the live stream at which the playback continues,
+        0 returns to the live stream.
+    :param zone: ID of the zone whose playback should seek, default if empty.
+    """
+    command = controls.Command()
+    command.seek.type = controls.SEEK
+    command.seek.delay = delay
+    if zone:
+        command.seek.zone = zone
+
+    return command
+
+
+def make_message_record(station_id: str, duration: int = 0) -> controls.Command:
+    """Generate "Record" command for radio-box service.
+
+    This command requires recorder to be enabled in the service.
+
+    :param station_id: ID of the station that should be recorded.
+    :param duration: Seconds after which the recording stops, 0 for no limit.
+    """
+    command = controls.Command()
+    command.record.type = controls.RECORD
+    command.record.station = station_id
+    if duration:
+        command.record.duration = duration
+
+    return command
+
+
+def make_message_stop_recording(station_id: str) -> controls.Command:
+    """Generate "Stop recording" command for radio-box service.
+
+    :param station_id: ID of the station whose recording should stop.
+    """
+    command = controls.Command()
+    command.stop_recording.type = controls.STOP_RECORDING
+    command.stop_recording.station = station_id
 
     return command
 
@@ -85,11 +272,411 @@ def make_message_quit() -> controls.Command:
     return command
 
 
-def send_message(socket_path: Path, message: controls.Command) -> None:
+def make_message_get_traces(limit: int = 0) -> controls.Command:
+    """Generate command that requests completed traces of recent commands.
+
+    Traces are returned in the reply, so this command requires "socket" transport.
+
+    :param limit: Maximum number of returned traces, all if 0.
+    """
+    command = controls.Command()
+    command.get_traces.type = controls.GET_TRACES
+    command.get_traces.limit = limit
+
+    return command
+
+
+def make_message_subscribe(zone: str = "") -> controls.Command:
+    """Generate command that subscribes the connection to changes of player state.
+
+    Service replies with the current state and then with every its change, so this
+    command requires "socket" transport.
+
+    :param zone: ID of the zone whose player state is sent, default if empty.
+    """
+    command = controls.Command()
+    command.subscribe.type = controls.SUBSCRIBE
+    if zone:
+        command.subscribe.zone = zone
+
+    return command
+
+
+def encode_message(message: Message) -> bytes:
+    """Serialize protobuf message and prefix it with its length.
+
+    :param message: Protobuf message.
+    :raises FramingError: If serialized message exceeds MAX_MESSAGE_SIZE.
+    """
+    payload = message.SerializeToString()
+    if len(payload) > MAX_MESSAGE_SIZE:
+        raise FramingError(
+            f"Message size {len(payload)}B exceeds limit of {MAX_MESSAGE_SIZE}B."
+        )
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+class MessageDecoder(Generic[MessageT]):
+    """Incremental decoder of a stream of length-prefixed protobuf messages.
+
+    Data can be fed to the decoder in arbitrary chunks, as they are read from the
+    pipe/socket. Incomplete frames are kept in the internal buffer until the rest of
+    the data arrives. The buffer never grows past a single frame plus the last chunk.
+    """
+
+    def __init__(
+        self, message_class: Type[MessageT], max_size: int = MAX_MESSAGE_SIZE
+    ) -> None:
+        """Initialize decoder.
+
+        :param message_class: Protobuf message class that's expected in the stream.
+        :param max_size: Maximum accepted size of a single message.
+        """
+        self.message_class = message_class
+        self.max_size = max_size
+        self._buffer = bytearray()
+
+    def reset(self) -> None:
+        """Drop any partially received data."""
+        self._buffer.clear()
+
+    def feed(self, data: bytes) -> List[MessageT]:
+        """Process chunk of data and return every message completed by it.
+
+        Frames that are correctly delimited but contain payload that can't be parsed
+        are skipped, rest of the stream is still decoded.
+
+        :param data: Chunk of raw data read from the stream.
+        :raises FramingError: If frame header announces message bigger than allowed
+            maximum. Stream can't be reliably decoded after that and the decoder
+            should be reset.
+        """
+        self._buffer.extend(data)
+        messages: List[MessageT] = []
+        offset = 0
+        buffer_size = len(self._buffer)
+        with memoryview(self._buffer) as view:
+            while buffer_size - offset >= FRAME_HEADER.size:
+                (size,) = FRAME_HEADER.unpack_from(view, offset)
+                if size > self.max_size:
+                    raise FramingError(
+                        f"Message size {size}B exceeds limit of {self.max_size}B."
+                    )
+                frame_start = offset + FRAME_HEADER.size
+                frame_end = frame_start + size
+                if frame_end > buffer_size:
+                    break
+                message = self.message_class()
+                try:
+                    message.ParseFromString(bytes(view[frame_start:frame_end]))
+                    messages.append(message)
+                except DecodeError as exc:
+                    print(f"Failed to parse message: {exc}")
+                offset = frame_end
+        del self._buffer[:offset]
+
+        return messages
+
+
+def pack_frames(messages: Iterable[controls.Command]) -> List[bytes]:
+    """Encode messages and pack them into as few chunks of data as possible.
+
+    Writes to a pipe are atomic only up to PIPE_BUF bytes, so chunks are split on frame
+    boundaries to prevent data from concurrent writers from being interleaved
+    mid-frame.
+
+    :param messages: Protobuf messages.
+    """
+    chunks: List[bytes] = []
+    chunk_size = 0
+    writes: List[bytes] = []
+    for message in messages:
+        frame = encode_message(message)
+        if chunks and chunk_size + len(frame) > select.PIPE_BUF:
+            writes.append(b"".join(chunks))
+            chunks, chunk_size = [], 0
+        chunks.append(frame)
+        chunk_size += len(frame)
+    if chunks:
+        writes.append(b"".join(chunks))
+
+    return writes
+
+
+class Sender:  # pylint: disable=too-many-instance-attributes
+    """Persistent connection to the radio-box service with bounded blocking time.
+
+    Connection is opened on first use and kept open for subsequent messages. Both the
+    pipe and the socket are used in non-blocking mode, so every operation waits at
+    most for the time configured in SenderOptions. Failed attempts are retried on a
+    fresh connection and if all of them fail, ServiceUnavailableError is raised.
+
+    Single instance can be shared by multiple threads.
+    """
+
+    def __init__(
+        self,
+        socket_path: Union[str, Path],
+        transport: str = TRANSPORT_PIPE,
+        options: Optional[SenderOptions] = None,
+    ) -> None:
+        """Initialize sender.
+
+        :param socket_path: Path to the named pipe or unix domain socket.
+        :param transport: Either "pipe" or "socket".
+        :param options: Timeouts and retries, defaults are used if not supplied.
+        """
+        self.socket_path = str(socket_path)
+        self.transport = transport
+        self.options = options or SenderOptions()
+        # Connections can't be shared with forked processes
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._pipe: Optional[int] = None
+        self._socket: Optional[socket.socket] = None
+        self._decoder = MessageDecoder(controls.Reply)
+
+    def close(self) -> None:
+        """Close connection to the service, if it's open."""
+        if self._pipe is not None:
+            os.close(self._pipe)
+            self._pipe = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def send(self, messages: Sequence[controls.Command]) -> List[controls.Reply]:
+        """Send batch of messages to the service.
+
+        Replies are returned only by the "socket" transport, one for each message.
+        Pipe transport always returns empty list.
+
+        Data that were already written are never sent again, so that commands are
+        not executed twice. Retry of the pipe continues with the rest of the data,
+        socket is not retried once it received any data, replies for them would be
+        lost with the connection.
+
+        :param messages: Protobuf messages.
+        :raises ServiceUnavailableError: If messages can't be delivered.
+        """
+        pending = pack_frames(messages)
+        chunk_count = len(pending)
+        error: Optional[OSError] = None
+        with self._lock:
+            for attempt in range(self.options.retries + 1):
+                if attempt:
+                    time.sleep(RETRY_BACKOFF * attempt)
+                try:
+                    if self.transport == TRANSPORT_SOCKET:
+                        sock = self._write_socket(pending)
+                        return self._read_replies(sock, len(messages))
+                    self._write_pipe(pending)
+                    return []
+                except OSError as exc:
+                    self.close()
+                    error = exc
+                if self.transport == TRANSPORT_SOCKET and len(pending) < chunk_count:
+                    break
+
+        raise ServiceUnavailableError(
+            f"Failed to send command to radio-box service: {error}"
+        )
+
+    def _write_pipe(self, pending: List[bytes]) -> None:
+        """Write chunks of data to the pipe, opening it if necessary.
+
+        Written data are removed from the list, it holds only the unwritten rest
+        when the write fails.
+
+        :param pending: Chunks of data to write.
+        :raises OSError: If pipe has no reader or it does not accept data in time.
+        """
+        if self._pipe is None:
+            # Fails immediately with ENXIO if the service does not have pipe open
+            self._pipe = os.open(self.socket_path, os.O_WRONLY | os.O_NONBLOCK)
+
+        deadline = time.monotonic() + self.options.write_timeout
+        while pending:
+            view = memoryview(pending[0])
+            try:
+                while view:
+                    try:
+                        written = os.write(self._pipe, view)
+                        view = view[written:]
+                        continue
+                    except BlockingIOError:
+                        pass
+                    remaining = deadline - time.monotonic()
+                    _, writable, _ = select.select(
+                        [], [self._pipe], [], max(remaining, 0)
+                    )
+                    if not writable:
+                        raise TimeoutError("Timed out writing to the pipe.")
+            except OSError:
+                # Only frames larger than PIPE_BUF can be written partially
+                pending[0] = view.tobytes()
+                raise
+            pending.pop(0)
+
+    def _write_socket(self, pending: List[bytes]) -> socket.socket:
+        """Write chunks of data to the socket, connecting to it if necessary.
+
+        Written chunks are removed from the list.
+
+        :param pending: Chunks of data to write.
+        :raises OSError: If connection fails or data are not accepted in time.
+        """
+        if self._socket is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.settimeout(self.options.connect_timeout)
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            self._socket = sock
+            self._decoder.reset()
+
+        self._socket.settimeout(self.options.write_timeout)
+        while pending:
+            self._socket.sendall(pending[0])
+            pending.pop(0)
+
+        return self._socket
+
+    def _read_replies(self, sock: socket.socket, count: int) -> List[controls.Reply]:
+        """Read replies for commands that were written to the socket.
+
+        Commands were already delivered, so failures at this point are not retried,
+        that could lead to the command being executed multiple times.
+
+        :param sock: Connected socket.
+        :param count: Number of expected replies.
+        :raises ServiceUnavailableError: If the replies are not received in time.
+        """
+        replies: List[controls.Reply] = []
+        try:
+            sock.settimeout(self.options.reply_timeout)
+            while len(replies) < count:
+                data = sock.recv(READ_SIZE)
+                if not data:
+                    raise ConnectionResetError("Connection closed by the service.")
+                replies.extend(self._decoder.feed(data))
+        except OSError as exc:
+            self.close()
+            raise ServiceUnavailableError(
+                f"Failed to receive reply from radio-box service: {exc}"
+            ) from exc
+
+        return replies
+
+
+_SENDERS: "OrderedDict[Tuple[str, str], Sender]" = OrderedDict()
+_SENDERS_LOCK = threading.Lock()
+
+
+def get_sender(
+    socket_path: Union[str, Path],
+    transport: str = TRANSPORT_PIPE,
+    options: Optional[SenderOptions] = None,
+) -> Sender:
+    """Return cached sender for the given path and transport.
+
+    Process keeps connections to the SENDER_CACHE_SIZE most recently used paths open.
+
+    :param socket_path: Path to the named pipe or unix domain socket.
+    :param transport: Either "pipe" or "socket".
+    :param options: Timeouts and retries. If supplied, they replace options of the
+        cached sender.
+    """
+    key = (str(socket_path), transport)
+    with _SENDERS_LOCK:
+        sender = _SENDERS.pop(key, None)
+        if sender is None or sender.pid != os.getpid():
+            sender = Sender(socket_path, transport, options)
+        elif options is not None:
+            sender.options = options
+        _SENDERS[key] = sender
+        while len(_SENDERS) > SENDER_CACHE_SIZE:
+            _, evicted = _SENDERS.popitem(last=False)
+            evicted.close()
+
+    return sender
+
+
+def send_messages(
+    socket_path: Path,
+    messages: Iterable[controls.Command],
+    options: Optional[SenderOptions] = None,
+) -> None:
+    """Write multiple protobuf messages to the named pipe at once.
+
+    Messages are framed and concatenated so that they can be written with as few
+    syscalls as possible.
+
+    :param socket_path: Path to the named pipe.
+    :param messages: Protobuf messages.
+    :param options: Timeouts and retries for the communication.
+    :raises ServiceUnavailableError: If messages can't be delivered.
+    """
+    get_sender(socket_path, TRANSPORT_PIPE, options).send(list(messages))
+
+
+def send_message(
+    socket_path: Path,
+    message: controls.Command,
+    options: Optional[SenderOptions] = None,
+) -> None:
     """Write protobuf message to the named pipe.
 
     :param socket_path: Path to the named pipe.
     :param message: Protobuf message.
+    :param options: Timeouts and retries for the communication.
+    :raises ServiceUnavailableError: If message can't be delivered.
+    """
+    send_messages(socket_path, [message], options)
+
+
+def send_request(
+    socket_path: Path,
+    message: controls.Command,
+    options: Optional[SenderOptions] = None,
+) -> controls.Reply:
+    """Send protobuf message over unix domain socket and wait for the reply.
+
+    :param socket_path: Path to the unix domain socket.
+    :param message: Protobuf message.
+    :param options: Timeouts and retries for the communication.
+    :raises ServiceUnavailableError: If message can't be delivered or the reply does
+        not arrive in time.
+    """
+    return get_sender(socket_path, TRANSPORT_SOCKET, options).send([message])[0]
+
+
+def send_command(
+    socket_path: Path,
+    message: controls.Command,
+    transport: str = TRANSPORT_PIPE,
+    options: Optional[SenderOptions] = None,
+) -> Optional[controls.Reply]:
+    """Send command to the radio-box service using selected transport.
+
+    Named pipe does not provide any feedback, so with the "pipe" transport, this
+    function always returns None.
+
+    :param socket_path: Path to the named pipe or unix domain socket.
+    :param message: Protobuf message.
+    :param transport: Either "pipe" or "socket".
+    :param options: Timeouts and retries for the communication.
+    :raises CommandError: If service replies that the command failed.
+    :raises ServiceUnavailableError: If service can't be reached.
     """
-    with open(socket_path, "wb") as pipe:
-        pipe.write(message.SerializeToString())
+    if transport != TRANSPORT_SOCKET:
+        send_message(socket_path, message, options)
+        return None
+
+    reply = send_request(socket_path, message, options)
+    if reply.status == controls.ERROR:
+        raise CommandError(reply.error)
+
+    return reply
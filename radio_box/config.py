@@ -0,0 +1,146 @@
+"""Loading of the configuration file through a compiled binary cache.
+
+Parsing of YAML is slow in pure Python, which is noticeable with configs that
+contain thousands of stations, because every CLI command, service start and web
+worker has to load the whole file. The parsed config is therefore stored next to
+the config file in the binary "marshal" format, which loads in a fraction of the
+time.
+
+The cache is keyed by size and modification time of the config file. If they
+don't match, the config file is read and its SHA-256 digest is compared with the
+one stored in the cache, so that the file is parsed again only if its content
+actually changed. Outdated cache is rebuilt automatically by whichever process
+loads the config first, replacing the cache file atomically. Failure to write the
+cache (e.g. CLI executed by a user without write access) is not an error.
+
+Layout (little endian):
+
+* header - magic b"RBCC", layout version (uint32), marshal version (uint32), size
+  (uint64) and modification time in nanoseconds (uint64) of the config file,
+  SHA-256 digest of the config file (32 bytes)
+* payload - parsed config serialized by "marshal"
+
+Modules needed only to rebuild the cache are imported lazily, loading of up to date
+cache must stay fast enough for every CLI command.
+"""
+import marshal
+import os
+import struct
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
+
+MAGIC = b"RBCC"
+# Incremented with every incompatible change of the layout
+LAYOUT_VERSION = 1
+HEADER = struct.Struct("<4sIIQQ32s")
+PAYLOAD_OFFSET = HEADER.size
+# Suffix of the cache file, which is placed next to the config file
+CACHE_SUFFIX = ".cache"
+# Directory of the data kept by the service on disk, e.g. the time-shift buffers
+DEFAULT_DATA_DIR = "/var/lib/radio-box"
+
+
+class CacheKey(NamedTuple):
+    """Identifies content of the config file that was compiled into the cache."""
+
+    size: int
+    mtime_ns: int
+    digest: bytes
+
+
+def data_dir() -> str:
+    """Return directory of the data kept by the service on disk.
+
+    Strictly confined snap can write only into its own directories, so the common
+    data directory of the snap ($SNAP_COMMON) is used when it's set.
+    """
+    return os.environ.get("SNAP_COMMON") or DEFAULT_DATA_DIR
+
+
+def cache_path(path: Path) -> Path:
+    """Return path to the compiled cache of the config file.
+
+    :param path: Path to the config file.
+    """
+    return path.with_name(f".{path.name}{CACHE_SUFFIX}")
+
+
+def read_cache(path: Path) -> Optional[Tuple[CacheKey, dict]]:
+    """Load compiled config, None if the cache does not exist or is not valid.
+
+    :param path: Path to the cache file.
+    """
+    try:
+        with open(path, "rb") as cache:
+            data = cache.read()
+        magic, layout, marshal_version, *key = HEADER.unpack_from(data)
+        if (magic, layout, marshal_version) != (MAGIC, LAYOUT_VERSION, marshal.version):
+            return None
+        config = marshal.loads(data[PAYLOAD_OFFSET:])
+    except (OSError, struct.error, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(config, dict):
+        return None
+    return CacheKey(*key), config
+
+
+def write_cache(path: Path, key: CacheKey, config: dict, mode: int = 0o644) -> None:
+    """Atomically replace the compiled config, errors are ignored.
+
+    :param path: Path to the cache file.
+    :param key: Identification of the compiled config file.
+    :param config: Parsed config.
+    :param mode: Permissions of the cache file, same as of the config file.
+    """
+    import tempfile  # pylint: disable=import-outside-toplevel
+
+    try:
+        data = marshal.dumps(config)
+    except ValueError:
+        # Config contains values that can't be marshalled (e.g. YAML timestamps)
+        return
+    header = HEADER.pack(MAGIC, LAYOUT_VERSION, marshal.version, *key)
+    try:
+        descriptor, temp_path = tempfile.mkstemp(prefix=path.name, dir=path.parent)
+    except OSError:
+        return
+    try:
+        with os.fdopen(descriptor, "wb") as cache:
+            cache.write(header + data)
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except OSError:
+        os.unlink(temp_path)
+
+
+def load_config(path: Path) -> dict:
+    """Load the config file, from the compiled cache if it's up to date.
+
+    :param path: Path to the config file.
+    :raises OSError: If the config file can't be read.
+    :raises yaml.YAMLError: If the config file is not a valid YAML.
+    """
+    stat = os.stat(path)
+    cache = cache_path(path)
+    cached = read_cache(cache)
+    if cached and cached[0][:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[1]
+
+    # pylint: disable=import-outside-toplevel
+    import hashlib
+
+    import yaml
+
+    with open(path, "rb") as conf:
+        source = conf.read()
+    key = CacheKey(stat.st_size, stat.st_mtime_ns, hashlib.sha256(source).digest())
+    if cached and cached[0].digest == key.digest:
+        # File was touched without changing its content
+        config = cached[1]
+    else:
+        # Use YAML parser implemented in C (libyaml) if it's available
+        loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+        config = yaml.load(source, Loader=loader)
+    if isinstance(config, dict):
+        write_cache(cache, key, config, stat.st_mode & 0o777)
+    return config
@@ -0,0 +1,220 @@
+"""Server-sent events with changes of the player state for the web interface.
+
+Each web worker process keeps a single subscription to the radio-box service (over
+the unix domain socket) in a background thread, no matter how many browsers are
+connected. EventHub fans the received states out to all connected clients. Every
+client has a small bounded queue, clients that don't keep up are disconnected
+instead of accumulating undelivered events. Browsers reconnect automatically and
+start with the current state. Every zone of the service has its own hub, the
+subscription of a zone is opened only once the first client asks for it.
+"""
+import json
+import queue
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+from radio_box.common import (
+    READ_SIZE,
+    CommandError,
+    FramingError,
+    MessageDecoder,
+    SenderOptions,
+    encode_message,
+    make_message_subscribe,
+)
+from radio_box.protocol import controls_pb2 as controls
+
+# Number of events that a client can fall behind before it's disconnected
+CLIENT_QUEUE_SIZE = 32
+# Seconds between comments that keep idle connections open through proxies
+KEEPALIVE_INTERVAL = 15
+# Seconds to wait before the subscription to the service is renewed
+RECONNECT_DELAY = 1.0
+
+EVENT_METADATA = "metadata"
+EVENT_VOLUME = "volume"
+
+# Kind of the event and the new player state, None disconnects the client
+Event = Optional[Tuple[str, controls.PlayerState]]
+
+
+def state_to_dict(state: controls.PlayerState) -> Dict[str, object]:
+    """Convert player state to JSON serializable dict.
+
+    :param state: Player state reported by the service.
+    """
+    return {
+        "station": state.station or None,
+        "status": controls.PlaybackStatus.Name(state.status).lower(),
+        "error": state.error or None,
+        "title": state.title or None,
+        "volume": state.volume if state.HasField("volume") else None,
+        "delay": state.delay or None,
+    }
+
+
+def event_kind(
+    previous: Optional[controls.PlayerState], state: controls.PlayerState
+) -> str:
+    """Name the change between two player states.
+
+    Change of the station or of the playback status is named by the new status
+    ("opening", "buffering", "playing", "paused", "stopped" or "failed").
+
+    :param previous: Previous state, None if there's none.
+    :param state: New state.
+    """
+    if (
+        previous is not None
+        and previous.station == state.station
+        and previous.status == state.status
+    ):
+        if previous.title != state.title:
+            return EVENT_METADATA
+        if previous.volume != state.volume:
+            return EVENT_VOLUME
+    return controls.PlaybackStatus.Name(state.status).lower()
+
+
+def format_event(kind: str, state: controls.PlayerState) -> str:
+    """Format server-sent event with the player state as JSON data.
+
+    :param kind: Name of the event.
+    :param state: Player state.
+    """
+    return f"event: {kind}\ndata: {json.dumps(state_to_dict(state))}\n\n"
+
+
+def subscribe_states(
+    socket_path: Path, options: SenderOptions, zone: str = ""
+) -> Iterator[controls.PlayerState]:
+    """Subscribe to the player state and yield its changes until the service quits.
+
+    :param socket_path: Path to the unix domain socket of the service.
+    :param options: Timeouts for the connection to the service.
+    :param zone: ID of the zone, empty for the default zone.
+    :raises OSError: If the connection fails.
+    :raises CommandError: If the service refuses the subscription.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(options.connect_timeout)
+        sock.connect(str(socket_path))
+        sock.sendall(encode_message(make_message_subscribe(zone)))
+        # States are sent only when they change, there's no upper bound on the wait
+        sock.settimeout(None)
+        decoder = MessageDecoder(controls.Reply)
+        while True:
+            data = sock.recv(READ_SIZE)
+            if not data:
+                return
+            for reply in decoder.feed(data):
+                if reply.status == controls.ERROR:
+                    raise CommandError(reply.error)
+                yield reply.state
+
+
+class EventHub:  # pylint: disable=too-many-instance-attributes
+    """Distributes player states from a single subscription to many clients."""
+
+    def __init__(
+        self,
+        socket_path: Path,
+        options: Optional[SenderOptions] = None,
+        queue_size: int = CLIENT_QUEUE_SIZE,
+        zone: str = "",
+    ) -> None:
+        """Initialize hub, the subscription starts with the first client.
+
+        :param socket_path: Path to the unix domain socket of the service.
+        :param options: Timeouts for the connection to the service.
+        :param queue_size: Number of events a client can fall behind.
+        :param zone: ID of the zone whose player state is distributed, empty for the
+            default zone.
+        """
+        self.socket_path = socket_path
+        self.options = options or SenderOptions()
+        self.queue_size = queue_size
+        self.zone = zone
+        self.state: Optional[controls.PlayerState] = None
+        self.clients: Set["queue.Queue[Event]"] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(
+        self, client: Optional["queue.Queue[Event]"] = None
+    ) -> "queue.Queue[Event]":
+        """Register new client and return queue that receives its events.
+
+        Queue starts with the current state, if it's known.
+
+        :param client: Queue of the client, new queue of the `queue_size` is created
+            by default.
+        """
+        if client is None:
+            client = queue.Queue(self.queue_size)
+        with self._lock:
+            if self.state is not None:
+                client.put_nowait((event_kind(None, self.state), self.state))
+            self.clients.add(client)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self.run, name="event-hub", daemon=True
+                )
+                self._thread.start()
+        return client
+
+    def unsubscribe(self, client: "queue.Queue[Event]") -> None:
+        """Stop sending events to the client.
+
+        :param client: Queue returned by the `subscribe()` method.
+        """
+        with self._lock:
+            self.clients.discard(client)
+
+    def publish(self, state: controls.PlayerState) -> None:
+        """Send new state to all clients, disconnect clients that fell behind.
+
+        :param state: New player state.
+        """
+        with self._lock:
+            event = (event_kind(self.state, state), state)
+            self.state = state
+            for client in list(self.clients):
+                try:
+                    client.put_nowait(event)
+                except queue.Full:
+                    self.clients.discard(client)
+                    with client.mutex:
+                        client.queue.clear()
+                    client.put_nowait(None)
+
+    def run(self) -> None:
+        """Keep subscription to the service and publish received states."""
+        while True:
+            try:
+                for state in subscribe_states(
+                    self.socket_path, self.options, self.zone
+                ):
+                    self.publish(state)
+            except (OSError, CommandError, FramingError) as exc:
+                print(f"Subscription to the player state failed: {exc}")
+            time.sleep(RECONNECT_DELAY)
+
+    def stream(self) -> Iterator[str]:
+        """Yield server-sent events for a single client until it's disconnected."""
+        client = self.subscribe()
+        try:
+            while True:
+                try:
+                    event = client.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    return
+                yield format_event(*event)
+        finally:
+            self.unsubscribe(client)
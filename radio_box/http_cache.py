@@ -0,0 +1,93 @@
+"""Precomputed REST API responses, revalidated by clients with ETags.
+
+Responses that change only with the configuration (e.g. list of stations) are
+serialized and compressed once per version of their data and kept in memory of the
+web worker. Every response carries a strong ETag derived from its content, so that
+all workers produce the same ETag for the same data and clients that already have
+the current version receive just "304 Not Modified".
+"""
+import gzip
+import hashlib
+import json
+import threading
+from typing import Callable, Hashable, NamedTuple, Optional
+
+from flask import Response, request
+
+# Clients may store the response, but must revalidate it before every use
+CACHE_CONTROL = "no-cache"
+GZIP_LEVEL = 6
+
+
+class CachedBody(NamedTuple):
+    """Serialized JSON response with its compressed variant."""
+
+    etag: str
+    raw: bytes
+    gzipped: bytes
+
+
+def precompute(payload: object) -> CachedBody:
+    """Serialize payload of the response and compress it.
+
+    :param payload: Data of the JSON response.
+    """
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf8")
+    return CachedBody(
+        etag=hashlib.sha256(raw).hexdigest()[:32],
+        raw=raw,
+        # Fixed mtime keeps compressed body identical in all workers
+        gzipped=gzip.compress(raw, GZIP_LEVEL, mtime=0),
+    )
+
+
+def cached_response(body: CachedBody) -> Response:
+    """Return precomputed body as a response to the current request.
+
+    "304 Not Modified" is returned if the client already has the same version, the
+    compressed variant is returned if the client accepts it.
+
+    :param body: Precomputed body.
+    """
+    if request.if_none_match.contains_weak(body.etag):
+        response = Response(status=304)
+    elif request.accept_encodings["gzip"]:
+        response = Response(body.gzipped, content_type="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(body.raw, content_type="application/json")
+    response.set_etag(body.etag)
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+class BodyCache:  # pylint: disable=too-few-public-methods
+    """Keeps the body precomputed for the latest version of its data."""
+
+    def __init__(self) -> None:
+        """Initialize cache, body is computed on the first use."""
+        self._source: object = None
+        self._version: Hashable = None
+        self._body: Optional[CachedBody] = None
+        self._lock = threading.Lock()
+
+    def get(
+        self, source: object, version: Hashable, build: Callable[[], object]
+    ) -> CachedBody:
+        """Return body for the data, compute it if the data changed.
+
+        :param source: Object with the data, it's compared by identity because it's
+            replaced (never modified) when the data change.
+        :param version: Version of other data included in the body.
+        :param build: Function that returns payload of the response.
+        """
+        with self._lock:
+            if (
+                self._body is None
+                or self._source is not source
+                or self._version != version
+            ):
+                self._body = precompute(build())
+                self._source, self._version = source, version
+            return self._body
@@ -0,0 +1,362 @@
+"""Counters and histograms exported in the Prometheus text exposition format.
+
+Radio-box runs as multiple processes, the service and several web workers. Every
+process records metrics into its own Registry and periodically stores a snapshot of
+it into a shared directory (one file per process). The /metrics endpoint merges all
+snapshots, so the counters and histograms are aggregated across all processes.
+
+Snapshots of processes that exited are kept, so that the aggregated counters do not
+decrease. The directory is cleared when the service starts.
+"""
+import abc
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Upper bounds (in seconds) of the histogram buckets, tuned for latencies between a
+# few milliseconds (command handling) and tens of seconds (stream buffering).
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Minimum number of seconds between two snapshots written by `Exporter.maybe_dump()`
+FLUSH_INTERVAL = 1.0
+# Suffix of the metrics directory, placed next to the service socket/pipe
+METRICS_DIR_SUFFIX = ".metrics"
+
+COUNTER = "counter"
+HISTOGRAM = "histogram"
+
+LabelValues = Tuple[str, ...]
+
+
+class Metric(abc.ABC):  # pylint: disable=too-few-public-methods
+    """Named collection of samples, one sample per combination of label values."""
+
+    kind = ""
+
+    def __init__(
+        self, name: str, documentation: str, labels: Sequence[str] = ()
+    ) -> None:
+        """Initialize metric without any samples.
+
+        :param name: Name of the metric.
+        :param documentation: Help text of the metric.
+        :param labels: Names of the labels.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels: Dict[str, str]) -> LabelValues:
+        """Return values of the labels in the order of the label names.
+
+        :param labels: Label values by label name.
+        :raises ValueError: If labels don't match label names of the metric.
+        """
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}.")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    @abc.abstractmethod
+    def snapshot(self) -> dict:
+        """Return JSON serializable copy of the metric."""
+
+
+class Counter(Metric):
+    """Monotonically increasing value."""
+
+    kind = COUNTER
+
+    def __init__(
+        self, name: str, documentation: str, labels: Sequence[str] = ()
+    ) -> None:
+        """Initialize counter without any samples.
+
+        :param name: Name of the metric.
+        :param documentation: Help text of the metric.
+        :param labels: Names of the labels.
+        """
+        super().__init__(name, documentation, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Increase the counter.
+
+        :param amount: Value to add.
+        :param labels: Values of the labels.
+        """
+        key = self._label_values(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def snapshot(self) -> dict:
+        """Return JSON serializable copy of the metric."""
+        with self._lock:
+            samples = [[list(key), value] for key, value in self.values.items()]
+        return {
+            "type": self.kind,
+            "help": self.documentation,
+            "labels": list(self.labels),
+            "samples": samples,
+        }
+
+
+class Histogram(Metric):
+    """Distribution of observed values in buckets."""
+
+    kind = HISTOGRAM
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        """Initialize histogram without any samples.
+
+        :param name: Name of the metric.
+        :param documentation: Help text of the metric.
+        :param labels: Names of the labels.
+        :param buckets: Sorted upper bounds of the buckets, "+Inf" is added.
+        """
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+        # Per label values: non-cumulative counts of each bucket and sum of values
+        self.values: Dict[LabelValues, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record observed value.
+
+        :param value: Observed value.
+        :param labels: Values of the labels.
+        """
+        key = self._label_values(labels)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[index] += 1
+            self.values[key] = (counts, total + value)
+
+    def snapshot(self) -> dict:
+        """Return JSON serializable copy of the metric."""
+        with self._lock:
+            samples = [
+                [list(key), {"buckets": list(counts), "sum": total}]
+                for key, (counts, total) in self.values.items()
+            ]
+        return {
+            "type": self.kind,
+            "help": self.documentation,
+            "labels": list(self.labels),
+            "buckets": list(self.buckets[:-1]),
+            "samples": samples,
+        }
+
+
+class Registry:
+    """Collection of metrics of a single process."""
+
+    def __init__(self) -> None:
+        """Initialize empty registry."""
+        self.metrics: Dict[str, Metric] = {}
+
+    def counter(
+        self, name: str, documentation: str, labels: Sequence[str] = ()
+    ) -> Counter:
+        """Create and register a counter.
+
+        :param name: Name of the metric.
+        :param documentation: Help text of the metric.
+        :param labels: Names of the labels.
+        """
+        counter = Counter(name, documentation, labels)
+        self.metrics[name] = counter
+        return counter
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        """Create and register a histogram.
+
+        :param name: Name of the metric.
+        :param documentation: Help text of the metric.
+        :param labels: Names of the labels.
+        :param buckets: Sorted upper bounds of the buckets.
+        """
+        histogram = Histogram(name, documentation, labels, buckets)
+        self.metrics[name] = histogram
+        return histogram
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Return JSON serializable copy of all metrics."""
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+
+# Registry of the current process
+REGISTRY = Registry()
+
+
+def metrics_dir_path(config: dict) -> Path:
+    """Return path to the directory with metric snapshots of all processes.
+
+    :param config: Content of the configuration file.
+    """
+    metrics_dir = config.get("metrics_dir")
+    if metrics_dir:
+        return Path(metrics_dir)
+    socket_path = Path(config["socket"])
+    return socket_path.with_name(socket_path.stem + METRICS_DIR_SUFFIX)
+
+
+class Exporter:
+    """Stores snapshots of the process registry into the metrics directory."""
+
+    def __init__(
+        self, directory: Path, role: str, registry: Optional[Registry] = None
+    ) -> None:
+        """Initialize exporter.
+
+        :param directory: Directory shared by all radio-box processes.
+        :param role: Name of the process type, e.g. "service" or "web".
+        :param registry: Registry to export, REGISTRY if omitted.
+        """
+        self.directory = directory
+        self.registry = registry or REGISTRY
+        self.role = role
+        self.last_dump = 0.0
+        self._pending: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Path:
+        """Path to the snapshot of the current process."""
+        return self.directory / f"{self.role}-{os.getpid()}.json"
+
+    def clear(self) -> None:
+        """Remove snapshots of all processes."""
+        for snapshot in self.directory.glob("*.json"):
+            snapshot.unlink()
+
+    def dump(self) -> None:
+        """Atomically replace snapshot of the current process."""
+        with self._lock:
+            self.last_dump = time.monotonic()
+            self._pending = None
+        path = self.path
+        temp_path = path.with_name(f".{path.name}.tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(temp_path, "w", encoding="utf8") as snapshot:
+                json.dump(self.registry.snapshot(), snapshot)
+            os.replace(temp_path, path)
+        except OSError as exc:
+            print(f"Failed to store metrics: {exc}")
+
+    def maybe_dump(self) -> None:
+        """Store snapshot at most once per FLUSH_INTERVAL.
+
+        If the snapshot was stored recently, it's stored again by a background timer
+        once the interval passes, so that the last changes are not lost when the
+        process becomes idle.
+        """
+        with self._lock:
+            remaining = self.last_dump + FLUSH_INTERVAL - time.monotonic()
+            if remaining > 0:
+                if self._pending is None:
+                    self._pending = threading.Timer(remaining, self.dump)
+                    self._pending.daemon = True
+                    self._pending.start()
+                return
+        self.dump()
+
+
+def _merge_samples(target: dict, metric: dict) -> None:
+    """Add samples of the metric snapshot to the aggregated metric.
+
+    :param target: Aggregated metric, samples are stored in "merged" dict.
+    :param metric: Snapshot of the metric from a single process.
+    """
+    merged = target["merged"]
+    for label_values, value in metric["samples"]:
+        key = tuple(label_values)
+        if metric["type"] == HISTOGRAM:
+            counts, total = merged.get(key, ([0] * len(value["buckets"]), 0.0))
+            counts = [a + b for a, b in zip(counts, value["buckets"])]
+            merged[key] = (counts, total + value["sum"])
+        else:
+            merged[key] = merged.get(key, 0) + value
+
+
+def collect(directory: Path) -> Dict[str, dict]:
+    """Merge metric snapshots of all processes.
+
+    Unreadable snapshots (e.g. of a process that is just being written) are skipped.
+
+    :param directory: Directory with the snapshots.
+    """
+    aggregated: Dict[str, dict] = {}
+    for path in sorted(directory.glob("*.json")):
+        try:
+            with open(path, "r", encoding="utf8") as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (OSError, ValueError):
+            continue
+        for name, metric in snapshot.items():
+            target = aggregated.setdefault(name, dict(metric, merged={}))
+            if target["type"] == metric["type"]:
+                _merge_samples(target, metric)
+    return aggregated
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    """Format labels of the sample.
+
+    :param names: Names of the labels.
+    :param values: Values of the labels.
+    """
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_bound(bound: float) -> str:
+    """Format upper bound of the histogram bucket."""
+    return "+Inf" if math.isinf(bound) else repr(float(bound))
+
+
+def render(metrics: Dict[str, dict]) -> str:
+    """Render aggregated metrics in the Prometheus text exposition format.
+
+    :param metrics: Metrics returned by `collect()`.
+    """
+    lines = []
+    for name, metric in sorted(metrics.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        label_names = metric["labels"]
+        for key, value in sorted(metric["merged"].items()):
+            if metric["type"] == COUNTER:
+                lines.append(f"{name}{_format_labels(label_names, key)} {value}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(metric["buckets"] + [math.inf], counts):
+                cumulative += count
+                labels = _format_labels(
+                    label_names + ["le"], list(key) + [_format_bound(bound)]
+                )
+                lines.append(f"{name}_bucket{labels} {cumulative}")
+            labels = _format_labels(label_names, key)
+            lines.append(f"{name}_sum{labels} {total}")
+            lines.append(f"{name}_count{labels} {cumulative}")
+    return "\n".join(lines) + "\n"
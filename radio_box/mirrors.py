@@ -0,0 +1,82 @@
+"""Selection of the mirror to play for stations that are published on multiple URLs.
+
+The "url" field of the station configuration can contain either a single URL or an
+ordered list of mirrors. MirrorStats remembers recently observed connect times and
+failures of each mirror and orders mirrors of the station from the most to the least
+preferred one.
+"""
+from typing import List
+
+from radio_box.resolver import TTLCache
+
+# Seconds for which the observed connect time is considered recent
+LATENCY_TTL = 3600
+# Seconds for which the failed mirror is ranked behind the working ones
+FAILURE_TTL = 600
+# Maximum number of mirrors with recorded statistics
+MIRROR_STATS_SIZE = 1024
+
+
+def station_urls(station: dict) -> List[str]:
+    """Return list of mirror URLs of the station, in the configured order.
+
+    :param station: Configuration of a single station.
+    """
+    urls = station.get("url") or []
+    if isinstance(urls, str):
+        urls = [urls]
+    return [str(url) for url in urls if url]
+
+
+class MirrorStats:
+    """Thread-safe statistics of the mirrors, used to choose the best one."""
+
+    def __init__(
+        self,
+        latency_ttl: float = LATENCY_TTL,
+        failure_ttl: float = FAILURE_TTL,
+        size: int = MIRROR_STATS_SIZE,
+    ) -> None:
+        """Initialize statistics without any observations.
+
+        :param latency_ttl: Seconds for which the observed connect time is used.
+        :param failure_ttl: Seconds for which the failed mirror is penalized.
+        :param size: Maximum number of mirrors with recorded statistics.
+        """
+        self.latencies: TTLCache[str, float] = TTLCache(latency_ttl, size)
+        self.failures: TTLCache[str, bool] = TTLCache(failure_ttl, size)
+
+    def record_latency(self, url: str, connect_ms: float) -> None:
+        """Remember connect time of the mirror.
+
+        :param url: URL of the mirror.
+        :param connect_ms: Time to establish connection in milliseconds.
+        """
+        self.latencies.set(url, connect_ms)
+
+    def record_failure(self, url: str) -> None:
+        """Remember that the mirror failed.
+
+        :param url: URL of the mirror.
+        """
+        self.failures.set(url, True)
+
+    def order(self, urls: List[str]) -> List[str]:
+        """Sort mirrors from the most to the least preferred one.
+
+        Mirrors that failed recently come last. The rest is ordered by the observed
+        connect time, mirrors without observations keep the configured order behind
+        the measured ones.
+
+        :param urls: Mirrors of the station in the configured order.
+        """
+        infinity = float("inf")
+
+        def preference(url: str) -> tuple:
+            latency = self.latencies.get(url)
+            return (
+                bool(self.failures.get(url)),
+                infinity if latency is None else latency,
+            )
+
+        return sorted(urls, key=preference)
@@ -0,0 +1,289 @@
+"""Background health checks of the configured radio stations.
+
+StationProber periodically connects to every station, measures how long it takes to
+establish the connection and to receive the first byte of the response, and stores
+the results in a JSON file. The file is read by the REST API, so the web interface
+can tell which stations are dead and which respond the fastest.
+
+Probes run on the event loop of the service with limited concurrency. Stations that
+are currently used by the player are not probed, so the prober never competes with
+the playback for the connection to the same server.
+"""
+import asyncio
+import json
+import os
+import ssl
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from radio_box.mirrors import MirrorStats, station_urls
+from radio_box.resolver import StreamResolver
+
+# Suffix of the file with probe results, placed next to the service socket/pipe
+STATUS_FILE_SUFFIX = ".health.json"
+USER_AGENT = "radio-box"
+
+
+class ProberOptions(NamedTuple):
+    """Settings of the station prober.
+
+    Values can be overridden in the "prober" section of the config file.
+    """
+
+    # Seconds between two rounds of probes
+    interval: float = 600
+    # Maximum number of stations probed at the same time
+    concurrency: int = 2
+    # Seconds to wait for the connection and for the first byte of the response
+    timeout: float = 5.0
+    # Path to the file with results, defaults to the socket path + ".health.json"
+    status_file: str = ""
+
+
+class ProbeResult(NamedTuple):
+    """Outcome of a single probe of the station."""
+
+    reachable: bool
+    # Unix timestamp of the probe
+    checked: float
+    # Milliseconds until the connection was established (including DNS and TLS)
+    connect_ms: Optional[float] = None
+    # Milliseconds from sending the request until the first byte of the response
+    ttfb_ms: Optional[float] = None
+    error: str = ""
+
+
+def status_file_path(config: dict) -> Path:
+    """Return path to the file with probe results.
+
+    :param config: Content of the configuration file.
+    """
+    status_file = config.get("prober", {}).get("status_file")
+    if status_file:
+        return Path(status_file)
+    socket_path = Path(config["socket"])
+    return socket_path.with_name(socket_path.stem + STATUS_FILE_SUFFIX)
+
+
+def load_results(path: Path) -> Dict[str, dict]:
+    """Read probe results stored by the prober.
+
+    Missing or corrupted file is treated as if there were no results.
+
+    :param path: Path to the file with results.
+    """
+    try:
+        with open(path, "r", encoding="utf8") as status_file:
+            results = json.load(status_file)
+    except (OSError, ValueError):
+        return {}
+    return results if isinstance(results, dict) else {}
+
+
+def results_version(path: Path) -> Optional[Tuple[int, int]]:
+    """Return modification time and size of the file with probe results.
+
+    Version changes every time the prober stores new results, None if there are no
+    results.
+
+    :param path: Path to the file with results.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def http_request(url: str) -> bytes:
+    """Build minimal HTTP GET request for the URL.
+
+    :param url: HTTP(S) URL of the station.
+    """
+    parts = urlsplit(url)
+    path = parts.path or "/"
+    if parts.query:
+        path += f"?{parts.query}"
+    return (
+        f"GET {path} HTTP/1.0\r\nHost: {parts.netloc}\r\n"
+        f"User-Agent: {USER_AGENT}\r\nIcy-MetaData: 0\r\n\r\n"
+    ).encode()
+
+
+def check_status(status_line: bytes) -> int:
+    """Check that the response status line reports success.
+
+    Shoutcast servers reply with "ICY 200 OK" instead of the HTTP status line.
+
+    :param status_line: First line of the response.
+    :return: Status code of the response.
+    :raises ValueError: If the status line is invalid or reports an error.
+    """
+    status = status_line.decode("latin-1").split()
+    if len(status) < 2 or not status[1].isdigit():
+        raise ValueError(f"invalid response {status_line[:40]!r}")
+    if int(status[1]) >= 400:
+        raise ValueError(f"server responded {int(status[1])}")
+    return int(status[1])
+
+
+async def probe_url(url: str, timeout: float) -> ProbeResult:
+    """Connect to the stream URL and wait for the first byte of the response.
+
+    Status codes below 400 mean that the station is reachable, redirects are not
+    followed.
+
+    :param url: HTTP(S) URL of the station.
+    :param timeout: Seconds to wait for the connection and for the response.
+    """
+    loop = asyncio.get_running_loop()
+    checked = time.time()
+    parts = urlsplit(url)
+    https = parts.scheme == "https"
+
+    connect_ms = None
+    started = loop.time()
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                parts.hostname,
+                parts.port or (443 if https else 80),
+                ssl=ssl.create_default_context() if https else None,
+            ),
+            timeout,
+        )
+        connect_ms = (loop.time() - started) * 1000
+        started = loop.time()
+        writer.write(http_request(url))
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        ttfb_ms = (loop.time() - started) * 1000
+        check_status(status_line)
+    except asyncio.TimeoutError:
+        return ProbeResult(False, checked, connect_ms, error="timed out")
+    except (OSError, ValueError) as exc:
+        return ProbeResult(False, checked, connect_ms, error=str(exc))
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return ProbeResult(True, checked, connect_ms, ttfb_ms)
+
+
+def preference(result: ProbeResult) -> Tuple[bool, float]:
+    """Sort key that puts reachable results with the lowest latency first.
+
+    :param result: Result of the probe.
+    """
+    latency = result.connect_ms if result.connect_ms is not None else float("inf")
+    return (not result.reachable, latency)
+
+
+class StationProber:
+    """Periodically probes all stations and stores the results in a file."""
+
+    def __init__(
+        self,
+        stations: Dict[str, dict],
+        status_file: Path,
+        options: Optional[ProberOptions] = None,
+        resolver: Optional[StreamResolver] = None,
+        mirrors: Optional[MirrorStats] = None,
+    ) -> None:
+        """Initialize prober without any results.
+
+        :param stations: dict containing station configuration.
+        :param status_file: Path to the file in which the results are stored.
+        :param options: Settings of the prober, default values are used if omitted.
+        :param resolver: If the stream URL of the station was already resolved, it's
+            probed instead of the station URL.
+        :param mirrors: Statistics that receive connect times and failures of every
+            probed mirror.
+        """
+        self.stations = stations
+        self.status_file = status_file
+        self.options = options or ProberOptions()
+        self.resolver = resolver
+        self.mirrors = mirrors
+        self.results: Dict[str, ProbeResult] = {}
+
+    def _probe_targets(self, station_id: str) -> List[Tuple[str, str]]:
+        """Return mirrors of the station that can be probed.
+
+        :param station_id: ID of the station.
+        :return: Pairs of the mirror URL and the URL that should be probed.
+        """
+        targets = []
+        for url in station_urls(self.stations[station_id]):
+            target = (self.resolver.streams.get(url) if self.resolver else None) or url
+            if urlsplit(target).scheme in ("http", "https"):
+                targets.append((url, target))
+        return targets
+
+    def _record(self, url: str, result: ProbeResult) -> None:
+        """Pass result of the mirror probe to the mirror statistics.
+
+        :param url: URL of the mirror.
+        :param result: Result of the probe.
+        """
+        if self.mirrors is None:
+            return
+        if result.reachable and result.connect_ms is not None:
+            self.mirrors.record_latency(url, result.connect_ms)
+        else:
+            self.mirrors.record_failure(url)
+
+    async def probe_all(self, skip: Iterable[Optional[str]] = ()) -> None:
+        """Probe every station once and store the results.
+
+        :param skip: Stations that must not be probed, their last results are kept.
+        """
+        semaphore = asyncio.Semaphore(self.options.concurrency)
+        skipped = set(skip)
+
+        async def probe(station_id: str, targets: List[Tuple[str, str]]) -> None:
+            results = []
+            for url, target in targets:
+                async with semaphore:
+                    result = await probe_url(target, self.options.timeout)
+                self._record(url, result)
+                results.append(result)
+            # Station is as good as its best mirror
+            self.results[station_id] = min(results, key=preference)
+
+        probes = []
+        for station_id in self.stations:
+            targets = self._probe_targets(station_id)
+            if targets and station_id not in skipped:
+                probes.append(probe(station_id, targets))
+        await asyncio.gather(*probes)
+
+        for station_id in set(self.results) - set(self.stations):
+            del self.results[station_id]
+        self.write_results()
+
+    def write_results(self) -> None:
+        """Atomically replace the file with current results."""
+        data = {
+            station_id: result._asdict() for station_id, result in self.results.items()
+        }
+        temp_file = self.status_file.with_name(f".{self.status_file.name}.tmp")
+        try:
+            with open(temp_file, "w", encoding="utf8") as status_file:
+                json.dump(data, status_file)
+            os.replace(temp_file, self.status_file)
+        except OSError as exc:
+            print(f"Failed to store station probe results: {exc}")
+
+    async def run(self, busy_stations: Callable[[], Set[Optional[str]]]) -> None:
+        """Probe stations periodically until cancelled.
+
+        :param busy_stations: Function returning stations used by the player.
+        """
+        while True:
+            await self.probe_all(busy_stations())
+            reachable = sum(result.reachable for result in self.results.values())
+            print(f"Station probe finished, {reachable}/{len(self.results)} reachable.")
+            await asyncio.sleep(self.options.interval)
@@ -1,320 +1,61 @@
+# -*- coding: utf-8 -*-
 # Generated by the protocol buffer compiler.  DO NOT EDIT!
 # source: controls.proto
-
-import sys
-_b=sys.version_info[0]<3 and (lambda x:x) or (lambda x:x.encode('latin1'))
-from google.protobuf.internal import enum_type_wrapper
+"""Generated protocol buffer code."""
+from google.protobuf.internal import builder as _builder
 from google.protobuf import descriptor as _descriptor
-from google.protobuf import message as _message
-from google.protobuf import reflection as _reflection
+from google.protobuf import descriptor_pool as _descriptor_pool
 from google.protobuf import symbol_database as _symbol_database
+
 # @@protoc_insertion_point(imports)
 
 _sym_db = _symbol_database.Default()
 
 
-
-
-DESCRIPTOR = _descriptor.FileDescriptor(
-  name='controls.proto',
-  package='radio_box',
-  syntax='proto2',
-  serialized_options=None,
-  serialized_pb=_b('\n\x0e\x63ontrols.proto\x12\tradio_box\"=\n\x04Play\x12$\n\x04type\x18\x01 \x02(\x0e\x32\x16.radio_box.CommandType\x12\x0f\n\x07station\x18\x02 \x02(\t\",\n\x04Stop\x12$\n\x04type\x18\x01 \x02(\x0e\x32\x16.radio_box.CommandType\"G\n\tSetVolume\x12$\n\x04type\x18\x01 \x02(\x0e\x32\x16.radio_box.CommandType\x12\x14\n\x0cvolume_level\x18\x02 \x02(\r\",\n\x04Quit\x12$\n\x04type\x18\x01 \x02(\x0e\x32\x16.radio_box.CommandType\"\xa7\x01\n\x07\x43ommand\x12\x1f\n\x04play\x18\x01 \x01(\x0b\x32\x0f.radio_box.PlayH\x00\x12\x1f\n\x04stop\x18\x02 \x01(\x0b\x32\x0f.radio_box.StopH\x00\x12*\n\nset_volume\x18\x03 \x01(\x0b\x32\x14.radio_box.SetVolumeH\x00\x12\x1f\n\x04quit\x18\x04 \x01(\x0b\x32\x0f.radio_box.QuitH\x00\x42\r\n\x0bsub_command*;\n\x0b\x43ommandType\x12\x08\n\x04PLAY\x10\x00\x12\x08\n\x04STOP\x10\x01\x12\x0e\n\nSET_VOLUME\x10\x02\x12\x08\n\x04QUIT\x10\x63')
-)
-
-_COMMANDTYPE = _descriptor.EnumDescriptor(
-  name='CommandType',
-  full_name='radio_box.CommandType',
-  filename=None,
-  file=DESCRIPTOR,
-  values=[
-    _descriptor.EnumValueDescriptor(
-      name='PLAY', index=0, number=0,
-      serialized_options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='STOP', index=1, number=1,
-      serialized_options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='SET_VOLUME', index=2, number=2,
-      serialized_options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='QUIT', index=3, number=99,
-      serialized_options=None,
-      type=None),
-  ],
-  containing_type=None,
-  serialized_options=None,
-  serialized_start=427,
-  serialized_end=486,
-)
-_sym_db.RegisterEnumDescriptor(_COMMANDTYPE)
-
-CommandType = enum_type_wrapper.EnumTypeWrapper(_COMMANDTYPE)
-PLAY = 0
-STOP = 1
-SET_VOLUME = 2
-QUIT = 99
-
-
-
-_PLAY = _descriptor.Descriptor(
-  name='Play',
-  full_name='radio_box.Play',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='type', full_name='radio_box.Play.type', index=0,
-      number=1, type=14, cpp_type=8, label=2,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-    _descriptor.FieldDescriptor(
-      name='station', full_name='radio_box.Play.station', index=1,
-      number=2, type=9, cpp_type=9, label=2,
-      has_default_value=False, default_value=_b("").decode('utf-8'),
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto2',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=29,
-  serialized_end=90,
-)
-
-
-_STOP = _descriptor.Descriptor(
-  name='Stop',
-  full_name='radio_box.Stop',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='type', full_name='radio_box.Stop.type', index=0,
-      number=1, type=14, cpp_type=8, label=2,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto2',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=92,
-  serialized_end=136,
-)
-
-
-_SETVOLUME = _descriptor.Descriptor(
-  name='SetVolume',
-  full_name='radio_box.SetVolume',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='type', full_name='radio_box.SetVolume.type', index=0,
-      number=1, type=14, cpp_type=8, label=2,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-    _descriptor.FieldDescriptor(
-      name='volume_level', full_name='radio_box.SetVolume.volume_level', index=1,
-      number=2, type=13, cpp_type=3, label=2,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto2',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=138,
-  serialized_end=209,
-)
-
-
-_QUIT = _descriptor.Descriptor(
-  name='Quit',
-  full_name='radio_box.Quit',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='type', full_name='radio_box.Quit.type', index=0,
-      number=1, type=14, cpp_type=8, label=2,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto2',
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=211,
-  serialized_end=255,
-)
-
-
-_COMMAND = _descriptor.Descriptor(
-  name='Command',
-  full_name='radio_box.Command',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='play', full_name='radio_box.Command.play', index=0,
-      number=1, type=11, cpp_type=10, label=1,
-      has_default_value=False, default_value=None,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-    _descriptor.FieldDescriptor(
-      name='stop', full_name='radio_box.Command.stop', index=1,
-      number=2, type=11, cpp_type=10, label=1,
-      has_default_value=False, default_value=None,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-    _descriptor.FieldDescriptor(
-      name='set_volume', full_name='radio_box.Command.set_volume', index=2,
-      number=3, type=11, cpp_type=10, label=1,
-      has_default_value=False, default_value=None,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-    _descriptor.FieldDescriptor(
-      name='quit', full_name='radio_box.Command.quit', index=3,
-      number=4, type=11, cpp_type=10, label=1,
-      has_default_value=False, default_value=None,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      serialized_options=None, file=DESCRIPTOR),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  serialized_options=None,
-  is_extendable=False,
-  syntax='proto2',
-  extension_ranges=[],
-  oneofs=[
-    _descriptor.OneofDescriptor(
-      name='sub_command', full_name='radio_box.Command.sub_command',
-      index=0, containing_type=None, fields=[]),
-  ],
-  serialized_start=258,
-  serialized_end=425,
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(
+    b'\n\x0e\x63ontrols.proto\x12\tradio_box"K\n\x04Play\x12$\n\x04type\x18\x01 \x02(\x0e\x32\x16.radio_box.CommandType\x12\x0f\n\x07station\x18\x02 \x02(\t\x12\x0c\n\x04zone\x18\x03 \x01(\t":\n\x04Stop\x12$\n\x04type\x18\x01 \x02(\x0e\x32\x16.radio_box.CommandType\x12\x0c\n\x04zone\x18\x02 \x01(\t"U\n\tSetVolume\x12$\n\x04type\x18\x01 \x02(\x0e\x32\x16.radio_box.CommandType\x12\x14\n\x0cvolume_level\x18\x02 \x02(\r\x12\x0c\n\x04zone\x18\x03 \x01(\t";\n\x05Pause\x12$\n\x04type\x18\x01 \x02(\x0e\x32\x16.radio_box.CommandType\x12\x0c\n\x04zone\x18\x02 \x01(\t"<\n\x06Resume\x12$\n\x04type\x18\x01 \x02(\x0e\x32\x16.radio_box.CommandType\x12\x0c\n\x04zone\x18\x02 \x01(\t"I\n\x04Seek\x12$\n\x04type\x18\x01 \x02(\x0e\x32\x16.radio_box.CommandType\x12\r\n\x05\x64\x65lay\x18\x02 \x02(\r\x12\x0c\n\x04zone\x18\x03 \x01(\t"Q\n\x06Record\x12$\n\x04type\x18\x01 \x02(\x0e\x32\x16.radio_box.CommandType\x12\x0f\n\x07station\x18\x02 \x02(\t\x12\x10\n\x08\x64uration\x18\x03 \x01(\r"F\n\rStopRecording\x12$\n\x04type\x18\x01 \x02(\x0e\x32\x16.radio_box.CommandType\x12\x0f\n\x07station\x18\x02 \x02(\t",\n\x04Quit\x12$\n\x04type\x18\x01 \x02(\x0e\x32\x16.radio_box.CommandType"@\n\tGetTraces\x12$\n\x04type\x18\x01 \x02(\x0e\x32\x16.radio_box.CommandType\x12\r\n\x05limit\x18\x02 \x01(\r"?\n\tSubscribe\x12$\n\x04type\x18\x01 \x02(\x0e\x32\x16.radio_box.CommandType\x12\x0c\n\x04zone\x18\x02 \x01(\t"6\n\x04Span\x12\r\n\x05stage\x18\x01 \x02(\t\x12\r\n\x05start\x18\x02 \x02(\x01\x12\x10\n\x08\x64uration\x18\x03 \x02(\x01"\x87\x04\n\x07\x43ommand\x12\x1f\n\x04play\x18\x01 \x01(\x0b\x32\x0f.radio_box.PlayH\x00\x12\x1f\n\x04stop\x18\x02 \x01(\x0b\x32\x0f.radio_box.StopH\x00\x12*\n\nset_volume\x18\x03 \x01(\x0b\x32\x14.radio_box.SetVolumeH\x00\x12\x1f\n\x04quit\x18\x04 \x01(\x0b\x32\x0f.radio_box.QuitH\x00\x12*\n\nget_traces\x18\x05 \x01(\x0b\x32\x14.radio_box.GetTracesH\x00\x12)\n\tsubscribe\x18\t \x01(\x0b\x32\x14.radio_box.SubscribeH\x00\x12!\n\x05pause\x18\n \x01(\x0b\x32\x10.radio_box.PauseH\x00\x12#\n\x06resume\x18\x0b \x01(\x0b\x32\x11.radio_box.ResumeH\x00\x12\x1f\n\x04seek\x18\x0c \x01(\x0b\x32\x0f.radio_box.SeekH\x00\x12#\n\x06record\x18\r \x01(\x0b\x32\x11.radio_box.RecordH\x00\x12\x32\n\x0estop_recording\x18\x0e \x01(\x0b\x32\x18.radio_box.StopRecordingH\x00\x12\x10\n\x08trace_id\x18\x06 \x01(\t\x12\x13\n\x0borigin_time\x18\x07 \x01(\x01\x12\x1e\n\x05spans\x18\x08 \x03(\x0b\x32\x0f.radio_box.SpanB\r\n\x0bsub_command"p\n\x05Trace\x12\x10\n\x08trace_id\x18\x01 \x02(\t\x12\x13\n\x0borigin_time\x18\x02 \x01(\x01\x12\x0f\n\x07\x63ommand\x18\x03 \x01(\t\x12\x1e\n\x05spans\x18\x04 \x03(\x0b\x32\x0f.radio_box.Span\x12\x0f\n\x07outcome\x18\x05 \x01(\t"\x86\x01\n\x0bPlayerState\x12\x0f\n\x07station\x18\x01 \x01(\t\x12)\n\x06status\x18\x02 \x01(\x0e\x32\x19.radio_box.PlaybackStatus\x12\r\n\x05\x65rror\x18\x03 \x01(\t\x12\r\n\x05title\x18\x04 \x01(\t\x12\x0e\n\x06volume\x18\x05 \x01(\r\x12\r\n\x05\x64\x65lay\x18\x06 \x01(\r"\x87\x01\n\x05Reply\x12&\n\x06status\x18\x01 \x02(\x0e\x32\x16.radio_box.ReplyStatus\x12\r\n\x05\x65rror\x18\x02 \x01(\t\x12%\n\x05state\x18\x03 \x01(\x0b\x32\x16.radio_box.PlayerState\x12 \n\x06traces\x18\x04 \x03(\x0b\x32\x10.radio_box.Trace*\x9b\x01\n\x0b\x43ommandType\x12\x08\n\x04PLAY\x10\x00\x12\x08\n\x04STOP\x10\x01\x12\x0e\n\nSET_VOLUME\x10\x02\x12\x0e\n\nGET_TRACES\x10\x03\x12\r\n\tSUBSCRIBE\x10\x04\x12\t\n\x05PAUSE\x10\x05\x12\n\n\x06RESUME\x10\x06\x12\x08\n\x04SEEK\x10\x07\x12\n\n\x06RECORD\x10\x08\x12\x12\n\x0eSTOP_RECORDING\x10\t\x12\x08\n\x04QUIT\x10\x63* \n\x0bReplyStatus\x12\x06\n\x02OK\x10\x00\x12\t\n\x05\x45RROR\x10\x01*^\n\x0ePlaybackStatus\x12\x0b\n\x07STOPPED\x10\x00\x12\x0b\n\x07OPENING\x10\x01\x12\r\n\tBUFFERING\x10\x02\x12\x0b\n\x07PLAYING\x10\x03\x12\n\n\x06\x46\x41ILED\x10\x04\x12\n\n\x06PAUSED\x10\x05'
 )
 
-_PLAY.fields_by_name['type'].enum_type = _COMMANDTYPE
-_STOP.fields_by_name['type'].enum_type = _COMMANDTYPE
-_SETVOLUME.fields_by_name['type'].enum_type = _COMMANDTYPE
-_QUIT.fields_by_name['type'].enum_type = _COMMANDTYPE
-_COMMAND.fields_by_name['play'].message_type = _PLAY
-_COMMAND.fields_by_name['stop'].message_type = _STOP
-_COMMAND.fields_by_name['set_volume'].message_type = _SETVOLUME
-_COMMAND.fields_by_name['quit'].message_type = _QUIT
-_COMMAND.oneofs_by_name['sub_command'].fields.append(
-  _COMMAND.fields_by_name['play'])
-_COMMAND.fields_by_name['play'].containing_oneof = _COMMAND.oneofs_by_name['sub_command']
-_COMMAND.oneofs_by_name['sub_command'].fields.append(
-  _COMMAND.fields_by_name['stop'])
-_COMMAND.fields_by_name['stop'].containing_oneof = _COMMAND.oneofs_by_name['sub_command']
-_COMMAND.oneofs_by_name['sub_command'].fields.append(
-  _COMMAND.fields_by_name['set_volume'])
-_COMMAND.fields_by_name['set_volume'].containing_oneof = _COMMAND.oneofs_by_name['sub_command']
-_COMMAND.oneofs_by_name['sub_command'].fields.append(
-  _COMMAND.fields_by_name['quit'])
-_COMMAND.fields_by_name['quit'].containing_oneof = _COMMAND.oneofs_by_name['sub_command']
-DESCRIPTOR.message_types_by_name['Play'] = _PLAY
-DESCRIPTOR.message_types_by_name['Stop'] = _STOP
-DESCRIPTOR.message_types_by_name['SetVolume'] = _SETVOLUME
-DESCRIPTOR.message_types_by_name['Quit'] = _QUIT
-DESCRIPTOR.message_types_by_name['Command'] = _COMMAND
-DESCRIPTOR.enum_types_by_name['CommandType'] = _COMMANDTYPE
-_sym_db.RegisterFileDescriptor(DESCRIPTOR)
-
-Play = _reflection.GeneratedProtocolMessageType('Play', (_message.Message,), dict(
-  DESCRIPTOR = _PLAY,
-  __module__ = 'controls_pb2'
-  # @@protoc_insertion_point(class_scope:radio_box.Play)
-  ))
-_sym_db.RegisterMessage(Play)
-
-Stop = _reflection.GeneratedProtocolMessageType('Stop', (_message.Message,), dict(
-  DESCRIPTOR = _STOP,
-  __module__ = 'controls_pb2'
-  # @@protoc_insertion_point(class_scope:radio_box.Stop)
-  ))
-_sym_db.RegisterMessage(Stop)
-
-SetVolume = _reflection.GeneratedProtocolMessageType('SetVolume', (_message.Message,), dict(
-  DESCRIPTOR = _SETVOLUME,
-  __module__ = 'controls_pb2'
-  # @@protoc_insertion_point(class_scope:radio_box.SetVolume)
-  ))
-_sym_db.RegisterMessage(SetVolume)
-
-Quit = _reflection.GeneratedProtocolMessageType('Quit', (_message.Message,), dict(
-  DESCRIPTOR = _QUIT,
-  __module__ = 'controls_pb2'
-  # @@protoc_insertion_point(class_scope:radio_box.Quit)
-  ))
-_sym_db.RegisterMessage(Quit)
-
-Command = _reflection.GeneratedProtocolMessageType('Command', (_message.Message,), dict(
-  DESCRIPTOR = _COMMAND,
-  __module__ = 'controls_pb2'
-  # @@protoc_insertion_point(class_scope:radio_box.Command)
-  ))
-_sym_db.RegisterMessage(Command)
-
-
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, "controls_pb2", globals())
+if _descriptor._USE_C_DESCRIPTORS == False:
+    DESCRIPTOR._options = None
+    _COMMANDTYPE._serialized_start = 1751
+    _COMMANDTYPE._serialized_end = 1906
+    _REPLYSTATUS._serialized_start = 1908
+    _REPLYSTATUS._serialized_end = 1940
+    _PLAYBACKSTATUS._serialized_start = 1942
+    _PLAYBACKSTATUS._serialized_end = 2036
+    _PLAY._serialized_start = 29
+    _PLAY._serialized_end = 104
+    _STOP._serialized_start = 106
+    _STOP._serialized_end = 164
+    _SETVOLUME._serialized_start = 166
+    _SETVOLUME._serialized_end = 251
+    _PAUSE._serialized_start = 253
+    _PAUSE._serialized_end = 312
+    _RESUME._serialized_start = 314
+    _RESUME._serialized_end = 374
+    _SEEK._serialized_start = 376
+    _SEEK._serialized_end = 449
+    _RECORD._serialized_start = 451
+    _RECORD._serialized_end = 532
+    _STOPRECORDING._serialized_start = 534
+    _STOPRECORDING._serialized_end = 604
+    _QUIT._serialized_start = 606
+    _QUIT._serialized_end = 650
+    _GETTRACES._serialized_start = 652
+    _GETTRACES._serialized_end = 716
+    _SUBSCRIBE._serialized_start = 718
+    _SUBSCRIBE._serialized_end = 781
+    _SPAN._serialized_start = 783
+    _SPAN._serialized_end = 837
+    _COMMAND._serialized_start = 840
+    _COMMAND._serialized_end = 1359
+    _TRACE._serialized_start = 1361
+    _TRACE._serialized_end = 1473
+    _PLAYERSTATE._serialized_start = 1476
+    _PLAYERSTATE._serialized_end = 1610
+    _REPLY._serialized_start = 1613
+    _REPLY._serialized_end = 1748
 # @@protoc_insertion_point(module_scope)
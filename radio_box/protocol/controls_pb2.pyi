@@ -4,6 +4,7 @@ isort:skip_file
 """
 import builtins
 import google.protobuf.descriptor
+import google.protobuf.internal.containers
 import google.protobuf.internal.enum_type_wrapper
 import google.protobuf.message
 import typing
@@ -12,84 +13,434 @@ import typing_extensions
 DESCRIPTOR: google.protobuf.descriptor.FileDescriptor = ...
 
 class _CommandType:
-    ValueType = typing.NewType('ValueType', builtins.int)
+    ValueType = typing.NewType("ValueType", builtins.int)
     V: typing_extensions.TypeAlias = ValueType
-class _CommandTypeEnumTypeWrapper(google.protobuf.internal.enum_type_wrapper._EnumTypeWrapper[_CommandType.ValueType], builtins.type):
+
+class _CommandTypeEnumTypeWrapper(
+    google.protobuf.internal.enum_type_wrapper._EnumTypeWrapper[_CommandType.ValueType],
+    builtins.type,
+):
     DESCRIPTOR: google.protobuf.descriptor.EnumDescriptor = ...
     PLAY: CommandType.ValueType = ...  # 0
     STOP: CommandType.ValueType = ...  # 1
     SET_VOLUME: CommandType.ValueType = ...  # 2
+    GET_TRACES: CommandType.ValueType = ...  # 3
+    SUBSCRIBE: CommandType.ValueType = ...  # 4
+    PAUSE: CommandType.ValueType = ...  # 5
+    RESUME: CommandType.ValueType = ...  # 6
+    SEEK: CommandType.ValueType = ...  # 7
+    RECORD: CommandType.ValueType = ...  # 8
+    STOP_RECORDING: CommandType.ValueType = ...  # 9
     QUIT: CommandType.ValueType = ...  # 99
+
 class CommandType(_CommandType, metaclass=_CommandTypeEnumTypeWrapper):
     pass
 
 PLAY: CommandType.ValueType = ...  # 0
 STOP: CommandType.ValueType = ...  # 1
 SET_VOLUME: CommandType.ValueType = ...  # 2
+GET_TRACES: CommandType.ValueType = ...  # 3
+SUBSCRIBE: CommandType.ValueType = ...  # 4
+PAUSE: CommandType.ValueType = ...  # 5
+RESUME: CommandType.ValueType = ...  # 6
+SEEK: CommandType.ValueType = ...  # 7
+RECORD: CommandType.ValueType = ...  # 8
+STOP_RECORDING: CommandType.ValueType = ...  # 9
 QUIT: CommandType.ValueType = ...  # 99
 global___CommandType = CommandType
 
+class _ReplyStatus:
+    ValueType = typing.NewType("ValueType", builtins.int)
+    V: typing_extensions.TypeAlias = ValueType
+
+class _ReplyStatusEnumTypeWrapper(
+    google.protobuf.internal.enum_type_wrapper._EnumTypeWrapper[_ReplyStatus.ValueType],
+    builtins.type,
+):
+    DESCRIPTOR: google.protobuf.descriptor.EnumDescriptor = ...
+    OK: ReplyStatus.ValueType = ...  # 0
+    ERROR: ReplyStatus.ValueType = ...  # 1
+
+class ReplyStatus(_ReplyStatus, metaclass=_ReplyStatusEnumTypeWrapper):
+    pass
+
+OK: ReplyStatus.ValueType = ...  # 0
+ERROR: ReplyStatus.ValueType = ...  # 1
+global___ReplyStatus = ReplyStatus
+
+class _PlaybackStatus:
+    ValueType = typing.NewType("ValueType", builtins.int)
+    V: typing_extensions.TypeAlias = ValueType
+
+class _PlaybackStatusEnumTypeWrapper(
+    google.protobuf.internal.enum_type_wrapper._EnumTypeWrapper[
+        _PlaybackStatus.ValueType
+    ],
+    builtins.type,
+):
+    DESCRIPTOR: google.protobuf.descriptor.EnumDescriptor = ...
+    STOPPED: PlaybackStatus.ValueType = ...  # 0
+    OPENING: PlaybackStatus.ValueType = ...  # 1
+    BUFFERING: PlaybackStatus.ValueType = ...  # 2
+    PLAYING: PlaybackStatus.ValueType = ...  # 3
+    FAILED: PlaybackStatus.ValueType = ...  # 4
+    PAUSED: PlaybackStatus.ValueType = ...  # 5
+
+class PlaybackStatus(_PlaybackStatus, metaclass=_PlaybackStatusEnumTypeWrapper):
+    pass
+
+STOPPED: PlaybackStatus.ValueType = ...  # 0
+OPENING: PlaybackStatus.ValueType = ...  # 1
+BUFFERING: PlaybackStatus.ValueType = ...  # 2
+PLAYING: PlaybackStatus.ValueType = ...  # 3
+FAILED: PlaybackStatus.ValueType = ...  # 4
+PAUSED: PlaybackStatus.ValueType = ...  # 5
+global___PlaybackStatus = PlaybackStatus
 
 class Play(google.protobuf.message.Message):
+    """Commands that control the player apply to the zone with the given ID, or to the
+    default (first configured) zone if the ID is unset or empty.
+    """
+
     DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
     TYPE_FIELD_NUMBER: builtins.int
     STATION_FIELD_NUMBER: builtins.int
+    ZONE_FIELD_NUMBER: builtins.int
     type: global___CommandType.ValueType = ...
     station: typing.Text = ...
-    def __init__(self,
+    zone: typing.Text = ...
+    def __init__(
+        self,
         *,
-        type : typing.Optional[global___CommandType.ValueType] = ...,
-        station : typing.Optional[typing.Text] = ...,
-        ) -> None: ...
-    def HasField(self, field_name: typing_extensions.Literal["station",b"station","type",b"type"]) -> builtins.bool: ...
-    def ClearField(self, field_name: typing_extensions.Literal["station",b"station","type",b"type"]) -> None: ...
+        type: typing.Optional[global___CommandType.ValueType] = ...,
+        station: typing.Optional[typing.Text] = ...,
+        zone: typing.Optional[typing.Text] = ...,
+    ) -> None: ...
+    def HasField(
+        self,
+        field_name: typing_extensions.Literal[
+            "station", b"station", "type", b"type", "zone", b"zone"
+        ],
+    ) -> builtins.bool: ...
+    def ClearField(
+        self,
+        field_name: typing_extensions.Literal[
+            "station", b"station", "type", b"type", "zone", b"zone"
+        ],
+    ) -> None: ...
+
 global___Play = Play
 
 class Stop(google.protobuf.message.Message):
     DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
     TYPE_FIELD_NUMBER: builtins.int
+    ZONE_FIELD_NUMBER: builtins.int
     type: global___CommandType.ValueType = ...
-    def __init__(self,
+    zone: typing.Text = ...
+    def __init__(
+        self,
         *,
-        type : typing.Optional[global___CommandType.ValueType] = ...,
-        ) -> None: ...
-    def HasField(self, field_name: typing_extensions.Literal["type",b"type"]) -> builtins.bool: ...
-    def ClearField(self, field_name: typing_extensions.Literal["type",b"type"]) -> None: ...
+        type: typing.Optional[global___CommandType.ValueType] = ...,
+        zone: typing.Optional[typing.Text] = ...,
+    ) -> None: ...
+    def HasField(
+        self, field_name: typing_extensions.Literal["type", b"type", "zone", b"zone"]
+    ) -> builtins.bool: ...
+    def ClearField(
+        self, field_name: typing_extensions.Literal["type", b"type", "zone", b"zone"]
+    ) -> None: ...
+
 global___Stop = Stop
 
 class SetVolume(google.protobuf.message.Message):
     DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
     TYPE_FIELD_NUMBER: builtins.int
     VOLUME_LEVEL_FIELD_NUMBER: builtins.int
+    ZONE_FIELD_NUMBER: builtins.int
     type: global___CommandType.ValueType = ...
     volume_level: builtins.int = ...
-    def __init__(self,
+    zone: typing.Text = ...
+    def __init__(
+        self,
         *,
-        type : typing.Optional[global___CommandType.ValueType] = ...,
-        volume_level : typing.Optional[builtins.int] = ...,
-        ) -> None: ...
-    def HasField(self, field_name: typing_extensions.Literal["type",b"type","volume_level",b"volume_level"]) -> builtins.bool: ...
-    def ClearField(self, field_name: typing_extensions.Literal["type",b"type","volume_level",b"volume_level"]) -> None: ...
+        type: typing.Optional[global___CommandType.ValueType] = ...,
+        volume_level: typing.Optional[builtins.int] = ...,
+        zone: typing.Optional[typing.Text] = ...,
+    ) -> None: ...
+    def HasField(
+        self,
+        field_name: typing_extensions.Literal[
+            "type", b"type", "volume_level", b"volume_level", "zone", b"zone"
+        ],
+    ) -> builtins.bool: ...
+    def ClearField(
+        self,
+        field_name: typing_extensions.Literal[
+            "type", b"type", "volume_level", b"volume_level", "zone", b"zone"
+        ],
+    ) -> None: ...
+
 global___SetVolume = SetVolume
 
+class Pause(google.protobuf.message.Message):
+    """Time-shift commands, available only when the "timeshift" section is configured.
+    Pause keeps buffering the station, so that it can be resumed where it was paused.
+    """
+
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    TYPE_FIELD_NUMBER: builtins.int
+    ZONE_FIELD_NUMBER: builtins.int
+    type: global___CommandType.ValueType = ...
+    zone: typing.Text = ...
+    def __init__(
+        self,
+        *,
+        type: typing.Optional[global___CommandType.ValueType] = ...,
+        zone: typing.Optional[typing.Text] = ...,
+    ) -> None: ...
+    def HasField(
+        self, field_name: typing_extensions.Literal["type", b"type", "zone", b"zone"]
+    ) -> builtins.bool: ...
+    def ClearField(
+        self, field_name: typing_extensions.Literal["type", b"type", "zone", b"zone"]
+    ) -> None: ...
+
+global___Pause = Pause
+
+class Resume(google.protobuf.message.Message):
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    TYPE_FIELD_NUMBER: builtins.int
+    ZONE_FIELD_NUMBER: builtins.int
+    type: global___CommandType.ValueType = ...
+    zone: typing.Text = ...
+    def __init__(
+        self,
+        *,
+        type: typing.Optional[global___CommandType.ValueType] = ...,
+        zone: typing.Optional[typing.Text] = ...,
+    ) -> None: ...
+    def HasField(
+        self, field_name: typing_extensions.Literal["type", b"type", "zone", b"zone"]
+    ) -> builtins.bool: ...
+    def ClearField(
+        self, field_name: typing_extensions.Literal["type", b"type", "zone", b"zone"]
+    ) -> None: ...
+
+global___Resume = Resume
+
+class Seek(google.protobuf.message.Message):
+    """Restarts playback of the active station the given number of seconds behind the
+    live stream, 0 returns to the live stream.
+    """
+
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    TYPE_FIELD_NUMBER: builtins.int
+    DELAY_FIELD_NUMBER: builtins.int
+    ZONE_FIELD_NUMBER: builtins.int
+    type: global___CommandType.ValueType = ...
+    delay: builtins.int = ...
+    zone: typing.Text = ...
+    def __init__(
+        self,
+        *,
+        type: typing.Optional[global___CommandType.ValueType] = ...,
+        delay: typing.Optional[builtins.int] = ...,
+        zone: typing.Optional[typing.Text] = ...,
+    ) -> None: ...
+    def HasField(
+        self,
+        field_name: typing_extensions.Literal[
+            "delay", b"delay", "type", b"type", "zone", b"zone"
+        ],
+    ) -> builtins.bool: ...
+    def ClearField(
+        self,
+        field_name: typing_extensions.Literal[
+            "delay", b"delay", "type", b"type", "zone", b"zone"
+        ],
+    ) -> None: ...
+
+global___Seek = Seek
+
+class Record(google.protobuf.message.Message):
+    """Recorder commands, available only when the "recorder" section is configured.
+    Recording applies to the station, independently of the zones and their playback.
+    """
+
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    TYPE_FIELD_NUMBER: builtins.int
+    STATION_FIELD_NUMBER: builtins.int
+    DURATION_FIELD_NUMBER: builtins.int
+    type: global___CommandType.ValueType = ...
+    station: typing.Text = ...
+    duration: builtins.int = ...
+    """Seconds after which the recording stops, it continues until stopped if unset
+    or 0.
+    """
+
+    def __init__(
+        self,
+        *,
+        type: typing.Optional[global___CommandType.ValueType] = ...,
+        station: typing.Optional[typing.Text] = ...,
+        duration: typing.Optional[builtins.int] = ...,
+    ) -> None: ...
+    def HasField(
+        self,
+        field_name: typing_extensions.Literal[
+            "duration", b"duration", "station", b"station", "type", b"type"
+        ],
+    ) -> builtins.bool: ...
+    def ClearField(
+        self,
+        field_name: typing_extensions.Literal[
+            "duration", b"duration", "station", b"station", "type", b"type"
+        ],
+    ) -> None: ...
+
+global___Record = Record
+
+class StopRecording(google.protobuf.message.Message):
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    TYPE_FIELD_NUMBER: builtins.int
+    STATION_FIELD_NUMBER: builtins.int
+    type: global___CommandType.ValueType = ...
+    station: typing.Text = ...
+    def __init__(
+        self,
+        *,
+        type: typing.Optional[global___CommandType.ValueType] = ...,
+        station: typing.Optional[typing.Text] = ...,
+    ) -> None: ...
+    def HasField(
+        self,
+        field_name: typing_extensions.Literal["station", b"station", "type", b"type"],
+    ) -> builtins.bool: ...
+    def ClearField(
+        self,
+        field_name: typing_extensions.Literal["station", b"station", "type", b"type"],
+    ) -> None: ...
+
+global___StopRecording = StopRecording
+
 class Quit(google.protobuf.message.Message):
     DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
     TYPE_FIELD_NUMBER: builtins.int
     type: global___CommandType.ValueType = ...
-    def __init__(self,
+    def __init__(
+        self,
         *,
-        type : typing.Optional[global___CommandType.ValueType] = ...,
-        ) -> None: ...
-    def HasField(self, field_name: typing_extensions.Literal["type",b"type"]) -> builtins.bool: ...
-    def ClearField(self, field_name: typing_extensions.Literal["type",b"type"]) -> None: ...
+        type: typing.Optional[global___CommandType.ValueType] = ...,
+    ) -> None: ...
+    def HasField(
+        self, field_name: typing_extensions.Literal["type", b"type"]
+    ) -> builtins.bool: ...
+    def ClearField(
+        self, field_name: typing_extensions.Literal["type", b"type"]
+    ) -> None: ...
+
 global___Quit = Quit
 
+class GetTraces(google.protobuf.message.Message):
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    TYPE_FIELD_NUMBER: builtins.int
+    LIMIT_FIELD_NUMBER: builtins.int
+    type: global___CommandType.ValueType = ...
+    limit: builtins.int = ...
+    """Maximum number of returned traces (the most recent ones), all if unset or 0."""
+
+    def __init__(
+        self,
+        *,
+        type: typing.Optional[global___CommandType.ValueType] = ...,
+        limit: typing.Optional[builtins.int] = ...,
+    ) -> None: ...
+    def HasField(
+        self, field_name: typing_extensions.Literal["limit", b"limit", "type", b"type"]
+    ) -> builtins.bool: ...
+    def ClearField(
+        self, field_name: typing_extensions.Literal["limit", b"limit", "type", b"type"]
+    ) -> None: ...
+
+global___GetTraces = GetTraces
+
+class Subscribe(google.protobuf.message.Message):
+    """Turns the connection into a stream of Reply messages, one for every change of the
+    player state, starting with the current state. Available only over the socket.
+    """
+
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    TYPE_FIELD_NUMBER: builtins.int
+    ZONE_FIELD_NUMBER: builtins.int
+    type: global___CommandType.ValueType = ...
+    zone: typing.Text = ...
+    def __init__(
+        self,
+        *,
+        type: typing.Optional[global___CommandType.ValueType] = ...,
+        zone: typing.Optional[typing.Text] = ...,
+    ) -> None: ...
+    def HasField(
+        self, field_name: typing_extensions.Literal["type", b"type", "zone", b"zone"]
+    ) -> builtins.bool: ...
+    def ClearField(
+        self, field_name: typing_extensions.Literal["type", b"type", "zone", b"zone"]
+    ) -> None: ...
+
+global___Subscribe = Subscribe
+
+class Span(google.protobuf.message.Message):
+    """Duration of a single stage of the command processing."""
+
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    STAGE_FIELD_NUMBER: builtins.int
+    START_FIELD_NUMBER: builtins.int
+    DURATION_FIELD_NUMBER: builtins.int
+    stage: typing.Text = ...
+    start: builtins.float = ...
+    """Unix timestamp at which the stage started."""
+
+    duration: builtins.float = ...
+    """Duration of the stage in seconds."""
+
+    def __init__(
+        self,
+        *,
+        stage: typing.Optional[typing.Text] = ...,
+        start: typing.Optional[builtins.float] = ...,
+        duration: typing.Optional[builtins.float] = ...,
+    ) -> None: ...
+    def HasField(
+        self,
+        field_name: typing_extensions.Literal[
+            "duration", b"duration", "stage", b"stage", "start", b"start"
+        ],
+    ) -> builtins.bool: ...
+    def ClearField(
+        self,
+        field_name: typing_extensions.Literal[
+            "duration", b"duration", "stage", b"stage", "start", b"start"
+        ],
+    ) -> None: ...
+
+global___Span = Span
+
 class Command(google.protobuf.message.Message):
     DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
     PLAY_FIELD_NUMBER: builtins.int
     STOP_FIELD_NUMBER: builtins.int
     SET_VOLUME_FIELD_NUMBER: builtins.int
     QUIT_FIELD_NUMBER: builtins.int
+    GET_TRACES_FIELD_NUMBER: builtins.int
+    SUBSCRIBE_FIELD_NUMBER: builtins.int
+    PAUSE_FIELD_NUMBER: builtins.int
+    RESUME_FIELD_NUMBER: builtins.int
+    SEEK_FIELD_NUMBER: builtins.int
+    RECORD_FIELD_NUMBER: builtins.int
+    STOP_RECORDING_FIELD_NUMBER: builtins.int
+    TRACE_ID_FIELD_NUMBER: builtins.int
+    ORIGIN_TIME_FIELD_NUMBER: builtins.int
+    SPANS_FIELD_NUMBER: builtins.int
     @property
     def play(self) -> global___Play: ...
     @property
@@ -98,14 +449,318 @@ class Command(google.protobuf.message.Message):
     def set_volume(self) -> global___SetVolume: ...
     @property
     def quit(self) -> global___Quit: ...
-    def __init__(self,
-        *,
-        play : typing.Optional[global___Play] = ...,
-        stop : typing.Optional[global___Stop] = ...,
-        set_volume : typing.Optional[global___SetVolume] = ...,
-        quit : typing.Optional[global___Quit] = ...,
-        ) -> None: ...
-    def HasField(self, field_name: typing_extensions.Literal["play",b"play","quit",b"quit","set_volume",b"set_volume","stop",b"stop","sub_command",b"sub_command"]) -> builtins.bool: ...
-    def ClearField(self, field_name: typing_extensions.Literal["play",b"play","quit",b"quit","set_volume",b"set_volume","stop",b"stop","sub_command",b"sub_command"]) -> None: ...
-    def WhichOneof(self, oneof_group: typing_extensions.Literal["sub_command",b"sub_command"]) -> typing.Optional[typing_extensions.Literal["play","stop","set_volume","quit"]]: ...
+    @property
+    def get_traces(self) -> global___GetTraces: ...
+    @property
+    def subscribe(self) -> global___Subscribe: ...
+    @property
+    def pause(self) -> global___Pause: ...
+    @property
+    def resume(self) -> global___Resume: ...
+    @property
+    def seek(self) -> global___Seek: ...
+    @property
+    def record(self) -> global___Record: ...
+    @property
+    def stop_recording(self) -> global___StopRecording: ...
+    trace_id: typing.Text = ...
+    """Commands with trace ID are traced, every stage of their processing appends a
+    span that starts where the previous one ended (or at the origin time).
+    """
+
+    origin_time: builtins.float = ...
+    """Unix timestamp at which the client started to handle the request."""
+
+    @property
+    def spans(
+        self,
+    ) -> google.protobuf.internal.containers.RepeatedCompositeFieldContainer[
+        global___Span
+    ]: ...
+    def __init__(
+        self,
+        *,
+        play: typing.Optional[global___Play] = ...,
+        stop: typing.Optional[global___Stop] = ...,
+        set_volume: typing.Optional[global___SetVolume] = ...,
+        quit: typing.Optional[global___Quit] = ...,
+        get_traces: typing.Optional[global___GetTraces] = ...,
+        subscribe: typing.Optional[global___Subscribe] = ...,
+        pause: typing.Optional[global___Pause] = ...,
+        resume: typing.Optional[global___Resume] = ...,
+        seek: typing.Optional[global___Seek] = ...,
+        record: typing.Optional[global___Record] = ...,
+        stop_recording: typing.Optional[global___StopRecording] = ...,
+        trace_id: typing.Optional[typing.Text] = ...,
+        origin_time: typing.Optional[builtins.float] = ...,
+        spans: typing.Optional[typing.Iterable[global___Span]] = ...,
+    ) -> None: ...
+    def HasField(
+        self,
+        field_name: typing_extensions.Literal[
+            "get_traces",
+            b"get_traces",
+            "origin_time",
+            b"origin_time",
+            "pause",
+            b"pause",
+            "play",
+            b"play",
+            "quit",
+            b"quit",
+            "record",
+            b"record",
+            "resume",
+            b"resume",
+            "seek",
+            b"seek",
+            "set_volume",
+            b"set_volume",
+            "stop",
+            b"stop",
+            "stop_recording",
+            b"stop_recording",
+            "sub_command",
+            b"sub_command",
+            "subscribe",
+            b"subscribe",
+            "trace_id",
+            b"trace_id",
+        ],
+    ) -> builtins.bool: ...
+    def ClearField(
+        self,
+        field_name: typing_extensions.Literal[
+            "get_traces",
+            b"get_traces",
+            "origin_time",
+            b"origin_time",
+            "pause",
+            b"pause",
+            "play",
+            b"play",
+            "quit",
+            b"quit",
+            "record",
+            b"record",
+            "resume",
+            b"resume",
+            "seek",
+            b"seek",
+            "set_volume",
+            b"set_volume",
+            "spans",
+            b"spans",
+            "stop",
+            b"stop",
+            "stop_recording",
+            b"stop_recording",
+            "sub_command",
+            b"sub_command",
+            "subscribe",
+            b"subscribe",
+            "trace_id",
+            b"trace_id",
+        ],
+    ) -> None: ...
+    def WhichOneof(
+        self, oneof_group: typing_extensions.Literal["sub_command", b"sub_command"]
+    ) -> typing.Optional[
+        typing_extensions.Literal[
+            "play",
+            "stop",
+            "set_volume",
+            "quit",
+            "get_traces",
+            "subscribe",
+            "pause",
+            "resume",
+            "seek",
+            "record",
+            "stop_recording",
+        ]
+    ]: ...
+
 global___Command = Command
+
+class Trace(google.protobuf.message.Message):
+    """Completed trace of the command."""
+
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    TRACE_ID_FIELD_NUMBER: builtins.int
+    ORIGIN_TIME_FIELD_NUMBER: builtins.int
+    COMMAND_FIELD_NUMBER: builtins.int
+    SPANS_FIELD_NUMBER: builtins.int
+    OUTCOME_FIELD_NUMBER: builtins.int
+    trace_id: typing.Text = ...
+    origin_time: builtins.float = ...
+    command: typing.Text = ...
+    """Human readable description of the command, e.g. "play best_radio"."""
+
+    @property
+    def spans(
+        self,
+    ) -> google.protobuf.internal.containers.RepeatedCompositeFieldContainer[
+        global___Span
+    ]: ...
+    outcome: typing.Text = ...
+    """How the processing ended: "ok", "error", "failed" or "superseded"."""
+
+    def __init__(
+        self,
+        *,
+        trace_id: typing.Optional[typing.Text] = ...,
+        origin_time: typing.Optional[builtins.float] = ...,
+        command: typing.Optional[typing.Text] = ...,
+        spans: typing.Optional[typing.Iterable[global___Span]] = ...,
+        outcome: typing.Optional[typing.Text] = ...,
+    ) -> None: ...
+    def HasField(
+        self,
+        field_name: typing_extensions.Literal[
+            "command",
+            b"command",
+            "origin_time",
+            b"origin_time",
+            "outcome",
+            b"outcome",
+            "trace_id",
+            b"trace_id",
+        ],
+    ) -> builtins.bool: ...
+    def ClearField(
+        self,
+        field_name: typing_extensions.Literal[
+            "command",
+            b"command",
+            "origin_time",
+            b"origin_time",
+            "outcome",
+            b"outcome",
+            "spans",
+            b"spans",
+            "trace_id",
+            b"trace_id",
+        ],
+    ) -> None: ...
+
+global___Trace = Trace
+
+class PlayerState(google.protobuf.message.Message):
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    STATION_FIELD_NUMBER: builtins.int
+    STATUS_FIELD_NUMBER: builtins.int
+    ERROR_FIELD_NUMBER: builtins.int
+    TITLE_FIELD_NUMBER: builtins.int
+    VOLUME_FIELD_NUMBER: builtins.int
+    DELAY_FIELD_NUMBER: builtins.int
+    station: typing.Text = ...
+    """Station that's currently playing. Unset when playback is stopped."""
+
+    status: global___PlaybackStatus.ValueType = ...
+    error: typing.Text = ...
+    """Reason of the FAILED status."""
+
+    title: typing.Text = ...
+    """Now playing title reported by the station, if any."""
+
+    volume: builtins.int = ...
+    """Volume of the player in percent."""
+
+    delay: builtins.int = ...
+    """Seconds by which the time-shifted playback lags behind the live stream."""
+
+    def __init__(
+        self,
+        *,
+        station: typing.Optional[typing.Text] = ...,
+        status: typing.Optional[global___PlaybackStatus.ValueType] = ...,
+        error: typing.Optional[typing.Text] = ...,
+        title: typing.Optional[typing.Text] = ...,
+        volume: typing.Optional[builtins.int] = ...,
+        delay: typing.Optional[builtins.int] = ...,
+    ) -> None: ...
+    def HasField(
+        self,
+        field_name: typing_extensions.Literal[
+            "delay",
+            b"delay",
+            "error",
+            b"error",
+            "station",
+            b"station",
+            "status",
+            b"status",
+            "title",
+            b"title",
+            "volume",
+            b"volume",
+        ],
+    ) -> builtins.bool: ...
+    def ClearField(
+        self,
+        field_name: typing_extensions.Literal[
+            "delay",
+            b"delay",
+            "error",
+            b"error",
+            "station",
+            b"station",
+            "status",
+            b"status",
+            "title",
+            b"title",
+            "volume",
+            b"volume",
+        ],
+    ) -> None: ...
+
+global___PlayerState = PlayerState
+
+class Reply(google.protobuf.message.Message):
+    DESCRIPTOR: google.protobuf.descriptor.Descriptor = ...
+    STATUS_FIELD_NUMBER: builtins.int
+    ERROR_FIELD_NUMBER: builtins.int
+    STATE_FIELD_NUMBER: builtins.int
+    TRACES_FIELD_NUMBER: builtins.int
+    status: global___ReplyStatus.ValueType = ...
+    error: typing.Text = ...
+    @property
+    def state(self) -> global___PlayerState: ...
+    @property
+    def traces(
+        self,
+    ) -> google.protobuf.internal.containers.RepeatedCompositeFieldContainer[
+        global___Trace
+    ]:
+        """Response to the GET_TRACES command, from the oldest trace."""
+        pass
+    def __init__(
+        self,
+        *,
+        status: typing.Optional[global___ReplyStatus.ValueType] = ...,
+        error: typing.Optional[typing.Text] = ...,
+        state: typing.Optional[global___PlayerState] = ...,
+        traces: typing.Optional[typing.Iterable[global___Trace]] = ...,
+    ) -> None: ...
+    def HasField(
+        self,
+        field_name: typing_extensions.Literal[
+            "error", b"error", "state", b"state", "status", b"status"
+        ],
+    ) -> builtins.bool: ...
+    def ClearField(
+        self,
+        field_name: typing_extensions.Literal[
+            "error",
+            b"error",
+            "state",
+            b"state",
+            "status",
+            b"status",
+            "traces",
+            b"traces",
+        ],
+    ) -> None: ...
+
+global___Reply = Reply
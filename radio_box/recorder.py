@@ -0,0 +1,475 @@
+"""Recording of the stations to disk, scheduled or on demand.
+
+With the "recorder" section in the config file, the service records stations into
+files in the recordings directory, e.g. "best_radio/best_radio-20240101-200000.mp3".
+Recordings are started by the RECORD command (optionally limited in duration) or by
+the "schedule" of recurring shows, and stopped by the STOP_RECORDING command.
+
+Stream of the recorded station is taken from the channel of the relay (see
+radio_box.relay), so the recording shares upstream connection with the LAN
+listeners and with the player when the time-shift is enabled. Without the
+time-shift, the player fetches the stream directly and the recording of the
+playing station opens its own upstream connection. The recorder is just
+another listener of the channel that copies the stream into its own buffer. Buffer
+is written into the file in large chunks and synced only once per `sync_interval`,
+all in a single thread dedicated to the recorder. Neither the event loop nor the
+player threads of the Tuner ever wait for the disk.
+
+Recording that falls behind the stream (e.g. when the disk stalls) loses the
+overwritten part of the stream and continues with the live stream. Files are
+rotated when they reach `max_file_size` or `max_file_duration`.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Sequence, Set, Union
+
+from radio_box.config import data_dir
+from radio_box.metrics import REGISTRY
+from radio_box.mirrors import station_urls
+from radio_box.relay import Listener, Relay
+
+# File extensions of the recordings by content type of the stream
+EXTENSIONS = {
+    "audio/mpeg": ".mp3",
+    "audio/aac": ".aac",
+    "audio/aacp": ".aac",
+    "audio/ogg": ".ogg",
+    "application/ogg": ".ogg",
+    "audio/flac": ".flac",
+}
+# Extension of the recordings of streams with unknown content type
+DEFAULT_EXTENSION = ".bin"
+# Seconds to wait before the recording reconnects to the station that failed
+RETRY_DELAY = 5.0
+# Days of the week in the schedule, in the order of `datetime.weekday()`
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+RECORDED_BYTES = REGISTRY.counter(
+    "radio_box_recorded_bytes_total",
+    "Bytes of the stations written into the recordings.",
+    ["station"],
+)
+RECORDING_GAPS = REGISTRY.counter(
+    "radio_box_recording_gaps_total",
+    "Parts of the stream lost by the recordings that fell behind or disconnected.",
+    ["station"],
+)
+
+
+class RecorderOptions(NamedTuple):
+    """Settings of the recorder.
+
+    Values can be overridden in the "recorder" section of the config file.
+    """
+
+    directory: str = os.path.join(data_dir(), "recordings")
+    # Bytes of the stream collected in memory before they are written to the file
+    chunk_size: int = 1024 * 1024
+    # Seconds between syncs of the file to the disk, collected stream is written at
+    # least this often
+    sync_interval: float = 30.0
+    # Recording continues in a new file after the file reaches this size in bytes
+    # or duration in seconds, 0 disables the limit
+    max_file_size: int = 0
+    max_file_duration: float = 3600.0
+    # Recurring recordings, see ScheduledRecording
+    schedule: Sequence[dict] = ()
+
+
+class ScheduledRecording(NamedTuple):
+    """Recurring recording of a show, an item of the "schedule" of the recorder."""
+
+    station: str
+    # Local time at which the show starts, "HH:MM"
+    start: str
+    minutes: float
+    # Days of the week on which the show is recorded ("mon" to "sun"), every day if
+    # empty
+    days: Sequence[str] = ()
+
+    def next_start(self, after: datetime) -> datetime:
+        """Return the first start of the show later than the given time.
+
+        :param after: Local time after which the show starts.
+        """
+        hour, minute = (int(part) for part in self.start.split(":"))
+        starts = (
+            (after + timedelta(days=offset)).replace(
+                hour=hour, minute=minute, second=0, microsecond=0
+            )
+            for offset in range(len(WEEKDAYS) + 1)
+        )
+        return next(
+            start
+            for start in starts
+            if start > after
+            and (not self.days or WEEKDAYS[start.weekday()] in self.days)
+        )
+
+
+def parse_schedule(schedule: Sequence[dict]) -> List[ScheduledRecording]:
+    """Validate items of the schedule from the config file.
+
+    :param schedule: Items of the "schedule" of the recorder.
+    :raises ValueError: If an item of the schedule is invalid.
+    """
+    recordings = []
+    for item in schedule:
+        try:
+            recording = ScheduledRecording(**item)
+            hour, minute = (int(part) for part in recording.start.split(":"))
+        except (TypeError, ValueError) as exc:
+            raise ValueError(f"Invalid scheduled recording {item}: {exc}") from exc
+        valid = (
+            0 <= hour < 24
+            and 0 <= minute < 60
+            and recording.minutes > 0
+            and set(recording.days) <= set(WEEKDAYS)
+        )
+        if not valid:
+            raise ValueError(f"Invalid scheduled recording {item}.")
+        recordings.append(recording)
+    return recordings
+
+
+def file_extension(content_type: str) -> str:
+    """Return extension of the recordings of the stream with the content type.
+
+    :param content_type: Content type of the stream, parameters are ignored.
+    """
+    mime_type = content_type.split(";")[0].strip().lower()
+    return EXTENSIONS.get(mime_type, DEFAULT_EXTENSION)
+
+
+class RecordingFiles:  # pylint: disable=too-many-instance-attributes
+    """Files of a single recording, rotated by size or duration.
+
+    Methods block on the disk, they are called only from the recorder thread.
+    """
+
+    def __init__(
+        self, directory: Path, station_id: str, options: RecorderOptions
+    ) -> None:
+        """Initialize files, the first one is created with the first data.
+
+        :param directory: Directory of the station's recordings.
+        :param station_id: ID of the recorded station.
+        :param options: Settings of the recorder.
+        """
+        self.directory = directory
+        self.station_id = station_id
+        self.options = options
+        self.file: Optional[BinaryIO] = None
+        self.path: Optional[Path] = None
+        # Bytes written into the current file, monotonic times at which it was
+        # opened and last synced
+        self.size = 0
+        self.opened = 0.0
+        self.synced = 0.0
+
+    def _open(self, extension: str) -> BinaryIO:
+        """Create new file named after the station and the current time."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"{file_name(self.station_id)}-{time.strftime('%Y%m%d-%H%M%S')}"
+        path = self.directory / f"{name}{extension}"
+        suffix = 1
+        while path.exists():
+            path = self.directory / f"{name}-{suffix}{extension}"
+            suffix += 1
+        print(f"Recording {self.station_id} into {path}.")
+        # Data come in large chunks already, they are not buffered again
+        file = open(path, "xb", buffering=0)  # pylint: disable=consider-using-with
+        self.file, self.path, self.size = file, path, 0
+        self.opened = self.synced = time.monotonic()
+        return file
+
+    def _full(self) -> bool:
+        """Check whether the current file reached its size or duration."""
+        max_size = self.options.max_file_size
+        max_duration = self.options.max_file_duration
+        return bool(
+            (max_size and self.size >= max_size)
+            or (max_duration and time.monotonic() - self.opened >= max_duration)
+        )
+
+    def write(self, data: Union[bytes, bytearray], extension: str) -> None:
+        """Append data to the current file, rotate the file first if it's full.
+
+        File is synced to the disk when its last sync is older than the sync
+        interval.
+
+        :param data: Data of the stream.
+        :param extension: Extension of the file, used when new file is created.
+        """
+        if self.file is not None and self._full():
+            self.close()
+        file = self.file or self._open(extension)
+        file.write(data)
+        self.size += len(data)
+        if time.monotonic() - self.synced >= self.options.sync_interval:
+            os.fsync(file.fileno())
+            self.synced = time.monotonic()
+
+    def close(self) -> None:
+        """Sync and close the current file, if there's any."""
+        if self.file is None:
+            return
+        os.fsync(self.file.fileno())
+        self.file.close()
+        self.file = None
+        print(f"Recorded {self.path} ({self.size} bytes).")
+
+
+def file_name(station_id: str) -> str:
+    """Return station ID usable as a name of a file.
+
+    :param station_id: ID of the station.
+    """
+    return station_id.replace(os.sep, "_").lstrip(".") or "_"
+
+
+class RecordingWriter:
+    """Collects stream of a recording in memory and writes it in large chunks.
+
+    Chunk is written in the recorder thread while the next one is being collected.
+    Collecting waits only when the next chunk is full before the previous one was
+    written, i.e. when the disk can't keep up with the stream.
+    """
+
+    def __init__(self, files: RecordingFiles, executor: ThreadPoolExecutor) -> None:
+        """Initialize writer.
+
+        :param files: Files of the recording.
+        :param executor: Executor of the recorder thread.
+        """
+        self.files = files
+        self.executor = executor
+        self.loop = asyncio.get_running_loop()
+        self.extension = DEFAULT_EXTENSION
+        self.buffer = bytearray()
+        self.pending: Optional["asyncio.Future[None]"] = None
+        # Loop time at which the last chunk was handed over to the recorder thread
+        self.flushed = self.loop.time()
+
+    async def write(self, data: memoryview) -> None:
+        """Collect the data, hand the collected chunk over when it's large enough.
+
+        Chunk is handed over at least once per sync interval, so that the files
+        are complete up to the last sync.
+
+        :param data: Data of the stream, copied before the method returns.
+        """
+        self.buffer += data
+        options = self.files.options
+        if (
+            len(self.buffer) >= options.chunk_size
+            or self.loop.time() - self.flushed >= options.sync_interval
+        ):
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Hand the collected chunk over to the recorder thread.
+
+        :raises OSError: If the previous chunk could not be written.
+        """
+        if self.pending:
+            await self.pending
+            self.pending = None
+        if self.buffer:
+            data, self.buffer = self.buffer, bytearray()
+            self.pending = self.loop.run_in_executor(
+                self.executor, self.files.write, data, self.extension
+            )
+            RECORDED_BYTES.inc(len(data), station=self.files.station_id)
+        self.flushed = self.loop.time()
+
+    async def close(self) -> None:
+        """Write the rest of the stream and close the file.
+
+        :raises OSError: If the stream could not be written.
+        """
+        try:
+            await self.flush()
+            if self.pending:
+                await self.pending
+        finally:
+            await self.loop.run_in_executor(self.executor, self.files.close)
+
+
+class RecordingListener(Listener):
+    """Listener of the channel that records the stream."""
+
+    def __init__(self, writer: RecordingWriter, position: int) -> None:
+        """Initialize listener.
+
+        :param writer: Writer of the recording.
+        :param position: Position of the first recorded byte.
+        """
+        super().__init__(position)
+        self.writer = writer
+
+    async def send(self, chunk: memoryview) -> None:
+        """Copy chunk of the stream into the recording.
+
+        :param chunk: Slice of the buffer, valid until the buffer wraps.
+        """
+        await self.writer.write(chunk)
+
+    def abort(self) -> None:
+        """Recording continues with the live stream, see Recorder.record()."""
+
+
+class Recorder:
+    """Records the stations to disk, scheduled or on demand.
+
+    All files are written by a single thread of the recorder, so that the writes
+    don't compete with the player threads and with each other.
+    """
+
+    def __init__(self, relay: Relay, options: Optional[RecorderOptions] = None) -> None:
+        """Initialize recorder.
+
+        :param relay: Relay whose channels provide the recorded streams.
+        :param options: Settings of the recorder, default values are used if omitted.
+        :raises ValueError: If the schedule is invalid.
+        """
+        self.relay = relay
+        self.options = options or RecorderOptions()
+        self.schedule = parse_schedule(self.options.schedule)
+        self.directory = Path(self.options.directory)
+        # Active recordings by ID of the station, and all tasks that did not finish
+        # yet, including the stopped recordings that are still closing their files
+        self.recordings: Dict[str, asyncio.Future] = {}
+        self.tasks: Set[asyncio.Future] = set()
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="recorder")
+
+    def start(self, station_id: str, duration: float = 0.0) -> None:
+        """Start recording the station.
+
+        :param station_id: ID of the station.
+        :param duration: Seconds after which the recording stops, 0 for no limit.
+        :raises ValueError: If the station is unknown or it's already recorded.
+        """
+        if not station_urls(self.relay.stations.get(station_id, {})):
+            raise ValueError(f"Unknown station {station_id}.")
+        if station_id in self.recordings:
+            raise ValueError(f"Station {station_id} is already being recorded.")
+        task = asyncio.ensure_future(self.record(station_id))
+        self.recordings[station_id] = task
+        self.tasks.add(task)
+        task.add_done_callback(lambda _: self._finished(station_id, task))
+        if duration:
+            timer = asyncio.get_running_loop().call_later(duration, task.cancel)
+            task.add_done_callback(lambda _: timer.cancel())
+
+    def stop(self, station_id: str) -> None:
+        """Stop recording the station, the file is closed in the background.
+
+        :param station_id: ID of the station.
+        :raises ValueError: If the station is not being recorded.
+        """
+        task = self.recordings.pop(station_id, None)
+        if task is None:
+            raise ValueError(f"Station {station_id} is not being recorded.")
+        task.cancel()
+
+    def _finished(self, station_id: str, task: asyncio.Future) -> None:
+        """Forget the finished recording."""
+        self.tasks.discard(task)
+        if self.recordings.get(station_id) is task:
+            del self.recordings[station_id]
+
+    async def record(self, station_id: str) -> None:
+        """Record the station until the task is cancelled.
+
+        :param station_id: ID of the station.
+        """
+        files = RecordingFiles(
+            self.directory / file_name(station_id), station_id, self.options
+        )
+        writer = RecordingWriter(files, self.executor)
+        try:
+            try:
+                await self._record_stream(station_id, writer)
+            finally:
+                await writer.close()
+        except OSError as exc:
+            print(f"Recording of {station_id} failed: {exc!r}")
+
+    async def _record_stream(self, station_id: str, writer: RecordingWriter) -> None:
+        """Pass the stream of the station to the writer until cancelled.
+
+        Recording that fell behind the stream continues with the live stream,
+        recording of the station that failed is restarted after a while.
+        """
+        while True:
+            if not station_urls(self.relay.stations.get(station_id, {})):
+                print(f"Recording of {station_id} stopped, the station was removed.")
+                return
+            channel = self.relay.channel(station_id)
+            listener = RecordingListener(writer, channel.start_position())
+            channel.attach(listener)
+            try:
+                while True:
+                    content_type = await asyncio.shield(channel.ready)
+                    if content_type:
+                        writer.extension = file_extension(content_type)
+                        await channel.stream(listener)
+                    RECORDING_GAPS.inc(station=station_id)
+                    if listener.dropped:
+                        print(f"Recording of {station_id} fell behind the stream.")
+                    if not listener.dropped or channel.closed:
+                        break
+                    # New listener is attached before the dropped one is removed,
+                    # otherwise the channel would close with its last listener
+                    dropped = listener
+                    listener = RecordingListener(writer, channel.start_position())
+                    channel.attach(listener)
+                    channel.remove(dropped)
+            finally:
+                channel.remove(listener)
+            if not listener.dropped:
+                await asyncio.sleep(RETRY_DELAY)
+
+    async def repeat(self, show: ScheduledRecording) -> None:
+        """Record the scheduled show until cancelled.
+
+        Show that is already on air when the recorder starts is recorded right away.
+
+        :param show: Scheduled recording.
+        """
+        duration = timedelta(minutes=show.minutes)
+        after = datetime.now() - duration
+        while True:
+            start = show.next_start(after)
+            wait = (start - datetime.now()).total_seconds()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            after = start
+            remaining = (start + duration - datetime.now()).total_seconds()
+            try:
+                # Show might have ended while the loop was busy
+                if remaining > 0:
+                    self.start(show.station, remaining)
+            except ValueError as exc:
+                print(f"Scheduled recording skipped: {exc}")
+
+    async def run(self) -> None:
+        """Run the schedule until cancelled, then stop all recordings."""
+        try:
+            if self.schedule:
+                await asyncio.gather(*(self.repeat(show) for show in self.schedule))
+            else:
+                # Recordings are started only on demand
+                await asyncio.Event().wait()
+        finally:
+            tasks = list(self.tasks)
+            self.recordings.clear()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.executor.shutdown()
@@ -0,0 +1,596 @@
+"""LAN relay that re-serves streams of the stations to other players over HTTP.
+
+When several boxes in the same network play the same station, each of them fetches
+the stream over the uplink. With the "relay" section in the config file, the service
+also listens for HTTP requests of "/<station ID>" and fetches the upstream of each
+requested station only once, no matter how many listeners it has. Other radio-box
+nodes (or any other player) point the "url" of the station at the relay, e.g.
+"http://living-room.local:8001/best_radio".
+
+Upstream data are written into a ring buffer of the station's channel. Listeners
+read the buffer at their own pace as memoryview slices, so the stream is not copied
+for every listener. Listener that falls behind by more than the buffer holds is
+disconnected instead of buffering the stream for it without limit, players reconnect
+on their own. Upstream is closed when its last listener disconnects (or a while
+later, see RelayOptions.linger).
+
+Listener can also request the stream "?delay=<seconds>" behind the live edge, which
+is how the time-shift (see radio_box.timeshift) plays from the buffer. Recorder (see
+radio_box.recorder) reads the buffer as a listener of its own, without HTTP.
+"""
+import abc
+import asyncio
+import mmap
+import ssl
+import tempfile
+from http import HTTPStatus
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple, Union
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from radio_box.metrics import REGISTRY
+from radio_box.mirrors import MirrorStats, station_urls
+from radio_box.prober import check_status, http_request
+from radio_box.resolver import StreamResolver
+
+# Size of the chunks read from the upstream and sent to the listeners
+READ_SIZE = 16 * 1024
+# Limit of a single line of the request head, longer lines are rejected
+MAX_LINE_SIZE = 8 * 1024
+MAX_HEADERS = 100
+# Content type of streams whose upstream does not announce it
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+# Query parameter with the seconds by which the listener lags behind the upstream
+DELAY_PARAMETER = "delay"
+
+RELAY_UPSTREAMS = REGISTRY.counter(
+    "radio_box_relay_upstreams_total",
+    "Upstream connections opened by the relay.",
+    ["station", "result"],
+)
+RELAY_LISTENERS = REGISTRY.counter(
+    "radio_box_relay_listeners_total",
+    "Listeners served by the relay.",
+    ["station"],
+)
+RELAY_DROPPED = REGISTRY.counter(
+    "radio_box_relay_dropped_listeners_total",
+    "Relay listeners disconnected because they fell behind the stream.",
+    ["station"],
+)
+
+
+class RelayOptions(NamedTuple):
+    """Settings of the LAN relay.
+
+    Values can be overridden in the "relay" section of the config file.
+    """
+
+    host: str = "0.0.0.0"
+    port: int = 8001
+    # Bytes of the stream buffered for each relayed station, listeners can fall
+    # behind the upstream by this much before they are disconnected
+    buffer_size: int = 1024 * 1024
+    # Bytes of the buffered stream sent to a new listener right away, so that its
+    # player does not wait for the upstream to fill its buffer
+    burst_size: int = 64 * 1024
+    # Seconds to wait for the upstream connection and its data
+    timeout: float = 10.0
+    # Directory for the memory-mapped files that back the buffers (empty for the
+    # default temporary directory), buffers are allocated in RAM if unset
+    buffer_dir: Optional[str] = None
+    # Seconds for which the upstream is kept open after its last listener
+    # disconnects, so that a listener that reconnects finds the buffer intact
+    linger: float = 0.0
+
+
+class RingBuffer:
+    """Fixed-size buffer with the most recent data of the stream.
+
+    Positions are absolute offsets in the stream, the buffer holds data between
+    `start` and `end`.
+    """
+
+    def __init__(self, capacity: int, directory: Optional[str] = None) -> None:
+        """Initialize empty buffer.
+
+        Large buffers can be backed by a file, kernel then writes their pages back
+        to the disk instead of keeping the whole buffer in memory of the process.
+        The file is unlinked right away, it's removed once the buffer is released.
+
+        :param capacity: Size of the buffer in bytes.
+        :param directory: Directory of the file that backs the buffer, empty for the
+            default temporary directory. Buffer is allocated in RAM if omitted.
+        """
+        self.capacity = capacity
+        self.end = 0
+        buffer: Union[bytearray, mmap.mmap]
+        if directory is None:
+            buffer = bytearray(capacity)
+        else:
+            with tempfile.TemporaryFile(dir=directory or None) as file:
+                file.truncate(capacity)
+                buffer = mmap.mmap(file.fileno(), capacity)
+        self._view = memoryview(buffer)
+
+    @property
+    def start(self) -> int:
+        """Position of the oldest byte that's still in the buffer."""
+        return max(0, self.end - self.capacity)
+
+    def write(self, data: bytes) -> None:
+        """Append data to the buffer, overwriting the oldest data.
+
+        :param data: Data of the stream.
+        """
+        view = memoryview(data)
+        if len(view) > self.capacity:
+            # Only the tail of the data would remain in the buffer
+            self.end += len(view) - self.capacity
+            view = view[slice(len(view) - self.capacity, None)]
+        offset = self.end % self.capacity
+        first = min(len(view), self.capacity - offset)
+        self._view[slice(offset, offset + first)] = view[slice(first)]
+        self._view[slice(len(view) - first)] = view[slice(first, None)]
+        self.end += len(view)
+
+    def read(self, position: int, size: int) -> memoryview:
+        """Return up to `size` bytes of the stream from the position, without copying.
+
+        Slice ends at the end of the data or at the end of the buffer, whichever
+        comes first. It's valid until the data are overwritten by further writes.
+
+        :param position: Position of the first byte.
+        :param size: Maximum number of bytes.
+        :raises IndexError: If the position is not in the buffer.
+        """
+        if not self.start <= position <= self.end:
+            raise IndexError(f"position {position} is not in the buffer")
+        offset = position % self.capacity
+        length = min(size, self.end - position, self.capacity - offset)
+        return self._view[slice(offset, offset + length)]
+
+
+class Listener(abc.ABC):
+    """Consumer of the stream of a single station, e.g. client of the relay."""
+
+    def __init__(self, position: int) -> None:
+        """Initialize listener.
+
+        :param position: Position of the first byte sent to the listener.
+        """
+        # Next byte to send
+        self.position = position
+        # All data before this position were consumed, data after it may still be
+        # referenced by the listener (e.g. by the write buffer of the connection)
+        self.flushed = position
+        self.wakeup = asyncio.Event()
+        self.dropped = False
+
+    @abc.abstractmethod
+    async def send(self, chunk: memoryview) -> None:
+        """Consume chunk of the stream, return when it's no longer referenced.
+
+        :param chunk: Slice of the buffer, valid until the buffer wraps.
+        """
+
+    @abc.abstractmethod
+    def abort(self) -> None:
+        """Stop the listener that fell behind the stream, its data are gone."""
+
+
+class ClientListener(Listener):
+    """Client of the relay that receives the stream over HTTP connection."""
+
+    def __init__(self, writer: asyncio.StreamWriter, position: int) -> None:
+        """Initialize listener.
+
+        :param writer: Outgoing stream of the client connection.
+        :param position: Position of the first byte sent to the client.
+        """
+        super().__init__(position)
+        self.writer = writer
+
+    async def send(self, chunk: memoryview) -> None:
+        """Send chunk of the stream, return when it was passed to the socket.
+
+        :param chunk: Slice of the buffer, valid until the buffer wraps.
+        """
+        self.writer.write(chunk)
+        await self.writer.drain()
+
+    def abort(self) -> None:
+        """Disconnect the client, its write buffer with the stale slices is dropped."""
+        self.writer.transport.abort()
+
+
+async def read_request(
+    reader: asyncio.StreamReader,
+) -> Tuple[str, str, Dict[str, List[str]]]:
+    """Read head of the HTTP request, return its method, path and query parameters.
+
+    :param reader: Incoming stream of the client connection.
+    :raises ValueError: If the request is invalid.
+    :raises asyncio.LimitOverrunError: If a line of the request is too long.
+    :raises asyncio.IncompleteReadError: If the client disconnects.
+    """
+    request_line = await reader.readuntil(b"\n")
+    for _ in range(MAX_HEADERS + 1):
+        if await reader.readuntil(b"\n") in (b"\r\n", b"\n"):
+            break
+    else:
+        raise ValueError("too many headers")
+    parts = request_line.decode("latin-1").split()
+    if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+        raise ValueError("invalid request line")
+    target = urlsplit(parts[1])
+    return parts[0], unquote(target.path), parse_qs(target.query)
+
+
+def requested_delay(query: Dict[str, List[str]]) -> float:
+    """Return seconds by which the listener wants to lag behind the upstream.
+
+    :param query: Query parameters of the request.
+    :raises ValueError: If the delay is not a non-negative number.
+    """
+    delay = float(query.get(DELAY_PARAMETER, ["0"])[0])
+    if not 0 <= delay < float("inf"):
+        raise ValueError(f"invalid delay {delay}")
+    return delay
+
+
+def response_head(status: HTTPStatus, content_type: str) -> bytes:
+    """Format head of the response, connection is closed after every response.
+
+    :param status: Status of the response.
+    :param content_type: Content type of the response body.
+    """
+    return (
+        f"HTTP/1.0 {status.value} {status.phrase}\r\nContent-Type: {content_type}\r\n"
+        "Cache-Control: no-cache\r\nConnection: close\r\n\r\n"
+    ).encode("latin-1")
+
+
+def error_response(status: HTTPStatus) -> bytes:
+    """Format complete response with the error status.
+
+    :param status: Status of the response.
+    """
+    return response_head(status, "text/plain") + status.phrase.encode()
+
+
+async def open_stream(
+    url: str,
+) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter, str]:
+    """Request the stream and read head of the response.
+
+    Redirects are not followed, they are resolved by the StreamResolver.
+
+    :param url: HTTP(S) URL of the stream.
+    :return: Streams of the connection positioned at the start of the stream data,
+        and content type of the stream.
+    :raises ValueError: If the URL is not supported or the server refuses it.
+    :raises OSError: If the connection fails.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https"):
+        raise ValueError(f"unsupported URL {url}")
+    https = parts.scheme == "https"
+    reader, writer = await asyncio.open_connection(
+        parts.hostname,
+        parts.port or (443 if https else 80),
+        ssl=ssl.create_default_context() if https else None,
+        limit=MAX_LINE_SIZE,
+    )
+    try:
+        writer.write(http_request(url))
+        status = check_status(await reader.readline())
+        if status >= 300:
+            raise ValueError(f"server responded {status}")
+        content_type = DEFAULT_CONTENT_TYPE
+        for _ in range(MAX_HEADERS + 1):
+            line = (await reader.readline()).decode("latin-1")
+            if not line.strip():
+                break
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-type":
+                content_type = value.strip()
+    except BaseException:
+        writer.close()
+        raise
+    return reader, writer, content_type
+
+
+class Channel:  # pylint: disable=too-many-instance-attributes
+    """Single upstream connection of the station, shared by all its listeners."""
+
+    def __init__(
+        self,
+        station_id: str,
+        urls: List[str],
+        options: RelayOptions,
+        mirrors: MirrorStats,
+        resolver: Optional[StreamResolver] = None,
+    ) -> None:
+        """Initialize channel, upstream is opened by the `run()` method.
+
+        :param station_id: ID of the relayed station.
+        :param urls: Mirrors of the station.
+        :param options: Settings of the relay.
+        :param mirrors: Statistics used to choose the mirror.
+        :param resolver: Optional resolver of the stream URLs.
+        """
+        self.station_id = station_id
+        self.urls = urls
+        self.options = options
+        self.mirrors = mirrors
+        self.resolver = resolver
+        self.ring = RingBuffer(options.buffer_size, options.buffer_dir)
+        self.listeners: Set[Listener] = set()
+        self.loop = asyncio.get_running_loop()
+        # Content type of the stream, empty if the upstream could not be opened
+        self.ready: "asyncio.Future[str]" = self.loop.create_future()
+        # Loop time at which the upstream was opened
+        self.started: Optional[float] = None
+        self.closed = False
+        self.task: Optional[asyncio.Future] = None
+        # Closes the upstream that lingers without listeners
+        self.linger_timer: Optional[asyncio.TimerHandle] = None
+
+    def delayed_position(self, delay: float) -> int:
+        """Return position in the buffer that lags behind the upstream by the delay.
+
+        Delay is converted to bytes by the average byte rate of the upstream. The
+        oldest position in the buffer is returned if the buffer does not reach that
+        far back.
+
+        :param delay: Seconds behind the upstream.
+        """
+        elapsed = self.loop.time() - self.started if self.started is not None else 0
+        rate = self.ring.end / elapsed if elapsed > 0 else 0
+        return max(self.ring.start, self.ring.end - int(delay * rate))
+
+    def start_position(self, delay: float = 0.0) -> int:
+        """Return position at which a new listener starts.
+
+        Listener of the live stream starts with the burst of the buffered stream,
+        so that its player fills its buffer right away.
+
+        :param delay: Seconds by which the listener lags behind the upstream.
+        """
+        if delay:
+            return self.delayed_position(delay)
+        return max(self.ring.start, self.ring.end - self.options.burst_size)
+
+    def attach(self, listener: Listener) -> None:
+        """Register the listener, it receives the stream from its position.
+
+        :param listener: Listener positioned within the buffer.
+        """
+        if self.linger_timer:
+            self.linger_timer.cancel()
+            self.linger_timer = None
+        self.listeners.add(listener)
+        RELAY_LISTENERS.inc(station=self.station_id)
+
+    def add(self, writer: asyncio.StreamWriter, delay: float = 0.0) -> ClientListener:
+        """Register new listener of the client connection.
+
+        :param writer: Outgoing stream of the client connection.
+        :param delay: Seconds by which the listener lags behind the upstream.
+        """
+        # Drain waits until everything is sent, so `flushed` is exact
+        writer.transport.set_write_buffer_limits(0)
+        listener = ClientListener(writer, self.start_position(delay))
+        self.attach(listener)
+        return listener
+
+    def remove(self, listener: Listener) -> None:
+        """Unregister the listener, upstream is closed with the last one.
+
+        :param listener: Listener returned by the `add()` method.
+        """
+        self.listeners.discard(listener)
+        if self.listeners or not self.task:
+            return
+        if self.options.linger:
+            self.linger_timer = self.loop.call_later(self.options.linger, self._idle)
+        else:
+            self.task.cancel()
+
+    def _idle(self) -> None:
+        """Close the upstream that lingered without listeners."""
+        self.linger_timer = None
+        if not self.listeners and self.task:
+            self.task.cancel()
+
+    def publish(self, data: bytes) -> None:
+        """Append upstream data to the buffer and wake up the listeners.
+
+        Listeners whose unsent data would be overwritten are disconnected.
+
+        :param data: Data of the stream.
+        """
+        overwritten = self.ring.end + len(data) - self.ring.capacity
+        for listener in list(self.listeners):
+            if listener.flushed < overwritten:
+                RELAY_DROPPED.inc(station=self.station_id)
+                listener.abort()
+                listener.dropped = True
+                listener.wakeup.set()
+                self.listeners.discard(listener)
+        self.ring.write(data)
+        for listener in self.listeners:
+            listener.wakeup.set()
+
+    async def connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter, str]:
+        """Open the stream on the first working mirror, by preference.
+
+        :raises ConnectionError: If none of the mirrors works.
+        """
+        loop = asyncio.get_running_loop()
+        for url in self.mirrors.order(self.urls):
+            stream_url = url
+            if self.resolver:
+                stream_url = await loop.run_in_executor(
+                    None, self.resolver.resolve, url
+                )
+            try:
+                stream = await asyncio.wait_for(
+                    open_stream(stream_url), self.options.timeout
+                )
+            except (OSError, ValueError, asyncio.TimeoutError) as exc:
+                print(f"Relay of {self.station_id} failed to open {url}: {exc!r}")
+                RELAY_UPSTREAMS.inc(station=self.station_id, result="error")
+                self.mirrors.record_failure(url)
+                continue
+            RELAY_UPSTREAMS.inc(station=self.station_id, result="ok")
+            return stream
+        raise ConnectionError(f"no working mirror of {self.station_id}")
+
+    async def run(self) -> None:
+        """Fetch the upstream until it ends or its last listener disconnects."""
+        writer = None
+        try:
+            reader, writer, content_type = await self.connect()
+            self.started = self.loop.time()
+            self.ready.set_result(content_type)
+            while True:
+                data = await asyncio.wait_for(
+                    reader.read(READ_SIZE), self.options.timeout
+                )
+                if not data:
+                    break
+                self.publish(data)
+        except (OSError, asyncio.TimeoutError) as exc:
+            print(f"Relay of {self.station_id} stopped: {exc!r}")
+        finally:
+            self.closed = True
+            if self.linger_timer:
+                self.linger_timer.cancel()
+            if not self.ready.done():
+                self.ready.set_result("")
+            if writer is not None:
+                writer.close()
+            for listener in self.listeners:
+                listener.wakeup.set()
+
+    async def stream(self, listener: Listener) -> None:
+        """Send the stream to the listener until it's dropped or the upstream ends.
+
+        :param listener: Listener returned by the `add()` method.
+        """
+        while not listener.dropped:
+            if listener.position < self.ring.end:
+                chunk = self.ring.read(listener.position, READ_SIZE)
+                listener.position += len(chunk)
+                await listener.send(chunk)
+                listener.flushed = listener.position
+            elif self.closed:
+                return
+            else:
+                listener.wakeup.clear()
+                await listener.wakeup.wait()
+
+
+class Relay:
+    """HTTP server that relays streams of the stations to the LAN."""
+
+    def __init__(
+        self,
+        stations: Dict[str, dict],
+        options: Optional[RelayOptions] = None,
+        resolver: Optional[StreamResolver] = None,
+        mirrors: Optional[MirrorStats] = None,
+    ) -> None:
+        """Initialize relay, upstreams are opened on demand.
+
+        :param stations: Configuration of the stations that can be relayed.
+        :param options: Settings of the relay, default values are used if omitted.
+        :param resolver: Optional resolver of the stream URLs.
+        :param mirrors: Statistics used to choose mirrors, shared with the player.
+        """
+        self.stations = stations
+        self.options = options or RelayOptions()
+        self.resolver = resolver
+        self.mirrors = mirrors or MirrorStats()
+        self.channels: Dict[str, Channel] = {}
+
+    def channel(self, station_id: str) -> Channel:
+        """Return channel of the station, open new one if there's none.
+
+        :param station_id: ID of the station.
+        """
+        channel = self.channels.get(station_id)
+        if channel is None or channel.closed:
+            channel = Channel(
+                station_id,
+                station_urls(self.stations[station_id]),
+                self.options,
+                self.mirrors,
+                self.resolver,
+            )
+            channel.task = asyncio.ensure_future(channel.run())
+            channel.task.add_done_callback(lambda _: self._closed(channel))
+            self.channels[station_id] = channel
+        return channel
+
+    def _closed(self, channel: Channel) -> None:
+        """Forget the channel whose upstream was closed."""
+        if self.channels.get(channel.station_id) is channel:
+            del self.channels[channel.station_id]
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve the stream requested by a single client connection.
+
+        :param reader: Incoming stream of the connection.
+        :param writer: Outgoing stream of the connection.
+        """
+        try:
+            method, path, query = await asyncio.wait_for(
+                read_request(reader), self.options.timeout
+            )
+            station_id = path.strip("/")
+            if method != "GET":
+                writer.write(error_response(HTTPStatus.METHOD_NOT_ALLOWED))
+            elif not station_urls(self.stations.get(station_id, {})):
+                writer.write(error_response(HTTPStatus.NOT_FOUND))
+            else:
+                await self.relay(station_id, writer, requested_delay(query))
+        except (ValueError, asyncio.LimitOverrunError):
+            writer.write(error_response(HTTPStatus.BAD_REQUEST))
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    async def relay(
+        self, station_id: str, writer: asyncio.StreamWriter, delay: float = 0.0
+    ) -> None:
+        """Stream the station to the client.
+
+        :param station_id: ID of the station.
+        :param writer: Outgoing stream of the client connection.
+        :param delay: Seconds by which the client lags behind the upstream.
+        """
+        channel = self.channel(station_id)
+        listener = channel.add(writer, delay)
+        try:
+            content_type = await asyncio.shield(channel.ready)
+            if not content_type:
+                writer.write(error_response(HTTPStatus.BAD_GATEWAY))
+                return
+            writer.write(response_head(HTTPStatus.OK, content_type))
+            await channel.stream(listener)
+        finally:
+            channel.remove(listener)
+
+    async def serve(self) -> None:
+        """Accept connections until the task is cancelled."""
+        server = await asyncio.start_server(
+            self.handle, self.options.host, self.options.port, limit=MAX_LINE_SIZE
+        )
+        async with server:
+            print(f"Relaying stations on {self.options.host}:{self.options.port}.")
+            await server.serve_forever()
@@ -0,0 +1,158 @@
+"""Reloading of the configuration file without restarting radio-box.
+
+Both the service and every web worker watch the config file and apply changes of
+the "stations" section in place. Changes are detected with inotify when it's
+available (Linux), with periodic checks of the file's modification time as a
+fallback. The directory of the file is watched rather than the file itself, because
+editors usually replace the file with a new one.
+
+Other settings (transport, socket, resolver, prober, ...) still require restart.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, NamedTuple, Optional, Set, Tuple
+
+import yaml
+
+from radio_box.config import load_config
+
+# Seconds between checks of the config file, also when inotify is available, in case
+# its events are not delivered (e.g. on network filesystems)
+POLL_INTERVAL = 2.0
+
+# inotify events (see inotify(7)) after which the file might have changed
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+ConfigCallback = Callable[[dict], None]
+# Identity, size and modification time of the file
+FileSignature = Tuple[int, int, int]
+
+
+class StationsDiff(NamedTuple):
+    """IDs of the stations that differ between two configurations."""
+
+    added: Set[str]
+    removed: Set[str]
+    changed: Set[str]
+
+    def __bool__(self) -> bool:
+        """Return True if any station differs."""
+        return bool(self.added or self.removed or self.changed)
+
+
+def diff_stations(old: Dict[str, dict], new: Dict[str, dict]) -> StationsDiff:
+    """Compare configuration of the stations.
+
+    :param old: Current "stations" section of the config.
+    :param new: New "stations" section of the config.
+    """
+    return StationsDiff(
+        added=set(new) - set(old),
+        removed=set(old) - set(new),
+        changed={key for key in set(old) & set(new) if old[key] != new[key]},
+    )
+
+
+def inotify_watch(directory: Path) -> Optional[int]:
+    """Start watching the directory for created and rewritten files.
+
+    :param directory: Directory to watch.
+    :return: Non-blocking inotify file descriptor, None if inotify isn't available.
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        descriptor = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if descriptor < 0:
+        return None
+    if libc.inotify_add_watch(descriptor, os.fsencode(directory), INOTIFY_MASK) < 0:
+        os.close(descriptor)
+        return None
+    return descriptor
+
+
+class ConfigWatcher:
+    """Reports new content of the config file every time the file changes."""
+
+    def __init__(
+        self, path: Path, callback: ConfigCallback, interval: float = POLL_INTERVAL
+    ) -> None:
+        """Initialize watcher, changes made from now on will be reported.
+
+        :param path: Path to the config file.
+        :param callback: Function that receives new content of the config file.
+            Note: Callback is executed in the watcher thread.
+        :param interval: Seconds between checks of the file's modification time.
+        """
+        self.path = path
+        self.callback = callback
+        self.interval = interval
+        self.signature = self._signature()
+        self._inotify: Optional[int] = None
+
+    def _signature(self) -> Optional[FileSignature]:
+        """Return signature of the config file, None if it does not exist."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def check(self) -> None:
+        """Report content of the config file if it changed since the last check.
+
+        Broken file, or a file that fails to be applied by the callback, is reported
+        only in logs and it's not loaded again until it changes.
+        """
+        signature = self._signature()
+        if signature is None or signature == self.signature:
+            return
+        self.signature = signature
+        try:
+            config = load_config(self.path)
+        except (OSError, yaml.YAMLError) as exc:
+            print(f"Failed to reload config file {self.path}: {exc}")
+            return
+        if not isinstance(config, dict) or not isinstance(config.get("stations"), dict):
+            print(f"Ignoring config file {self.path} without stations.")
+            return
+        try:
+            self.callback(config)
+        except Exception as exc:  # pylint: disable=broad-except
+            # Watcher keeps running, the next change of the file is applied again
+            print(f"Failed to apply config file {self.path}: {exc!r}")
+
+    def wait(self) -> None:
+        """Block until the directory of the config file changes or interval passes."""
+        if self._inotify is None:
+            time.sleep(self.interval)
+            return
+        readable, _, _ = select.select([self._inotify], [], [], self.interval)
+        if readable:
+            try:
+                while os.read(self._inotify, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def run(self) -> None:
+        """Check the config file after every change until the process exits."""
+        self._inotify = inotify_watch(self.path.parent)
+        while True:
+            self.wait()
+            self.check()
+
+    def start(self) -> threading.Thread:
+        """Watch the config file in a background thread."""
+        thread = threading.Thread(target=self.run, name="config-watcher", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,401 @@
+"""Resolution of station URLs to the URLs of the actual audio streams.
+
+Station URLs often point to playlists (.m3u, .pls) or to addresses that redirect
+somewhere else. Resolving them takes several network round-trips (DNS lookup, TCP/TLS
+handshake, HTTP request) every time the station is played. StreamResolver follows the
+redirects and playlists once and remembers the final stream URL. Host names are
+resolved through a DNS cache as well, so the repeated resolution of an expired entry
+does not wait for the DNS either.
+"""
+import functools
+import http.client
+import socket
+import ssl
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from configparser import ConfigParser, Error
+from http.client import HTTPConnection, HTTPSConnection
+from pathlib import PurePosixPath
+from typing import (
+    Any,
+    Callable,
+    Generic,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
+from urllib.error import URLError
+from urllib.parse import urljoin, urlsplit
+
+# Content types of the playlists that are resolved to the URL of the first stream.
+# HLS playlists (.m3u8) are not included, VLC has to refresh them while playing.
+M3U_CONTENT_TYPES = ("audio/x-mpegurl", "audio/mpegurl")
+PLS_CONTENT_TYPES = ("audio/x-scpls", "audio/scpls")
+M3U_SUFFIXES = (".m3u",)
+PLS_SUFFIXES = (".pls",)
+# Maximum size of the playlist, anything bigger is most likely a stream
+MAX_PLAYLIST_SIZE = 64 * 1024
+# Playlists can point to other playlists, but only this deep
+MAX_PLAYLIST_DEPTH = 3
+
+KeyT = TypeVar("KeyT")
+ValueT = TypeVar("ValueT")
+Address = Tuple[str, int]
+
+
+class ResolverOptions(NamedTuple):
+    """Limits of the stream resolver.
+
+    Values can be overridden in the "resolver" section of the config file.
+    """
+
+    # Seconds for which the resolved stream URL is valid. 0 disables the resolver.
+    ttl: float = 3600
+    # Maximum number of stations with cached stream URL
+    size: int = 128
+    # Seconds for which the resolved address of the host is valid
+    dns_ttl: float = 300
+    # Seconds to wait for the stream server during resolution
+    timeout: float = 5.0
+
+
+class ResolverError(Exception):
+    """Raised when station URL can't be resolved to the stream URL."""
+
+
+class TTLCache(Generic[KeyT, ValueT]):
+    """Thread-safe mapping with limited size in which entries expire after TTL.
+
+    When the cache is full, the least recently used entry is evicted.
+    """
+
+    def __init__(
+        self, ttl: float, size: int, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        """Initialize empty cache.
+
+        :param ttl: Number of seconds after which entries expire.
+        :param size: Maximum number of entries.
+        :param clock: Function that returns current time in seconds.
+        """
+        self.ttl = ttl
+        self.size = size
+        self.clock = clock
+        self._entries: "OrderedDict[KeyT, Tuple[float, ValueT]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return number of entries, including the expired ones."""
+        return len(self._entries)
+
+    def get(self, key: KeyT) -> Optional[ValueT]:
+        """Return value stored under the key, or None if it's missing or expired.
+
+        :param key: Key of the entry.
+        """
+        with self._lock:
+            expires, value = self._entries.get(key, (0.0, None))
+            if expires <= self.clock():
+                self._entries.pop(key, None)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: KeyT, value: ValueT) -> None:
+        """Store value under the key.
+
+        :param key: Key of the entry.
+        :param value: Value to store.
+        """
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: KeyT) -> None:
+        """Remove entry from the cache, if it exists.
+
+        :param key: Key of the entry.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class DNSCache:
+    """Remembers addresses of the hosts for a limited time."""
+
+    def __init__(self, ttl: float, size: int) -> None:
+        """Initialize empty cache.
+
+        :param ttl: Number of seconds for which the addresses are valid.
+        :param size: Maximum number of hosts in the cache.
+        """
+        self.addresses: TTLCache[Address, List[Address]] = TTLCache(ttl, size)
+
+    def lookup(self, host: str, port: int) -> List[Address]:
+        """Return all addresses of the host, in the order in which they are tried.
+
+        :param host: Host name or IP address.
+        :param port: Port number.
+        :raises OSError: If host name can't be resolved.
+        """
+        cached = self.addresses.get((host, port))
+        if cached is not None:
+            return cached
+
+        info = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = [(str(entry[4][0]), int(entry[4][1])) for entry in info]
+        self.addresses.set((host, port), addresses)
+        return addresses
+
+    def invalidate(self, host: str, port: int) -> None:
+        """Forget address of the host.
+
+        :param host: Host name or IP address.
+        :param port: Port number.
+        """
+        self.addresses.pop((host, port))
+
+
+def connect_any(
+    addresses: List[Address], timeout: Any, source_address: Any = None
+) -> socket.socket:
+    """Return socket connected to the first address that accepts the connection.
+
+    Addresses are tried in order, as socket.create_connection() does with all
+    addresses of the host (e.g. IPv4 address after unreachable IPv6 one).
+
+    :param addresses: Resolved addresses of the host.
+    :param timeout: Timeout of each connection attempt and of the socket.
+    :param source_address: Local address to bind the socket to.
+    :raises OSError: Error of the last address, if none of them can be connected.
+    """
+    errors: List[OSError] = []
+    for address in addresses:
+        try:
+            return socket.create_connection(address, timeout, source_address)
+        except OSError as exc:
+            errors.append(exc)
+    raise errors[-1] if errors else OSError("Host has no addresses.")
+
+
+class CachedDNSHTTPConnection(HTTPConnection):
+    """HTTP connection that looks up the address of the host in DNSCache."""
+
+    def __init__(self, host: str, *, dns_cache: DNSCache, **kwargs: Any) -> None:
+        """Initialize connection.
+
+        :param host: Host name and optional port of the server.
+        :param dns_cache: Cache used to look up the address of the host.
+        :param kwargs: Other arguments of the HTTPConnection.
+        """
+        super().__init__(host, **kwargs)
+        self.dns_cache = dns_cache
+
+    def connect(self) -> None:
+        """Connect to the cached addresses of the host."""
+        addresses = self.dns_cache.lookup(self.host, self.port)
+        self.sock = connect_any(addresses, self.timeout)
+
+
+class CachedDNSHTTPSConnection(HTTPSConnection):
+    """HTTPS connection that looks up the address of the host in DNSCache.
+
+    TLS is established by HTTPSConnection on top of the socket connected to the cached
+    address, certificate is verified against the original host name.
+    """
+
+    def __init__(self, host: str, *, dns_cache: DNSCache, **kwargs: Any) -> None:
+        """Initialize connection.
+
+        HTTPSConnection passes its arguments positionally to HTTPConnection, so the
+        DNS cache can't be shared with CachedDNSHTTPConnection through inheritance.
+
+        :param host: Host name and optional port of the server.
+        :param dns_cache: Cache used to look up the address of the host.
+        :param kwargs: Other arguments of the HTTPSConnection.
+        """
+        super().__init__(host, **kwargs)
+        self.dns_cache = dns_cache
+        self._create_connection = self._create_cached_connection
+
+    def _create_cached_connection(
+        self, address: Address, timeout: Any, source_address: Any = None
+    ) -> socket.socket:
+        """Create socket connected to the cached addresses of the host.
+
+        :param address: Host name and port of the server.
+        :param timeout: Timeout of the socket.
+        :param source_address: Local address to bind the socket to.
+        """
+        return connect_any(self.dns_cache.lookup(*address), timeout, source_address)
+
+
+class CachedDNSHandler(urllib.request.HTTPHandler, urllib.request.HTTPSHandler):
+    """Opens HTTP and HTTPS URLs using cached DNS."""
+
+    def __init__(
+        self, dns_cache: DNSCache, context: Optional[ssl.SSLContext] = None
+    ) -> None:
+        """Initialize handler.
+
+        :param dns_cache: Cache used to look up the address of the host.
+        :param context: SSL context of HTTPS connections, default one if omitted.
+        """
+        super().__init__(context=context)
+        self.dns_cache = dns_cache
+
+    def do_open(  # type: ignore[override]
+        self, http_class: type, req: urllib.request.Request, **http_conn_args: Any
+    ) -> http.client.HTTPResponse:
+        """Open URL with connection that uses cached DNS.
+
+        :param http_class: Connection class selected by HTTP(S)Handler.
+        :param req: Request to send.
+        :param http_conn_args: Additional arguments for the connection.
+        """
+        connection_class: Union[
+            Type[CachedDNSHTTPConnection], Type[CachedDNSHTTPSConnection]
+        ] = CachedDNSHTTPConnection
+        if issubclass(http_class, HTTPSConnection):
+            connection_class = CachedDNSHTTPSConnection
+        connection = functools.partial(connection_class, dns_cache=self.dns_cache)
+        return super().do_open(connection, req, **http_conn_args)
+
+
+def parse_m3u(data: str) -> str:
+    """Return first entry of the M3U playlist.
+
+    :param data: Content of the playlist.
+    :raises ResolverError: If playlist has no entries.
+    """
+    for line in data.splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            return line
+    raise ResolverError("Playlist is empty.")
+
+
+def parse_pls(data: str) -> str:
+    """Return first entry of the PLS playlist.
+
+    :param data: Content of the playlist.
+    :raises ResolverError: If playlist has no entries or it's not valid.
+    """
+    parser = ConfigParser(interpolation=None)
+    try:
+        parser.read_string(data)
+        # Section name is case-insensitive in practice, "[Playlist]" is common too
+        section = next(
+            (name for name in parser.sections() if name.lower() == "playlist"),
+            "playlist",
+        )
+        prefix_length = len("file")
+        entries = [
+            (int(key[prefix_length:]), value)
+            for key, value in parser.items(section)
+            if key.startswith("file")
+        ]
+    except (Error, ValueError) as exc:
+        raise ResolverError(f"Invalid playlist: {exc}") from exc
+    if not entries:
+        raise ResolverError("Playlist is empty.")
+    return min(entries)[1]
+
+
+class StreamResolver:
+    """Resolves station URLs to stream URLs and caches the results.
+
+    Resolution follows HTTP redirects and the first entry of M3U and PLS playlists.
+    Every other content is considered to be the stream itself and the connection is
+    closed without reading it.
+    """
+
+    def __init__(self, options: Optional[ResolverOptions] = None) -> None:
+        """Initialize resolver with empty caches.
+
+        :param options: Limits of the resolver, default values are used if omitted.
+        """
+        self.options = options or ResolverOptions()
+        self.streams: TTLCache[str, str] = TTLCache(self.options.ttl, self.options.size)
+        self.dns_cache = DNSCache(self.options.dns_ttl, self.options.size)
+        self._opener = urllib.request.build_opener(
+            urllib.request.ProxyHandler({}),
+            CachedDNSHandler(self.dns_cache),
+        )
+
+    def resolve(self, url: str) -> str:
+        """Return URL of the stream that the station URL points to.
+
+        If the resolution fails, the station URL is returned so that VLC can give it
+        a try on its own. Failed resolutions are not cached.
+
+        :param url: Station URL from the configuration.
+        """
+        if not self.options.ttl or urlsplit(url).scheme not in ("http", "https"):
+            return url
+
+        stream_url = self.streams.get(url)
+        if stream_url is None:
+            try:
+                stream_url = self._resolve(url, MAX_PLAYLIST_DEPTH)
+            except (ResolverError, URLError, OSError, ValueError) as exc:
+                print(f"Failed to resolve stream URL {url}: {exc}")
+                return url
+            if stream_url != url:
+                print(f"Resolved {url} to {stream_url}")
+            self.streams.set(url, stream_url)
+        return stream_url
+
+    def _resolve(self, url: str, depth: int) -> str:
+        """Follow redirects and playlists to the URL of the stream.
+
+        :param url: URL to resolve.
+        :param depth: Maximum number of nested playlists.
+        :raises ResolverError: If playlist is invalid or it's nested too deep.
+        """
+        with self._opener.open(url, timeout=self.options.timeout) as response:
+            final_url = response.geturl()
+            content_type = response.headers.get_content_type()
+            suffix = PurePosixPath(urlsplit(final_url).path).suffix.lower()
+            if content_type in M3U_CONTENT_TYPES or suffix in M3U_SUFFIXES:
+                parse = parse_m3u
+            elif content_type in PLS_CONTENT_TYPES or suffix in PLS_SUFFIXES:
+                parse = parse_pls
+            else:
+                return final_url
+
+            data = response.read(MAX_PLAYLIST_SIZE + 1)
+
+        if len(data) > MAX_PLAYLIST_SIZE:
+            raise ResolverError("Playlist is too big.")
+        if depth <= 0:
+            raise ResolverError("Too many nested playlists.")
+        entry = urljoin(final_url, parse(data.decode("utf-8", errors="replace")))
+        return self._resolve(entry, depth - 1)
+
+    def invalidate(self, url: str) -> None:
+        """Forget the resolved stream URL and the address of its host.
+
+        This should be called when the playback of the stream fails, the station
+        might have moved.
+
+        :param url: Station URL from the configuration.
+        """
+        stream_url = self.streams.get(url)
+        self.streams.pop(url)
+        for resolved in (url, stream_url):
+            if resolved:
+                parts = urlsplit(resolved)
+                default_port = 443 if parts.scheme == "https" else 80
+                if parts.hostname:
+                    self.dns_cache.invalidate(
+                        parts.hostname, parts.port or default_port
+                    )
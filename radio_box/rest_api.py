@@ -1,16 +1,508 @@
 """Simple REST Api interface for controlling radio-box service."""
 import os
-from typing import Dict, Optional
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
-import yaml
-from flask import Flask, Response, abort, jsonify, request, send_from_directory
+from flask import Flask, Response, abort, g, jsonify, request
+from google.protobuf.json_format import MessageToDict
 
+from radio_box.catalog import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    IndexCache,
+    StationIndex,
+    load_stations,
+)
 from radio_box.common import (
+    MAX_VOLUME,
+    TRANSPORT_PIPE,
+    TRANSPORT_SOCKET,
+    CommandError,
+    SenderOptions,
+    ServiceUnavailableError,
     create_pipe,
+    make_message_pause,
     make_message_play,
+    make_message_record,
+    make_message_resume,
+    make_message_seek,
+    make_message_set_volume,
     make_message_stop,
-    send_message,
+    make_message_stop_recording,
+    send_command,
+    zone_configs,
 )
+from radio_box.config import load_config
+from radio_box.events import EventHub, state_to_dict
+from radio_box.http_cache import BodyCache, cached_response
+from radio_box.metrics import REGISTRY, Exporter, collect, metrics_dir_path, render
+from radio_box.prober import load_results, results_version, status_file_path
+from radio_box.reload import ConfigWatcher, diff_stations
+from radio_box.static import StaticFiles
+from radio_box.status import StatusReader, status_block_path
+from radio_box.tracing import mark, query_traces, start_trace
+
+INDEX_FILE = "index.html"
+# Key of the app extensions under which the event hubs are available to the servers,
+# hubs are keyed by ID of their zone, empty ID is the default zone
+EVENTS_EXTENSION = "radio_box.events"
+# Longest delay that fits into the Seek command
+MAX_DELAY = 2**32 - 1
+# Longest duration that fits into the Record command
+MAX_DURATION = 2**32 - 1
+# Content type of the Prometheus text exposition format
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUEST_DURATION = REGISTRY.histogram(
+    "radio_box_http_request_duration_seconds",
+    "Time spent handling the REST API request.",
+    ["route", "method", "status"],
+)
+
+
+def requested_volume(data: object) -> int:
+    """Return volume level from the json data of the request.
+
+    :param data: Parsed json data, expected to contain "volume" key.
+    :raises HTTPException: With "400 Bad Request" response if the volume is invalid.
+    """
+    level = data.get("volume") if isinstance(data, dict) else None
+    if isinstance(level, bool) or not isinstance(level, int):
+        level = -1
+    if not 0 <= level <= MAX_VOLUME:
+        abort(Response(f"Volume must be between 0 and {MAX_VOLUME}.", status=400))
+    return level
+
+
+def requested_delay(data: object) -> int:
+    """Return delay of the time-shifted playback from the json data of the request.
+
+    :param data: Parsed json data, expected to contain "delay" key.
+    :raises HTTPException: With "400 Bad Request" response if the delay is invalid.
+    """
+    delay = data.get("delay") if isinstance(data, dict) else None
+    if isinstance(delay, bool) or not isinstance(delay, int):
+        delay = -1
+    if not 0 <= delay <= MAX_DELAY:
+        abort(Response("Delay must be a non-negative number of seconds.", status=400))
+    return delay
+
+
+def requested_duration(data: Dict[str, object]) -> int:
+    """Return duration of the recording from the json data of the request.
+
+    :param data: Parsed json data, duration is 0 (no limit) if it's not specified.
+    :raises HTTPException: With "400 Bad Request" response if the duration is
+        invalid.
+    """
+    duration = data.get("duration", 0)
+    if isinstance(duration, bool) or not isinstance(duration, int):
+        duration = -1
+    if not 0 <= duration <= MAX_DURATION:
+        abort(
+            Response("Duration must be a non-negative number of seconds.", status=400)
+        )
+    return duration
+
+
+def requested_zone(zones: Dict[str, dict], zone: object) -> str:
+    """Return ID of the zone requested by the client, empty for the default zone.
+
+    :param zones: Configuration of the zones.
+    :param zone: Zone from the request, None if the request does not specify it.
+    :raises HTTPException: With "404 Not Found" response if the zone is unknown.
+    """
+    if zone is None or zone == "":
+        return ""
+    if not isinstance(zone, str) or zone not in zones:
+        abort(Response(f"Zone '{zone}' not found.", status=404))
+    return zone
+
+
+def add_error_handlers(app: Flask) -> None:
+    """Translate failures of the communication with the service to HTTP responses.
+
+    :param app: Flask app.
+    """
+
+    @app.errorhandler(CommandError)
+    def command_failed(error: CommandError) -> Response:
+        """Report commands refused by radio-box service."""
+        return Response(f"Command failed: {error}", status=500)
+
+    @app.errorhandler(ServiceUnavailableError)
+    def service_unavailable(error: ServiceUnavailableError) -> Response:
+        """Fail fast when radio-box service does not respond."""
+        return Response(str(error), status=503)
+
+
+def add_static(app: Flask, static_files: StaticFiles) -> None:
+    """Serve files of the web UI, "/" serves its "index.html".
+
+    :param app: Flask app.
+    :param static_files: Files of the built web UI.
+    """
+
+    @app.route("/", methods=["GET"])
+    def index() -> Response:
+        """Serve static frontend."""
+        return static(INDEX_FILE)
+
+    @app.route("/<path:filename>", methods=["GET"])
+    def static(filename: str) -> Response:
+        """Serve static file, precompressed if the client accepts it."""
+        response = static_files.response(filename)
+        if response is None:
+            abort(404)
+        return response
+
+
+def add_metrics(app: Flask, exporter: Exporter) -> None:
+    """Measure duration of all requests and serve metrics on the "/metrics" endpoint.
+
+    :param app: Flask app to instrument.
+    :param exporter: Exporter that stores metrics of this worker.
+    """
+
+    @app.before_request
+    def start_timer() -> None:
+        """Remember when the request handling started."""
+        g.request_origin = time.time()
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response: Response) -> Response:
+        """Record duration of the request in the metrics of the worker."""
+        REQUEST_DURATION.observe(
+            time.perf_counter() - g.request_started,
+            route=request.url_rule.rule if request.url_rule else "unmatched",
+            method=request.method,
+            status=str(response.status_code),
+        )
+        exporter.maybe_dump()
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics() -> Response:
+        """Return metrics of the service and all web workers in Prometheus format."""
+        exporter.dump()
+        return Response(
+            render(collect(exporter.directory)), content_type=METRICS_CONTENT_TYPE
+        )
+
+
+def add_events(
+    app: Flask, zones: Dict[str, dict], hubs: Optional[Dict[str, EventHub]]
+) -> None:
+    """Stream changes of the player state on the "/events" endpoint.
+
+    :param app: Flask app.
+    :param zones: Configuration of the zones.
+    :param hubs: Hubs distributing player states of the zones to clients of this
+        worker, empty ID is the default zone. None if the transport does not support
+        subscriptions.
+    """
+    app.extensions[EVENTS_EXTENSION] = hubs
+
+    @app.route("/events", methods=["GET"])
+    def events() -> Response:
+        """Return server-sent events with the current player state and its changes.
+
+        Each event is named after the change ("opening", "buffering", "playing",
+        "paused", "stopped", "failed", "metadata" or "volume") and contains the
+        whole state. Time-shifted playback reports its "delay" in seconds.
+        Optional "zone" query parameter selects the zone, default zone is streamed
+        otherwise.
+        Example:
+            event: playing
+            data: {"station": "best_radio", "status": "playing", "error": null,
+                   "title": "Artist - Song", "volume": null, "delay": null}
+        """
+        zone = requested_zone(zones, request.args.get("zone"))
+        if hubs is None:
+            abort(
+                Response(
+                    "Events are available only with the socket transport.", status=501
+                )
+            )
+        return Response(
+            hubs[zone].stream(),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+
+def add_timeshift(
+    app: Flask,
+    zones: Dict[str, dict],
+    socket_path: Path,
+    transport: str,
+    options: SenderOptions,
+) -> None:
+    """Control the time-shift with "/pause", "/resume" and "/seek" endpoints.
+
+    Service refuses these commands if the time-shift is not enabled, which is
+    reported only with the socket transport.
+
+    :param app: Flask app.
+    :param zones: Configuration of the zones.
+    :param socket_path: Path to the pipe/socket on which the service listens.
+    :param transport: Transport used to communicate with the service.
+    :param options: Timeouts and retries for the communication.
+    """
+
+    @app.route("/pause", methods=["GET"])
+    def pause() -> Response:
+        """Pause current playback, the station keeps buffering meanwhile.
+
+        Optional "zone" query parameter selects the zone, default zone is paused
+        otherwise.
+        """
+        zone = requested_zone(zones, request.args.get("zone"))
+        send_command(socket_path, make_message_pause(zone), transport, options)
+        return Response("OK", status=200)
+
+    @app.route("/resume", methods=["GET"])
+    def resume() -> Response:
+        """Resume paused playback where it was paused.
+
+        Optional "zone" query parameter selects the zone, default zone is resumed
+        otherwise.
+        """
+        zone = requested_zone(zones, request.args.get("zone"))
+        send_command(socket_path, make_message_resume(zone), transport, options)
+        return Response("OK", status=200)
+
+    @app.route("/seek", methods=["POST"])
+    def seek() -> Response:
+        """Continue playback the number of seconds behind the live stream.
+
+        Delay in seconds is expected to be supplied in json form, 0 returns to the
+        live stream. Optional zone ID selects the zone, default zone seeks
+        otherwise.
+        Example:
+            {'delay': 300, 'zone': 'kitchen'}
+        """
+        data = request.json
+        delay = requested_delay(data)
+        zone = requested_zone(zones, data.get("zone"))
+        send_command(socket_path, make_message_seek(delay, zone), transport, options)
+        return Response("OK", status=200)
+
+
+def add_recorder(
+    app: Flask,
+    config: dict,
+    socket_path: Path,
+    transport: str,
+    options: SenderOptions,
+) -> None:
+    """Control the recorder with "/record" and "/record/stop" endpoints.
+
+    Service refuses these commands if the recorder is not enabled, which is reported
+    only with the socket transport.
+
+    :param app: Flask app.
+    :param config: Content of the configuration file, with the current stations.
+    :param socket_path: Path to the pipe/socket on which the service listens.
+    :param transport: Transport used to communicate with the service.
+    :param options: Timeouts and retries for the communication.
+    """
+
+    @app.route("/record", methods=["POST"])
+    def record() -> Response:
+        """Start recording the station to disk.
+
+        Station ID is expected to be supplied in json form. Optional duration in
+        seconds stops the recording, it continues until stopped otherwise.
+        Example:
+            {'station': 'best_radio', 'duration': 3600}
+        """
+        data = request.json
+        if not isinstance(data, dict):
+            abort(Response("Missing json data.", status=400))
+        station = data.get("station", "")
+        if station not in config["stations"]:
+            abort(Response(f"Station '{station}' not found.", status=404))
+        message = make_message_record(station, requested_duration(data))
+        send_command(socket_path, message, transport, options)
+        return Response("OK", status=200)
+
+    @app.route("/record/stop", methods=["POST"])
+    def stop_recording() -> Response:
+        """Stop recording the station.
+
+        Station ID is expected to be supplied in json form.
+        Example:
+            {'station': 'best_radio'}
+        """
+        data = request.json
+        station = data.get("station") if isinstance(data, dict) else None
+        if not isinstance(station, str) or not station:
+            abort(Response("Missing station.", status=400))
+        message = make_message_stop_recording(station)
+        send_command(socket_path, message, transport, options)
+        return Response("OK", status=200)
+
+
+def add_status(app: Flask, reader: StatusReader) -> None:
+    """Serve current player state from the shared status block on "/status".
+
+    :param app: Flask app.
+    :param reader: Reader of the status block published by the service.
+    """
+
+    @app.route("/status", methods=["GET"])
+    def status() -> Response:
+        """Return current player state without contacting the radio-box service.
+
+        Example:
+            {"station": "best_radio", "status": "playing", "error": null,
+             "title": "Artist - Song", "volume": null, "delay": null}
+        """
+        state = reader.read()
+        if state is None:
+            abort(Response("Player status is not available yet.", status=503))
+        return jsonify(state_to_dict(state))
+
+
+def requested_page() -> Tuple[int, int]:
+    """Return offset and limit of the requested page of stations."""
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    limit = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    return offset, min(max(limit, 1), MAX_PAGE_SIZE)
+
+
+def station_health(config: dict, keys: List[str]) -> Dict[str, dict]:
+    """Return results of the last probe of the stations, if they were probed.
+
+    :param config: Config of the app.
+    :param keys: IDs of the stations.
+    """
+    results = load_results(status_file_path(config))
+    return {key: results[key] for key in keys if key in results}
+
+
+def list_stations(config: dict, stations: Dict[str, dict]) -> dict:
+    """Return names and health of all stations.
+
+    :param config: Config of the app.
+    :param stations: Current configuration of the stations.
+    """
+    return {
+        "stations": {key: value["name"] for key, value in stations.items()},
+        "health": station_health(config, list(stations)),
+    }
+
+
+def add_stations(app: Flask, config: dict, index_cache: IndexCache) -> None:
+    """List and search stations on "/stations" and "/stations/search" endpoints.
+
+    :param app: Flask app.
+    :param config: Config of the app, with stations merged from the catalog.
+    :param index_cache: Search index of the current stations.
+    """
+
+    all_stations = BodyCache()
+
+    @app.route("/stations", methods=["GET"])
+    def stations() -> Response:
+        """Return list of all radio stations, or its page.
+
+        If "offset" or "limit" query parameter is present, only requested page of
+        the stations in the order of their names is returned, together with the
+        total number of stations.
+
+        If the station prober is enabled, the "health" field contains results of the
+        last probe of each station.
+
+        Complete list is precomputed once for every version of the stations and
+        probe results, clients revalidate it with its ETag.
+        """
+        if "offset" not in request.args and "limit" not in request.args:
+            station_data = config["stations"]
+            version = results_version(status_file_path(config))
+            body = all_stations.get(
+                station_data, version, lambda: list_stations(config, station_data)
+            )
+            return cached_response(body)
+
+        offset, limit = requested_page()
+        index = index_cache.get(config["stations"])
+        keys = index.page(offset, limit)
+        return jsonify(
+            {
+                "stations": {key: index.stations[key]["name"] for key in keys},
+                "health": station_health(config, keys),
+                "total": len(index),
+                "offset": offset,
+                "limit": limit,
+            }
+        )
+
+    @app.route("/stations/search", methods=["GET"])
+    def search() -> Response:
+        """Return page of the stations that match the "q" query parameter.
+
+        All words of the query must match the station's name, tags, country or
+        codec. Words "tag:<tag>", "country:<code>" and "codec:<codec>" select
+        exact value of the field. Optional "offset" and "limit" parameters select
+        the page of the results.
+        Example:
+            {"stations": [{"id": "best_radio", "name": "Best Radio",
+                           "tags": ["jazz"], "country": "SK", "codec": "MP3"}],
+             "health": {}, "total": 1, "offset": 0, "limit": 100}
+        """
+        offset, limit = requested_page()
+        index = index_cache.get(config["stations"])
+        total, keys = index.search(request.args.get("q", ""), offset, limit)
+        return jsonify(
+            {
+                "stations": [station_summary(index, key) for key in keys],
+                "health": station_health(config, keys),
+                "total": total,
+                "offset": offset,
+                "limit": limit,
+            }
+        )
+
+
+def station_summary(index: StationIndex, key: str) -> dict:
+    """Return searchable fields of the station.
+
+    :param index: Index that contains the station.
+    :param key: ID of the station.
+    """
+    station = index.stations[key]
+    return {
+        "id": key,
+        "name": station["name"],
+        "tags": station.get("tags", []),
+        "country": station.get("country", ""),
+        "codec": station.get("codec", ""),
+    }
+
+
+def watch_stations(config: dict, conf_file: Path, index_cache: IndexCache) -> None:
+    """Keep stations of this worker up to date with the config file.
+
+    :param config: Config of the app, its "stations" section is replaced on change.
+    :param conf_file: Path to the config file.
+    :param index_cache: Search index of the stations, rebuilt after the change.
+    """
+
+    def reload(new_config: dict) -> None:
+        stations = load_stations(new_config)
+        diff = diff_stations(config["stations"], stations)
+        if diff:
+            # Replaced at once, so that requests in progress see consistent stations
+            config["stations"] = stations
+            print(f"Reloaded stations from {conf_file}.")
+            index_cache.get(stations)
+
+    ConfigWatcher(conf_file, reload).start()
 
 
 def create_app(
@@ -19,25 +511,34 @@ def create_app(
     """Initialize flask app."""
     conf_file = os.environ.get("RADIO_BOX_CONF") or "/etc/radio-box/conf.yaml"
     static_folder = os.environ.get("RADIO_BOX_WEB_STATIC") or "static"
-    with open(conf_file, "r", encoding="utf8") as conf:
-        config = yaml.safe_load(conf)
+    config = load_config(Path(conf_file))
+    config["stations"] = load_stations(config)
+    index_cache = IndexCache()
+    # Index is built in the background, large catalogs take a while to index
+    threading.Thread(
+        target=index_cache.get, args=(config["stations"],), daemon=True
+    ).start()
 
-    socket_path = create_pipe(config["socket"])
-    app = Flask(__name__, static_url_path="", static_folder=static_folder)
+    transport = config.get("transport", TRANSPORT_PIPE)
+    options = SenderOptions(**config.get("connection", {}))
+    if transport == TRANSPORT_PIPE:
+        socket_path = create_pipe(config["socket"])
+    else:
+        socket_path = Path(config["socket"])
+    zones = zone_configs(config)
+    app = Flask(__name__, static_folder=None)
 
-    @app.route("/", methods=["GET"])
-    def index() -> Response:
-        """Redirect root url to static frontend."""
-        return send_from_directory(static_folder, "index.html")
+    add_error_handlers(app)
 
     @app.route("/play", methods=["POST"])
     def play() -> Response:
         """Play selected station.
 
         Station ID is expected to be supplied in json form and contain ID that matches
-        one station IDs returned by the '/stations' endpoint.
+        one station IDs returned by the '/stations' endpoint. Optional zone ID selects
+        the zone that plays the station, default zone plays it otherwise.
         Example:
-            {'station': 'best_radio'}
+            {'station': 'best_radio', 'zone': 'kitchen'}
         """
         data = request.json
         if not isinstance(data, dict):
@@ -46,24 +547,76 @@ def create_app(
         station = data.get("station", "")
         if station not in config["stations"]:
             abort(Response(f"Station '{station}' not found.", status=404))
+        zone = requested_zone(zones, data.get("zone"))
 
-        play_command = make_message_play(station)
-        send_message(socket_path, play_command)
+        play_command = make_message_play(station, zone)
+        start_trace(play_command, g.request_origin)
+        mark(play_command, "rest")
+        send_command(socket_path, play_command, transport, options)
         return Response("OK", status=200)
 
     @app.route("/stop", methods=["GET"])
     def stop() -> Response:
-        """Stop current playback."""
-        stop_command = make_message_stop()
-        send_message(socket_path, stop_command)
+        """Stop current playback.
+
+        Optional "zone" query parameter selects the zone, default zone is stopped
+        otherwise.
+        """
+        stop_command = make_message_stop(
+            requested_zone(zones, request.args.get("zone"))
+        )
+        start_trace(stop_command, g.request_origin)
+        mark(stop_command, "rest")
+        send_command(socket_path, stop_command, transport, options)
 
         return Response("OK", status=200)
 
-    @app.route("/stations", methods=["GET"])
-    def stations() -> Response:
-        """Return list of all pre-configured radio stations."""
-        station_data = config["stations"]
-        all_stations = {key: value["name"] for key, value in station_data.items()}
-        return jsonify({"stations": all_stations})
+    @app.route("/volume", methods=["POST"])
+    def volume() -> Response:
+        """Change playback volume.
+
+        Volume level between 0 and 100 is expected to be supplied in json form.
+        Optional zone ID selects the zone, volume of the default zone is changed
+        otherwise.
+        Example:
+            {'volume': 40, 'zone': 'kitchen'}
+        """
+        data = request.json
+        level = requested_volume(data)
+        zone = requested_zone(zones, data.get("zone"))
+        send_command(
+            socket_path, make_message_set_volume(level, zone), transport, options
+        )
+        return Response("OK", status=200)
+
+    @app.route("/traces", methods=["GET"])
+    def traces() -> Response:
+        """Return timing of commands recently executed by the radio-box service.
+
+        Optional "limit" query parameter selects number of the most recent traces,
+        all traces kept by the service are returned by default.
+        """
+        limit = request.args.get("limit", 0, type=int)
+        completed = query_traces(socket_path, transport, max(limit, 0), options)
+        return jsonify(
+            {
+                "traces": [
+                    MessageToDict(trace, preserving_proto_field_name=True)
+                    for trace in completed
+                ]
+            }
+        )
 
+    hubs = None
+    if transport == TRANSPORT_SOCKET:
+        hubs = {name: EventHub(socket_path, options, zone=name) for name in zones}
+        hubs[""] = next(iter(hubs.values()))
+    add_events(app, zones, hubs)
+    add_timeshift(app, zones, socket_path, transport, options)
+    add_recorder(app, config, socket_path, transport, options)
+    add_stations(app, config, index_cache)
+    add_static(app, StaticFiles(static_folder))
+    watch_stations(config, Path(conf_file), index_cache)
+    add_status(app, StatusReader(status_block_path(config)))
+    add_metrics(app, Exporter(metrics_dir_path(config), "web"))
     return app
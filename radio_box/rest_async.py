@@ -0,0 +1,488 @@
+"""Asyncio server of the REST API for many long-lived connections.
+
+The default (sync) deployment runs the REST API in gunicorn, where every open
+connection occupies one worker thread for as long as it's open. That's fine for
+short requests, but browsers connected to the "/events" stream keep their threads
+forever, so the number of connected browsers is limited by workers x threads.
+
+This server keeps all connections in a single process and a single event loop,
+an idle connection costs only a coroutine and its buffers:
+
+* "/events" is streamed directly by the event loop, each client gets its queue
+  from the worker's EventHub of the requested zone, but no thread
+* all other requests (e.g. "/play", "/stop", "/stations") are passed to the same
+  Flask app in a small pool of threads, so both modes serve the same routes
+* connections are kept alive between requests until they are idle for
+  `keepalive_timeout` seconds
+
+Request bodies must have "Content-Length" (chunked requests are rejected),
+responses of the Flask app are buffered before they are sent.
+"""
+import argparse
+import asyncio
+import io
+import queue
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http import HTTPStatus
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, unquote_to_bytes
+
+from flask import Flask
+
+from radio_box.events import KEEPALIVE_INTERVAL, Event, EventHub, format_event
+from radio_box.rest_api import EVENTS_EXTENSION, create_app
+
+DEFAULT_BIND = "0.0.0.0:80"
+# Threads that run the Flask app, only short requests are handled by them
+DEFAULT_THREADS = 8
+DEFAULT_MAX_CONNECTIONS = 1024
+# Seconds for which idle connection is kept open between requests
+KEEPALIVE_TIMEOUT = 75.0
+# Limit of a single line of the request head, longer lines are rejected
+MAX_LINE_SIZE = 8 * 1024
+MAX_HEADERS = 100
+MAX_BODY_SIZE = 1024 * 1024
+# Headers that apply to a single connection, they are set by the server
+HOP_BY_HOP = frozenset(("connection", "keep-alive", "transfer-encoding"))
+
+
+class HttpError(Exception):
+    """Request can't be handled, connection is closed after the error response."""
+
+    def __init__(self, status: HTTPStatus) -> None:
+        """Initialize error.
+
+        :param status: Status of the error response.
+        """
+        super().__init__(status.phrase)
+        self.status = status
+
+
+class Request(NamedTuple):
+    """Parsed HTTP request."""
+
+    method: str
+    path: str
+    query: str
+    version: str
+    # Header names are lower case, values of repeated headers are joined
+    headers: Dict[str, str]
+    body: bytes
+
+
+class EventQueue(queue.Queue):
+    """Queue of events that wakes up coroutine waiting in the event loop.
+
+    Events are put into the queue by the EventHub thread, the asyncio.Event is set
+    through the loop, because it's not thread-safe.
+    """
+
+    def __init__(
+        self, maxsize: int, loop: asyncio.AbstractEventLoop, wakeup: asyncio.Event
+    ) -> None:
+        """Initialize queue.
+
+        :param maxsize: Number of events the client can fall behind.
+        :param loop: Event loop of the client.
+        :param wakeup: Event set when anything is put into the queue.
+        """
+        super().__init__(maxsize)
+        self.loop = loop
+        self.wakeup = wakeup
+
+    def _put(self, item: Event) -> None:
+        """Add event to the queue and wake up the client."""
+        super()._put(item)
+        try:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+        except RuntimeError:
+            # Loop is already closed, client is gone
+            pass
+
+    def take_all(self) -> List[Event]:
+        """Remove and return all queued events without blocking."""
+        with self.mutex:
+            events = list(self.queue)
+            self.queue.clear()
+            self.not_full.notify_all()
+        return events
+
+
+def _split_header(line: str) -> Tuple[str, str]:
+    """Return lower case name and value of the header line.
+
+    :raises HttpError: If the line is not a header.
+    """
+    name, separator, value = line.partition(":")
+    if not separator or not name or name != name.strip():
+        raise HttpError(HTTPStatus.BAD_REQUEST)
+    return name.lower(), value.strip()
+
+
+async def _read_line(reader: asyncio.StreamReader) -> str:
+    """Read single line of the request head.
+
+    :raises HttpError: If the line is too long.
+    """
+    try:
+        line = await reader.readuntil(b"\n")
+    except asyncio.LimitOverrunError as exc:
+        raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE) from exc
+    return line.decode("latin-1").rstrip("\r\n")
+
+
+async def _read_headers(reader: asyncio.StreamReader) -> Dict[str, str]:
+    """Read header lines up to the empty line that ends the request head.
+
+    :raises HttpError: If the headers are not valid or there are too many of them.
+    """
+    headers: Dict[str, str] = {}
+    for _ in range(MAX_HEADERS + 1):
+        line = await _read_line(reader)
+        if not line:
+            return headers
+        name, value = _split_header(line)
+        headers[name] = f"{headers[name]}, {value}" if name in headers else value
+    raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+
+
+async def _read_body(reader: asyncio.StreamReader, headers: Dict[str, str]) -> bytes:
+    """Read body of the request, its length must be known in advance.
+
+    :raises HttpError: If the length is missing, invalid or too large.
+    """
+    if "transfer-encoding" in headers:
+        raise HttpError(HTTPStatus.LENGTH_REQUIRED)
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError as exc:
+        raise HttpError(HTTPStatus.BAD_REQUEST) from exc
+    if not 0 <= length <= MAX_BODY_SIZE:
+        raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    return await reader.readexactly(length)
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    """Read HTTP/1.x request from the connection.
+
+    :param reader: Stream of the connection, its limit bounds the line length.
+    :return: None if the connection was closed before the request started.
+    :raises HttpError: If the request is not valid or it's not supported.
+    :raises asyncio.IncompleteReadError: If the connection was closed mid-request.
+    """
+    try:
+        request_line = await _read_line(reader)
+    except asyncio.IncompleteReadError as exc:
+        if not exc.partial:
+            return None
+        raise
+    try:
+        method, target, version = request_line.split(" ")
+    except ValueError as exc:
+        raise HttpError(HTTPStatus.BAD_REQUEST) from exc
+    if version not in ("HTTP/1.0", "HTTP/1.1"):
+        raise HttpError(HTTPStatus.HTTP_VERSION_NOT_SUPPORTED)
+    headers = await _read_headers(reader)
+    body = await _read_body(reader, headers)
+    path, _, query = target.partition("?")
+    return Request(method, path, query, version, headers, body)
+
+
+def keep_alive(request: Request) -> bool:
+    """Return True if the client wants to keep the connection open.
+
+    :param request: Parsed request.
+    """
+    connection = request.headers.get("connection", "").lower()
+    if request.version == "HTTP/1.0":
+        return connection == "keep-alive"
+    return connection != "close"
+
+
+def wsgi_environ(
+    request: Request, server: Tuple[Any, ...], peer: Tuple[Any, ...]
+) -> Dict[str, Any]:
+    """Return WSGI environment of the request.
+
+    :param request: Parsed request.
+    :param server: Local address of the connection.
+    :param peer: Address of the client.
+    """
+    environ: Dict[str, Any] = {
+        "REQUEST_METHOD": request.method,
+        "SCRIPT_NAME": "",
+        "PATH_INFO": unquote_to_bytes(request.path).decode("latin-1"),
+        "QUERY_STRING": request.query,
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": request.version,
+        "REMOTE_ADDR": str(peer[0]),
+        "REMOTE_PORT": str(peer[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(request.body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in request.headers.items():
+        key = name.upper().replace("-", "_")
+        if key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            key = f"HTTP_{key}"
+        environ[key] = value
+    return environ
+
+
+def call_app(
+    app: Flask, environ: Dict[str, Any]
+) -> Tuple[str, List[Tuple[str, str]], bytes]:
+    """Run the WSGI app and collect its whole response.
+
+    :param app: Flask app.
+    :param environ: WSGI environment of the request.
+    :return: Status, headers and body of the response.
+    """
+    started: List[Any] = []
+    chunks: List[bytes] = []
+
+    def start_response(status: str, headers: List[Tuple[str, str]], *_: Any) -> Any:
+        started[:] = [status, headers]
+        return chunks.append
+
+    result = app(environ, start_response)
+    try:
+        chunks.extend(result)
+    finally:
+        close = getattr(result, "close", None)
+        if close is not None:
+            close()
+    return started[0], started[1], b"".join(chunks)
+
+
+def format_head(status: str, headers: List[Tuple[str, str]], alive: bool) -> bytes:
+    """Format status line and headers of the response.
+
+    :param status: Status code and reason, e.g. "200 OK".
+    :param headers: Headers of the response, hop-by-hop headers are replaced.
+    :param alive: Whether the connection is kept open after the response.
+    """
+    lines = [f"HTTP/1.1 {status}", f"Date: {formatdate(usegmt=True)}"]
+    lines.extend(
+        f"{name}: {value}" for name, value in headers if name.lower() not in HOP_BY_HOP
+    )
+    lines.append(f"Connection: {'keep-alive' if alive else 'close'}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def format_response(
+    status: str, headers: List[Tuple[str, str]], body: bytes, alive: bool
+) -> bytes:
+    """Format the whole response, "Content-Length" is added if it's missing.
+
+    :param status: Status code and reason, e.g. "200 OK".
+    :param headers: Headers of the response.
+    :param body: Body of the response.
+    :param alive: Whether the connection is kept open after the response.
+    """
+    code = int(status.split(" ", 1)[0])
+    bodyless = code < 200 or code in (204, 304)
+    if not bodyless and all(name.lower() != "content-length" for name, _ in headers):
+        headers = headers + [("Content-Length", str(len(body)))]
+    return format_head(status, headers, alive) + body
+
+
+def error_response(status: HTTPStatus) -> bytes:
+    """Format error response that closes the connection.
+
+    :param status: Status of the error.
+    """
+    return format_response(
+        f"{status.value} {status.phrase}",
+        [("Content-Type", "text/plain; charset=utf-8")],
+        status.phrase.encode("utf8"),
+        alive=False,
+    )
+
+
+class AsyncServer:
+    """Serves the REST API app to many connections from a single event loop."""
+
+    def __init__(
+        self,
+        app: Flask,
+        threads: int = DEFAULT_THREADS,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        keepalive_timeout: float = KEEPALIVE_TIMEOUT,
+    ) -> None:
+        """Initialize server.
+
+        :param app: Flask app of the REST API.
+        :param threads: Number of threads that run the Flask app.
+        :param max_connections: Number of open connections above which new
+            connections are refused with "503 Service Unavailable".
+        :param keepalive_timeout: Seconds for which idle connections are kept open.
+        """
+        self.app = app
+        self.hubs: Optional[Dict[str, EventHub]] = app.extensions.get(EVENTS_EXTENSION)
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="rest")
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.connections = 0
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve requests of a single connection until it's closed.
+
+        :param reader: Incoming stream of the connection.
+        :param writer: Outgoing stream of the connection.
+        """
+        if self.connections >= self.max_connections:
+            writer.write(error_response(HTTPStatus.SERVICE_UNAVAILABLE))
+            writer.close()
+            return
+        self.connections += 1
+        try:
+            while await self.serve_request(reader, writer):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def serve_request(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> bool:
+        """Read and answer single request.
+
+        :param reader: Incoming stream of the connection.
+        :param writer: Outgoing stream of the connection.
+        :return: True if the connection should be kept open for the next request.
+        """
+        try:
+            request = await asyncio.wait_for(
+                read_request(reader), self.keepalive_timeout
+            )
+        except HttpError as exc:
+            writer.write(error_response(exc.status))
+            await writer.drain()
+            return False
+        if request is None:
+            return False
+        hub = self.events_hub(request)
+        if hub:
+            await self.stream_events(hub, writer)
+            return False
+
+        environ = wsgi_environ(
+            request,
+            writer.get_extra_info("sockname"),
+            writer.get_extra_info("peername"),
+        )
+        loop = asyncio.get_running_loop()
+        status, headers, body = await loop.run_in_executor(
+            self.executor, call_app, self.app, environ
+        )
+        alive = keep_alive(request)
+        writer.write(format_response(status, headers, body, alive))
+        await writer.drain()
+        return alive
+
+    def events_hub(self, request: Request) -> Optional[EventHub]:
+        """Return hub of the zone if the request is for its events.
+
+        Requests for unknown zones are left to the app, which refuses them.
+
+        :param request: Parsed request.
+        :return: None if the request is not streamed by the loop.
+        """
+        if request.method != "GET" or request.path != "/events" or not self.hubs:
+            return None
+        zone = parse_qs(request.query).get("zone", [""])[0]
+        return self.hubs.get(zone)
+
+    @staticmethod
+    async def stream_events(hub: EventHub, writer: asyncio.StreamWriter) -> None:
+        """Stream server-sent events until the client disconnects or falls behind.
+
+        :param hub: Hub distributing player states of this server.
+        :param writer: Outgoing stream of the connection.
+        """
+        wakeup = asyncio.Event()
+        client = EventQueue(hub.queue_size, asyncio.get_running_loop(), wakeup)
+        hub.subscribe(client)
+        try:
+            headers = [
+                ("Content-Type", "text/event-stream; charset=utf-8"),
+                ("Cache-Control", "no-cache"),
+                ("X-Accel-Buffering", "no"),
+            ]
+            writer.write(format_head("200 OK", headers, alive=False))
+            await writer.drain()
+            while True:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    writer.write(b": keepalive\n\n")
+                    await writer.drain()
+                    continue
+                wakeup.clear()
+                for event in client.take_all():
+                    if event is None:
+                        return
+                    writer.write(format_event(*event).encode("utf8"))
+                await writer.drain()
+        finally:
+            hub.unsubscribe(client)
+
+    async def serve(self, host: str, port: int) -> None:
+        """Accept connections until the task is cancelled.
+
+        :param host: Address to listen on.
+        :param port: Port to listen on.
+        """
+        server = await asyncio.start_server(
+            self.handle, host, port, limit=MAX_LINE_SIZE
+        )
+        async with server:
+            print(f"Listening on {host}:{port}")
+            await server.serve_forever()
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse CLI arguments of the async server."""
+    parser = argparse.ArgumentParser(
+        description="Serve radio-box REST API and web interface with asyncio."
+    )
+    parser.add_argument(
+        "-b", "--bind", default=DEFAULT_BIND, help="Address and port, ADDRESS:PORT"
+    )
+    parser.add_argument(
+        "-t",
+        "--threads",
+        type=int,
+        default=DEFAULT_THREADS,
+        help="Threads that handle requests other than '/events'",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=DEFAULT_MAX_CONNECTIONS,
+        help="Maximum number of open connections",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    """Run the async server of the REST API."""
+    args = parse_args()
+    host, _, port = args.bind.rpartition(":")
+    server = AsyncServer(create_app(), args.threads, args.max_connections)
+    try:
+        asyncio.run(server.serve(host or "0.0.0.0", int(port)))
+    except KeyboardInterrupt:
+        pass
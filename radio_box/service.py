@@ -1,83 +1,676 @@
 """RadioBox service that waits commands and plays selected internet radio stations.
 
-Communication is conducted over a named pipe defined in the configuration file. This
-service can be controlled either with cli client or rest api, both are part of the
-radio_box python package.
+Communication is conducted over a named pipe or a unix domain socket defined in the
+configuration file. This service can be controlled either with cli client or rest api,
+both are part of the radio_box python package. Messages are length-prefixed, so
+writers can keep the connection open and send multiple commands at once. When using
+the socket, every command receives a reply with the result and current player state.
+
+The service runs on a single asyncio event loop. Reading of commands, their
+execution, processing of VLC player events and publishing of the player state are all
+tasks on this loop. Calls into the VLC library may block for a long time, so they are
+executed in a dedicated thread and the loop is free to accept next commands meanwhile.
 
 This service utilizes VLC player to process audio streams. The VLC player is started
 in the headless mode (no GUI required) and audio output is played over a default alsa
-audio device.
+audio device. Optionally, the service plays in multiple zones (e.g. rooms), each with
+its own player and alsa device. Commands select their zone by its ID. With the
+time-shift enabled, stations are played through the relay that buffers them, so that
+the playback can be paused and sought back (see radio_box.timeshift). Stations can
+also be recorded to disk, independently of the playback (see radio_box.recorder).
 """
+# pylint: disable=too-many-lines
 import argparse
-from typing import Dict, Optional
+import asyncio
+import math
+import os
+import stat
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import (
+    Awaitable,
+    Callable,
+    Coroutine,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+    cast,
+)
 
 import vlc
-import yaml
-from google.protobuf.message import DecodeError
 
-from radio_box.common import common_argument_parser, create_pipe
+from radio_box.catalog import load_stations
+from radio_box.common import (
+    DEFAULT_ZONE,
+    MAX_VOLUME,
+    READ_SIZE,
+    TRANSPORT_PIPE,
+    TRANSPORT_SOCKET,
+    FramingError,
+    MessageDecoder,
+    common_argument_parser,
+    create_pipe,
+    encode_message,
+    make_message_play,
+    make_message_stop,
+    zone_configs,
+)
+from radio_box.config import load_config
+from radio_box.metrics import REGISTRY, Exporter, metrics_dir_path
+from radio_box.mirrors import MirrorStats, station_urls
+from radio_box.prober import ProberOptions, StationProber, status_file_path
 from radio_box.protocol import controls_pb2 as controls
+from radio_box.recorder import Recorder, RecorderOptions
+from radio_box.relay import Relay, RelayOptions
+from radio_box.reload import ConfigWatcher, StationsDiff, diff_stations
+from radio_box.resolver import ResolverOptions, StreamResolver
+from radio_box.status import StatusWriter, status_block_path
+from radio_box.timeshift import (
+    TimeShiftOptions,
+    relay_url,
+    station_url,
+    timeshift_relay_options,
+)
+from radio_box.tracing import (
+    OUTCOME_ERROR,
+    OUTCOME_FAILED,
+    OUTCOME_OK,
+    OUTCOME_SUPERSEDED,
+    TraceBuffer,
+    mark,
+    mark_received,
+    to_trace,
+)
+
+# Options of the libvlc instance, audio is played over ALSA
+VLC_OPTIONS = ("--input-repeat=-1", "-Idummy", "--aout=alsa")
+
+# Events reported by the Tuner, translated from the VLC player events
+EVENT_OPENING = "opening"
+EVENT_BUFFERING = "buffering"
+EVENT_PLAYING = "playing"
+EVENT_ERROR = "error"
+EVENT_END = "end"
+EVENT_METADATA = "metadata"
+
+PLAYER_EVENTS = {
+    vlc.EventType.MediaPlayerOpening: EVENT_OPENING,
+    vlc.EventType.MediaPlayerBuffering: EVENT_BUFFERING,
+    vlc.EventType.MediaPlayerPlaying: EVENT_PLAYING,
+    vlc.EventType.MediaPlayerEncounteredError: EVENT_ERROR,
+    vlc.EventType.MediaPlayerEndReached: EVENT_END,
+}
+# Reported in the player state when the station fails on these events
+FAILURE_REASONS = {EVENT_ERROR: "Stream error", EVENT_END: "Stream ended"}
+
+# Maximum number of commands waiting for execution. Readers stop consuming data from
+# the pipe/socket when the queue is full.
+COMMAND_QUEUE_SIZE = 64
+# Queued commands of the same group supersede each other, only the latest one is
+# executed. E.g. when user clicks through several stations while the player is busy,
+# only the last station is started.
+COALESCING_GROUPS = {
+    "play": "playback",
+    "stop": "playback",
+    "set_volume": "volume",
+    "seek": "seek",
+}
+# Number of state updates that subscriber can fall behind before the oldest updates
+# are dropped.
+SUBSCRIBER_QUEUE_SIZE = 16
+
+# Seconds for which the station may be opening/buffering before it's considered stalled
+STALL_TIMEOUT = 15
+
+# Volume changes are spread over this many steps, one step per interval (in seconds),
+# so that the jump in the output level does not produce an audible click
+VOLUME_RAMP_STEPS = 4
+VOLUME_RAMP_INTERVAL = 0.01
+
+# Seconds between two snapshots of the service metrics
+METRICS_INTERVAL = 5
+
+# What started the station switch, reported in the metrics and logs
+SWITCH_COMMAND = "command"
+SWITCH_FAILOVER = "failover"
+SWITCH_MESSAGES = {SWITCH_COMMAND: "Switched to", SWITCH_FAILOVER: "Failed over"}
+
+# Strategies for choosing the station that's kept ready in the standby player. Any
+# other value is interpreted as an ID of a favourite station.
+STANDBY_RECENT = "recent"
+STANDBY_NEXT = "next"
+STANDBY_OFF = "off"
+STANDBY_STRATEGIES = (STANDBY_RECENT, STANDBY_NEXT, STANDBY_OFF)
+# Standby player in one of these states has to be restarted before use
+STANDBY_FAILED_STATES = (vlc.State.Error, vlc.State.Ended, vlc.State.Stopped)
 
-QUIT_ = False
+COMMANDS = REGISTRY.counter(
+    "radio_box_commands_total",
+    "Commands processed by the service.",
+    ["command", "status"],
+)
+COALESCED_COMMANDS = REGISTRY.counter(
+    "radio_box_commands_coalesced_total",
+    "Commands skipped because a later queued command superseded them.",
+    ["command"],
+)
+COMMAND_DURATION = REGISTRY.histogram(
+    "radio_box_command_duration_seconds",
+    "Time from receiving the command until the player executed it.",
+    ["command"],
+)
+PLAYING_DELAY = REGISTRY.histogram(
+    "radio_box_playing_delay_seconds",
+    "Time from the player starting the station until VLC reported playback.",
+    ["trigger"],
+)
+TIME_TO_AUDIO = REGISTRY.histogram(
+    "radio_box_time_to_audio_seconds",
+    "Time from receiving the command (or failure) until the station played.",
+    ["station", "trigger"],
+)
+BUFFERING_EVENTS = REGISTRY.counter(
+    "radio_box_buffering_events_total",
+    "Interruptions of the playback caused by emptied buffer.",
+    ["station"],
+)
+RECONNECTS = REGISTRY.counter(
+    "radio_box_reconnects_total",
+    "Attempts to fail over the station to its next mirror.",
+    ["station", "result"],
+)
 
+PlayerEventCallback = Callable[[str, float], None]
+Submit = Callable[[controls.Command], Awaitable["asyncio.Future[controls.Reply]"]]
 
-class Tuner:
-    """Wrapper for VLC player instance that handles start/stop and media change."""
 
-    def __init__(self, stations: Dict[str, dict]) -> None:
+class Tuner:  # pylint: disable=too-many-instance-attributes
+    """Wrapper for VLC player instance that handles start/stop and media change.
+
+    Besides the active player, Tuner keeps a second, muted, standby player connected
+    to the station that is most likely to be played next. Switching to that station
+    only swaps the players and unmutes the standby one, so the listener does not
+    have to wait for the connection to be established and the buffer to fill up.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        stations: Dict[str, dict],
+        standby: str = STANDBY_RECENT,
+        resolver: Optional[StreamResolver] = None,
+        mirrors: Optional[MirrorStats] = None,
+        *,
+        instance: Optional[vlc.Instance] = None,
+        output: Optional[str] = None,
+        timeshift_url: Optional[str] = None,
+        timeshift_window: float = 0.0,
+    ) -> None:
         """Initialize Tuner instance.
 
         The station parameter expects dict containing station configurations. The
         format of the dict must be {'station_id': {'url': 'station_stream_url'}}.
+        The 'url' can also be a list of mirrors of the station.
         Example:
             {'best_radio': {'url': 'http://example.org/best_stream.mp3'}}
 
+        The standby parameter selects station that is kept ready in the standby
+        player:
+            * "recent" - previously played station
+            * "next" - station that follows the active one in the configuration
+            * "off" - standby player is not used
+            * any other value is an ID of a favourite station
+
         :param stations: dict containing station configuration.
+        :param standby: Strategy for choosing the standby station.
+        :param resolver: Resolver of stream URLs. If omitted, station URLs are passed
+            to VLC unchanged.
+        :param mirrors: Statistics used to choose the best mirror of the station.
+        :param instance: libvlc instance shared by tuners of multiple zones, new
+            instance is created if omitted.
+        :param output: ALSA device on which the tuner plays (e.g.
+            "hw:CARD=Device"), the default device if omitted.
+        :param timeshift_url: Base URL of the relay that buffers the stations for
+            the time-shift. Stations are played directly if omitted and the
+            time-shift is disabled.
+        :param timeshift_window: Seconds of the stations kept by the relay.
+        :raises ValueError: If the favourite standby station is not configured.
         """
+        if standby not in STANDBY_STRATEGIES and standby not in stations:
+            raise ValueError(f"Unknown standby station {standby}.")
+
         self.stations = stations
-        self.vlc = vlc.Instance("--input-repeat=-1", "-Idummy", "--aout=alsa")
+        self.standby = standby
+        self.resolver = resolver
+        self.mirrors = mirrors or MirrorStats()
+        self.vlc = instance or vlc.Instance(*VLC_OPTIONS)
+        self.output = output
         self.player: vlc.MediaPlayer = self.vlc.media_player_new()
         self.active_media: Optional[vlc.Media] = None
+        self.active_station: Optional[str] = None
+        self.active_url: Optional[str] = None
+        # Mirrors of the active station that failed since it was selected
+        self.failed_urls: Set[str] = set()
+        self.standby_player: vlc.MediaPlayer = self.vlc.media_player_new()
+        self.standby_media: Optional[vlc.Media] = None
+        self.standby_station: Optional[str] = None
+        self.standby_url: Optional[str] = None
+        if output:
+            for player in (self.player, self.standby_player):
+                player.audio_output_device_set(None, output)
+        # Now playing title reported by the active station
+        self.now_playing = ""
+        # Volume of the players, libvlc starts with unamplified output
+        self.volume = MAX_VOLUME
+        self.timeshift_url = timeshift_url
+        self.timeshift_window = timeshift_window
+        # Seconds by which the active station lagged behind the live stream when it
+        # was last resumed or sought, and monotonic time at which it was paused
+        self.delay = 0.0
+        self.paused_at: Optional[float] = None
+        self._event_callback: Optional[PlayerEventCallback] = None
+        # Guards roles of the players, they are swapped while libvlc threads may be
+        # delivering events.
+        self._roles_lock = threading.Lock()
 
-    def _set_station(self, station_id: str) -> None:
-        """Change current station.
+    def attach_events(self, callback: PlayerEventCallback) -> None:
+        """Register callback for events of the VLC player.
 
-        The 'station_id' parameter must be a key from `self.stations` dict.
+        Callback receives name of the event and its value. Value is percentage of the
+        filled buffer for "buffering" events and 0 for other events. Only events of
+        the active player are reported. The "metadata" event reports change of the
+        `now_playing` title.
 
-        :param station_id: ID of the new station to set as a current media.
+        Note: Callback is executed in the libvlc thread.
+
+        :param callback: Function called on each player event.
+        """
+        self._event_callback = callback
+        for player in (self.player, self.standby_player):
+            event_manager = player.event_manager()
+            for vlc_event, event_name in PLAYER_EVENTS.items():
+                event_manager.event_attach(
+                    vlc_event, self._forward_event, event_name, player, callback
+                )
+
+    def _forward_event(
+        self,
+        event: vlc.Event,
+        event_name: str,
+        player: vlc.MediaPlayer,
+        callback: PlayerEventCallback,
+    ) -> None:
+        """Extract data from VLC event and pass them to the callback.
+
+        VLC event objects are valid only for the duration of the VLC callback, so
+        they can't be passed to other threads. Events of the standby player are not
+        forwarded. Audio output of the player exists only after the playback starts,
+        so that's when the standby player is muted.
+        """
+        with self._roles_lock:
+            is_active = player is self.player
+            if not is_active and event_name == EVENT_PLAYING:
+                player.audio_set_mute(True)
+
+        if is_active:
+            value = event.u.new_cache if event_name == EVENT_BUFFERING else 0.0
+            callback(event_name, value)
+
+    def _forward_metadata(
+        self, _event: vlc.Event, media: vlc.Media, callback: PlayerEventCallback
+    ) -> None:
+        """Update now playing title when metadata of the active media change.
+
+        Note: This method is executed in the libvlc thread.
+        """
+        title = media.get_meta(vlc.Meta.NowPlaying) or ""
+        with self._roles_lock:
+            is_active = media is self.active_media and title != self.now_playing
+            if is_active:
+                self.now_playing = title
+
+        if is_active:
+            callback(EVENT_METADATA, 0.0)
+
+    def _get_urls(self, station_id: str) -> List[str]:
+        """Return mirrors of the station, from the most preferred one.
+
+        :param station_id: ID of the station.
         :raises ValueError: If supplied station_id is not found in self.stations.
         """
-        station: dict = self.stations.get(station_id, {})
-        if not station:
+        urls = station_urls(self.stations.get(station_id, {}))
+        if not urls:
             raise ValueError(
                 f"Unknown station {station_id}. Check config file to see if it's"
-                "defined."
+                " defined."
+            )
+        return self.mirrors.order(urls)
+
+    def _media_url(self, station_id: str, url: str, delay: int = 0) -> str:
+        """Return URL from which the player plays the station.
+
+        :param station_id: ID of the station.
+        :param url: URL of the station mirror, resolved if possible.
+        :param delay: Seconds behind the live stream, used only with time-shift.
+        """
+        if self.timeshift_url:
+            return station_url(self.timeshift_url, station_id, delay)
+        return self.resolver.resolve(url) if self.resolver else url
+
+    def _new_media(self, station_id: str, url: str, delay: int = 0) -> vlc.Media:
+        """Create VLC media for the station.
+
+        :param station_id: ID of the station.
+        :param url: URL of the station mirror.
+        :param delay: Seconds behind the live stream, used only with time-shift.
+        """
+        media = self.vlc.media_new(self._media_url(station_id, url, delay))
+        if self._event_callback:
+            media.event_manager().event_attach(
+                vlc.EventType.MediaMetaChanged,
+                self._forward_metadata,
+                media,
+                self._event_callback,
             )
+        return media
 
-        self.active_media = self.vlc.media_new(station.get("url"))
+    def invalidate_station(self, station_id: str) -> None:
+        """Forget resolved stream URL of the station, e.g. after its playback failed.
+
+        Note: Unlike other methods, this one is safe to call from any thread.
+
+        :param station_id: ID of the station.
+        """
+        if self.resolver:
+            for url in station_urls(self.stations.get(station_id, {})):
+                self.resolver.invalidate(url)
+
+    def update_stations(self, stations: Dict[str, dict]) -> StationsDiff:
+        """Replace configuration of the stations without interrupting the playback.
+
+        Resolved URLs of removed and changed stations are forgotten and the standby
+        player is stopped if its station is one of them. Active station is left to
+        the caller.
+
+        :param stations: New "stations" section of the config.
+        """
+        diff = diff_stations(self.stations, stations)
+        for station_id in diff.removed | diff.changed:
+            self.invalidate_station(station_id)
+        self.stations = stations
+        if self.standby_station in diff.removed | diff.changed:
+            self._stop_standby()
+        return diff
+
+    def _set_station(
+        self, station_id: str, url: Optional[str] = None, delay: int = 0
+    ) -> None:
+        """Change current station.
+
+        The 'station_id' parameter must be a key from `self.stations` dict.
+
+        :param station_id: ID of the new station to set as a current media.
+        :param url: Mirror of the station to use, the best one if omitted.
+        :param delay: Seconds behind the live stream, used only with time-shift.
+        :raises ValueError: If supplied station_id is not found in self.stations.
+        """
+        url = url or self._get_urls(station_id)[0]
+        self.active_media = self._new_media(station_id, url, delay)
+        self.active_station = station_id
+        self.active_url = url
+        self.now_playing = ""
         self.player.set_media(self.active_media)
 
-    def stop(self) -> None:
-        """Stop current playback."""
+    def _swap_players(self) -> None:
+        """Make standby player active and mute the previously active player."""
+        with self._roles_lock:
+            self.player, self.standby_player = self.standby_player, self.player
+            self.active_media, self.standby_media = (
+                self.standby_media,
+                self.active_media,
+            )
+            self.active_station, self.standby_station = (
+                self.standby_station,
+                self.active_station,
+            )
+            self.active_url, self.standby_url = self.standby_url, self.active_url
+            self.now_playing = ""
+            self.delay = 0.0
+            self.paused_at = None
+            self.standby_player.audio_set_mute(True)
+            self.player.audio_set_mute(False)
+
+    def _standby_target(
+        self, active: Optional[str], previous: Optional[str]
+    ) -> Optional[str]:
+        """Predict which station will be played after the active one.
+
+        :param active: Currently played station.
+        :param previous: Station that was played before the active one.
+        """
+        if self.standby == STANDBY_OFF:
+            target = None
+        elif self.standby == STANDBY_RECENT:
+            target = previous
+        elif self.standby == STANDBY_NEXT:
+            station_ids = list(self.stations)
+            position = station_ids.index(active) if active in station_ids else -1
+            target = station_ids[(position + 1) % len(station_ids)]
+        else:
+            target = self.standby if self.standby != active else previous
+
+        # Stations might have been removed from the config since
+        return target if target != active and target in self.stations else None
+
+    def _stop_standby(self) -> None:
+        """Stop playback of the standby player."""
+        self.standby_player.stop()
+        if self.standby_media:
+            self.standby_media.release()
+            self.standby_media = None
+        self.standby_station = None
+        self.standby_url = None
+
+    def _prepare_standby(self, previous: Optional[str]) -> None:
+        """Connect standby player to the station that's likely to be played next.
+
+        :param previous: Station that was played before the active one.
+        """
+        target = self._standby_target(self.active_station, previous)
+        if target == self.standby_station:
+            return
+
+        self._stop_standby()
+        if target is not None:
+            print(f"Preparing standby station: {target}")
+            self.standby_url = self._get_urls(target)[0]
+            self.standby_media = self._new_media(target, self.standby_url)
+            self.standby_station = target
+            self.standby_player.set_media(self.standby_media)
+            self.standby_player.audio_set_mute(True)
+            self.standby_player.play()
+
+    def _standby_ready(self, station_id: str) -> bool:
+        """Check whether the standby player can take over playback of the station.
+
+        :param station_id: ID of the station that should be played.
+        """
+        return (
+            station_id == self.standby_station
+            and self.standby_player.get_state() not in STANDBY_FAILED_STATES
+        )
+
+    def _stop_active(self) -> None:
+        """Stop playback of the active player."""
         self.player.stop()
         if self.active_media:
             print("Stopping current media.")
             self.active_media.release()
             self.active_media = None
+        self.active_station = None
+        self.active_url = None
+        self.delay = 0.0
+        self.paused_at = None
+
+    def set_volume(self, level: int) -> None:
+        """Change volume of both players, so that it's kept when they are swapped.
+
+        :param level: Volume level between 0 and MAX_VOLUME.
+        """
+        for player in (self.player, self.standby_player):
+            player.audio_set_volume(level)
+        self.volume = level
+
+    def stop(self) -> None:
+        """Stop current playback and release the standby player."""
+        self._stop_active()
+        self._stop_standby()
 
-    def play(self, station_id: str) -> None:
+    def play(self, station_id: str) -> bool:
         """Starts playback of selected radio station.
 
-        The 'station_id' parameter must be a key from self.stations dict.
+        The 'station_id' parameter must be a key from self.stations dict. If the
+        station is ready in the standby player, players are swapped. Otherwise, the
+        previously active player is kept as a standby (if it's the predicted next
+        station) and the playback starts from scratch.
 
         :param station_id: ID of the new station to set as a current media.
         :raises ValueError: If supplied station_id is not found in self.stations.
+        :return: True if the station is already playing.
         """
-        if self.active_media:
-            self.stop()
+        self._get_urls(station_id)
+        previous = self.active_station
+        self.failed_urls.clear()
+        if self.paused:
+            # Paused player lags behind the live stream, it can't be kept as standby
+            self._stop_active()
+
+        if self._standby_ready(station_id):
+            print(f"Switching to standby station: {station_id}")
+            self._swap_players()
+            self._prepare_standby(previous)
+            return bool(self.player.is_playing())
+
+        if previous and self._standby_target(station_id, previous) == previous:
+            self._swap_players()
+        self._stop_active()
+
         print(f"Starting playback: {station_id}")
         self._set_station(station_id)
         self.player.play()
+        self._prepare_standby(previous)
+        return False
+
+    def failover(self, station_id: str) -> bool:
+        """Switch playback of the failed station to its next mirror.
+
+        Failed mirror is ranked behind the working ones for a while. Each mirror is
+        tried at most once until the station is played again.
+
+        :param station_id: Station that failed, nothing is done if it's not active.
+        :return: True if the playback of the next mirror started, False if the
+            station is no longer active or all of its mirrors failed.
+        """
+        if station_id != self.active_station or not self.active_url:
+            return False
+
+        failed_url = self.active_url
+        self.failed_urls.add(failed_url)
+        self.mirrors.record_failure(failed_url)
+        if self.resolver:
+            self.resolver.invalidate(failed_url)
+
+        remaining = [
+            url for url in self._get_urls(station_id) if url not in self.failed_urls
+        ]
+        if not remaining:
+            return False
+
+        print(f"Mirror {failed_url} failed, switching to {remaining[0]}")
+        self._stop_active()
+        self._set_station(station_id, remaining[0])
+        self.player.play()
+        return True
+
+    @property
+    def paused(self) -> bool:
+        """Whether the active station is paused."""
+        return self.paused_at is not None
+
+    def current_delay(self) -> int:
+        """Return seconds by which the active station lags behind the live stream."""
+        delay = self.delay
+        if self.paused_at is not None:
+            delay += time.monotonic() - self.paused_at
+        return int(min(delay, self.timeshift_window))
+
+    def _timeshift_station(self) -> str:
+        """Return active station that's about to be time-shifted.
+
+        :raises ValueError: If the time-shift is disabled or nothing is playing.
+        """
+        if not self.timeshift_url:
+            raise ValueError("Time-shift is not enabled.")
+        if not self.active_station:
+            raise ValueError("Nothing is playing.")
+        return self.active_station
+
+    def pause(self) -> None:
+        """Pause the active station, the relay keeps buffering it meanwhile.
+
+        :raises ValueError: If the time-shift is disabled or nothing is playing.
+        """
+        self._timeshift_station()
+        if self.paused_at is None:
+            print(f"Pausing playback: {self.active_station}")
+            self.player.set_pause(1)
+            self.paused_at = time.monotonic()
+
+    def resume(self) -> bool:
+        """Continue paused playback where it was paused.
+
+        Player continues reading its connection to the relay, so the playback starts
+        without reconnecting. If it was paused for longer than the relay keeps the
+        station, it continues from the oldest buffered part instead.
+
+        :raises ValueError: If the time-shift is disabled or nothing is playing.
+        :return: True if the playback continued right away.
+        """
+        self._timeshift_station()
+        if self.paused_at is None:
+            return bool(self.player.is_playing())
+        delay = self.delay + time.monotonic() - self.paused_at
+        if delay >= self.timeshift_window:
+            self.seek(int(self.timeshift_window))
+            return False
+        print(f"Resuming playback: {self.active_station}")
+        self.player.set_pause(0)
+        self.delay = delay
+        self.paused_at = None
+        return True
+
+    def seek(self, delay: int) -> None:
+        """Restart the active station the number of seconds behind the live stream.
+
+        Delay is limited by the time-shift window, 0 returns to the live stream.
+
+        :param delay: Seconds behind the live stream.
+        :raises ValueError: If the time-shift is disabled or nothing is playing.
+        """
+        station_id = self._timeshift_station()
+        url = self.active_url
+        delay = min(delay, int(self.timeshift_window))
+        print(f"Seeking {station_id} {delay}s behind the live stream.")
+        self._stop_active()
+        self._set_station(station_id, url, delay)
+        self.player.play()
+        self.delay = delay
 
 
 def parse_args() -> argparse.Namespace:
@@ -86,50 +679,1118 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
-def process_command(message: controls.Command, tuner: Tuner) -> None:
+def coalescing_group(message: controls.Command) -> Optional[str]:
+    """Return group of commands that supersede each other, None if there's none.
+
+    :param message: Protobuf message containing command.
+    """
+    return COALESCING_GROUPS.get(str(message.WhichOneof("sub_command")))
+
+
+def process_command(message: controls.Command, tuner: Tuner) -> bool:
     """Parse and execute command contained in the message.
 
     :param message: Protobuf message containing command.
     :param tuner: Tuner instance
+    :return: True if the selected station is already playing.
     """
     message_type = str(message.WhichOneof("sub_command"))
     command = getattr(message, message_type)
 
     if command.type == controls.PLAY:
-        tuner.play(command.station)
-    elif command.type == controls.STOP:
+        return tuner.play(command.station)
+    if command.type == controls.RESUME:
+        return tuner.resume()
+    if command.type == controls.STOP:
         tuner.stop()
-    elif command.type == controls.QUIT:
-        global QUIT_  # pylint: disable=global-statement
-        QUIT_ = True
+    elif command.type == controls.PAUSE:
+        tuner.pause()
+    elif command.type == controls.SEEK:
+        tuner.seek(command.delay)
     else:  # pragma: no cover
         print(f"Unknown command {message_type}")
+    return False
+
+
+class StatePublisher:
+    """Keeps current player state and distributes its changes to subscribers.
+
+    Rapid changes are coalesced, subscribers always receive the latest state. Each
+    subscriber has a bounded queue and when it falls behind, the oldest states are
+    dropped.
+    """
+
+    def __init__(self) -> None:
+        """Initialize publisher with the "stopped" state."""
+        self.state = controls.PlayerState(status=controls.STOPPED)
+        self.subscribers: List[asyncio.Queue] = []
+        self._changed = asyncio.Event()
+
+    def update(
+        self,
+        station: Optional[str],
+        status: controls.PlaybackStatus.ValueType,
+        error: str = "",
+    ) -> None:
+        """Change player state and schedule its publishing.
+
+        Now playing title and delay are kept while the station does not change.
+
+        :param station: Currently active station, None if there's no active station.
+        :param status: One of the PlaybackStatus values.
+        :param error: Reason of the FAILED status.
+        """
+        state = controls.PlayerState(status=status)
+        if station:
+            state.station = station
+        if error:
+            state.error = error
+        if station and station == self.state.station:
+            if self.state.title:
+                state.title = self.state.title
+            if self.state.delay:
+                state.delay = self.state.delay
+        if self.state.HasField("volume"):
+            state.volume = self.state.volume
+        self._publish(state)
+
+    def update_title(self, title: str) -> None:
+        """Change now playing title of the active station.
+
+        :param title: Title reported by the station, empty if unknown.
+        """
+        state = controls.PlayerState()
+        state.CopyFrom(self.state)
+        if title:
+            state.title = title
+        else:
+            state.ClearField("title")
+        self._publish(state)
+
+    def update_volume(self, level: int) -> None:
+        """Change requested volume of the player.
+
+        :param level: Volume level between 0 and MAX_VOLUME.
+        """
+        state = controls.PlayerState()
+        state.CopyFrom(self.state)
+        state.volume = level
+        self._publish(state)
+
+    def update_delay(self, delay: int) -> None:
+        """Change delay of the time-shifted playback.
+
+        :param delay: Seconds behind the live stream, 0 for the live stream.
+        """
+        state = controls.PlayerState()
+        state.CopyFrom(self.state)
+        if delay:
+            state.delay = delay
+        else:
+            state.ClearField("delay")
+        self._publish(state)
+
+    def _publish(self, state: controls.PlayerState) -> None:
+        """Replace current state and schedule its publishing if it changed."""
+        if state != self.state:
+            self.state = state
+            self._changed.set()
+
+    def subscribe(self) -> "asyncio.Queue[controls.PlayerState]":
+        """Return queue that will receive player state after every change."""
+        queue: "asyncio.Queue[controls.PlayerState]" = asyncio.Queue(
+            SUBSCRIBER_QUEUE_SIZE
+        )
+        self.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        """Stop sending player state to the queue.
+
+        :param queue: Queue returned by the `subscribe()` method.
+        """
+        self.subscribers.remove(queue)
+
+    async def run(self) -> None:
+        """Distribute state changes to all subscribers."""
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            for queue in self.subscribers:
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(self.state)
+
+
+# Returns publisher of the zone's player state, None if there's no such zone
+Publishers = Callable[[str], Optional[StatePublisher]]
+
+
+class PipeServer:  # pylint: disable=too-few-public-methods
+    """Reads commands from the named pipe.
+
+    Pipe is opened in read-write mode. That way the open() does not block while there
+    are no writers, and the read end does not receive EOF every time the last writer
+    closes the pipe.
+    """
+
+    def __init__(self, pipe_path: Path) -> None:
+        """Initialize server.
+
+        :param pipe_path: Path to the named pipe.
+        """
+        self.pipe_path = pipe_path
+
+    async def serve(
+        self, submit: Submit, _publishers: Optional[Publishers] = None
+    ) -> None:
+        """Submit commands from the pipe for execution until cancelled.
+
+        Subscriptions to the player state are not supported over the pipe.
+
+        :param submit: Coroutine function that queues command for execution.
+        """
+        loop = asyncio.get_running_loop()
+        decoder = MessageDecoder(controls.Command)
+        data_ready = asyncio.Event()
+        pipe = os.open(self.pipe_path, os.O_RDWR | os.O_NONBLOCK)
+        loop.add_reader(pipe, data_ready.set)
+        try:
+            while True:
+                await data_ready.wait()
+                data_ready.clear()
+                try:
+                    data = os.read(pipe, READ_SIZE)
+                except BlockingIOError:
+                    continue
+                received = time.time()
+                try:
+                    messages = decoder.feed(data)
+                except FramingError as exc:
+                    print(f"Corrupted data in the pipe, dropping buffer: {exc}")
+                    decoder.reset()
+                    continue
+                for message in messages:
+                    mark_received(message, received)
+                    # Nobody is waiting for the reply, errors are logged by the service
+                    await submit(message)
+        finally:
+            loop.remove_reader(pipe)
+            os.close(pipe)
+
+
+class SocketServer:
+    """Server that accepts commands from multiple clients over unix domain socket.
+
+    Clients can send any number of commands over a single connection, each command
+    receives a Reply message.
+    """
+
+    def __init__(self, socket_path: Path) -> None:
+        """Initialize server.
+
+        :param socket_path: Path on which the unix domain socket will be created.
+        """
+        self.socket_path = socket_path
+
+    @staticmethod
+    async def stream_states(
+        publisher: StatePublisher,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        """Send current player state and all its changes to the subscribed client.
+
+        Returns when the client closes the connection.
+
+        :param publisher: Publisher of the player state.
+        :param reader: Incoming data stream of the connection.
+        :param writer: Outgoing data stream of the connection.
+        """
+
+        async def wait_closed() -> None:
+            while await reader.read(READ_SIZE):
+                pass
+
+        queue = publisher.subscribe()
+        closed = asyncio.ensure_future(wait_closed())
+        try:
+            state = publisher.state
+            while True:
+                reply = controls.Reply(status=controls.OK, state=state)
+                writer.write(encode_message(reply))
+                await writer.drain()
+                update = asyncio.ensure_future(queue.get())
+                await asyncio.wait(
+                    [update, closed], return_when=asyncio.FIRST_COMPLETED
+                )
+                if closed.done():
+                    update.cancel()
+                    return
+                state = update.result()
+        finally:
+            closed.cancel()
+            publisher.unsubscribe(queue)
+
+    @staticmethod
+    async def handle_connection(
+        submit: Submit,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        publishers: Optional[Publishers] = None,
+    ) -> None:
+        """Execute commands received from a single client connection.
+
+        SUBSCRIBE command turns the connection into a stream of player states of
+        the requested zone, any further data from the client are ignored.
+        Subscription to unknown zone is submitted as any other command, so that the
+        client receives the error.
+
+        :param submit: Coroutine function that queues command for execution.
+        :param reader: Incoming data stream of the connection.
+        :param writer: Outgoing data stream of the connection.
+        :param publishers: Publishers of the zones' player state for subscribed
+            clients.
+        """
+        decoder = MessageDecoder(controls.Command)
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                received = time.time()
+                for message in decoder.feed(data):
+                    publisher = (
+                        publishers(message.subscribe.zone)
+                        if message.HasField("subscribe") and publishers
+                        else None
+                    )
+                    if publisher:
+                        await SocketServer.stream_states(publisher, reader, writer)
+                        return
+                    mark_received(message, received)
+                    result = await submit(message)
+                    writer.write(encode_message(await result))
+                await writer.drain()
+        except FramingError as exc:
+            print(f"Corrupted data from client, closing connection: {exc}")
+        except ConnectionError as exc:
+            print(f"Connection with client failed: {exc}")
+        except asyncio.CancelledError:
+            # Service is shutting down. Handler must not end up cancelled, asyncio
+            # streams would report it as an unhandled error.
+            pass
+        finally:
+            writer.close()
+
+    def remove_stale_socket(self) -> None:
+        """Remove socket file left behind by previous run of the service.
+
+        :raises FileExistsError: If path exists and it's not a socket.
+        """
+        try:
+            file_mode = os.stat(self.socket_path).st_mode
+        except FileNotFoundError:
+            return
+
+        if not stat.S_ISSOCK(file_mode):
+            raise FileExistsError(f"{self.socket_path} exists and is not a socket.")
+        os.unlink(self.socket_path)
+
+    async def serve(
+        self, submit: Submit, publishers: Optional[Publishers] = None
+    ) -> None:
+        """Accept client connections until cancelled.
+
+        :param submit: Coroutine function that queues command for execution.
+        :param publishers: Publishers of the zones' player state for subscribed
+            clients.
+        """
+        self.remove_stale_socket()
+        server = await asyncio.start_unix_server(
+            lambda reader, writer: self.handle_connection(
+                submit, reader, writer, publishers
+            ),
+            path=str(self.socket_path),
+        )
+        async with server:
+            await server.serve_forever()
+
+
+Server = Union[PipeServer, SocketServer]
+
+
+class Zone:  # pylint: disable=too-many-instance-attributes
+    """Playback in a single zone of the service, with its own tuner and audio output.
+
+    Commands for the zone are queued and executed one by one. Blocking calls into the
+    Tuner run in a thread dedicated to the zone, so the loop can keep accepting
+    commands and processing player events while VLC opens a stream, and a stream
+    that is slow to open in one zone does not hold up the other zones.
+    """
+
+    def __init__(self, name: str, tuner: Tuner, service: "RadioBoxService") -> None:
+        """Initialize zone.
+
+        :param name: ID of the zone.
+        :param tuner: Tuner that plays in the zone.
+        :param service: Service that runs the zone.
+        """
+        self.name = name
+        self.tuner = tuner
+        self.service = service
+        self.loop = service.loop
+        # Zones other than the default one are named in the log
+        self.log_prefix = "" if name == DEFAULT_ZONE else f"[{name}] "
+        self.publisher = StatePublisher()
+        # Queued commands with futures for their replies and times of their receipt
+        self.commands: "asyncio.Queue[Tuple[controls.Command, asyncio.Future, float]]"
+        self.commands = asyncio.Queue(COMMAND_QUEUE_SIZE)
+        # Loop time at which the last PLAY command (or failover) was received and at
+        # which the player started the station, until the station starts playing
+        self.switch_started: Optional[float] = None
+        self.player_started = 0.0
+        self.switch_trigger = SWITCH_COMMAND
+        self.failing_over = False
+        # Trace of the last PLAY command, completed when the station starts playing
+        self.pending_trace: Optional[controls.Trace] = None
+        # The latest requested volume and the task that ramps the player towards it
+        self.volume_target = tuner.volume
+        self.volume_ramp: Optional[asyncio.Future] = None
+        # Only single thread is allowed to manipulate the player
+        self.player_executor = ThreadPoolExecutor(1, thread_name_prefix="player")
+
+    async def run_in_player_thread(self, func: Callable, *args: object) -> object:
+        """Run blocking function in the thread dedicated to the player.
+
+        :param func: Function to execute.
+        :param args: Positional arguments for the function.
+        """
+        return await self.loop.run_in_executor(self.player_executor, func, *args)
+
+    async def submit(
+        self, message: controls.Command
+    ) -> "asyncio.Future[controls.Reply]":
+        """Queue command for execution.
+
+        Returns future that will contain the reply after the command is executed.
+        Caller is blocked only while the command queue is full.
+
+        :param message: Protobuf message containing command.
+        """
+        result: "asyncio.Future[controls.Reply]" = self.loop.create_future()
+        await self.commands.put((message, result, self.loop.time()))
+        return result
+
+    async def execute(
+        self, message: controls.Command, received: Optional[float] = None
+    ) -> controls.Reply:
+        """Execute command and report result together with the current player state.
+
+        :param message: Protobuf message containing command.
+        :param received: Loop time at which the command was received, used to
+            measure latency of the command. Defaults to the current time.
+        """
+        started = self.loop.time() if received is None else received
+        command = str(message.WhichOneof("sub_command"))
+        reply = controls.Reply(status=controls.OK)
+        if message.HasField("quit"):
+            self.service.quit_event.set()
+        elif message.HasField("get_traces"):
+            reply.traces.extend(self.service.traces.latest(message.get_traces.limit))
+        elif message.HasField("subscribe"):
+            reply.status = controls.ERROR
+            reply.error = "Subscriptions are available only with the socket transport."
+        elif message.HasField("set_volume"):
+            self.set_volume(message.set_volume.volume_level, reply)
+        elif message.HasField("record") or message.HasField("stop_recording"):
+            self.service.control_recorder(message, reply)
+        else:
+            await self.execute_player_command(message, started, reply)
+
+        status_name = controls.ReplyStatus.Name(reply.status).lower()
+        COMMANDS.inc(command=command, status=status_name)
+        reply.state.CopyFrom(self.publisher.state)
+        return reply
+
+    async def execute_player_command(
+        self, message: controls.Command, started: float, reply: controls.Reply
+    ) -> None:
+        """Execute command that controls the player and update the player state.
+
+        :param message: Protobuf message containing command.
+        :param started: Loop time at which the command was received.
+        :param reply: Reply that receives result of the command.
+        """
+        self.finish_trace(OUTCOME_SUPERSEDED, "playback")
+        mark(message, "queue")
+        playing = False
+        try:
+            playing = bool(
+                await self.run_in_player_thread(process_command, message, self.tuner)
+            )
+        except ValueError as exc:
+            print(f"{self.log_prefix}Failed to execute command: {exc}")
+            reply.status = controls.ERROR
+            reply.error = str(exc)
+        except Exception as exc:  # pylint: disable=broad-except
+            # Unexpected failure of the player must not stop the command queue
+            print(f"{self.log_prefix}Unexpected error while executing command: {exc!r}")
+            reply.status = controls.ERROR
+            reply.error = f"Failed to execute command: {exc}"
+        else:
+            self.switch_started = started if message.HasField("play") else None
+            self.switch_trigger = SWITCH_COMMAND
+        mark(message, "tuner")
+        self.player_started = self.loop.time()
+        COMMAND_DURATION.observe(
+            self.player_started - started,
+            command=str(message.WhichOneof("sub_command")),
+        )
+
+        if message.trace_id:
+            self.pending_trace = to_trace(message)
+            if reply.status == controls.ERROR:
+                self.finish_trace(OUTCOME_ERROR)
+            elif not message.HasField("play"):
+                self.finish_trace(OUTCOME_OK)
+
+        if self.tuner.paused:
+            self.publisher.update(self.tuner.active_station, controls.PAUSED)
+        elif self.tuner.active_station:
+            status = controls.PLAYING if playing else controls.OPENING
+            self.publisher.update(self.tuner.active_station, status)
+            if playing:
+                self.report_switch()
+        else:
+            self.publisher.update(None, controls.STOPPED)
+        self.publisher.update_delay(self.tuner.current_delay())
+
+    def set_volume(self, level: int, reply: controls.Reply) -> None:
+        """Request new volume level, the player is ramped towards it in background.
+
+        :param level: Requested volume level.
+        :param reply: Reply that receives result of the command.
+        """
+        if level > MAX_VOLUME:
+            reply.status = controls.ERROR
+            reply.error = f"Volume must be between 0 and {MAX_VOLUME}."
+            return
+        self.volume_target = level
+        self.publisher.update_volume(level)
+        if self.volume_ramp is None or self.volume_ramp.done():
+            self.volume_ramp = self.service.add_task(self.ramp_volume())
+
+    async def ramp_volume(self) -> None:
+        """Move volume of the player to the requested level in a few small steps.
+
+        When new level is requested during the ramp, the ramp continues from the
+        current level towards the new one. Rapid changes (e.g. from a slider) are
+        thus coalesced, only the latest requested level is reached and the player
+        receives at most one change per VOLUME_RAMP_INTERVAL.
+        """
+        target, remaining = self.tuner.volume, 0
+        while self.tuner.volume != self.volume_target:
+            if target != self.volume_target:
+                target, remaining = self.volume_target, VOLUME_RAMP_STEPS
+            difference = target - self.tuner.volume
+            step = math.ceil(abs(difference) / remaining)
+            remaining -= 1
+            level = self.tuner.volume + int(math.copysign(step, difference))
+            await self.run_in_player_thread(self.tuner.set_volume, level)
+            if self.tuner.volume != self.volume_target:
+                await asyncio.sleep(VOLUME_RAMP_INTERVAL)
+
+    def finish_trace(self, outcome: str, stage: Optional[str] = None) -> None:
+        """Store pending trace of the last command into the trace buffer.
+
+        :param outcome: How the processing of the command ended.
+        :param stage: Name of the stage that ends now, if any.
+        """
+        if self.pending_trace is None:
+            return
+        if stage:
+            mark(self.pending_trace, stage)
+        self.service.traces.add(self.pending_trace, outcome)
+        self.pending_trace = None
+
+    def supersede(self, message: controls.Command) -> controls.Reply:
+        """Answer command superseded by a later queued command, without executing it.
+
+        :param message: Protobuf message containing command.
+        """
+        COALESCED_COMMANDS.inc(command=str(message.WhichOneof("sub_command")))
+        if message.trace_id:
+            mark(message, "queue")
+            self.service.traces.add(to_trace(message), OUTCOME_SUPERSEDED)
+        reply = controls.Reply(status=controls.OK)
+        reply.state.CopyFrom(self.publisher.state)
+        return reply
+
+    async def process_commands(self) -> None:
+        """Execute queued commands one by one.
+
+        Commands that arrived while the previous command was executing are collected
+        first. Command is skipped if a later collected command belongs to the same
+        coalescing group, its client receives reply with the current state right
+        away.
+        """
+        pending: Deque[Tuple[controls.Command, asyncio.Future, float]] = deque()
+        while True:
+            if not pending:
+                pending.append(await self.commands.get())
+            while len(pending) < COMMAND_QUEUE_SIZE and not self.commands.empty():
+                pending.append(self.commands.get_nowait())
+            message, result, received = pending.popleft()
+            group = coalescing_group(message)
+            if group and any(
+                coalescing_group(queued[0]) == group for queued in pending
+            ):
+                reply = self.supersede(message)
+            else:
+                reply = await self.execute(message, received)
+            if not result.done():
+                result.set_result(reply)
+
+    def on_player_event(self, event: str, value: float) -> None:
+        """Update player state based on VLC player event.
+
+        Note: This method must be called from the event loop.
+
+        :param event: Name of the event reported by Tuner.
+        :param value: Event specific value.
+        """
+        station = self.publisher.state.station
+        if not station:
+            # Late events from the media that was already stopped
+            return
+
+        if event == EVENT_PLAYING or (event == EVENT_BUFFERING and value >= 100):
+            self.publisher.update(station, controls.PLAYING)
+            self.report_switch()
+        elif event == EVENT_BUFFERING:
+            if self.publisher.state.status == controls.PLAYING:
+                BUFFERING_EVENTS.inc(station=station)
+            self.publisher.update(station, controls.BUFFERING)
+        elif event == EVENT_OPENING:
+            self.publisher.update(station, controls.OPENING)
+        elif event == EVENT_METADATA:
+            self.publisher.update_title(self.tuner.now_playing)
+        else:
+            self.service.add_task(self.fail_over(station, FAILURE_REASONS[event]))
+
+    async def fail_over(self, station: str, reason: str = "Playback failed") -> None:
+        """Switch failed station to its next mirror or report it as failed.
+
+        :param station: Station that failed to play.
+        :param reason: Reason of the failure, reported if no mirror is left.
+        """
+        if self.failing_over:
+            return
+
+        self.failing_over = True
+        started = self.loop.time()
+        try:
+            switched = await self.run_in_player_thread(self.tuner.failover, station)
+        finally:
+            self.failing_over = False
+
+        if self.publisher.state.station != station:
+            # Station was changed or stopped in the meantime
+            return
+        RECONNECTS.inc(station=station, result="switched" if switched else "failed")
+        if switched:
+            self.switch_started = started
+            self.player_started = self.loop.time()
+            self.switch_trigger = SWITCH_FAILOVER
+            self.publisher.update(station, controls.OPENING)
+            self.publisher.update_delay(0)
+        else:
+            self.publisher.update(station, controls.FAILED, reason)
+            self.finish_trace(OUTCOME_FAILED, "playback")
+            # The station might have moved, resolve its URL again on the next play
+            self.tuner.invalidate_station(station)
+
+    async def watch_stalls(self) -> None:
+        """Fail over stations that don't start playing within the stall timeout."""
+        queue = self.publisher.subscribe()
+        state = self.publisher.state
+        while True:
+            waiting = state.status in (controls.OPENING, controls.BUFFERING)
+            try:
+                state = await asyncio.wait_for(
+                    queue.get(), self.service.stall_timeout if waiting else None
+                )
+            except asyncio.TimeoutError:
+                print(f"{self.log_prefix}Playback of {state.station} stalled.")
+                await self.fail_over(state.station, "Playback stalled")
+                state = self.publisher.state
+
+    def report_switch(self) -> None:
+        """Log time it took from the PLAY command until the station started playing."""
+        self.finish_trace(OUTCOME_OK, "playback")
+        if self.switch_started is None:
+            return
+        now = self.loop.time()
+        latency = now - self.switch_started
+        self.switch_started = None
+        station = self.publisher.state.station
+        trigger = self.switch_trigger
+        TIME_TO_AUDIO.observe(latency, station=station, trigger=trigger)
+        PLAYING_DELAY.observe(now - self.player_started, trigger=trigger)
+        print(
+            f"{self.log_prefix}{SWITCH_MESSAGES[trigger]} {station}"
+            f" in {latency * 1000:.0f} ms."
+        )
+
+    def _on_player_event_threadsafe(self, event: str, value: float) -> None:
+        """Pass player event from libvlc thread to the event loop."""
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.on_player_event, event, value)
+
+    async def reload_stations(self, stations: Dict[str, dict]) -> StationsDiff:
+        """Apply changed configuration of the stations to the tuner of the zone.
+
+        Active station keeps playing, unless it was removed (playback is stopped) or
+        its configuration changed (it's started again).
+
+        :param stations: New configuration of all stations.
+        """
+        diff = cast(
+            StationsDiff,
+            await self.run_in_player_thread(self.tuner.update_stations, stations),
+        )
+        active = self.publisher.state.station
+        if active in diff.removed:
+            await self.submit(make_message_stop(self.name))
+        elif active in diff.changed:
+            await self.submit(make_message_play(active, self.name))
+        return diff
+
+    async def log_state(self) -> None:
+        """Print every change of the player state."""
+        queue = self.publisher.subscribe()
+        while True:
+            state = await queue.get()
+            status = controls.PlaybackStatus.Name(state.status)
+            print(f"{self.log_prefix}Player state: {status} {state.station}".rstrip())
+
+    def start(self) -> None:
+        """Start processing of the commands and player events as service tasks."""
+        self.tuner.attach_events(self._on_player_event_threadsafe)
+        self.service.add_task(self.publisher.run())
+        self.service.add_task(self.log_state())
+        self.service.add_task(self.process_commands())
+        if self.service.stall_timeout:
+            self.service.add_task(self.watch_stalls())
+
+    async def close(self) -> None:
+        """Stop the playback and the player thread, after the tasks were cancelled."""
+        await self.run_in_player_thread(self.tuner.stop)
+        self.player_executor.shutdown()
+
+
+def command_zone(message: controls.Command) -> str:
+    """Return ID of the zone the command applies to, empty for the default zone.
+
+    :param message: Protobuf message containing command.
+    """
+    command = getattr(message, str(message.WhichOneof("sub_command")), None)
+    return str(getattr(command, "zone", ""))
+
+
+class RadioBoxService:  # pylint: disable=too-many-instance-attributes
+    """Core of the radio-box service, running on asyncio event loop.
+
+    Service plays in one or more zones (see Zone), each with its own tuner. All
+    tuners share a single libvlc instance, so every additional zone costs only its
+    players. Commands submitted by the server are routed to their zone, commands
+    without zone go to the default (first) zone. Any other long-running work should
+    be started with `add_task()`, which ensures that it's cancelled when the service
+    quits.
+
+    Instances must be created from within the running event loop.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        tuners: Dict[str, Tuner],
+        server: Server,
+        prober: Optional[StationProber] = None,
+        stall_timeout: float = STALL_TIMEOUT,
+        *,
+        exporter: Optional[Exporter] = None,
+        status_block: Optional[StatusWriter] = None,
+        config_path: Optional[Path] = None,
+        relay: Optional[Relay] = None,
+        recorder: Optional[Recorder] = None,
+    ) -> None:
+        """Initialize service.
+
+        :param tuners: Tuners of the zones by ID of the zone, the first zone is the
+            default one.
+        :param server: Server that receives commands from clients.
+        :param prober: Optional prober that checks health of the stations.
+        :param stall_timeout: Seconds after which station that does not start playing
+            is failed over to the next mirror. 0 disables the stall detection.
+        :param exporter: Optional exporter that periodically stores service metrics.
+        :param status_block: Optional writer of the default zone's player state
+            shared with the web workers.
+        :param config_path: Config file that's watched for changes of the stations.
+        :param relay: Optional relay of the station streams to the LAN.
+        :param recorder: Optional recorder of the stations.
+        """
+        self.server = server
+        self.prober = prober
+        self.stall_timeout = stall_timeout
+        self.exporter = exporter
+        self.status_block = status_block
+        self.config_path = config_path
+        self.relay = relay
+        self.recorder = recorder
+        self.loop = asyncio.get_running_loop()
+        self.tasks: Set[asyncio.Future] = set()
+        self.quit_event = asyncio.Event()
+        self.traces = TraceBuffer()
+        self.zones = {name: Zone(name, tuner, self) for name, tuner in tuners.items()}
+        self.default_zone = next(iter(self.zones.values()))
+
+    def add_task(self, coroutine: Coroutine) -> asyncio.Future:
+        """Run coroutine as a background task of the service.
+
+        Tasks are cancelled when the service quits. Exceptions raised by tasks are
+        logged.
+
+        :param coroutine: Coroutine to run.
+        """
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task: asyncio.Future) -> None:
+        """Forget finished task and log its failure."""
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            print(f"Background task failed: {task.exception()!r}")
+
+    def zone(self, name: str) -> Optional[Zone]:
+        """Return zone with the ID, None if there's no such zone.
+
+        :param name: ID of the zone, empty for the default zone.
+        """
+        return self.zones.get(name) if name else self.default_zone
+
+    def zone_publisher(self, name: str) -> Optional[StatePublisher]:
+        """Return publisher of the zone's player state, None for unknown zone.
+
+        :param name: ID of the zone, empty for the default zone.
+        """
+        zone = self.zone(name)
+        return zone.publisher if zone else None
+
+    async def submit(
+        self, message: controls.Command
+    ) -> "asyncio.Future[controls.Reply]":
+        """Queue command for execution in its zone.
+
+        Returns future that will contain the reply after the command is executed.
+        Commands for unknown zones are refused right away.
+
+        :param message: Protobuf message containing command.
+        """
+        name = command_zone(message)
+        zone = self.zone(name)
+        if zone is None:
+            COMMANDS.inc(command=str(message.WhichOneof("sub_command")), status="error")
+            result: "asyncio.Future[controls.Reply]" = self.loop.create_future()
+            result.set_result(
+                controls.Reply(status=controls.ERROR, error=f"Unknown zone {name}.")
+            )
+            return result
+        return await zone.submit(message)
+
+    def _reload_config_threadsafe(self, config: dict) -> None:
+        """Pass new content of the config file from the watcher thread to the loop."""
+        # Catalog is loaded here, so that reading of a large file does not block loop
+        stations = load_stations(config)
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(
+                self.add_task, self.reload_stations(stations, config["stations"])
+            )
+
+    async def reload_stations(
+        self,
+        stations: Dict[str, dict],
+        probed_stations: Optional[Dict[str, dict]] = None,
+    ) -> None:
+        """Apply changed configuration of the stations to all zones.
+
+        :param stations: New configuration of all stations.
+        :param probed_stations: Stations checked by the prober, all by default.
+        """
+        diffs = [await zone.reload_stations(stations) for zone in self.zones.values()]
+        diff = diffs[0]
+        if not diff:
+            return
+        print(
+            f"Reloaded stations, added: {sorted(diff.added)},"
+            f" removed: {sorted(diff.removed)}, changed: {sorted(diff.changed)}."
+        )
+        if self.prober:
+            self.prober.stations = (
+                stations if probed_stations is None else probed_stations
+            )
+        if self.relay:
+            self.relay.stations = stations
+        if self.recorder:
+            self.recorder.relay.stations = stations
+
+    def control_recorder(
+        self, message: controls.Command, reply: controls.Reply
+    ) -> None:
+        """Start or stop recording of the station requested by the command.
+
+        :param message: Protobuf message containing RECORD or STOP_RECORDING command.
+        :param reply: Reply that receives result of the command.
+        """
+        try:
+            if self.recorder is None:
+                raise ValueError("Recorder is not enabled.")
+            if message.HasField("record"):
+                self.recorder.start(message.record.station, message.record.duration)
+            else:
+                self.recorder.stop(message.stop_recording.station)
+        except ValueError as exc:
+            print(f"Failed to execute command: {exc}")
+            reply.status = controls.ERROR
+            reply.error = str(exc)
+
+    def busy_stations(self) -> Set[Optional[str]]:
+        """Return stations that are currently used by the players of all zones."""
+        busy: Set[Optional[str]] = set()
+        for zone in self.zones.values():
+            busy.update((zone.tuner.active_station, zone.tuner.standby_station))
+        return busy
+
+    @staticmethod
+    async def export_metrics(exporter: Exporter) -> None:
+        """Periodically store snapshot of the service metrics.
+
+        Snapshots left behind by previous runs of the service and web workers are
+        removed first.
+
+        :param exporter: Exporter of the service metrics.
+        """
+        exporter.clear()
+        while True:
+            exporter.dump()
+            await asyncio.sleep(METRICS_INTERVAL)
+
+    async def publish_status(self, status_block: StatusWriter) -> None:
+        """Write player state of the default zone into the status block.
+
+        :param status_block: Writer of the shared status block.
+        """
+        publisher = self.default_zone.publisher
+        queue = publisher.subscribe()
+        status_block.write(publisher.state)
+        while True:
+            status_block.write(await queue.get())
+
+    def start(self) -> None:
+        """Start zones and background tasks of the service."""
+        for zone in self.zones.values():
+            zone.start()
+        self.add_task(self.server.serve(self.submit, self.zone_publisher))
+        if self.prober:
+            self.add_task(self.prober.run(self.busy_stations))
+        if self.exporter:
+            self.add_task(self.export_metrics(self.exporter))
+        if self.status_block:
+            self.add_task(self.publish_status(self.status_block))
+        if self.relay:
+            self.add_task(self.relay.serve())
+        if self.recorder:
+            self.add_task(self.recorder.run())
+        if self.config_path:
+            ConfigWatcher(self.config_path, self._reload_config_threadsafe).start()
+
+    async def run(self) -> None:
+        """Run service until QUIT command is received."""
+        self.start()
+        print("Radio Box ready.")
+
+        await self.quit_event.wait()
+
+        print("Shutting down.")
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for zone in self.zones.values():
+            await zone.close()
+        if self.exporter:
+            self.exporter.dump()
+        if self.status_block:
+            self.status_block.write(controls.PlayerState(status=controls.STOPPED))
+            self.status_block.close()
+
+
+async def start_service(  # pylint: disable=too-many-arguments
+    tuners: Dict[str, Tuner],
+    server: Server,
+    prober: Optional[StationProber] = None,
+    stall_timeout: float = STALL_TIMEOUT,
+    exporter: Optional[Exporter] = None,
+    *,
+    status_block: Optional[StatusWriter] = None,
+    config_path: Optional[Path] = None,
+    relay: Optional[Relay] = None,
+    recorder: Optional[Recorder] = None,
+) -> None:
+    """Create radio-box service in the running event loop and run it.
+
+    :param tuners: Tuners of the zones by ID of the zone, the first zone is the
+        default one.
+    :param server: Server that receives commands from clients.
+    :param prober: Optional prober that checks health of the stations.
+    :param stall_timeout: Seconds after which stalled station is failed over.
+    :param exporter: Optional exporter that periodically stores service metrics.
+    :param status_block: Optional writer of the player state shared with the web
+        workers.
+    :param config_path: Config file that's watched for changes of the stations.
+    :param relay: Optional relay of the station streams to the LAN.
+    :param recorder: Optional recorder of the stations.
+    """
+    await RadioBoxService(
+        tuners,
+        server,
+        prober,
+        stall_timeout,
+        exporter=exporter,
+        status_block=status_block,
+        config_path=config_path,
+        relay=relay,
+        recorder=recorder,
+    ).run()
+
+
+def relay_options(config: dict) -> Optional[RelayOptions]:
+    """Return settings of the relay, None if the service does not run it.
+
+    Relay runs when it's configured for the LAN or when the time-shift is enabled,
+    directory of the time-shift buffers is created in the latter case. If it can't
+    be created, the buffers are kept in the default temporary directory.
+
+    :param config: Content of the configuration file.
+    """
+    options = RelayOptions(**config["relay"]) if "relay" in config else None
+    if "timeshift" in config:
+        timeshift = TimeShiftOptions(**config["timeshift"])
+        if timeshift.directory:
+            try:
+                os.makedirs(timeshift.directory, exist_ok=True)
+            except OSError as exc:
+                print(
+                    f"Failed to create time-shift directory {timeshift.directory}: "
+                    f"{exc}. Buffers are kept in the temporary directory."
+                )
+                timeshift = timeshift._replace(directory="")
+        options = timeshift_relay_options(timeshift, options)
+    return options
+
+
+def create_tuners(
+    config: dict,
+    stations: Dict[str, dict],
+    resolver: StreamResolver,
+    relay: Optional[RelayOptions] = None,
+) -> Dict[str, Tuner]:
+    """Create tuners of all configured zones, sharing a single libvlc instance.
+
+    :param config: Content of the configuration file.
+    :param stations: Configuration of all stations.
+    :param resolver: Resolver of stream URLs shared by the zones.
+    :param relay: Settings of the relay, tuners play the stations through it when
+        the time-shift is enabled.
+    """
+    instance = vlc.Instance(*VLC_OPTIONS)
+    mirrors = MirrorStats()
+    standby = config.get("standby", STANDBY_RECENT)
+    timeshift = (
+        TimeShiftOptions(**config["timeshift"]) if "timeshift" in config else None
+    )
+    return {
+        name: Tuner(
+            stations,
+            zone.get("standby", standby),
+            resolver,
+            mirrors,
+            instance=instance,
+            output=zone.get("output"),
+            timeshift_url=relay_url(relay) if timeshift and relay else None,
+            timeshift_window=timeshift.window if timeshift else 0.0,
+        )
+        for name, zone in zone_configs(config).items()
+    }
 
 
 def run() -> None:
     """Run radio-box service process and await commands."""
     args = parse_args()
-    with open(args.config, "r", encoding="utf8") as conf:
-        config: dict = yaml.safe_load(conf)
+    config = load_config(Path(args.config))
 
     socket_ = args.socket or config["socket"]
 
-    print("Opening pipe.")
-    pipe_path = create_pipe(socket_)
+    server: Server
+    if config.get("transport", TRANSPORT_PIPE) == TRANSPORT_SOCKET:
+        print(f"Listening on socket {socket_}.")
+        server = SocketServer(Path(socket_))
+    else:
+        print("Opening pipe.")
+        server = PipeServer(create_pipe(socket_))
+
     print("Starting Player.")
-    tuner = Tuner(config["stations"])
-    print("Radio Box ready.")
+    resolver = StreamResolver(ResolverOptions(**config.get("resolver", {})))
+    stations = load_stations(config)
+    relay_settings = relay_options(config)
+    tuners = create_tuners(config, stations, resolver, relay_settings)
+    mirrors = next(iter(tuners.values())).mirrors
 
-    while not QUIT_:
-        print("Waiting for commands")
-        with open(pipe_path, "rb") as pipe:
-            message = controls.Command()
-            try:
-                message.ParseFromString(pipe.read())
-                process_command(message, tuner)
-            except DecodeError as exc:  # pragma: no cover
-                print(f"Failed to parse message: {exc}")
-                continue
+    prober = None
+    if "prober" in config:
+        prober_options = ProberOptions(**config["prober"])
+        status_file = status_file_path(config)
+        print(f"Probing stations every {prober_options.interval}s to {status_file}.")
+        # Only configured stations are probed, catalog can contain thousands of them
+        prober = StationProber(
+            config["stations"], status_file, prober_options, resolver, mirrors
+        )
+    relay = None
+    if relay_settings:
+        relay = Relay(stations, relay_settings, resolver, mirrors)
+    recorder = None
+    if "recorder" in config:
+        # Recordings share upstreams with the relay, the service runs a private
+        # relay for them if it does not serve one
+        recorder = Recorder(
+            relay or Relay(stations, None, resolver, mirrors),
+            RecorderOptions(**config["recorder"]),
+        )
+    asyncio.run(
+        start_service(
+            tuners,
+            server,
+            prober,
+            config.get("stall_timeout", STALL_TIMEOUT),
+            Exporter(metrics_dir_path(config), "service"),
+            status_block=StatusWriter(status_block_path(config)),
+            config_path=Path(args.config),
+            relay=relay,
+            recorder=recorder,
+        )
+    )
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -0,0 +1,173 @@
+"""Serving of the web UI files with precompressed variants and cache headers.
+
+Files of the built web UI don't change while the web worker runs (they are replaced
+only by an upgrade, which restarts the workers), so everything needed to serve a
+file is looked up only once per path: its type, ETag, cache policy and the
+precompressed variants (".br" and ".gz" files next to it). Small files are also
+kept in memory, so that repeated requests don't touch the filesystem at all.
+
+Files with a content hash in their name (e.g. "js/app.3f2a1b9c.js") are served
+as immutable with long expiration, other files (e.g. "index.html") must be
+revalidated with their ETag before every use.
+"""
+import mimetypes
+import os
+import re
+import threading
+from pathlib import Path
+from stat import S_ISREG
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from flask import Response, request
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+
+# Precompressed variants in the order of preference, with suffixes of their files
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDATE = "no-cache"
+# Content hash added to the file names by the web UI build
+HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.[^./]+$")
+# Files up to this size are kept in memory
+MAX_CACHED_SIZE = 1024 * 1024
+# Maximum number of looked up paths, including those that don't exist
+MAX_ENTRIES = 1024
+
+
+class Variant(NamedTuple):
+    """Single representation of the static file."""
+
+    path: str
+    size: int
+    etag: str
+    content: Optional[bytes]
+
+
+class StaticFile(NamedTuple):
+    """Everything needed to serve the static file."""
+
+    content_type: str
+    cache_control: str
+    # Variants by content encoding, "identity" is the file itself
+    variants: Dict[str, Variant]
+
+
+def _variant(path: str, encoding: str) -> Optional[Variant]:
+    """Stat the file and read it if it's small.
+
+    :param path: Path to the file.
+    :param encoding: Content encoding of the file.
+    :return: None if the file does not exist.
+    """
+    try:
+        stat = os.stat(path)
+        if not S_ISREG(stat.st_mode):
+            return None
+        content = None
+        if stat.st_size <= MAX_CACHED_SIZE:
+            with open(path, "rb") as static_file:
+                content = static_file.read()
+    except OSError:
+        return None
+    etag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    if encoding != "identity":
+        etag += f"-{encoding}"
+    return Variant(path, stat.st_size, etag, content)
+
+
+def lookup(folder: str, filename: str) -> Optional[StaticFile]:
+    """Find the static file and its precompressed variants.
+
+    :param folder: Directory with the static files.
+    :param filename: Requested path relative to the folder.
+    :return: None if the file does not exist or it's outside of the folder.
+    """
+    path = safe_join(folder, filename)
+    if path is None:
+        return None
+    identity = _variant(path, "identity")
+    if identity is None:
+        return None
+    variants = {"identity": identity}
+    for encoding, suffix in ENCODINGS:
+        variant = _variant(path + suffix, encoding)
+        if variant:
+            variants[encoding] = variant
+    hashed = HASHED_NAME.search(Path(filename).name)
+    return StaticFile(
+        content_type=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+        cache_control=CACHE_IMMUTABLE if hashed else CACHE_REVALIDATE,
+        variants=variants,
+    )
+
+
+class StaticFiles:
+    """Serves files from the directory, results of the lookups are cached."""
+
+    def __init__(self, folder: str, max_entries: int = MAX_ENTRIES) -> None:
+        """Initialize static files, files are looked up on the first request.
+
+        :param folder: Directory with the static files.
+        :param max_entries: Maximum number of cached lookups.
+        """
+        self.folder = folder
+        self.max_entries = max_entries
+        self._files: Dict[str, Optional[StaticFile]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, filename: str) -> Optional[StaticFile]:
+        """Return cached lookup of the static file.
+
+        :param filename: Requested path relative to the folder.
+        """
+        try:
+            return self._files[filename]
+        except KeyError:
+            pass
+        static_file = lookup(self.folder, filename)
+        with self._lock:
+            if len(self._files) >= self.max_entries:
+                # Arbitrary paths can be requested, don't let them fill the memory
+                self._files.clear()
+            self._files[filename] = static_file
+        return static_file
+
+    @staticmethod
+    def select(static_file: StaticFile) -> Tuple[str, Variant]:
+        """Choose the best variant accepted by the client of the current request.
+
+        :param static_file: Static file.
+        """
+        for encoding, _ in ENCODINGS:
+            if encoding in static_file.variants and request.accept_encodings[encoding]:
+                return encoding, static_file.variants[encoding]
+        return "identity", static_file.variants["identity"]
+
+    def response(self, filename: str) -> Optional[Response]:
+        """Serve the static file to the current request.
+
+        :param filename: Requested path relative to the folder.
+        :return: None if the file does not exist.
+        """
+        static_file = self.get(filename)
+        if static_file is None:
+            return None
+        encoding, variant = self.select(static_file)
+        if request.if_none_match.contains_weak(variant.etag):
+            response = Response(status=304)
+        elif variant.content is not None:
+            response = Response(variant.content, content_type=static_file.content_type)
+        else:
+            # pylint: disable-next=consider-using-with
+            data = wrap_file(request.environ, open(variant.path, "rb"))
+            response = Response(
+                data, content_type=static_file.content_type, direct_passthrough=True
+            )
+            response.content_length = variant.size
+        if encoding != "identity" and response.status_code != 304:
+            response.headers["Content-Encoding"] = encoding
+        if len(static_file.variants) > 1:
+            response.vary.add("Accept-Encoding")
+        response.set_etag(variant.etag)
+        response.headers["Cache-Control"] = static_file.cache_control
+        return response
@@ -0,0 +1,192 @@
+"""Player state shared with web workers through a memory-mapped status block.
+
+The service writes its current state into a small file with fixed layout, which is
+mapped into memory by every web worker. Reading the state is then just a memory
+access, without any round-trip to the service or a system call per request.
+
+Consistency is ensured by a sequence lock. The writer makes the sequence number odd
+before it changes the payload and even again afterwards. Reader copies the payload
+and accepts it only if the sequence number was even and did not change meanwhile.
+
+Layout (little endian):
+
+* header - magic b"RBST", layout version (uint32), sequence number (uint64)
+* payload - playback status (uint8), volume flag (uint8), volume (uint16), delay
+  flag (uint8), time-shift delay in seconds (uint32), station ID (64 bytes), last
+  error (256 bytes) and now playing title (256 bytes). Texts are UTF-8 encoded and
+  padded with NUL bytes, longer texts are truncated.
+
+The file is reused when the service restarts, so that workers keep valid mapping.
+"""
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Optional, Tuple
+
+from radio_box.protocol import controls_pb2 as controls
+
+MAGIC = b"RBST"
+# Incremented with every incompatible change of the layout
+LAYOUT_VERSION = 2
+HEADER = struct.Struct("<4sIQ")
+PAYLOAD = struct.Struct("<BBHBI64s256s256s")
+PAYLOAD_OFFSET = HEADER.size
+STATUS_SIZE = PAYLOAD_OFFSET + PAYLOAD.size
+# Suffix of the status block file, placed next to the service socket/pipe
+STATUS_BLOCK_SUFFIX = ".status"
+# Number of attempts to read consistent state while the writer changes it
+READ_ATTEMPTS = 100
+
+
+def status_block_path(config: dict) -> Path:
+    """Return path to the file with the status block.
+
+    :param config: Content of the configuration file.
+    """
+    status_block = config.get("status_block")
+    if status_block:
+        return Path(status_block)
+    socket_path = Path(config["socket"])
+    return socket_path.with_name(socket_path.stem + STATUS_BLOCK_SUFFIX)
+
+
+def _encode_text(text: str, size: int) -> bytes:
+    """Encode text and truncate it to the size of the field.
+
+    :param text: Text to encode.
+    :param size: Size of the field in bytes.
+    """
+    return text.encode("utf8")[:size]
+
+
+def _decode_text(data: bytes) -> str:
+    """Decode NUL padded text, incomplete character cut off by truncation is dropped.
+
+    :param data: Content of the field.
+    """
+    return data.rstrip(b"\0").decode("utf8", "ignore")
+
+
+def encode_state(state: controls.PlayerState) -> bytes:
+    """Serialize player state into the payload of the status block.
+
+    :param state: Player state.
+    """
+    return PAYLOAD.pack(
+        state.status,
+        state.HasField("volume"),
+        state.volume,
+        state.HasField("delay"),
+        state.delay,
+        _encode_text(state.station, 64),
+        _encode_text(state.error, 256),
+        _encode_text(state.title, 256),
+    )
+
+
+def decode_state(fields: Tuple) -> controls.PlayerState:
+    """Create player state from unpacked fields of the payload.
+
+    :param fields: Payload unpacked by the PAYLOAD struct.
+    """
+    status, has_volume, volume, has_delay, delay, station, error, title = fields
+    state = controls.PlayerState(status=status)
+    for name, data in (("station", station), ("error", error), ("title", title)):
+        text = _decode_text(data)
+        if text:
+            setattr(state, name, text)
+    if has_volume:
+        state.volume = volume
+    if has_delay:
+        state.delay = delay
+    return state
+
+
+class StatusWriter:
+    """Publishes player state of the service into the status block."""
+
+    def __init__(self, path: Path) -> None:
+        """Create or reuse the status block file and map it into memory.
+
+        :param path: Path to the status block file.
+        :raises OSError: If the file can't be created.
+        """
+        self.path = path
+        descriptor = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(descriptor).st_size != STATUS_SIZE:
+                os.ftruncate(descriptor, STATUS_SIZE)
+            self._map = mmap.mmap(descriptor, STATUS_SIZE)
+        finally:
+            os.close(descriptor)
+        magic, layout, sequence = HEADER.unpack_from(self._map)
+        # Continue the sequence of the previous run, readers may have cached it
+        if magic == MAGIC and layout == LAYOUT_VERSION:
+            self.sequence = sequence + sequence % 2
+        else:
+            self.sequence = 0
+
+    def write(self, state: controls.PlayerState) -> None:
+        """Replace state in the status block.
+
+        :param state: Current player state.
+        """
+        payload = encode_state(state)
+        HEADER.pack_into(self._map, 0, MAGIC, LAYOUT_VERSION, self.sequence + 1)
+        self._map[PAYLOAD_OFFSET:STATUS_SIZE] = payload
+        self.sequence += 2
+        HEADER.pack_into(self._map, 0, MAGIC, LAYOUT_VERSION, self.sequence)
+
+    def close(self) -> None:
+        """Unmap the status block, the file is kept for readers."""
+        self._map.close()
+
+
+class StatusReader:  # pylint: disable=too-few-public-methods
+    """Reads player state from the status block published by the service."""
+
+    def __init__(self, path: Path) -> None:
+        """Initialize reader, the file is mapped on the first read.
+
+        :param path: Path to the status block file.
+        """
+        self.path = path
+        self._map: Optional[mmap.mmap] = None
+        # Sequence number and state decoded from the last consistent read
+        self._cached: Tuple[int, Optional[controls.PlayerState]] = (-1, None)
+
+    def _open(self) -> Optional[mmap.mmap]:
+        """Map status block into memory, None if it was not created yet."""
+        try:
+            with open(self.path, "rb") as status_file:
+                return mmap.mmap(status_file.fileno(), STATUS_SIZE, prot=mmap.PROT_READ)
+        except (OSError, ValueError):
+            return None
+
+    def read(self) -> Optional[controls.PlayerState]:
+        """Return current player state, None if the service did not publish it yet.
+
+        State is decoded only when its sequence number changes. If the writer keeps
+        changing the state during all read attempts, the last consistent state is
+        returned.
+        """
+        if self._map is None:
+            self._map = self._open()
+            if self._map is None:
+                return None
+        for _ in range(READ_ATTEMPTS):
+            magic, layout, sequence = HEADER.unpack_from(self._map)
+            if magic != MAGIC or layout != LAYOUT_VERSION:
+                return None
+            cached_sequence, cached_state = self._cached
+            if sequence == cached_sequence:
+                return cached_state
+            if sequence % 2:
+                continue
+            fields = PAYLOAD.unpack_from(self._map, PAYLOAD_OFFSET)
+            if HEADER.unpack_from(self._map)[2] == sequence:
+                state = decode_state(fields)
+                self._cached = (sequence, state)
+                return state
+        return self._cached[1]
@@ -0,0 +1,92 @@
+"""Time-shift of the live stations, with pause, resume and seek back.
+
+With the "timeshift" section in the config file, players don't fetch the stations
+directly. They play them through the relay (see radio_box.relay) on the loopback,
+which keeps the last `minutes` of every played station in its buffer. Buffers are
+backed by memory-mapped files, so the memory used by the service stays flat no
+matter how long the window is.
+
+Paused player just stops reading its connection to the relay, while the relay keeps
+buffering the upstream. Resumed player continues reading where it stopped, without
+reconnecting to the station. Seek reconnects the player to the relay with the
+requested delay, the buffered stream is available right away.
+"""
+import os
+from typing import NamedTuple, Optional
+from urllib.parse import quote
+
+from radio_box.config import data_dir
+from radio_box.relay import DELAY_PARAMETER, RelayOptions
+
+# Address on which the service reaches the relay
+LOOPBACK_HOST = "127.0.0.1"
+# Relay hosts that include the loopback interface
+WILDCARD_HOSTS = ("", "0.0.0.0", "::")
+
+
+class TimeShiftOptions(NamedTuple):
+    """Settings of the time-shift.
+
+    Values can be overridden in the "timeshift" section of the config file.
+    """
+
+    # Length of the window in which the playback can be paused and sought back
+    minutes: float = 30.0
+    # Highest expected bitrate of the stations in kbit/s, buffers are sized so that
+    # they hold the whole window of streams up to this bitrate
+    bitrate: int = 320
+    # Directory of the buffer files, empty for the default temporary directory. It
+    # should be on disk, the temporary directory is often in RAM (tmpfs).
+    directory: str = os.path.join(data_dir(), "timeshift")
+    # Seconds for which the station stays buffered after its player disconnects,
+    # e.g. while the player seeks or switches the stations
+    linger: float = 10.0
+
+    @property
+    def window(self) -> float:
+        """Length of the window in seconds."""
+        return self.minutes * 60
+
+    @property
+    def buffer_size(self) -> int:
+        """Size of the buffer of a single station in bytes."""
+        return int(self.window * self.bitrate * 1000 / 8)
+
+
+def timeshift_relay_options(
+    options: TimeShiftOptions, relay: Optional[RelayOptions] = None
+) -> RelayOptions:
+    """Return settings of the relay that buffers the stations for the time-shift.
+
+    Configured LAN relay is reused, so that the stations are not fetched twice.
+    Otherwise, the relay listens only on the loopback.
+
+    :param options: Settings of the time-shift.
+    :param relay: Settings of the LAN relay, if it's configured.
+    """
+    base = relay or RelayOptions(host=LOOPBACK_HOST)
+    return base._replace(
+        buffer_size=max(base.buffer_size, options.buffer_size),
+        buffer_dir=options.directory or "",
+        linger=max(base.linger, options.linger),
+    )
+
+
+def relay_url(options: RelayOptions) -> str:
+    """Return base URL on which the service reaches the relay.
+
+    :param options: Settings of the relay.
+    """
+    host = LOOPBACK_HOST if options.host in WILDCARD_HOSTS else options.host
+    return f"http://{host}:{options.port}"
+
+
+def station_url(base_url: str, station_id: str, delay: int = 0) -> str:
+    """Return URL of the station relayed with the delay.
+
+    :param base_url: Base URL of the relay.
+    :param station_id: ID of the station.
+    :param delay: Seconds behind the live stream, 0 for the live stream.
+    """
+    url = f"{base_url}/{quote(station_id, safe='')}"
+    return f"{url}?{DELAY_PARAMETER}={delay}" if delay else url
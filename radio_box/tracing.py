@@ -0,0 +1,187 @@
+"""Tracing of commands through all stages of their processing.
+
+Clients (REST API, CLI) start a trace by setting trace ID and origin time of the
+command. Every stage that handles the command then closes a span that starts where
+the previous span ended, so the spans cover the whole time from the origin until the
+station starts playing without gaps:
+
+* "rest"/"cli" - handling of the request by the client, until the command is sent
+* "transport" - serialization and write of the command, until the service reads it
+* "decode" - parsing of the protobuf message
+* "queue" - waiting in the command queue of the service
+* "tuner" - execution of the command by the Tuner (stream resolution, media setup)
+* "playback" - opening and buffering of the stream, until VLC starts playing
+
+Completed traces are kept by the service in a bounded ring buffer and can be queried
+with the GET_TRACES command (`radio-box trace` or the "/traces" REST endpoint).
+"""
+import os
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, List, Optional, Union
+
+from radio_box.common import (
+    TRANSPORT_SOCKET,
+    CommandError,
+    SenderOptions,
+    make_message_get_traces,
+    send_command,
+)
+from radio_box.protocol import controls_pb2 as controls
+
+# Maximum number of completed traces kept by the service
+TRACE_BUFFER_SIZE = 256
+
+OUTCOME_OK = "ok"
+OUTCOME_ERROR = "error"
+OUTCOME_FAILED = "failed"
+OUTCOME_SUPERSEDED = "superseded"
+
+Traced = Union[controls.Command, controls.Trace]
+
+
+def start_trace(message: controls.Command, origin: Optional[float] = None) -> None:
+    """Mark command as traced.
+
+    :param message: Command that will be traced.
+    :param origin: Unix timestamp at which the request handling started, now if
+        omitted.
+    """
+    message.trace_id = os.urandom(8).hex()
+    message.origin_time = time.time() if origin is None else origin
+
+
+def last_end(traced: Traced) -> float:
+    """Return time at which the last span ended, origin time if there are no spans.
+
+    :param traced: Traced command or trace.
+    """
+    if traced.spans:
+        return traced.spans[-1].start + traced.spans[-1].duration
+    return traced.origin_time
+
+
+def mark(traced: Traced, stage: str, now: Optional[float] = None) -> None:
+    """Close the span of the stage, if the command is traced.
+
+    Span starts where the previous span ended.
+
+    :param traced: Traced command or trace.
+    :param stage: Name of the stage.
+    :param now: Unix timestamp at which the stage ended, current time if omitted.
+    """
+    if not traced.trace_id:
+        return
+    start = last_end(traced)
+    end = time.time() if now is None else now
+    traced.spans.add(stage=stage, start=start, duration=max(end - start, 0.0))
+
+
+def mark_received(message: controls.Command, received: float) -> None:
+    """Close the "transport" and "decode" spans of the command read by the service.
+
+    :param message: Decoded command.
+    :param received: Unix timestamp at which the data of the command were read.
+    """
+    mark(message, "transport", received)
+    mark(message, "decode")
+
+
+def describe(message: controls.Command) -> str:
+    """Return human readable description of the command, e.g. "play best_radio".
+
+    :param message: Protobuf message containing command.
+    """
+    sub_command = str(message.WhichOneof("sub_command"))
+    if sub_command == "play":
+        return f"play {message.play.station}"
+    return sub_command
+
+
+def to_trace(message: controls.Command) -> controls.Trace:
+    """Create trace from the spans collected by the traced command.
+
+    :param message: Traced command.
+    """
+    trace = controls.Trace(
+        trace_id=message.trace_id,
+        origin_time=message.origin_time,
+        command=describe(message),
+    )
+    trace.spans.extend(message.spans)
+    return trace
+
+
+class TraceBuffer:
+    """Ring buffer of completed traces, the oldest traces are dropped when full."""
+
+    def __init__(self, size: int = TRACE_BUFFER_SIZE) -> None:
+        """Initialize empty buffer.
+
+        :param size: Maximum number of kept traces.
+        """
+        self.traces: Deque[controls.Trace] = deque(maxlen=size)
+
+    def add(self, trace: controls.Trace, outcome: str) -> None:
+        """Store completed trace.
+
+        :param trace: Completed trace.
+        :param outcome: How the processing of the command ended.
+        """
+        trace.outcome = outcome
+        self.traces.append(trace)
+
+    def latest(self, limit: int = 0) -> List[controls.Trace]:
+        """Return the most recent traces, from the oldest one.
+
+        :param limit: Maximum number of returned traces, all if 0.
+        """
+        traces = list(self.traces)
+        return traces[-limit:] if limit else traces
+
+
+def format_trace(trace: controls.Trace) -> str:
+    """Format trace as a line with the total duration and duration of each stage.
+
+    Example:
+        2023-05-01 12:00:00.123 4f3c2a1b play best_radio ok 812.4 ms
+        (rest 1.2, transport 0.4, decode 0.1, queue 0.0, tuner 35.1, playback 775.6)
+
+    :param trace: Completed trace.
+    """
+    # Only needed by the "trace" command, not imported by other CLI commands
+    from datetime import datetime  # pylint: disable=import-outside-toplevel
+
+    origin = datetime.fromtimestamp(trace.origin_time).isoformat(" ", "milliseconds")
+    total = (last_end(trace) - trace.origin_time) * 1000
+    stages = ", ".join(
+        f"{span.stage} {span.duration * 1000:.1f}" for span in trace.spans
+    )
+    return (
+        f"{origin} {trace.trace_id} {trace.command} {trace.outcome} {total:.1f} ms"
+        f" ({stages})"
+    )
+
+
+def query_traces(
+    socket_path: Path,
+    transport: str,
+    limit: int = 0,
+    options: Optional[SenderOptions] = None,
+) -> List[controls.Trace]:
+    """Request the most recent traces from the radio-box service.
+
+    :param socket_path: Path to the unix domain socket of the service.
+    :param transport: Transport used to communicate with the service.
+    :param limit: Maximum number of returned traces, all if 0.
+    :param options: Timeouts and retries for the communication.
+    :raises CommandError: If the transport can't deliver replies.
+    :raises ServiceUnavailableError: If service can't be reached.
+    """
+    if transport != TRANSPORT_SOCKET:
+        raise CommandError("Traces can be queried only with the socket transport.")
+    reply = send_command(
+        socket_path, make_message_get_traces(limit), transport, options
+    )
+    return list(reply.traces) if reply else []
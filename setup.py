@@ -3,7 +3,7 @@ from setuptools import setup, find_packages
 requirements = [
     "python-vlc",
     "pyyaml",
-    "protobuf<4",
+    "protobuf>=3.20,<4",
     "flask",
 ]
 
@@ -30,10 +30,13 @@ setup(
     description='Internet radio streaming tool.',
     author='Martin Kalcok',
     packages=find_packages(exclude=['tests*']),
+    python_requires='>=3.7',
     entry_points={
         'console_scripts': [
             'radio-box-service = radio_box.service:run',
             'radio-box = radio_box.client:main',
+            'radio-box-import = radio_box.catalog:main',
+            'radio-box-web-async = radio_box.rest_async:main',
         ],
     },
     install_requires=requirements,
@@ -0,0 +1,46 @@
+"""Benchmark of the station search over a catalog of a public directory size."""
+import os
+import random
+import string
+import time
+
+from radio_box.catalog import StationIndex
+
+# 99th percentile of the search time, in milliseconds
+BUDGET_MS = float(os.environ.get("RADIO_BOX_SEARCH_BUDGET_MS", "10"))
+STATIONS = 30000
+QUERIES = 1000
+TAGS = ["rock", "pop", "jazz", "news", "talk", "classical", "dance", "80s", "oldies"]
+
+
+def test_search_p99():
+    """Test that searches over a large catalog stay within the budget."""
+    rng = random.Random(0)
+    words = [
+        "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+        for _ in range(3000)
+    ]
+    stations = {
+        f"station_{number}": {
+            "url": f"http://example.org/{number}.mp3",
+            "name": " ".join(rng.sample(words, rng.randint(1, 4))).title(),
+            "tags": rng.sample(TAGS, 3),
+            "country": rng.choice(["DE", "FR", "GB", "SK", "US"]),
+            "codec": rng.choice(["AAC", "MP3", "OGG"]),
+        }
+        for number in range(STATIONS)
+    }
+    index = StationIndex(stations)
+    queries = [rng.choice(words)[: rng.randint(1, 6)] for _ in range(QUERIES)]
+    queries += ["a", "rock", "tag:jazz country:de", "mp3 rock"]
+
+    durations = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query, 0, 100)
+        durations.append((time.perf_counter() - start) * 1000)
+
+    durations.sort()
+    p99 = durations[int(len(durations) * 0.99)]
+    print(f"\nsearch over {STATIONS} stations: p99 {p99:.2f} ms")
+    assert p99 < BUDGET_MS
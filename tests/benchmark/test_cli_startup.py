@@ -0,0 +1,57 @@
+"""Benchmark of the CLI client startup time.
+
+Timing depends on the machine, so the benchmark is not part of the unit tests, run
+it with "tox -e benchmark". Budget can be adjusted for slower machines with the
+RADIO_BOX_CLI_BUDGET_MS environment variable.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from radio_box.common import MessageDecoder
+from radio_box.config import load_config
+from radio_box.protocol import controls_pb2 as controls
+
+# Median wall time of the "stop" command, in milliseconds
+BUDGET_MS = float(os.environ.get("RADIO_BOX_CLI_BUDGET_MS", "50"))
+RUNS = 20
+CLI = "from radio_box.client import main; main()"
+
+
+@pytest.fixture
+def service_pipe(tmp_path: Path):
+    """Provide config with a pipe that is read like by the running service."""
+    pipe = tmp_path / "radio.pipe"
+    os.mkfifo(pipe)
+    conf_file = tmp_path / "conf.yaml"
+    conf_file.write_text(f"socket: {pipe}\nstations: {{}}\n")
+    # Service builds the config cache at startup
+    load_config(conf_file)
+    reader = os.open(pipe, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        yield conf_file, reader
+    finally:
+        os.close(reader)
+
+
+def test_cli_stop(service_pipe):
+    """Test that "radio-box stop" delivers the command within the budget."""
+    conf_file, reader = service_pipe
+    command = [sys.executable, "-c", CLI, "-c", str(conf_file), "stop"]
+    decoder = MessageDecoder(controls.Command)
+    durations = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run(command, check=True)
+        durations.append((time.perf_counter() - start) * 1000)
+        messages = decoder.feed(os.read(reader, 4096))
+        assert [message.WhichOneof("sub_command") for message in messages] == ["stop"]
+
+    median = statistics.median(durations)
+    print(f"\nradio-box stop: median {median:.1f} ms, max {max(durations):.1f} ms")
+    assert median < BUDGET_MS
@@ -1,6 +1,7 @@
 """Pytest fixtures."""
+import asyncio
 from typing import Dict, List
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock
 
 import pytest
 from flask.testing import FlaskClient
@@ -25,25 +26,48 @@ def stations() -> Dict:
     }
 
 
+@pytest.fixture(scope="session")
+def many_stations() -> Dict:
+    """Provide example configuration of multiple radio stations."""
+    return {
+        station_id: {"url": f"http://example.org/{station_id}.mp3"}
+        for station_id in ("first_fm", "second_fm", "third_fm")
+    }
+
+
 @pytest.fixture()
 def vlc_instance(mocker) -> MagicMock:
     """Mock objects from VLC library used in radio_box.service.Tuner class."""
-    media_player_mock = MagicMock()
     vlc_instance_mock = MagicMock()
-    vlc_instance_mock.media_player_new.return_value = media_player_mock
+    # Tuner uses active and standby player, each must be a separate object
+    vlc_instance_mock.media_player_new.side_effect = MagicMock
     mocker.patch.object(service.vlc, "Instance", return_value=vlc_instance_mock)
 
     return vlc_instance_mock
 
 
+@pytest.fixture
+def unused_port() -> int:
+    """Provide port on which nothing listens."""
+
+    async def get_port() -> int:
+        server = await asyncio.start_server(lambda *_: None, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        server.close()
+        await server.wait_closed()
+        return port
+
+    return asyncio.run(get_port())
+
+
 @pytest.fixture
 def rest_client(mocker, stations) -> FlaskClient:
     """Provide rest client for api testing."""
     config = {"stations": stations, "socket": "/tmp/foo.pipe"}
-    mocker.patch.object(rest_api.yaml, "safe_load", return_value=config)
+    mocker.patch.object(rest_api, "load_config", return_value=config)
     mocker.patch.object(rest_api, "create_pipe")
+    mocker.patch.object(rest_api, "Exporter")
 
-    with patch("builtins.open"):
-        app = rest_api.create_app({"TESTING": True})
-        with app.test_client() as client:
-            yield client
+    app = rest_api.create_app({"TESTING": True})
+    with app.test_client() as client:
+        yield client
@@ -0,0 +1,247 @@
+"""Unit Tests for radio_box/catalog.py."""
+import json
+from pathlib import Path
+from typing import Dict, List
+from unittest.mock import MagicMock
+
+import pytest
+
+from radio_box import catalog
+from radio_box.catalog import IndexCache, StationIndex, import_stations, read_dump
+
+DUMP = [
+    {
+        "stationuuid": "9617a958-0601-11e8-ae97-52543be04c81",
+        "name": "Jazz Radio ",
+        "url": "http://example.org/jazz.m3u",
+        "url_resolved": "http://example.org/jazz.mp3",
+        "tags": "jazz,smooth jazz, ",
+        "country": "France",
+        "countrycode": "FR",
+        "codec": "MP3",
+    },
+    {"name": "Rock FM", "url": "http://example.org/rock.mp3", "tags": ["rock"]},
+    {"name": "Rock FM", "url": "http://example.org/rock2.mp3", "tags": None},
+    {"name": "No Stream"},
+    {"url": "http://example.org/anonymous.mp3"},
+]
+
+
+@pytest.fixture
+def index_stations() -> Dict[str, dict]:
+    """Provide stations with searchable fields."""
+    return {
+        "jazz": {
+            "name": "Jazz Radio",
+            "tags": ["jazz"],
+            "country": "FR",
+            "codec": "MP3",
+        },
+        "bbc": {
+            "name": "BBC Radio 1",
+            "tags": ["pop"],
+            "country": "GB",
+            "codec": "AAC",
+        },
+        "rjazz": {
+            "name": "Radio Jazz",
+            "tags": ["jazz"],
+            "country": "GB",
+            "codec": "AAC",
+        },
+        "rock": {"name": "Rock FM", "tags": ["rock", "classic rock"], "codec": "MP3"},
+        "plain": {"url": "http://example.org/plain.mp3"},
+    }
+
+
+def test_import_stations():
+    """Test that dump entries are converted to configuration of stations."""
+    stations = import_stations(DUMP)
+
+    assert stations == {
+        "9617a958-0601-11e8-ae97-52543be04c81": {
+            "url": "http://example.org/jazz.mp3",
+            "name": "Jazz Radio",
+            "tags": ["jazz", "smooth jazz"],
+            "country": "FR",
+            "codec": "MP3",
+        },
+        "rock_fm": {
+            "url": "http://example.org/rock.mp3",
+            "name": "Rock FM",
+            "tags": ["rock"],
+            "country": "",
+            "codec": "",
+        },
+        "rock_fm_2": {
+            "url": "http://example.org/rock2.mp3",
+            "name": "Rock FM",
+            "tags": [],
+            "country": "",
+            "codec": "",
+        },
+    }
+    assert catalog.station_id("!!!", set()) == "station"
+
+
+def test_read_dump(tmp_path: Path):
+    """Test that JSON and CSV dumps are supported."""
+    json_dump = tmp_path / "stations.json"
+    json_dump.write_text(json.dumps([DUMP[1], "garbage"]))
+    csv_dump = tmp_path / "stations.CSV"
+    csv_dump.write_text("name,url,tags\nRock FM,http://example.org/rock.mp3,rock\n")
+    invalid_dump = tmp_path / "invalid.json"
+    invalid_dump.write_text("{}")
+
+    assert read_dump(json_dump) == [DUMP[1]]
+    assert read_dump(csv_dump) == [
+        {"name": "Rock FM", "url": "http://example.org/rock.mp3", "tags": "rock"}
+    ]
+    with pytest.raises(ValueError):
+        read_dump(invalid_dump)
+
+
+def test_save_and_load_catalog(tmp_path: Path, capsys):
+    """Test that configured stations take precedence over the catalog."""
+    path = tmp_path / "catalog.json"
+    config = {"stations": {"foo": {"url": "a", "name": "Foo"}}, "catalog": str(path)}
+    catalog.save_catalog(path, {"foo": {"url": "b"}, "bar": {"url": "c"}})
+
+    assert catalog.catalog_path({"stations": {}}) is None
+    assert catalog.load_stations({"stations": {}}) == {}
+    assert catalog.load_stations(config) == {
+        "foo": {"url": "a", "name": "Foo"},
+        "bar": {"url": "c"},
+    }
+
+    path.write_text("[")
+    assert catalog.load_stations(config) == config["stations"]
+    assert f"Failed to load station catalog {path}" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("content", ['[{"url": "a"}]', '"foo"', "null"])
+def test_load_stations_not_mapping(content: str, tmp_path: Path, capsys):
+    """Test that catalog which is not a mapping of stations is skipped."""
+    path = tmp_path / "catalog.json"
+    path.write_text(content)
+    config = {"stations": {"foo": {"url": "a"}}, "catalog": str(path)}
+
+    assert catalog.load_stations(config) == config["stations"]
+    assert "does not contain mapping of stations" in capsys.readouterr().out
+
+
+def test_save_catalog_failure(tmp_path: Path, mocker):
+    """Test that failed write does not leave temporary files behind."""
+    mocker.patch.object(catalog.json, "dump", side_effect=ValueError("Circular"))
+
+    with pytest.raises(ValueError):
+        catalog.save_catalog(tmp_path / "catalog.json", {})
+
+    assert not list(tmp_path.iterdir())
+
+
+def test_index_page(index_stations: Dict[str, dict]):
+    """Test that stations are paginated in the order of their names."""
+    index = StationIndex(index_stations)
+
+    assert len(index) == 5
+    assert index.page(0, 2) == ["bbc", "jazz"]
+    assert index.page(2) == ["plain", "rjazz", "rock"]
+    assert not index.page(10, 2)
+
+
+@pytest.mark.parametrize(
+    "query, expected_total, expected_keys",
+    [
+        # Prefix of a word, name prefix first
+        ("r", 4, ["rjazz", "rock", "bbc", "jazz"]),
+        ("ra", 3, ["rjazz", "bbc", "jazz"]),
+        # Substrings of the indexed fields
+        ("JAZZ", 2, ["jazz", "rjazz"]),
+        ("adio jaz", 2, ["jazz", "rjazz"]),
+        ("aac", 2, ["bbc", "rjazz"]),
+        ("radio 1", 1, ["bbc"]),
+        # Filters of the fields
+        ("tag:jazz country:gb", 1, ["rjazz"]),
+        ("tag:classic codec:mp3", 0, []),
+        ("radio codec:mp3", 1, ["jazz"]),
+        # No match
+        ("zzz", 0, []),
+        ("jazz rock", 0, []),
+        ("", 0, []),
+        ("-", 0, []),
+    ],
+)
+def test_index_search(
+    query: str,
+    expected_total: int,
+    expected_keys: List[str],
+    index_stations: Dict[str, dict],
+):
+    """Test that stations matching all words of the query are found."""
+    index = StationIndex(index_stations)
+
+    assert index.search(query) == (expected_total, expected_keys)
+
+
+def test_index_search_page(index_stations: Dict[str, dict]):
+    """Test that results of the search are paginated."""
+    index = StationIndex(index_stations)
+
+    assert index.search("r", 1, 2) == (4, ["rock", "bbc"])
+
+
+def test_index_cache(index_stations: Dict[str, dict]):
+    """Test that index is rebuilt only for new stations."""
+    cache = IndexCache()
+
+    first = cache.get(index_stations)
+    assert cache.get(index_stations) is first
+    assert cache.get(dict(index_stations)) is not first
+
+
+@pytest.mark.parametrize("output", [None, "catalog.json"])
+def test_main(output, tmp_path: Path, mocker, capsys):
+    """Test that dumps are imported into the catalog."""
+    dump = tmp_path / "stations.json"
+    dump.write_text(json.dumps(DUMP))
+    args = MagicMock(dumps=[dump], output=output and str(tmp_path / output))
+    mocker.patch.object(catalog, "parse_args", return_value=args)
+    load_config = mocker.patch.object(
+        catalog, "load_config", return_value={"catalog": tmp_path / "catalog.json"}
+    )
+
+    catalog.main()
+
+    assert len(json.loads((tmp_path / "catalog.json").read_text())) == 3
+    assert "Imported 3 stations to" in capsys.readouterr().out
+    assert load_config.called == (output is None)
+
+
+@pytest.mark.parametrize(
+    "config, dump_content, expected_error",
+    [
+        ({}, "[]", "Catalog is not configured"),
+        ({"catalog": "catalog.json"}, "{}", "Failed to read"),
+    ],
+)
+def test_main_error(config, dump_content, expected_error, tmp_path: Path, mocker):
+    """Test that importer exits with error if the catalog can't be created."""
+    dump = tmp_path / "stations.json"
+    dump.write_text(dump_content)
+    args = MagicMock(dumps=[dump], output=None)
+    mocker.patch.object(catalog, "parse_args", return_value=args)
+    mocker.patch.object(catalog, "load_config", return_value=config)
+
+    with pytest.raises(SystemExit, match=expected_error):
+        catalog.main()
+
+
+def test_parse_args(mocker):
+    """Test that multiple dumps can be imported at once."""
+    mocker.patch.object(catalog.sys, "argv", ["radio-box-import", "a.json", "b.csv"])
+
+    args = catalog.parse_args()
+
+    assert args.dumps == [Path("a.json"), Path("b.csv")]
+    assert args.output is None
@@ -1,11 +1,48 @@
 """Unit Tests for radio_box/client.py."""
+import argparse
+import subprocess
+import sys
 from pathlib import Path
 from typing import Dict
-from unittest.mock import MagicMock, call, patch
+from unittest.mock import ANY, MagicMock, call
 
 import pytest
 
-from radio_box.client import PLAY, QUIT, STOP, main, parse_args, play, quit_, stop, yaml
+from radio_box.client import (
+    PAUSE,
+    PLAY,
+    QUIT,
+    RECORD,
+    RESUME,
+    SEEK,
+    STOP,
+    STOP_RECORDING,
+    TRACE,
+    VOLUME,
+    delay_seconds,
+    main,
+    parse_args,
+    pause,
+    play,
+    quit_,
+    record,
+    recording_minutes,
+    resume,
+    seek,
+    stop,
+    stop_recording,
+    trace,
+    volume,
+    volume_level,
+)
+from radio_box.common import (
+    TRANSPORT_PIPE,
+    TRANSPORT_SOCKET,
+    CommandError,
+    SenderOptions,
+    ServiceUnavailableError,
+)
+from radio_box.protocol import controls_pb2 as controls
 
 
 def test_parse_args(mocker):
@@ -19,6 +56,10 @@ def test_parse_args(mocker):
     subparser_play = MagicMock()
     subparser_stop = MagicMock()
     subparser_quit = MagicMock()
+    subparser_trace = MagicMock()
+    subparser_volume = MagicMock()
+    subparser_seek = MagicMock()
+    subparser_record = MagicMock()
 
     mock_common_argument_parser = mocker.patch(
         "radio_box.client.common_argument_parser", return_value=mock_argument_parser
@@ -28,11 +69,21 @@ def test_parse_args(mocker):
         subparser_play,
         subparser_stop,
         subparser_quit,
+        subparser_volume,
+        MagicMock(),
+        MagicMock(),
+        subparser_seek,
+        subparser_record,
+        MagicMock(),
+        subparser_trace,
     ]
     parse_args()
 
     # Assert common argument parser is created
     mock_common_argument_parser.asser_called_once_with(expected_description)
+    mock_argument_parser.add_argument.assert_called_once_with(
+        "-z", "--zone", default="", help=ANY
+    )
     # Assert subparsers are created
     mock_argument_parser.add_subparsers.assert_called_once_with(
         title="commands", dest="subparser_command"
@@ -40,42 +91,63 @@ def test_parse_args(mocker):
     # Assert proper subparsers are added
     mock_subparser.add_parser.assert_has_calls(
         [call(arg) for arg in [PLAY, STOP, QUIT]]
+        + [call(VOLUME, help="Change playback volume")]
+        + [call(PAUSE, help=ANY), call(RESUME, help=ANY), call(SEEK, help=ANY)]
+        + [call(RECORD, help=ANY), call(STOP_RECORDING, help=ANY)]
+        + [call(TRACE, help="Show timing of recently executed commands")]
     )
     # Assert positional option "station" is added to PLAY subparser
     subparser_play.add_argument.assert_called_once_with(
         expected_play_positional_arg, help=expected_playpositional_arg_help
     )
+    subparser_volume.add_argument.assert_called_once_with(
+        "level", type=volume_level, help="Volume level between 0 and 100"
+    )
+    subparser_seek.add_argument.assert_called_once_with(
+        "delay", type=delay_seconds, help=ANY
+    )
+    subparser_record.add_argument.assert_called_with(
+        "-m", "--minutes", type=recording_minutes, default=0, help=ANY
+    )
 
 
 def test_play(mocker):
     """Test that client writes "play" command into the named pipe."""
     socket_path = Path("/tmp/foo.pipe")
     station = "bar radio"
-    message_mock = MagicMock()
+    message = controls.Command()
     mock_make_message_play = mocker.patch(
-        "radio_box.client.make_message_play", return_value=message_mock
+        "radio_box.client.make_message_play", return_value=message
     )
-    mock_send_message = mocker.patch("radio_box.client.send_message")
+    mock_send_command = mocker.patch("radio_box.client.send_command")
 
-    play(socket_path, station)
+    play(socket_path, station, origin=1000.0, zone="kitchen")
 
-    mock_make_message_play.assert_called_once_with(station)
-    mock_send_message.assert_called_once_with(socket_path, message_mock)
+    mock_make_message_play.assert_called_once_with(station, "kitchen")
+    mock_send_command.assert_called_once_with(
+        socket_path, message, TRANSPORT_PIPE, None
+    )
+    # Command is traced from the start of the CLI
+    assert message.trace_id and message.origin_time == 1000.0
+    assert [span.stage for span in message.spans] == ["cli"]
 
 
 def test_stop(mocker):
     """Test that client writes "stop" command into the named pipe."""
     socket_path = Path("/tmp/foo.pipe")
-    message_mock = MagicMock()
+    message = controls.Command()
     mock_make_message_stop = mocker.patch(
-        "radio_box.client.make_message_stop", return_value=message_mock
+        "radio_box.client.make_message_stop", return_value=message
     )
-    mock_send_message = mocker.patch("radio_box.client.send_message")
+    mock_send_command = mocker.patch("radio_box.client.send_command")
 
     stop(socket_path)
 
-    mock_make_message_stop.assert_called_once()
-    mock_send_message.assert_called_once_with(socket_path, message_mock)
+    mock_make_message_stop.assert_called_once_with("")
+    mock_send_command.assert_called_once_with(
+        socket_path, message, TRANSPORT_PIPE, None
+    )
+    assert [span.stage for span in message.spans] == ["cli"]
 
 
 def test_quit_(mocker):
@@ -85,23 +157,104 @@ def test_quit_(mocker):
     mock_make_message_quit = mocker.patch(
         "radio_box.client.make_message_quit", return_value=message_mock
     )
-    mock_send_message = mocker.patch("radio_box.client.send_message")
+    mock_send_command = mocker.patch("radio_box.client.send_command")
 
     quit_(socket_path)
 
     mock_make_message_quit.assert_called_once()
-    mock_send_message.assert_called_once_with(socket_path, message_mock)
+    mock_send_command.assert_called_once_with(
+        socket_path, message_mock, TRANSPORT_PIPE, None
+    )
+
+
+def test_volume(mocker):
+    """Test that client writes "set_volume" command into the named pipe."""
+    socket_path = Path("/tmp/foo.pipe")
+    mock_send_command = mocker.patch("radio_box.client.send_command")
+
+    volume(socket_path, 40, zone="kitchen")
+
+    message = mock_send_command.call_args.args[1]
+    assert message.set_volume.volume_level == 40
+    assert message.set_volume.zone == "kitchen"
+    mock_send_command.assert_called_once_with(socket_path, ANY, TRANSPORT_PIPE, None)
+
+
+def test_timeshift(mocker):
+    """Test that client writes time-shift commands into the named pipe."""
+    socket_path = Path("/tmp/foo.pipe")
+    mock_send_command = mocker.patch("radio_box.client.send_command")
+
+    pause(socket_path, zone="kitchen")
+    resume(socket_path)
+    seek(socket_path, 300, zone="kitchen")
+
+    paused, resumed, sought = [
+        sent.args[1] for sent in mock_send_command.call_args_list
+    ]
+    assert paused.pause.zone == "kitchen"
+    assert resumed.resume.type == controls.RESUME
+    assert not resumed.resume.HasField("zone")
+    assert (sought.seek.delay, sought.seek.zone) == (300, "kitchen")
+
+
+def test_recording(mocker):
+    """Test that client writes recorder commands into the named pipe."""
+    socket_path = Path("/tmp/foo.pipe")
+    mock_send_command = mocker.patch("radio_box.client.send_command")
+
+    record(socket_path, "bar radio", 3600)
+    stop_recording(socket_path, "bar radio")
+
+    recorded, stopped = [sent.args[1] for sent in mock_send_command.call_args_list]
+    assert (recorded.record.station, recorded.record.duration) == ("bar radio", 3600)
+    assert stopped.stop_recording.station == "bar radio"
+    mock_send_command.assert_called_with(socket_path, ANY, TRANSPORT_PIPE, None)
+
+
+@pytest.mark.parametrize("value", ["-1", "later", "inf", "nan"])
+def test_recording_minutes_invalid(value: str):
+    """Test that invalid duration of the record command is rejected."""
+    assert recording_minutes("0") == 0
+    assert recording_minutes("1.5") == 1.5
+    with pytest.raises(argparse.ArgumentTypeError):
+        recording_minutes(value)
+
+
+@pytest.mark.parametrize("value", ["-1", "soon", "1.5"])
+def test_delay_seconds_invalid(value: str):
+    """Test that invalid delay of the seek command is rejected."""
+    assert delay_seconds("0") == 0
+    assert delay_seconds("300") == 300
+    with pytest.raises(argparse.ArgumentTypeError):
+        delay_seconds(value)
+
+
+@pytest.mark.parametrize("value", ["-1", "101", "loud"])
+def test_volume_level_invalid(value: str):
+    """Test that volume outside of the supported range is rejected."""
+    assert volume_level("100") == 100
+    with pytest.raises(argparse.ArgumentTypeError):
+        volume_level(value)
 
 
 @pytest.mark.parametrize(
-    "action, function, arguments",
+    "action, function, arguments, extra_arguments",
     [
-        (PLAY, "play", {"station": "foo station"}),
-        (STOP, "stop", {}),
-        (QUIT, "quit_", {}),
+        (PLAY, "play", {"station": "foo station"}, {"origin": ANY, "zone": "kitchen"}),
+        (STOP, "stop", {}, {"origin": ANY, "zone": "kitchen"}),
+        (QUIT, "quit_", {}, {}),
+        (VOLUME, "volume", {"level": 40}, {"zone": "kitchen"}),
+        (PAUSE, "pause", {}, {"zone": "kitchen"}),
+        (RESUME, "resume", {}, {"zone": "kitchen"}),
+        (SEEK, "seek", {"delay": 300}, {"zone": "kitchen"}),
+        (RECORD, "record", {"station": "foo station"}, {"duration": 0}),
+        (STOP_RECORDING, "stop_recording", {"station": "foo station"}, {}),
     ],
 )
-def test_main_actions(action: str, function: str, arguments: Dict, mocker):
+def test_main_actions(
+    action: str, function: str, arguments: Dict, extra_arguments: Dict, mocker
+):
     """Test execution of the main function with all supported commands.
 
     This test mimics user executing CLI client with proper arguments for supported
@@ -114,22 +267,28 @@ def test_main_actions(action: str, function: str, arguments: Dict, mocker):
     mock_args.config = config
     mock_args.socket = socket_
     mock_args.subparser_command = action
+    mock_args.zone = "kitchen"
+    mock_args.minutes = 0
     for arg, value in arguments.items():
         setattr(mock_args, arg, value)
 
     mock_arg_parser = mocker.patch(
         "radio_box.client.parse_args", return_value=mock_args
     )
-    mock_create_pipe = mocker.patch("radio_box.client.create_pipe")
     mock_expected_function = mocker.patch("radio_box.client." + function)
-    mocker.patch.object(yaml, "safe_load", return_value={})
+    load_config = mocker.patch("radio_box.client.load_config", return_value={})
 
-    with patch("builtins.open"):
-        main()
+    main()
 
     mock_arg_parser.assert_called_once()
-    mock_create_pipe.assert_called_once_with(socket_)
-    mock_expected_function.assert_called_once_with(socket_, **arguments)
+    load_config.assert_called_once_with(Path(config))
+    mock_expected_function.assert_called_once_with(
+        socket_,
+        transport=TRANSPORT_PIPE,
+        options=SenderOptions(),
+        **arguments,
+        **extra_arguments,
+    )
 
 
 def test_main_socket_location_from_config(mocker):
@@ -141,15 +300,18 @@ def test_main_socket_location_from_config(mocker):
     mock_args.socket = None
 
     mocker.patch("radio_box.client.parse_args", return_value=mock_args)
-    mock_create_pipe = mocker.patch("radio_box.client.create_pipe")
     mock_function = mocker.patch("radio_box.client.stop")
-    mocker.patch.object(yaml, "safe_load", return_value={"socket": socket_path})
+    mocker.patch("radio_box.client.load_config", return_value={"socket": socket_path})
 
-    with patch("builtins.open"):
-        main()
+    main()
 
-    mock_create_pipe.assert_called_once_with(socket_path)
-    mock_function.assert_called_once_with(socket_path)
+    mock_function.assert_called_once_with(
+        socket_path,
+        transport=TRANSPORT_PIPE,
+        options=SenderOptions(),
+        origin=ANY,
+        zone=ANY,
+    )
 
 
 def test_main_socket_location_arg_override(mocker):
@@ -162,12 +324,111 @@ def test_main_socket_location_arg_override(mocker):
     mock_args.socket = arg_socket_path
 
     mocker.patch("radio_box.client.parse_args", return_value=mock_args)
-    mock_create_pipe = mocker.patch("radio_box.client.create_pipe")
     mock_function = mocker.patch("radio_box.client.stop")
-    mocker.patch.object(yaml, "safe_load", return_value={"socket": config_socket_path})
+    mocker.patch(
+        "radio_box.client.load_config", return_value={"socket": config_socket_path}
+    )
+
+    main()
+
+    mock_function.assert_called_once_with(
+        arg_socket_path,
+        transport=TRANSPORT_PIPE,
+        options=SenderOptions(),
+        origin=ANY,
+        zone=ANY,
+    )
+
 
-    with patch("builtins.open"):
+def test_main_socket_transport(mocker):
+    """Test that client uses transport and connection options from config."""
+    socket_path = "/tmp/foo.sock"
+    mock_args = MagicMock()
+    mock_args.subparser_command = STOP
+    mock_args.socket = None
+
+    mocker.patch("radio_box.client.parse_args", return_value=mock_args)
+    mock_function = mocker.patch("radio_box.client.stop")
+    config = {
+        "socket": socket_path,
+        "transport": TRANSPORT_SOCKET,
+        "connection": {"retries": 0},
+    }
+    mocker.patch("radio_box.client.load_config", return_value=config)
+
+    main()
+
+    mock_function.assert_called_once_with(
+        socket_path,
+        transport=TRANSPORT_SOCKET,
+        options=SenderOptions(retries=0),
+        origin=ANY,
+        zone=ANY,
+    )
+
+
+@pytest.mark.parametrize(
+    "error",
+    [CommandError("Unknown station"), ServiceUnavailableError("Service is down")],
+)
+def test_main_command_error(error: Exception, mocker):
+    """Test that client exits with error if command can't be executed."""
+    mock_args = MagicMock()
+    mock_args.subparser_command = PLAY
+    mock_args.station = "foo"
+    mock_args.socket = "/tmp/foo.sock"
+
+    mocker.patch("radio_box.client.parse_args", return_value=mock_args)
+    mocker.patch("radio_box.client.play", side_effect=error)
+    config = {"transport": TRANSPORT_SOCKET}
+    mocker.patch("radio_box.client.load_config", return_value=config)
+
+    with pytest.raises(SystemExit) as exc:
         main()
 
-    mock_create_pipe.assert_called_once_with(arg_socket_path)
-    mock_function.assert_called_once_with(arg_socket_path)
+    assert str(error) in str(exc.value)
+
+
+def test_trace(mocker, capsys):
+    """Test that recent traces are printed one per line."""
+    traces = [
+        controls.Trace(trace_id="a", origin_time=1.0, command="stop", outcome="ok"),
+        controls.Trace(trace_id="b", origin_time=2.0, command="stop", outcome="ok"),
+    ]
+    query_traces = mocker.patch("radio_box.client.query_traces", return_value=traces)
+
+    trace(Path("/tmp/foo.sock"), 5, TRANSPORT_SOCKET)
+
+    query_traces.assert_called_once_with(
+        Path("/tmp/foo.sock"), TRANSPORT_SOCKET, 5, None
+    )
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split()[2] for line in lines] == ["a", "b"]
+
+
+def test_main_trace(mocker):
+    """Test that "trace" command passes limit of the traces."""
+    mock_args = MagicMock()
+    mock_args.subparser_command = TRACE
+    mock_args.socket = "/tmp/foo.sock"
+    mock_args.limit = 3
+
+    mocker.patch("radio_box.client.parse_args", return_value=mock_args)
+    mock_function = mocker.patch("radio_box.client.trace")
+    mocker.patch("radio_box.client.load_config", return_value={"transport": "socket"})
+
+    main()
+
+    mock_function.assert_called_once_with(
+        "/tmp/foo.sock", 3, transport=TRANSPORT_SOCKET, options=SenderOptions()
+    )
+
+
+def test_startup_imports():
+    """Test that modules needed only on rare occasions are not imported by CLI."""
+    script = "import sys, radio_box.client; print(' '.join(sys.modules))"
+    output = subprocess.run(
+        [sys.executable, "-c", script], check=True, capture_output=True, text=True
+    ).stdout
+
+    assert not {"yaml", "tempfile", "uuid"} & set(output.split())
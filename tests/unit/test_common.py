@@ -1,21 +1,52 @@
 """Unit Tests for radio_box/common.py."""
 import errno
 import os
+import select
+import socket
+import threading
 from pathlib import Path
 from typing import List
-from unittest.mock import call, mock_open, patch
+from unittest.mock import call
 
 import pytest
 from pytest import mark
 
+from radio_box import common
 from radio_box.common import (
+    FRAME_HEADER,
+    MAX_MESSAGE_SIZE,
+    RETRY_BACKOFF,
+    SENDER_CACHE_SIZE,
+    TRANSPORT_PIPE,
+    TRANSPORT_SOCKET,
+    CommandError,
+    FramingError,
+    MessageDecoder,
+    Sender,
+    SenderOptions,
+    ServiceUnavailableError,
     common_argument_parser,
     create_pipe,
+    encode_message,
+    get_sender,
+    make_message_get_traces,
+    make_message_pause,
     make_message_play,
     make_message_quit,
+    make_message_record,
+    make_message_resume,
+    make_message_seek,
+    make_message_set_volume,
     make_message_stop,
+    make_message_stop_recording,
+    pack_frames,
+    send_command,
     send_message,
+    send_messages,
+    send_request,
+    zone_configs,
 )
+from radio_box.protocol import controls_pb2 as controls
 
 
 def test_common_argument_parser(common_parser_options: List):
@@ -69,6 +100,8 @@ def test_make_message_play():
 
     assert hasattr(message, "play")
     assert message.play.station == station
+    assert not message.play.HasField("zone")
+    assert make_message_play(station, "kitchen").play.zone == "kitchen"
 
 
 def test_make_message_stop():
@@ -76,6 +109,8 @@ def test_make_message_stop():
     message = make_message_stop()
 
     assert hasattr(message, "stop")
+    assert not message.stop.HasField("zone")
+    assert make_message_stop("kitchen").stop.zone == "kitchen"
 
 
 def test_make_message_quit():
@@ -85,15 +120,516 @@ def test_make_message_quit():
     assert hasattr(message, "quit")
 
 
-def test_send_message():
-    """Test writing protobuf message into named pipe."""
+def test_make_message_set_volume():
+    """Test creation of "set_volume" protobuf message."""
+    message = make_message_set_volume(40)
+
+    assert message.set_volume.type == controls.SET_VOLUME
+    assert message.set_volume.volume_level == 40
+    assert make_message_set_volume(40, "kitchen").set_volume.zone == "kitchen"
+
+
+def test_make_message_timeshift():
+    """Test creation of "pause", "resume" and "seek" protobuf messages."""
+    pause = make_message_pause()
+    resume = make_message_resume("kitchen")
+    seek = make_message_seek(30)
+
+    assert pause.pause.type == controls.PAUSE
+    assert not pause.pause.HasField("zone")
+    assert make_message_pause("kitchen").pause.zone == "kitchen"
+    assert resume.resume.type == controls.RESUME
+    assert resume.resume.zone == "kitchen"
+    assert not make_message_resume().resume.HasField("zone")
+    assert seek.seek.type == controls.SEEK
+    assert seek.seek.delay == 30
+    assert not seek.seek.HasField("zone")
+    assert make_message_seek(0, "kitchen").seek.zone == "kitchen"
+
+
+def test_make_message_recording():
+    """Test creation of "record" and "stop_recording" protobuf messages."""
+    record = make_message_record("best_radio", 3600)
+    stop = make_message_stop_recording("best_radio")
+
+    assert record.record.type == controls.RECORD
+    assert record.record.station == "best_radio"
+    assert record.record.duration == 3600
+    assert not make_message_record("best_radio").record.HasField("duration")
+    assert stop.stop_recording.type == controls.STOP_RECORDING
+    assert stop.stop_recording.station == "best_radio"
+
+
+@pytest.mark.parametrize(
+    "zones, expected",
+    [
+        (None, {"default": {}}),
+        (
+            {"kitchen": {"output": "hw:1"}, 2: None},
+            {"kitchen": {"output": "hw:1"}, "2": {}},
+        ),
+    ],
+)
+def test_zone_configs(zones, expected):
+    """Test that zones are read from the config, single default zone without them."""
+    assert list(zone_configs({"zones": zones}).items()) == list(expected.items())
+
+
+def test_make_message_get_traces():
+    """Test creation of "get_traces" protobuf message."""
+    message = make_message_get_traces(5)
+
+    assert message.get_traces.type == controls.GET_TRACES
+    assert message.get_traces.limit == 5
+
+
+def test_encode_message():
+    """Test that encoded message is prefixed with its length."""
+    message = make_message_play("fooRadio")
+    payload = message.SerializeToString()
+
+    frame = encode_message(message)
+
+    assert frame == FRAME_HEADER.pack(len(payload)) + payload
+
+
+def test_encode_message_too_big():
+    """Test that messages over the size limit are refused."""
+    message = make_message_play("x" * MAX_MESSAGE_SIZE)
+
+    with pytest.raises(FramingError):
+        encode_message(message)
+
+
+def test_message_decoder_multiple_messages():
+    """Test decoding multiple messages received in a single chunk."""
+    messages = [make_message_play("foo"), make_message_stop(), make_message_quit()]
+    decoder = MessageDecoder(controls.Command)
+
+    result = decoder.feed(b"".join(encode_message(msg) for msg in messages))
+
+    assert result == messages
+
+
+def test_message_decoder_partial_data():
+    """Test that decoder waits for complete frames before returning messages."""
+    message = make_message_play("foo")
+    frame = encode_message(message)
+    decoder = MessageDecoder(controls.Command)
+
+    # Feed data one byte at a time
+    results = [decoder.feed(bytes([byte])) for byte in frame]
+
+    assert all(result == [] for result in results[:-1])
+    assert results[-1] == [message]
+    assert not decoder.feed(b"")
+
+
+def test_message_decoder_skips_invalid_payload():
+    """Test that frame with unparsable payload does not break rest of the stream."""
+    message = make_message_stop()
+    garbage = b"\xff\xff\xff"
+    bad_frame = FRAME_HEADER.pack(len(garbage)) + garbage
+    decoder = MessageDecoder(controls.Command)
+
+    assert decoder.feed(bad_frame + encode_message(message)) == [message]
+
+
+def test_message_decoder_oversized_frame():
+    """Test that decoder refuses frames that exceed the size limit."""
+    decoder = MessageDecoder(controls.Command, max_size=10)
+
+    with pytest.raises(FramingError):
+        decoder.feed(FRAME_HEADER.pack(11))
+
+    decoder.reset()
+    message = make_message_stop()
+    assert decoder.feed(encode_message(message)) == [message]
+
+
+def test_pack_frames():
+    """Test that messages are packed into single chunk of data."""
+    messages = [make_message_play("foo"), make_message_stop()]
+
+    assert pack_frames(messages) == [
+        b"".join(encode_message(message) for message in messages)
+    ]
+
+
+def test_pack_frames_split_on_pipe_buf():
+    """Test that batches bigger than PIPE_BUF are split into frame-aligned chunks."""
+    message = make_message_play("x" * 1000)
+    frame = encode_message(message)
+    frames_per_write = select.PIPE_BUF // len(frame)
+    messages = [message] * (frames_per_write + 1)
+
+    assert pack_frames(messages) == [frame * frames_per_write, frame]
+
+
+def test_sender_pipe(tmp_path: Path, mocker):
+    """Test that sender keeps the pipe open and writes batches at once."""
+    pipe_path = create_pipe(tmp_path / "radio.pipe")
+    reader = os.open(pipe_path, os.O_RDONLY | os.O_NONBLOCK)
+    open_mock = mocker.patch.object(common.os, "open", wraps=os.open)
+    messages = [make_message_play("foo"), make_message_stop()]
+    sender = Sender(pipe_path)
+
+    try:
+        assert not sender.send(messages)
+        assert not sender.send(messages[:1])
+        data = os.read(reader, 4096)
+    finally:
+        sender.close()
+        os.close(reader)
+
+    open_mock.assert_called_once_with(str(pipe_path), os.O_WRONLY | os.O_NONBLOCK)
+    assert data == b"".join(encode_message(msg) for msg in messages + messages[:1])
+
+
+def test_sender_pipe_without_reader(tmp_path: Path, mocker):
+    """Test that sender does not block when service is not running."""
+    pipe_path = create_pipe(tmp_path / "radio.pipe")
+    sleep_mock = mocker.patch.object(common.time, "sleep")
+    sender = Sender(pipe_path, options=SenderOptions(retries=2))
+
+    with pytest.raises(ServiceUnavailableError, match="No such device"):
+        sender.send([make_message_stop()])
+
+    assert sleep_mock.call_args_list == [call(RETRY_BACKOFF), call(RETRY_BACKOFF * 2)]
+
+
+def test_sender_pipe_reconnect(tmp_path: Path, mocker):
+    """Test that sender reopens the pipe when service restarts."""
+    pipe_path = create_pipe(tmp_path / "radio.pipe")
+    mocker.patch.object(common.time, "sleep")
+    message = make_message_stop()
+    sender = Sender(pipe_path)
+
+    reader = os.open(pipe_path, os.O_RDONLY | os.O_NONBLOCK)
+    sender.send([message])
+    os.close(reader)
+    # Service is down
+    with pytest.raises(ServiceUnavailableError):
+        sender.send([message])
+    # Service starts and opens the pipe again
+    reader = os.open(pipe_path, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        sender.send([message])
+        assert os.read(reader, 4096) == encode_message(message)
+    finally:
+        sender.close()
+        os.close(reader)
+
+
+def test_sender_pipe_write_timeout(tmp_path: Path, mocker):
+    """Test that sender waits for limited time when the pipe is full."""
+    pipe_path = create_pipe(tmp_path / "radio.pipe")
+    mocker.patch.object(common.time, "sleep")
+    reader = os.open(pipe_path, os.O_RDONLY | os.O_NONBLOCK)
+    options = SenderOptions(write_timeout=0.01, retries=0)
+    sender = Sender(pipe_path, options=options)
+    message = make_message_play("x" * 1000)
+
+    try:
+        with pytest.raises(ServiceUnavailableError, match="Timed out"):
+            # Nobody reads from the pipe, so it fills up eventually.
+            for _ in range(1000):
+                sender.send([message] * 4)
+    finally:
+        sender.close()
+        os.close(reader)
+
+
+def test_sender_pipe_timeout_mid_batch(tmp_path: Path, mocker):
+    """Test that retry writes only the chunks that were not written yet."""
+    pipe_path = create_pipe(tmp_path / "radio.pipe")
+    reader = os.open(pipe_path, os.O_RDONLY | os.O_NONBLOCK)
+    mocker.patch.object(common.time, "sleep")
+    batch = [make_message_play(str(i) * 1000) for i in range(8)]
+    first, second = pack_frames(batch)  # pylint: disable=unbalanced-tuple-unpacking
+    # Pipe accepts the first chunk, then it stays full until the write times out
+    write = mocker.patch.object(
+        common.os, "write", side_effect=[len(first), BlockingIOError(), len(second)]
+    )
+    mocker.patch.object(common.select, "select", return_value=([], [], []))
+    sender = Sender(pipe_path, options=SenderOptions(retries=1))
+
+    try:
+        assert not sender.send(batch)
+    finally:
+        sender.close()
+        os.close(reader)
+
+    assert [bytes(args[1]) for args, _ in write.call_args_list] == [
+        first,
+        second,
+        second,
+    ]
+
+
+def test_sender_pipe_partial_frame(tmp_path: Path, mocker):
+    """Test that retry continues with the rest of the partially written frame."""
+    pipe_path = create_pipe(tmp_path / "radio.pipe")
+    reader = os.open(pipe_path, os.O_RDONLY | os.O_NONBLOCK)
+    mocker.patch.object(common.time, "sleep")
+    message = make_message_play("x" * 2 * select.PIPE_BUF)
+    frame = pack_frames([message])[0]
+    written = select.PIPE_BUF
+    write = mocker.patch.object(
+        common.os,
+        "write",
+        side_effect=[written, BrokenPipeError(), len(frame) - written],
+    )
+    sender = Sender(pipe_path, options=SenderOptions(retries=1))
+
+    try:
+        assert not sender.send([message])
+    finally:
+        sender.close()
+        os.close(reader)
+
+    assert bytes(write.call_args_list[-1].args[1]) == frame[written:]
+
+
+def test_sender_pipe_waits_for_reader(tmp_path: Path):
+    """Test that sender finishes writing when service drains the full pipe."""
+    pipe_path = create_pipe(tmp_path / "radio.pipe")
+    reader = os.open(pipe_path, os.O_RDONLY | os.O_NONBLOCK)
+    os.set_blocking(reader, True)
+    sender = Sender(pipe_path, options=SenderOptions(write_timeout=5))
+    message = make_message_play("x" * 1000)
+    batch = [message] * 200
+    received = bytearray()
+
+    def drain():
+        expected = len(encode_message(message)) * len(batch)
+        while len(received) < expected:
+            received.extend(os.read(reader, 65536))
+
+    drain_thread = threading.Thread(target=drain)
+    drain_thread.start()
+    try:
+        sender.send(batch)
+        drain_thread.join(5)
+    finally:
+        sender.close()
+        os.close(reader)
+
+    assert bytes(received) == b"".join(pack_frames(batch))
+
+
+class ReplyServer:
+    """Minimal stand-in of radio-box service listening on unix domain socket."""
+
+    def __init__(self, socket_path: Path, reply: bool = True) -> None:
+        self.socket_path = socket_path
+        self.reply = reply
+        self.connections = 0
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(str(socket_path))
+        self.sock.listen()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self) -> None:
+        """Reply to every command with station that it asked to play."""
+        while True:
+            try:
+                connection, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            decoder = MessageDecoder(controls.Command)
+            with connection:
+                for data in iter(lambda: connection.recv(4096), b""):
+                    if not self.reply:
+                        break
+                    for message in decoder.feed(data):
+                        reply = controls.Reply(status=controls.OK)
+                        reply.state.station = message.play.station
+                        connection.sendall(encode_message(reply))
+
+    def close(self) -> None:
+        """Stop accepting connections."""
+        self.sock.shutdown(socket.SHUT_RDWR)
+        self.sock.close()
+        self.thread.join()
+
+
+def test_sender_socket(tmp_path: Path):
+    """Test that sender receives reply for every message over single connection."""
+    socket_path = tmp_path / "radio.sock"
+    server = ReplyServer(socket_path)
+    sender = Sender(socket_path, TRANSPORT_SOCKET)
+
+    try:
+        replies = sender.send([make_message_play("foo"), make_message_play("bar")])
+        replies += sender.send([make_message_play("baz")])
+    finally:
+        sender.close()
+        server.close()
+
+    assert [reply.state.station for reply in replies] == ["foo", "bar", "baz"]
+    assert server.connections == 1
+
+
+def test_sender_socket_unavailable(tmp_path: Path, mocker):
+    """Test that sender fails after retries if service does not listen."""
+    mocker.patch.object(common.time, "sleep")
+    sender = Sender(tmp_path / "radio.sock", TRANSPORT_SOCKET)
+
+    with pytest.raises(ServiceUnavailableError):
+        sender.send([make_message_stop()])
+
+    # Socket that refuses connection
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(str(tmp_path / "radio.sock"))
+        with pytest.raises(ServiceUnavailableError, match="refused"):
+            sender.send([make_message_stop()])
+
+
+def test_sender_socket_reply_timeout(tmp_path: Path):
+    """Test that sender does not wait for reply forever."""
+    socket_path = tmp_path / "radio.sock"
+    sender = Sender(socket_path, TRANSPORT_SOCKET, SenderOptions(reply_timeout=0.01))
+
+    # Service accepts connections, but it's stuck and never replies
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(str(socket_path))
+        sock.listen()
+        with pytest.raises(ServiceUnavailableError, match="receive reply"):
+            sender.send([make_message_stop()])
+
+    assert sender._socket is None
+
+
+def test_sender_socket_failure_mid_batch(tmp_path: Path, mocker):
+    """Test that batch is not sent again once part of it reached the service."""
+    socket_path = tmp_path / "radio.sock"
+    server = ReplyServer(socket_path)
+    mocker.patch.object(common.time, "sleep")
+    sendall = mocker.patch.object(
+        common.socket.socket, "sendall", side_effect=[None, TimeoutError()]
+    )
+    sender = Sender(socket_path, TRANSPORT_SOCKET, SenderOptions(retries=2))
+
+    try:
+        with pytest.raises(ServiceUnavailableError, match="Failed to send"):
+            sender.send([make_message_play(str(i) * 1000) for i in range(8)])
+    finally:
+        sender.close()
+        server.close()
+
+    # Second chunk failed and the batch was not sent again on a new connection
+    assert sendall.call_count == 2
+
+
+def test_sender_socket_connection_closed(tmp_path: Path):
+    """Test that commands are not repeated when service closes connection."""
+    socket_path = tmp_path / "radio.sock"
+    server = ReplyServer(socket_path, reply=False)
+    sender = Sender(socket_path, TRANSPORT_SOCKET)
+
+    try:
+        with pytest.raises(ServiceUnavailableError, match="closed by the service"):
+            sender.send([make_message_stop()])
+    finally:
+        sender.close()
+        server.close()
+
+    assert server.connections == 1
+
+
+def test_get_sender(mocker):
+    """Test that senders are cached per path and transport."""
+    mocker.patch.dict(common._SENDERS, clear=True)
+    options = SenderOptions(retries=5)
+
+    sender = get_sender("/tmp/foo.pipe")
+    assert get_sender(Path("/tmp/foo.pipe")) is sender
+    assert get_sender("/tmp/foo.pipe", TRANSPORT_SOCKET) is not sender
+    assert get_sender("/tmp/foo.pipe", options=options) is sender
+    assert sender.options == options
+
+    # Forked process does not reuse sender of its parent
+    mocker.patch.object(common.os, "getpid", return_value=sender.pid + 1)
+    assert get_sender("/tmp/foo.pipe") is not sender
+
+
+def test_get_sender_eviction(mocker):
+    """Test that least recently used connection is closed when cache is full."""
+    mocker.patch.dict(common._SENDERS, clear=True)
+    close_mock = mocker.patch.object(Sender, "close")
+
+    first = get_sender("/tmp/0.pipe")
+    for index in range(1, SENDER_CACHE_SIZE + 1):
+        get_sender(f"/tmp/{index}.pipe")
+
+    close_mock.assert_called_once_with()
+    assert first not in common._SENDERS.values()
+    assert len(common._SENDERS) == SENDER_CACHE_SIZE
+
+
+def test_send_messages(mocker):
+    """Test writing batch of protobuf messages using cached sender."""
+    messages = [make_message_play("foo"), make_message_stop()]
+    pipe_path = Path("/tmp/foo.pipe")
+    get_sender_mock = mocker.patch.object(common, "get_sender")
+
+    send_messages(pipe_path, iter(messages))
+
+    get_sender_mock.assert_called_once_with(pipe_path, TRANSPORT_PIPE, None)
+    get_sender_mock.return_value.send.assert_called_once_with(messages)
+
+
+def test_send_message(mocker):
+    """Test that single message is sent as a batch of one."""
     message = make_message_stop()
     pipe_path = Path("/tmp/foo.pip")
+    options = SenderOptions()
+    send_messages_mock = mocker.patch.object(common, "send_messages")
+
+    send_message(pipe_path, message, options)
+
+    send_messages_mock.assert_called_once_with(pipe_path, [message], options)
+
+
+def test_send_request(mocker):
+    """Test sending message over unix domain socket and receiving the reply."""
+    message = make_message_play("foo")
+    reply = controls.Reply(status=controls.OK)
+    get_sender_mock = mocker.patch.object(common, "get_sender")
+    get_sender_mock.return_value.send.return_value = [reply]
+
+    assert send_request(Path("/tmp/foo.sock"), message) == reply
+
+    get_sender_mock.assert_called_once_with(
+        Path("/tmp/foo.sock"), TRANSPORT_SOCKET, None
+    )
+    get_sender_mock.return_value.send.assert_called_once_with([message])
 
-    pipe_mock = mock_open()
-    pipe_handle = pipe_mock()  # This handle will have `write()` calls
-    with patch("builtins.open", pipe_mock):
-        send_message(pipe_path, message)
 
-    pipe_mock.assert_has_calls([call(pipe_path, "wb")])
-    pipe_handle.write.assert_called_once_with(message.SerializeToString())
+def test_send_command_pipe(mocker):
+    """Test that commands sent over the pipe don't produce reply."""
+    message = make_message_stop()
+    send_message_mock = mocker.patch("radio_box.common.send_message")
+    send_request_mock = mocker.patch("radio_box.common.send_request")
+
+    assert send_command(Path("/tmp/foo.pipe"), message, TRANSPORT_PIPE) is None
+
+    send_message_mock.assert_called_once_with(Path("/tmp/foo.pipe"), message, None)
+    send_request_mock.assert_not_called()
+
+
+@mark.parametrize("status", [controls.OK, controls.ERROR])
+def test_send_command_socket(status, mocker):
+    """Test that replies to commands sent over the socket are checked for errors."""
+    message = make_message_stop()
+    reply = controls.Reply(status=status, error="Failed")
+    mocker.patch("radio_box.common.send_request", return_value=reply)
+
+    if status == controls.ERROR:
+        with pytest.raises(CommandError, match="Failed"):
+            send_command(Path("/tmp/foo.sock"), message, TRANSPORT_SOCKET)
+    else:
+        assert send_command(Path("/tmp/foo.sock"), message, TRANSPORT_SOCKET) == reply
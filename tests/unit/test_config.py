@@ -0,0 +1,115 @@
+"""Unit Tests for radio_box/config.py."""
+import os
+from pathlib import Path
+
+import pytest
+import yaml
+
+from radio_box import config
+from radio_box.config import CacheKey, cache_path, load_config, read_cache, write_cache
+
+CONFIG = "socket: /tmp/foo.pipe\nstations:\n  foo:\n    url: http://example.org/foo\n"
+
+
+@pytest.fixture
+def conf_file(tmp_path: Path) -> Path:
+    """Provide config file with a single station."""
+    path = tmp_path / "conf.yaml"
+    path.write_text(CONFIG)
+    return path
+
+
+def test_cache_path():
+    """Test that cache is a hidden file next to the config file."""
+    assert cache_path(Path("/etc/radio-box/conf.yaml")) == Path(
+        "/etc/radio-box/.conf.yaml.cache"
+    )
+
+
+@pytest.mark.parametrize(
+    "snap_common, expected",
+    [
+        (None, "/var/lib/radio-box"),
+        ("/var/snap/radio-box/common", "/var/snap/radio-box/common"),
+    ],
+)
+def test_data_dir(snap_common, expected, monkeypatch):
+    """Test that data are kept in the common directory of the snap if it's set."""
+    monkeypatch.delenv("SNAP_COMMON", raising=False)
+    if snap_common:
+        monkeypatch.setenv("SNAP_COMMON", snap_common)
+
+    assert config.data_dir() == expected
+
+
+def test_load_config(conf_file: Path, mocker):
+    """Test that config is parsed only until the cache is built."""
+    expected = yaml.safe_load(CONFIG)
+    parse = mocker.spy(yaml, "load")
+    conf_file.chmod(0o640)
+
+    assert load_config(conf_file) == expected
+    assert load_config(conf_file) == expected
+
+    parse.assert_called_once()
+    assert os.stat(cache_path(conf_file)).st_mode & 0o777 == 0o640
+    assert read_cache(cache_path(conf_file))[1] == expected
+
+
+def test_load_config_changed(conf_file: Path, mocker):
+    """Test that cache is rebuilt after the content of the config file changes."""
+    load_config(conf_file)
+    parse = mocker.spy(yaml, "load")
+
+    # Touching the file does not require parsing
+    os.utime(conf_file, ns=(0, 0))
+    load_config(conf_file)
+    parse.assert_not_called()
+    assert read_cache(cache_path(conf_file))[0].mtime_ns == 0
+
+    conf_file.write_text(CONFIG.replace("foo.pipe", "bar.pipe"))
+    assert load_config(conf_file)["socket"] == "/tmp/bar.pipe"
+    assert load_config(conf_file)["socket"] == "/tmp/bar.pipe"
+    parse.assert_called_once()
+
+
+def test_load_config_not_cached(conf_file: Path, mocker):
+    """Test that configs that are not dictionaries are not cached."""
+    conf_file.write_text("- foo")
+    write = mocker.spy(config, "write_cache")
+
+    assert load_config(conf_file) == ["foo"]
+    write.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        b"",
+        b"XXXX" + bytes(config.HEADER.size),
+        config.HEADER.pack(config.MAGIC, config.LAYOUT_VERSION, 0, 0, 0, bytes(32)),
+        config.HEADER.pack(
+            config.MAGIC, config.LAYOUT_VERSION, config.marshal.version, 0, 0, bytes(32)
+        )
+        + config.marshal.dumps(["foo"]),
+    ],
+)
+def test_read_cache_invalid(content: bytes, tmp_path: Path):
+    """Test that broken or incompatible cache is ignored."""
+    path = tmp_path / ".conf.yaml.cache"
+    path.write_bytes(content)
+
+    assert read_cache(path) is None
+
+
+def test_write_cache_failure(tmp_path: Path, mocker):
+    """Test that cache that can't be written is skipped without leftovers."""
+    key = CacheKey(0, 0, bytes(32))
+    path = tmp_path / ".conf.yaml.cache"
+
+    write_cache(tmp_path / "missing" / ".conf.yaml.cache", key, {})
+    write_cache(path, key, {"date": yaml.safe_load("2023-01-01")})
+    mocker.patch.object(config.os, "replace", side_effect=PermissionError)
+    write_cache(path, key, {})
+
+    assert not list(tmp_path.iterdir())
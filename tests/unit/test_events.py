@@ -0,0 +1,172 @@
+"""Unit Tests for radio_box/events.py."""
+import socket
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+import pytest
+
+from radio_box import events
+from radio_box.common import CommandError, MessageDecoder, SenderOptions, encode_message
+from radio_box.events import EventHub, event_kind, format_event, state_to_dict
+from radio_box.protocol import controls_pb2 as controls
+
+
+class StopLoop(Exception):
+    """Breaks otherwise endless loop of the tested function."""
+
+
+def serve_replies(socket_path: Path, replies: List[controls.Reply]) -> List:
+    """Accept single connection in the background and send replies to the client.
+
+    Returns list that receives commands sent by the client.
+    """
+    received: List[controls.Command] = []
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(str(socket_path))
+    server.listen(1)
+
+    def serve() -> None:
+        with server, server.accept()[0] as connection:
+            decoder = MessageDecoder(controls.Command)
+            while not received:
+                received.extend(decoder.feed(connection.recv(4096)))
+            for reply in replies:
+                connection.sendall(encode_message(reply))
+
+    threading.Thread(target=serve, daemon=True).start()
+    return received
+
+
+def test_state_to_dict():
+    """Test that unset fields of the state are reported as nulls."""
+    assert state_to_dict(controls.PlayerState(status=controls.STOPPED)) == {
+        "station": None,
+        "status": "stopped",
+        "error": None,
+        "title": None,
+        "volume": None,
+        "delay": None,
+    }
+    state = controls.PlayerState(
+        station="foo", status=controls.PLAYING, title="Song", volume=0, delay=30
+    )
+    assert state_to_dict(state)["title"] == "Song"
+    assert state_to_dict(state)["volume"] == 0
+    assert state_to_dict(state)["delay"] == 30
+
+
+@pytest.mark.parametrize(
+    "previous, expected_kind",
+    [
+        (None, "playing"),
+        (controls.PlayerState(station="foo", status=controls.BUFFERING), "playing"),
+        (controls.PlayerState(station="bar", status=controls.PLAYING), "playing"),
+        (controls.PlayerState(station="foo", status=controls.PLAYING), "metadata"),
+        (
+            controls.PlayerState(
+                station="foo", status=controls.PLAYING, title="Song", volume=10
+            ),
+            "volume",
+        ),
+    ],
+)
+def test_event_kind(previous: Optional[controls.PlayerState], expected_kind: str):
+    """Test that event is named after the most significant change of the state."""
+    state = controls.PlayerState(
+        station="foo", status=controls.PLAYING, title="Song", volume=20
+    )
+
+    assert event_kind(previous, state) == expected_kind
+
+
+def test_format_event():
+    """Test that state is sent as JSON data of the named event."""
+    state = controls.PlayerState(station="foo", status=controls.FAILED, error="Boom")
+
+    assert format_event("failed", state) == (
+        "event: failed\n"
+        'data: {"station": "foo", "status": "failed", "error": "Boom", '
+        '"title": null, "volume": null, "delay": null}\n\n'
+    )
+
+
+def test_subscribe_states(tmp_path: Path):
+    """Test that states are received until the service closes the connection."""
+    socket_path = tmp_path / "radio.sock"
+    states = [
+        controls.PlayerState(status=controls.STOPPED),
+        controls.PlayerState(station="foo", status=controls.OPENING),
+    ]
+    received = serve_replies(
+        socket_path, [controls.Reply(status=controls.OK, state=s) for s in states]
+    )
+
+    assert list(events.subscribe_states(socket_path, SenderOptions(), "kitchen")) == (
+        states
+    )
+    assert received[0].subscribe.zone == "kitchen"
+
+
+def test_subscribe_states_refused(tmp_path: Path):
+    """Test that refused subscription raises CommandError."""
+    socket_path = tmp_path / "radio.sock"
+    serve_replies(socket_path, [controls.Reply(status=controls.ERROR, error="No")])
+
+    with pytest.raises(CommandError, match="No"):
+        list(events.subscribe_states(socket_path, SenderOptions()))
+
+
+def test_event_hub_publish(mocker):
+    """Test that states are distributed to all clients, slow clients are dropped."""
+    run = mocker.patch.object(EventHub, "run")
+    hub = EventHub(Path("/tmp/foo.sock"), queue_size=2)
+    slow = hub.subscribe()
+    fast = hub.subscribe()
+
+    hub.publish(controls.PlayerState(station="foo", status=controls.OPENING))
+    hub.publish(controls.PlayerState(station="foo", status=controls.PLAYING))
+    fast.get_nowait()
+    fast.get_nowait()
+    hub.publish(controls.PlayerState(station="foo", status=controls.STOPPED))
+
+    assert slow.get_nowait() is None
+    assert fast.get_nowait()[0] == "stopped"
+    assert hub.clients == {fast}
+    # New clients start with the current state, subscription is started only once
+    assert hub.subscribe().get_nowait()[0] == "stopped"
+    run.assert_called_once()
+
+
+def test_event_hub_run(mocker, capsys):
+    """Test that subscription is renewed after it fails or ends."""
+    state = controls.PlayerState(station="foo", status=controls.PLAYING)
+    subscribe_states = mocker.patch.object(
+        events, "subscribe_states", side_effect=[iter([state]), OSError("Refused")]
+    )
+    sleep = mocker.patch.object(events.time, "sleep", side_effect=[None, StopLoop])
+    hub = EventHub(Path("/tmp/foo.sock"), zone="kitchen")
+
+    with pytest.raises(StopLoop):
+        hub.run()
+
+    assert hub.state == state
+    subscribe_states.assert_called_with(Path("/tmp/foo.sock"), hub.options, "kitchen")
+    sleep.assert_called_with(events.RECONNECT_DELAY)
+    assert "Subscription to the player state failed: Refused" in capsys.readouterr().out
+
+
+def test_event_hub_stream(mocker):
+    """Test that client receives keepalive comments and events until dropped."""
+    mocker.patch.object(EventHub, "run")
+    mocker.patch.object(events, "KEEPALIVE_INTERVAL", 0.01)
+    hub = EventHub(Path("/tmp/foo.sock"))
+
+    stream = hub.stream()
+    assert next(stream) == ": keepalive\n\n"
+    hub.publish(controls.PlayerState(status=controls.STOPPED))
+    assert next(stream).startswith("event: stopped\n")
+    next(iter(hub.clients)).put_nowait(None)
+
+    assert not list(stream)
+    assert not hub.clients
@@ -0,0 +1,65 @@
+"""Unit Tests for radio_box/http_cache.py."""
+import gzip
+import json
+from typing import Dict
+from unittest.mock import MagicMock
+
+import pytest
+from flask import Flask
+
+from radio_box.http_cache import BodyCache, cached_response, precompute
+
+
+def test_precompute():
+    """Test that the same payload always produces the same body and ETag."""
+    body = precompute({"b": 1, "a": "é"})
+
+    assert json.loads(body.raw) == {"a": "é", "b": 1}
+    assert gzip.decompress(body.gzipped) == body.raw
+    assert precompute({"a": "é", "b": 1}) == body
+    assert precompute({"a": "é", "b": 2}).etag != body.etag
+
+
+@pytest.mark.parametrize(
+    "headers, expected_status, expected_encoding",
+    [
+        ({}, 200, None),
+        ({"Accept-Encoding": "gzip, deflate"}, 200, "gzip"),
+        ({"Accept-Encoding": "gzip;q=0, deflate"}, 200, None),
+        ({"If-None-Match": '"other"'}, 200, None),
+        ({"If-None-Match": '"other", W/"ETAG"'}, 304, None),
+        ({"If-None-Match": "*", "Accept-Encoding": "gzip"}, 304, None),
+    ],
+)
+def test_cached_response(headers: Dict, expected_status: int, expected_encoding):
+    """Test that content is negotiated and revalidated with the ETag."""
+    body = precompute({"stations": {}})
+    headers = {key: value.replace("ETAG", body.etag) for key, value in headers.items()}
+
+    with Flask(__name__).test_request_context(headers=headers):
+        response = cached_response(body)
+
+    assert response.status_code == expected_status
+    assert response.get_etag() == (body.etag, False)
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.content_encoding == expected_encoding
+    if expected_status == 200:
+        expected_data = body.gzipped if expected_encoding else body.raw
+        assert response.get_data() == expected_data
+        assert response.content_type == "application/json"
+
+
+def test_body_cache():
+    """Test that body is computed again only when its data change."""
+    cache = BodyCache()
+    stations = {"foo": {}}
+    build = MagicMock(return_value={"stations": ["foo"]})
+
+    first = cache.get(stations, 1, build)
+    assert cache.get(stations, 1, build) is first
+    assert build.call_count == 1
+
+    cache.get(dict(stations), 1, build)
+    cache.get(stations, 2, build)
+    assert build.call_count == 3
@@ -0,0 +1,130 @@
+"""Unit Tests for radio_box/metrics.py."""
+import json
+import time
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+from radio_box import metrics
+from radio_box.metrics import Exporter, Registry, collect, render
+
+
+def test_counter():
+    """Test that counter is increased separately for each combination of labels."""
+    counter = Registry().counter("requests_total", "Requests.", ["method"])
+
+    counter.inc(method="GET")
+    counter.inc(2, method="GET")
+    counter.inc(method="POST")
+
+    assert counter.values == {("GET",): 3, ("POST",): 1}
+    with pytest.raises(ValueError):
+        counter.inc(route="/")
+
+
+def test_histogram():
+    """Test that observed values are counted in the first bucket they fit in."""
+    histogram = Registry().histogram("duration", "Duration.", buckets=(0.1, 1))
+
+    for value in (0.05, 0.1, 0.5, 20):
+        histogram.observe(value)
+
+    assert histogram.values == {(): ([2, 1, 1], 20.65)}
+
+
+def test_metric_is_abstract():
+    """Test that metric without snapshot can't be created."""
+    with pytest.raises(TypeError):
+        # pylint: disable=abstract-class-instantiated
+        metrics.Metric("incomplete", "Incomplete.")
+
+
+@pytest.mark.parametrize(
+    "config, expected_path",
+    [
+        ({"socket": "/run/radio-box.pipe"}, "/run/radio-box.metrics"),
+        ({"socket": "/run/radio-box.pipe", "metrics_dir": "/tmp/m"}, "/tmp/m"),
+    ],
+)
+def test_metrics_dir_path(config: Dict, expected_path: str):
+    """Test that metrics are stored next to the socket unless configured."""
+    assert metrics.metrics_dir_path(config) == Path(expected_path)
+
+
+def test_exporter_dump(tmp_path: Path):
+    """Test that snapshot of the process replaces previous one and can be cleared."""
+    registry = Registry()
+    counter = registry.counter("requests_total", "Requests.")
+    exporter = Exporter(tmp_path / "metrics", "web", registry)
+
+    counter.inc()
+    exporter.dump()
+    counter.inc()
+    exporter.dump()
+
+    snapshot = json.loads(exporter.path.read_text())
+    assert snapshot["requests_total"]["samples"] == [[[], 2]]
+    assert [path.name for path in exporter.directory.iterdir()] == [exporter.path.name]
+
+    exporter.clear()
+    assert not list(exporter.directory.iterdir())
+
+
+def test_exporter_dump_failure(tmp_path: Path, capsys):
+    """Test that failure to store metrics is only logged."""
+    (tmp_path / "metrics").touch()
+
+    Exporter(tmp_path / "metrics", "web", Registry()).dump()
+
+    assert "Failed to store metrics" in capsys.readouterr().out
+
+
+def test_exporter_maybe_dump(tmp_path: Path, mocker):
+    """Test that frequent dumps are throttled, but the last one is not lost."""
+    mocker.patch.object(metrics, "FLUSH_INTERVAL", 0.05)
+    registry = Registry()
+    counter = registry.counter("requests_total", "Requests.")
+    exporter = Exporter(tmp_path, "web", registry)
+
+    for _ in range(3):
+        counter.inc()
+        exporter.maybe_dump()
+
+    assert json.loads(exporter.path.read_text())["requests_total"]["samples"] == [
+        [[], 1]
+    ]
+    time.sleep(0.2)
+    assert json.loads(exporter.path.read_text())["requests_total"]["samples"] == [
+        [[], 3]
+    ]
+
+
+def test_collect_and_render(tmp_path: Path):
+    """Test that snapshots of all processes are summed up and rendered."""
+    for role, value in (("web-1", 0.2), ("web-2", 3), ("service-3", 0.01)):
+        registry = Registry()
+        registry.counter("requests_total", "Requests.", ["path"]).inc(path='a"\\\n')
+        histogram = registry.histogram("duration", "Duration.", buckets=(0.1, 1))
+        histogram.observe(value)
+        Exporter(tmp_path, role, registry).dump()
+    (tmp_path / "broken-4.json").write_text("{")
+    # Metric of the same name with a different type is ignored
+    conflicting = Registry()
+    conflicting.counter("duration", "Other.").inc()
+    Exporter(tmp_path, "web-5", conflicting).dump()
+
+    text = render(collect(tmp_path))
+
+    assert text == (
+        "# HELP duration Duration.\n"
+        "# TYPE duration histogram\n"
+        'duration_bucket{le="0.1"} 1\n'
+        'duration_bucket{le="1.0"} 2\n'
+        'duration_bucket{le="+Inf"} 3\n'
+        "duration_sum 3.21\n"
+        "duration_count 3\n"
+        "# HELP requests_total Requests.\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{path="a\\"\\\\\\n"} 3\n'
+    )
@@ -0,0 +1,47 @@
+"""Unit Tests for radio_box/mirrors.py."""
+from typing import Dict, List
+
+import pytest
+
+from radio_box.mirrors import MirrorStats, station_urls
+
+
+@pytest.mark.parametrize(
+    "station, expected_urls",
+    [
+        ({"url": "http://a/"}, ["http://a/"]),
+        ({"url": ["http://a/", "", "http://b/"]}, ["http://a/", "http://b/"]),
+        ({"url": None}, []),
+        ({}, []),
+    ],
+)
+def test_station_urls(station: Dict, expected_urls: List[str]):
+    """Test that both single URL and list of mirrors are accepted."""
+    assert station_urls(station) == expected_urls
+
+
+def test_mirror_stats_order():
+    """Test that mirrors are ordered by latency and failed ones come last."""
+    mirrors = ["http://a/", "http://b/", "http://c/", "http://d/"]
+    stats = MirrorStats()
+
+    # Without observations, configured order is kept
+    assert stats.order(mirrors) == mirrors
+
+    stats.record_latency("http://c/", 50)
+    stats.record_latency("http://b/", 80)
+    stats.record_failure("http://a/")
+    assert stats.order(mirrors) == ["http://c/", "http://b/", "http://d/", "http://a/"]
+
+    stats.record_failure("http://c/")
+    assert stats.order(mirrors) == ["http://b/", "http://d/", "http://c/", "http://a/"]
+
+
+def test_mirror_stats_expire():
+    """Test that only recent observations are used."""
+    stats = MirrorStats(latency_ttl=0, failure_ttl=0)
+
+    stats.record_latency("http://b/", 10)
+    stats.record_failure("http://a/")
+
+    assert stats.order(["http://a/", "http://b/"]) == ["http://a/", "http://b/"]
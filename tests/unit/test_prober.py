@@ -0,0 +1,267 @@
+"""Unit Tests for radio_box/prober.py."""
+import asyncio
+import json
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List
+from unittest.mock import MagicMock
+
+import pytest
+
+from radio_box import prober
+from radio_box.mirrors import MirrorStats
+from radio_box.prober import ProbeResult, ProberOptions, StationProber, probe_url
+from radio_box.resolver import StreamResolver
+
+
+async def serve_http(
+    respond: Callable[[asyncio.StreamWriter], Awaitable[None]],
+    scenario: Callable[[str], Awaitable],
+    requests: List[bytes],
+) -> object:
+    """Run scenario against local HTTP stand-in of a station.
+
+    :param respond: Coroutine that writes response to the client.
+    :param scenario: Coroutine function that receives URL of the server.
+    :param requests: List that receives headers of every request.
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        requests.append(await reader.readuntil(b"\r\n\r\n"))
+        await respond(writer)
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        return await scenario(f"http://127.0.0.1:{port}")
+
+
+def respond_with(data: bytes, delay: float = 0) -> Callable:
+    """Create responder that writes data after a delay."""
+
+    async def respond(writer: asyncio.StreamWriter) -> None:
+        await asyncio.sleep(delay)
+        writer.write(data)
+        await writer.drain()
+
+    return respond
+
+
+@pytest.mark.parametrize(
+    "response",
+    [b"HTTP/1.0 200 OK\r\n\r\n", b"ICY 200 OK\r\n\r\n", b"HTTP/1.1 302 Found\r\n\r\n"],
+)
+def test_probe_url(response: bytes):
+    """Test that reachable station reports connect time and time to first byte."""
+    requests: List[bytes] = []
+
+    async def scenario(url: str) -> ProbeResult:
+        return await probe_url(f"{url}/stream?id=1", 1)
+
+    result = asyncio.run(serve_http(respond_with(response, 0.02), scenario, requests))
+
+    assert result.reachable
+    assert result.connect_ms is not None
+    assert result.ttfb_ms is not None and result.ttfb_ms >= 20
+    assert result.error == ""
+    assert requests[0].startswith(b"GET /stream?id=1 HTTP/1.0\r\nHost: 127.0.0.1:")
+
+
+@pytest.mark.parametrize(
+    "response, delay, expected_error",
+    [
+        (b"HTTP/1.0 404 Not Found\r\n\r\n", 0, "server responded 404"),
+        (b"garbage\r\n", 0, "invalid response b'garbage\\r\\n'"),
+        (b"", 0, "invalid response b''"),
+        (b"HTTP/1.0 200 OK\r\n\r\n", 0.5, "timed out"),
+    ],
+)
+def test_probe_url_failure(response: bytes, delay: float, expected_error: str):
+    """Test that errors and slow responses mark station as unreachable."""
+
+    async def scenario(url: str) -> ProbeResult:
+        return await probe_url(url, 0.1)
+
+    result = asyncio.run(serve_http(respond_with(response, delay), scenario, []))
+
+    assert not result.reachable
+    assert result.connect_ms is not None
+    assert result.ttfb_ms is None
+    assert result.error == expected_error
+
+
+def test_probe_url_refused(unused_port: int):
+    """Test that station that refuses connection is unreachable."""
+    result = asyncio.run(probe_url(f"http://127.0.0.1:{unused_port}/", 1))
+
+    assert not result.reachable
+    assert result.connect_ms is None
+    assert result.error
+
+
+def test_probe_url_https(mocker):
+    """Test that HTTPS stations are probed over TLS on the default port."""
+    open_connection = mocker.patch.object(
+        prober.asyncio, "open_connection", side_effect=ConnectionRefusedError()
+    )
+
+    asyncio.run(probe_url("https://example.org/stream", 1))
+
+    host, port = open_connection.call_args.args
+    assert (host, port) == ("example.org", 443)
+    assert open_connection.call_args.kwargs["ssl"] is not None
+
+
+@pytest.mark.parametrize(
+    "config, expected_path",
+    [
+        ({"socket": "/run/radio-box.pipe"}, "/run/radio-box.health.json"),
+        (
+            {"socket": "/run/radio-box.pipe", "prober": {"status_file": "/tmp/h"}},
+            "/tmp/h",
+        ),
+    ],
+)
+def test_status_file_path(config: Dict, expected_path: str):
+    """Test that results are stored next to the socket unless configured."""
+    assert prober.status_file_path(config) == Path(expected_path)
+
+
+def test_load_results(tmp_path: Path):
+    """Test that stored results are loaded and invalid files are ignored."""
+    status_file = tmp_path / "health.json"
+    assert not prober.load_results(status_file)
+
+    status_file.write_text('{"foo": {"reachable": true}}')
+    assert prober.load_results(status_file) == {"foo": {"reachable": True}}
+
+    status_file.write_text("[]")
+    assert not prober.load_results(status_file)
+
+    status_file.write_text("{")
+    assert not prober.load_results(status_file)
+
+
+def test_results_version(tmp_path: Path):
+    """Test that version of the results changes with every write."""
+    status_file = tmp_path / "health.json"
+    assert prober.results_version(status_file) is None
+
+    status_file.write_text("{}")
+    first = prober.results_version(status_file)
+    status_file.write_text('{"foo": {}}')
+
+    assert prober.results_version(status_file) != first
+
+
+def test_prober_probe_all(tmp_path: Path, mocker):
+    """Test that all stations except the skipped ones are probed."""
+    stations = {
+        "first_fm": {"url": "http://example.org/first.pls"},
+        "busy_fm": {"url": "http://example.org/busy"},
+        "local_fm": {"url": "/home/user/music.mp3"},
+    }
+    resolver = StreamResolver()
+    resolver.streams.set("http://example.org/first.pls", "http://example.org/first")
+    status_file = tmp_path / "health.json"
+    probe_result = ProbeResult(True, 1.0, 10.0, 20.0)
+    probe_url_mock = mocker.patch.object(prober, "probe_url", return_value=probe_result)
+    station_prober = StationProber(stations, status_file, ProberOptions(), resolver)
+    station_prober.results["busy_fm"] = ProbeResult(False, 0.5)
+    station_prober.results["removed_fm"] = ProbeResult(False, 0.5)
+
+    asyncio.run(station_prober.probe_all(["busy_fm", None]))
+
+    probe_url_mock.assert_called_once_with("http://example.org/first", 5.0)
+    assert station_prober.results == {
+        "first_fm": probe_result,
+        "busy_fm": ProbeResult(False, 0.5),
+    }
+    assert json.loads(status_file.read_text()) == {
+        "first_fm": probe_result._asdict(),
+        "busy_fm": ProbeResult(False, 0.5)._asdict(),
+    }
+
+
+def test_prober_mirrors(tmp_path: Path, mocker):
+    """Test that every mirror is probed and station reports the best one."""
+    mirrors = [
+        "http://a.example.org/",
+        "http://b.example.org/",
+        "http://c.example.org/",
+    ]
+    results = {
+        mirrors[0]: ProbeResult(False, 1.0, error="timed out"),
+        mirrors[1]: ProbeResult(True, 1.0, 30.0, 40.0),
+        mirrors[2]: ProbeResult(True, 1.0, 20.0, 90.0),
+    }
+
+    async def probe(url: str, timeout: float) -> ProbeResult:
+        return results[url]
+
+    mocker.patch.object(prober, "probe_url", side_effect=probe)
+    mirror_stats = MirrorStats()
+    station_prober = StationProber(
+        {"foo": {"url": mirrors}}, tmp_path / "health.json", mirrors=mirror_stats
+    )
+
+    asyncio.run(station_prober.probe_all())
+
+    assert station_prober.results == {"foo": results[mirrors[2]]}
+    assert mirror_stats.order(mirrors) == [mirrors[2], mirrors[1], mirrors[0]]
+    assert mirror_stats.failures.get(mirrors[0])
+
+
+def test_prober_concurrency(tmp_path: Path, mocker):
+    """Test that number of concurrent probes is limited."""
+    stations = {f"station_{i}": {"url": f"http://example.org/{i}"} for i in range(6)}
+    running = []
+    peak = []
+
+    async def slow_probe(url: str, timeout: float) -> ProbeResult:
+        running.append(url)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(url)
+        return ProbeResult(True, 1.0)
+
+    mocker.patch.object(prober, "probe_url", side_effect=slow_probe)
+    options = ProberOptions(concurrency=2)
+    station_prober = StationProber(stations, tmp_path / "health.json", options)
+
+    asyncio.run(station_prober.probe_all())
+
+    assert max(peak) == 2
+    assert len(station_prober.results) == 6
+
+
+def test_prober_write_failure(tmp_path: Path, capsys):
+    """Test that failure to store results does not stop the prober."""
+    station_prober = StationProber({}, tmp_path / "missing" / "health.json")
+
+    station_prober.write_results()
+
+    assert "Failed to store station probe results" in capsys.readouterr().out
+
+
+def test_prober_run(tmp_path: Path, mocker, capsys):
+    """Test that stations are probed periodically, skipping the busy ones."""
+    stations = {"first_fm": {"url": "http://example.org/first"}}
+    probe_url_mock = mocker.patch.object(
+        prober, "probe_url", return_value=ProbeResult(True, 1.0)
+    )
+    busy_stations = MagicMock(side_effect=[set(), {"first_fm"}, set()])
+    options = ProberOptions(interval=0.01)
+    station_prober = StationProber(stations, tmp_path / "health.json", options)
+
+    async def scenario():
+        task = asyncio.ensure_future(station_prober.run(busy_stations))
+        while busy_stations.call_count < 3:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+    assert probe_url_mock.call_count == 2
+    assert "Station probe finished, 1/1 reachable." in capsys.readouterr().out
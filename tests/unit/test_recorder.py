@@ -0,0 +1,386 @@
+"""Unit Tests for radio_box/recorder.py."""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+from unittest.mock import MagicMock
+
+import pytest
+
+from radio_box import recorder
+from radio_box.config import data_dir
+from radio_box.recorder import (
+    Recorder,
+    RecorderOptions,
+    RecordingFiles,
+    RecordingListener,
+    RecordingWriter,
+    ScheduledRecording,
+    file_extension,
+    file_name,
+    parse_schedule,
+)
+from radio_box.relay import Channel, Relay, RelayOptions
+
+STATIONS = {"foo": {"url": "http://example.org/foo.mp3"}}
+
+
+def recorded(directory: Path) -> Dict[str, bytes]:
+    """Return content of the recordings in the directory by name of the file."""
+    return {path.name: path.read_bytes() for path in sorted(directory.iterdir())}
+
+
+def test_recorder_options():
+    """Test that recordings are kept in the data directory of the service."""
+    assert RecorderOptions().directory == os.path.join(data_dir(), "recordings")
+
+
+@pytest.mark.parametrize(
+    "show, now, expected",
+    [
+        # Later today, or tomorrow if it already started
+        (ScheduledRecording("foo", "20:00", 60), (2024, 1, 1, 8), (2024, 1, 1, 20)),
+        (ScheduledRecording("foo", "20:00", 60), (2024, 1, 1, 20), (2024, 1, 2, 20)),
+        # 2024-01-01 is Monday
+        (
+            ScheduledRecording("foo", "07:30", 60, ["sat", "sun"]),
+            (2024, 1, 1, 8),
+            (2024, 1, 6, 7, 30),
+        ),
+        (
+            ScheduledRecording("foo", "07:30", 60, ["mon"]),
+            (2024, 1, 1, 8),
+            (2024, 1, 8, 7, 30),
+        ),
+    ],
+)
+def test_scheduled_recording_next_start(show, now, expected):
+    """Test that the show starts at its time on the next of its days."""
+    assert show.next_start(datetime(*now)) == datetime(*expected)
+
+
+@pytest.mark.parametrize(
+    "item",
+    [
+        {"station": "foo", "start": "24:00", "minutes": 60},
+        {"station": "foo", "start": "20:60", "minutes": 60},
+        {"station": "foo", "start": "8pm", "minutes": 60},
+        {"station": "foo", "start": "20:00", "minutes": 0},
+        {"station": "foo", "start": "20:00", "minutes": 60, "days": ["monday"]},
+        {"station": "foo", "start": "20:00"},
+        {"station": "foo", "start": "20:00", "minutes": 60, "hours": 1},
+    ],
+)
+def test_parse_schedule_invalid(item: dict):
+    """Test that invalid items of the schedule are rejected."""
+    with pytest.raises(ValueError, match="Invalid scheduled recording"):
+        parse_schedule([item])
+
+
+def test_parse_schedule():
+    """Test that the schedule from the config file is parsed."""
+    schedule = [{"station": "foo", "start": "07:30", "minutes": 90, "days": ["sun"]}]
+
+    assert parse_schedule(schedule) == [ScheduledRecording("foo", "07:30", 90, ["sun"])]
+    assert Recorder(Relay(STATIONS), RecorderOptions(schedule=schedule)).schedule
+
+
+@pytest.mark.parametrize(
+    "content_type, expected",
+    [
+        ("audio/mpeg", ".mp3"),
+        ("audio/AACP; charset=binary", ".aac"),
+        ("application/ogg", ".ogg"),
+        ("application/octet-stream", ".bin"),
+        ("", ".bin"),
+    ],
+)
+def test_file_extension(content_type: str, expected: str):
+    """Test that recordings are named after the content type of the stream."""
+    assert file_extension(content_type) == expected
+
+
+def test_file_name():
+    """Test that station IDs can't escape the recordings directory."""
+    assert file_name("best_radio") == "best_radio"
+    assert file_name("../etc/foo") == "_etc_foo"
+    assert file_name("..") == "_"
+
+
+def test_recording_files(tmp_path: Path, mocker):
+    """Test that files are rotated by size or duration and synced periodically."""
+    mocker.patch.object(recorder.time, "strftime", return_value="20240101-200000")
+    fsync = mocker.spy(recorder.os, "fsync")
+    options = RecorderOptions(max_file_size=4, max_file_duration=60, sync_interval=60)
+    files = RecordingFiles(tmp_path / "foo", "foo", options)
+
+    files.write(b"abc", ".mp3")
+    files.write(b"de", ".mp3")
+    # File reached its size
+    files.write(b"f", ".mp3")
+    fsync.assert_called_once()
+    # File reached its duration
+    files.opened -= 60
+    files.write(b"g", ".aac")
+    # Sync interval elapsed
+    files.synced -= 60
+    files.write(b"h", ".aac")
+    assert fsync.call_count == 3
+    files.close()
+    files.close()
+
+    assert recorded(tmp_path / "foo") == {
+        "foo-20240101-200000-1.mp3": b"f",
+        "foo-20240101-200000.aac": b"gh",
+        "foo-20240101-200000.mp3": b"abcde",
+    }
+    assert fsync.call_count == 4
+
+
+def test_recording_writer(tmp_path: Path):
+    """Test that stream is collected and written in chunks in the recorder thread."""
+    options = RecorderOptions(chunk_size=4, sync_interval=60)
+    files = RecordingFiles(tmp_path, "foo", options)
+    written = recorder.RECORDED_BYTES.values.get(("foo",), 0)
+    chunks: List[bytes] = []
+
+    async def scenario():
+        writer = RecordingWriter(files, executor)
+        writer.extension = ".mp3"
+        await writer.write(memoryview(b"ab"))
+        chunks.append(bytes(writer.buffer))
+        await writer.write(memoryview(b"cde"))
+        chunks.append(bytes(writer.buffer))
+        # Collected stream is handed over at least once per sync interval
+        writer.flushed -= 60
+        await RecordingListener(writer, 0).send(memoryview(b"f"))
+        chunks.append(bytes(writer.buffer))
+        await writer.write(memoryview(b"g"))
+        await writer.close()
+
+    with ThreadPoolExecutor(1) as executor:
+        asyncio.run(scenario())
+
+    assert chunks == [b"ab", b"", b""]
+    assert list(recorded(tmp_path).values()) == [b"abcdefg"]
+    assert recorder.RECORDED_BYTES.values[("foo",)] == written + 7
+
+
+def test_recording_writer_error(tmp_path: Path):
+    """Test that failed write is reported and the file is closed anyway."""
+    files = RecordingFiles(tmp_path, "foo", RecorderOptions(chunk_size=1))
+    files.close = MagicMock()
+
+    async def scenario():
+        writer = RecordingWriter(files, executor)
+        (tmp_path / "foo").mkdir()
+        files.directory = tmp_path / "foo" / "bar"
+        (tmp_path / "foo" / "bar").write_bytes(b"")
+        await writer.write(memoryview(b"a"))
+        await writer.close()
+
+    with ThreadPoolExecutor(1) as executor:
+        with pytest.raises(OSError):
+            asyncio.run(scenario())
+
+    files.close.assert_called_once()
+
+
+def test_recorder_start_stop(mocker):
+    """Test that recordings are started and stopped by the station."""
+
+    async def record(_station_id):
+        await asyncio.sleep(10)
+
+    mocker.patch.object(Recorder, "record", side_effect=record)
+
+    async def scenario():
+        recorder_ = Recorder(Relay(STATIONS))
+        with pytest.raises(ValueError, match="Unknown station bar."):
+            recorder_.start("bar")
+        recorder_.start("foo")
+        with pytest.raises(ValueError, match="already being recorded"):
+            recorder_.start("foo")
+        task = recorder_.recordings["foo"]
+        recorder_.stop("foo")
+        # Station can be recorded again while the stopped recording closes its file
+        recorder_.start("foo", duration=0.01)
+        assert len(recorder_.tasks) == 2
+        await asyncio.sleep(0.05)
+        with pytest.raises(ValueError, match="not being recorded"):
+            recorder_.stop("foo")
+        return task, recorder_
+
+    task, recorder_ = asyncio.run(scenario())
+
+    assert task.cancelled()
+    assert not recorder_.recordings and not recorder_.tasks
+    recorder_.executor.shutdown()
+
+
+def test_recorder_record(tmp_path: Path, capsys, mocker):
+    """Test that recording continues with the live stream after it fell behind."""
+    mocker.patch.object(recorder, "RETRY_DELAY", 10)
+    gaps = recorder.RECORDING_GAPS.values.get(("foo",), 0)
+    relay = MagicMock()
+    relay.stations = STATIONS
+    options = RecorderOptions(directory=str(tmp_path), chunk_size=1)
+
+    async def scenario():
+        channel = Channel("foo", [], RelayOptions(buffer_size=4, burst_size=2), None)
+        relay.channel.return_value = channel
+        recorder_ = Recorder(relay, options)
+        channel.ready.set_result("audio/mpeg")
+        recorder_.start("foo")
+        await asyncio.sleep(0.01)
+        # Recording did not send anything yet, overwritten data are lost
+        channel.publish(b"abcdef")
+        await asyncio.sleep(0.01)
+        channel.publish(b"g")
+        await asyncio.sleep(0.01)
+        # Recording waits for the upstream that ended
+        channel.closed = True
+        for listener in channel.listeners:
+            listener.wakeup.set()
+        await asyncio.sleep(0.01)
+        assert not channel.listeners
+        recorder_.stop("foo")
+        await asyncio.gather(*recorder_.tasks, return_exceptions=True)
+        recorder_.executor.shutdown()
+
+    asyncio.run(scenario())
+
+    (recording,) = recorded(tmp_path / "foo").items()
+    assert recording[0].endswith(".mp3")
+    assert recording[1] == b"efg"
+    assert recorder.RECORDING_GAPS.values[("foo",)] == gaps + 2
+    assert "Recording of foo fell behind the stream." in capsys.readouterr().out
+
+
+def test_recorder_record_live_channel(tmp_path: Path, capsys, mocker):
+    """Test that recording that fell behind keeps the upstream of the channel."""
+    mocker.patch.object(recorder, "RETRY_DELAY", 10)
+    gaps = recorder.RECORDING_GAPS.values.get(("foo",), 0)
+    requests: List[bytes] = []
+    options = RecorderOptions(directory=str(tmp_path), chunk_size=1)
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        requests.append(await reader.readuntil(b"\r\n\r\n"))
+        # Burst larger than the buffer drops the recording before it sends anything
+        for data in (b"HTTP/1.0 200 OK\r\n\r\nabcdef", b"gh"):
+            writer.write(data)
+            await asyncio.sleep(0.1)
+        writer.close()
+
+    async def scenario():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        async with server:
+            url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/foo.mp3"
+            relay = Relay({"foo": {"url": url}}, RelayOptions(buffer_size=4))
+            recorder_ = Recorder(relay, options)
+            recorder_.start("foo")
+            await asyncio.sleep(0.3)
+            recorder_.stop("foo")
+            await asyncio.gather(*recorder_.tasks, return_exceptions=True)
+            recorder_.executor.shutdown()
+
+    asyncio.run(scenario())
+
+    assert len(requests) == 1
+    assert list(recorded(tmp_path / "foo").values()) == [b"cdefgh"]
+    # Drop and the end of the upstream
+    assert recorder.RECORDING_GAPS.values[("foo",)] == gaps + 2
+    assert "Recording of foo fell behind the stream." in capsys.readouterr().out
+
+
+def test_recorder_record_failures(tmp_path: Path, capsys, mocker):
+    """Test that recording retries failed station and stops with removed one."""
+    mocker.patch.object(recorder, "RETRY_DELAY", 0)
+    relay = Relay(dict(STATIONS))
+    options = RecorderOptions(directory=str(tmp_path), chunk_size=1)
+
+    async def scenario():
+        failed = Channel("foo", [], RelayOptions(), None)
+        failed.ready.set_result("")
+        relay.channel = MagicMock(return_value=failed)
+        recorder_ = Recorder(relay, options)
+        recorder_.start("foo")
+        await asyncio.sleep(0.01)
+        del relay.stations["foo"]
+        await asyncio.sleep(0.01)
+        assert not recorder_.tasks
+        # Recording that can't write stops
+        (tmp_path / "foo").write_bytes(b"")
+        failed.ready = asyncio.get_running_loop().create_future()
+        failed.ready.set_result("audio/mpeg")
+        failed.publish(b"abc")
+        failed.closed = True
+        relay.stations["foo"] = STATIONS["foo"]
+        recorder_.start("foo")
+        await asyncio.gather(*recorder_.tasks)
+        recorder_.executor.shutdown()
+        return relay.channel.call_count
+
+    assert asyncio.run(scenario()) > 2
+    output = capsys.readouterr().out
+    assert "Recording of foo stopped, the station was removed." in output
+    assert "Recording of foo failed: FileExistsError" in output
+
+
+def test_recorder_run(mocker, capsys):
+    """Test that scheduled shows are recorded, including the one already on air."""
+    now = mocker.patch.object(recorder, "datetime")
+    now.now.return_value = datetime(2024, 1, 1, 20, 30)
+    start = mocker.patch.object(Recorder, "start")
+    start.side_effect = [None, ValueError("Unknown station bar.")]
+    schedule = [
+        {"station": "foo", "start": "20:00", "minutes": 60},
+        {"station": "bar", "start": "20:15", "minutes": 30},
+        # Ended show is recorded only on its next day
+        {"station": "baz", "start": "19:00", "minutes": 30},
+    ]
+
+    async def scenario():
+        recorder_ = Recorder(Relay(STATIONS), RecorderOptions(schedule=schedule))
+        running = asyncio.ensure_future(recorder_.run())
+        await asyncio.sleep(0.01)
+        running.cancel()
+        await asyncio.gather(running, return_exceptions=True)
+        return recorder_
+
+    recorder_ = asyncio.run(scenario())
+
+    assert [call.args for call in start.call_args_list] == [
+        ("foo", 1800.0),
+        ("bar", 900.0),
+    ]
+    assert "Scheduled recording skipped: Unknown station bar." in (
+        capsys.readouterr().out
+    )
+    assert recorder_.executor._shutdown
+
+
+def test_recorder_run_on_demand(tmp_path: Path, mocker):
+    """Test that recordings are stopped when the recorder is cancelled."""
+
+    async def record(_station_id):
+        await asyncio.sleep(10)
+
+    mocker.patch.object(Recorder, "record", side_effect=record)
+
+    async def scenario():
+        recorder_ = Recorder(Relay(STATIONS), RecorderOptions(directory=str(tmp_path)))
+        running = asyncio.ensure_future(recorder_.run())
+        recorder_.start("foo")
+        await asyncio.sleep(0.01)
+        task = recorder_.recordings["foo"]
+        running.cancel()
+        await asyncio.gather(running, return_exceptions=True)
+        return task, recorder_
+
+    task, recorder_ = asyncio.run(scenario())
+
+    assert task.cancelled()
+    assert not recorder_.recordings
@@ -0,0 +1,463 @@
+"""Unit Tests for radio_box/relay.py."""
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from radio_box import relay
+from radio_box.mirrors import MirrorStats
+from radio_box.relay import (
+    Channel,
+    Relay,
+    RelayOptions,
+    RingBuffer,
+    open_stream,
+    read_request,
+    requested_delay,
+)
+
+STREAM_HEAD = b"HTTP/1.0 200 OK\r\nContent-Type: audio/mpeg\r\nicy-name: Foo\r\n\r\n"
+
+
+async def serve_upstream(
+    chunks: List[bytes],
+    scenario: Callable[[str], Awaitable],
+    requests: List[bytes],
+    gate: Optional[asyncio.Event] = None,
+    head: bytes = STREAM_HEAD,
+) -> object:
+    """Run scenario against local stand-in of the station's stream server.
+
+    :param chunks: Data of the stream, the connection is closed after the last one.
+    :param scenario: Coroutine function that receives URL of the stream.
+    :param requests: List that receives headers of every request.
+    :param gate: Event that must be set before the stream data are sent.
+    :param head: Head of the response.
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        requests.append(await reader.readuntil(b"\r\n\r\n"))
+        writer.write(head)
+        if gate:
+            await gate.wait()
+        for chunk in chunks:
+            writer.write(chunk)
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        return await scenario(f"http://127.0.0.1:{port}/stream")
+
+
+async def open_listener(
+    relay_server: asyncio.AbstractServer, request: bytes
+) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """Connect to the relay and send the request."""
+    port = relay_server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(request)
+    return reader, writer
+
+
+def test_ring_buffer():
+    """Test that buffer keeps the most recent data and reads them without copying."""
+    ring = RingBuffer(8)
+    ring.write(b"abcdef")
+    assert (ring.start, ring.end) == (0, 6)
+    assert ring.read(1, 3) == b"bcd"
+
+    # Data wrap around the end of the buffer, read stops at the wrap
+    ring.write(b"ghij")
+    assert (ring.start, ring.end) == (2, 10)
+    assert ring.read(2, 100) == b"cdefgh"
+    assert ring.read(8, 100) == b"ij"
+    assert ring.read(10, 100) == b""
+    assert isinstance(ring.read(2, 1), memoryview)
+    with pytest.raises(IndexError):
+        ring.read(1, 1)
+    with pytest.raises(IndexError):
+        ring.read(11, 1)
+
+    # Only the tail of data bigger than the buffer is kept
+    ring.write(b"0123456789")
+    assert (ring.start, ring.end) == (12, 20)
+    assert ring.read(12, 100) == b"2345"
+    assert ring.read(16, 100) == b"6789"
+
+
+def test_ring_buffer_file(tmp_path):
+    """Test that buffer can be backed by an unlinked memory-mapped file."""
+    ring = RingBuffer(8, str(tmp_path))
+    ring.write(b"abcdefghij")
+
+    assert ring.read(2, 100) == b"cdefgh"
+    assert ring.read(8, 100) == b"ij"
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ({}, 0.0),
+        ({"delay": ["90"]}, 90.0),
+        ({"delay": ["1.5", "2"]}, 1.5),
+        ({"delay": ["-1"]}, ValueError),
+        ({"delay": ["inf"]}, ValueError),
+        ({"delay": ["nan"]}, ValueError),
+        ({"delay": ["soon"]}, ValueError),
+    ],
+)
+def test_requested_delay(query, expected):
+    """Test parsing of the delay requested by the listener."""
+    if isinstance(expected, float):
+        assert requested_delay(query) == expected
+    else:
+        with pytest.raises(expected):
+            requested_delay(query)
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        (
+            b"GET /foo%20fm?delay=5 HTTP/1.1\r\nHost: box\r\n\r\n",
+            ("GET", "/foo fm", {"delay": ["5"]}),
+        ),
+        (b"POST / HTTP/1.0\n\n", ("POST", "/", {})),
+        (b"GET /\r\n\r\n", ValueError),
+        (b"GET / HTTP/1.1\r\n" + b"A: b\r\n" * 101, ValueError),
+        (b"GET / HTTP/1.1\r\nHost", asyncio.IncompleteReadError),
+        (b"GET /" + b"a" * 10000, asyncio.LimitOverrunError),
+    ],
+)
+def test_read_request(data: bytes, expected):
+    """Test that method, path and query are read from the request head."""
+
+    async def parse():
+        reader = asyncio.StreamReader(limit=relay.MAX_LINE_SIZE)
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_request(reader)
+
+    if isinstance(expected, tuple):
+        assert asyncio.run(parse()) == expected
+    else:
+        with pytest.raises(expected):
+            asyncio.run(parse())
+
+
+@pytest.mark.parametrize(
+    "head, expected",
+    [
+        (STREAM_HEAD, "audio/mpeg"),
+        (b"ICY 200 OK\r\nicy-br: 128\r\n\r\n", relay.DEFAULT_CONTENT_TYPE),
+        (b"HTTP/1.0 302 Found\r\nLocation: /\r\n\r\n", "server responded 302"),
+        (b"HTTP/1.0 404 Not Found\r\n\r\n", "server responded 404"),
+    ],
+)
+def test_open_stream(head: bytes, expected: str):
+    """Test that stream is requested and its content type is read."""
+    requests: List[bytes] = []
+
+    async def scenario(url: str) -> str:
+        try:
+            reader, writer, content_type = await open_stream(url)
+        except ValueError as exc:
+            return str(exc)
+        data = await reader.read()
+        writer.close()
+        assert data == b"data"
+        return content_type
+
+    assert asyncio.run(serve_upstream([b"data"], scenario, requests, head=head)) == (
+        expected
+    )
+    assert requests[0].startswith(b"GET /stream HTTP/1.0\r\n")
+    assert b"Icy-MetaData: 0\r\n" in requests[0]
+
+
+def test_open_stream_https(mocker):
+    """Test that HTTPS streams are opened over TLS and other schemes are refused."""
+    open_connection = mocker.patch.object(
+        relay.asyncio, "open_connection", side_effect=ConnectionRefusedError()
+    )
+
+    with pytest.raises(ConnectionRefusedError):
+        asyncio.run(open_stream("https://example.org/stream"))
+    with pytest.raises(ValueError):
+        asyncio.run(open_stream("rtsp://example.org/stream"))
+
+    host, port = open_connection.call_args.args
+    assert (host, port) == ("example.org", 443)
+    assert open_connection.call_args.kwargs["ssl"] is not None
+
+
+def test_listener_interface():
+    """Test that consumers of the stream must implement sending and aborting."""
+
+    class SendingListener(relay.Listener):  # pylint: disable=abstract-method
+        """Listener that does not implement aborting."""
+
+        async def send(self, chunk: memoryview) -> None:
+            """Discard the chunk."""
+
+    with pytest.raises(TypeError):
+        # pylint: disable=abstract-class-instantiated
+        relay.Listener(0)
+    with pytest.raises(TypeError):
+        SendingListener(0)  # pylint: disable=abstract-class-instantiated
+
+
+def test_channel_drops_slow_listener():
+    """Test that listeners whose unsent data would be overwritten are dropped."""
+    dropped = relay.RELAY_DROPPED.values.get(("foo",), 0)
+
+    async def scenario():
+        channel = Channel("foo", [], RelayOptions(buffer_size=10, burst_size=4), None)
+        slow, fast = channel.add(MagicMock()), channel.add(MagicMock())
+        channel.publish(b"abcdef")
+        fast.flushed = 6
+        channel.publish(b"ghijkl")
+        return channel, slow, fast, channel.add(MagicMock())
+
+    channel, slow, fast, late = asyncio.run(scenario())
+
+    assert slow.dropped and slow.wakeup.is_set()
+    slow.writer.transport.abort.assert_called_once()
+    fast.writer.transport.abort.assert_not_called()
+    fast.writer.transport.set_write_buffer_limits.assert_called_once_with(0)
+    assert fast.wakeup.is_set()
+    assert channel.listeners == {fast, late}
+    assert relay.RELAY_DROPPED.values[("foo",)] == dropped + 1
+    # New listener starts with the burst of the buffered data
+    assert late.position == 8
+
+
+def test_channel_stream():
+    """Test that buffered data are sent to the listener until the upstream ends."""
+
+    sent: List[bytes] = []
+
+    async def scenario():
+        channel = Channel("foo", [], RelayOptions(buffer_size=4), None)
+        writer = MagicMock()
+        # Slices are valid only until the buffer wraps, copy them right away
+        writer.write.side_effect = lambda chunk: sent.append(bytes(chunk))
+        writer.drain = AsyncMock()
+        listener = channel.add(writer)
+        channel.publish(b"abc")
+        streaming = asyncio.ensure_future(channel.stream(listener))
+        await asyncio.sleep(0)
+        channel.publish(b"de")
+        await asyncio.sleep(0)
+        channel.closed = True
+        listener.wakeup.set()
+        await streaming
+        # Dropped listener is not sent anything
+        listener.dropped = True
+        await channel.stream(listener)
+
+    asyncio.run(scenario())
+
+    assert b"".join(sent) == b"abcde"
+
+
+def test_channel_remove():
+    """Test that upstream is closed when its last listener disconnects."""
+
+    async def scenario():
+        channel = Channel("foo", [], RelayOptions(), None)
+        channel.task = MagicMock()
+        first, second = channel.add(MagicMock()), channel.add(MagicMock())
+        channel.remove(first)
+        channel.task.cancel.assert_not_called()
+        channel.remove(second)
+        return channel.task
+
+    asyncio.run(scenario()).cancel.assert_called_once()
+
+
+def test_channel_delayed_position():
+    """Test that delayed listeners start behind the upstream by its byte rate."""
+
+    async def scenario():
+        channel = Channel("foo", [], RelayOptions(buffer_size=60), None)
+        channel.publish(b"a" * 100)
+        # Upstream was not opened, its rate is unknown
+        assert channel.delayed_position(1) == 100
+        channel.started = channel.loop.time() - 2
+        return channel.add(MagicMock(), 1).position, channel.delayed_position(10)
+
+    delayed, oldest = asyncio.run(scenario())
+
+    assert 49 <= delayed <= 51
+    assert oldest == 40
+
+
+def test_channel_linger():
+    """Test that upstream is kept open for a while after its last listener left."""
+
+    async def scenario():
+        channel = Channel("foo", [], RelayOptions(linger=0.01), MirrorStats())
+        channel.task = task = MagicMock()
+        channel.remove(channel.add(MagicMock()))
+        # Listener that comes back in time keeps the upstream open
+        listener = channel.add(MagicMock())
+        await asyncio.sleep(0.02)
+        task.cancel.assert_not_called()
+        channel.remove(listener)
+        await asyncio.sleep(0.02)
+        task.cancel.assert_called_once()
+        # Closed upstream does not linger
+        channel.remove(channel.add(MagicMock()))
+        await channel.run()
+        return channel.linger_timer
+
+    assert asyncio.run(scenario()).cancelled()
+
+
+def test_relay_fan_out():
+    """Test that one upstream connection is shared by all listeners."""
+    chunks = [bytes([i]) * 5000 for i in range(40)]
+    requests: List[bytes] = []
+    gate = asyncio.Event()
+
+    async def scenario(url: str):
+        station_relay = Relay({"foo": {"url": url}})
+        server = await asyncio.start_server(station_relay.handle, "127.0.0.1", 0)
+        async with server:
+            listeners = []
+            heads = []
+            for path in (b"/foo", b"/foo", b"/foo?delay=5"):
+                reader, writer = await open_listener(
+                    server, b"GET " + path + b" HTTP/1.1\r\n\r\n"
+                )
+                heads.append(await reader.readuntil(b"\r\n\r\n"))
+                listeners.append((reader, writer))
+            gate.set()
+            bodies = [await reader.read() for reader, _ in listeners]
+            for _, writer in listeners:
+                writer.close()
+        await asyncio.sleep(0)
+        return heads, bodies, station_relay.channels
+
+    heads, bodies, channels = asyncio.run(
+        serve_upstream(chunks, scenario, requests, gate)
+    )
+
+    assert len(requests) == 1
+    assert all(head.startswith(b"HTTP/1.0 200 OK\r\n") for head in heads)
+    assert b"Content-Type: audio/mpeg\r\n" in heads[0]
+    assert bodies == [b"".join(chunks)] * 3
+    assert not channels
+
+
+def test_relay_mirrors(unused_port: int, capsys):
+    """Test that failed mirrors are skipped and upstream stall ends the stream."""
+    mirrors = MirrorStats()
+    resolver = MagicMock()
+    resolver.resolve.side_effect = lambda url: url.replace("/playlist", "/stream")
+    dead = f"http://127.0.0.1:{unused_port}/"
+
+    async def scenario(url: str) -> bytes:
+        station_relay = Relay(
+            {"foo": {"url": [dead, url.replace("/stream", "/playlist")]}},
+            RelayOptions(timeout=0.1),
+            resolver,
+            mirrors,
+        )
+        server = await asyncio.start_server(station_relay.handle, "127.0.0.1", 0)
+        async with server:
+            reader, writer = await open_listener(server, b"GET /foo HTTP/1.1\r\n\r\n")
+            response = await reader.read()
+            writer.close()
+            return response
+
+    # Upstream never sends any data
+    response = asyncio.run(serve_upstream([], scenario, [], asyncio.Event()))
+
+    assert response.startswith(b"HTTP/1.0 200 OK\r\n")
+    assert response.endswith(b"\r\n\r\n")
+    assert mirrors.failures.get(dead)
+    output = capsys.readouterr().out
+    assert f"Relay of foo failed to open {dead}" in output
+    assert "Relay of foo stopped: TimeoutError()" in output
+
+
+@pytest.mark.parametrize(
+    "request_data, status",
+    [
+        (b"GET /bar HTTP/1.1\r\n\r\n", b"404 Not Found"),
+        (b"GET / HTTP/1.1\r\n\r\n", b"404 Not Found"),
+        (b"POST /foo HTTP/1.1\r\n\r\n", b"405 Method Not Allowed"),
+        (b"GET /foo\r\n\r\n", b"400 Bad Request"),
+        (b"GET /foo?delay=x HTTP/1.1\r\n\r\n", b"400 Bad Request"),
+        (b"GET /foo HTTP/1.1\r\n\r\n", b"502 Bad Gateway"),
+    ],
+)
+def test_relay_errors(request_data: bytes, status: bytes, unused_port: int):
+    """Test that invalid requests and unreachable upstreams are answered with error."""
+
+    async def scenario() -> bytes:
+        station_relay = Relay(
+            {"foo": {"url": f"http://127.0.0.1:{unused_port}/"}, "baz": {}}
+        )
+        server = await asyncio.start_server(station_relay.handle, "127.0.0.1", 0)
+        async with server:
+            reader, writer = await open_listener(server, request_data)
+            response = await reader.read()
+            writer.close()
+            return response
+
+    assert asyncio.run(scenario()).startswith(b"HTTP/1.0 " + status + b"\r\n")
+
+
+def test_relay_disconnected():
+    """Test that client that disconnects before sending its request is ignored."""
+
+    async def scenario():
+        handled = asyncio.Event()
+
+        async def handle(reader, writer):
+            await Relay({}).handle(reader, writer)
+            handled.set()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        async with server:
+            _, writer = await open_listener(server, b"GET /foo HTTP/1.1\r\n")
+            writer.close()
+            await asyncio.wait_for(handled.wait(), 1)
+
+    asyncio.run(scenario())
+
+
+def test_relay_channel():
+    """Test that channel is reused until its upstream is closed."""
+
+    async def scenario():
+        station_relay = Relay({"foo": {"url": "http://127.0.0.1:1/"}})
+        station_relay.channels["foo"] = closed = MagicMock(closed=True)
+        channel = station_relay.channel("foo")
+        assert channel is not closed
+        assert station_relay.channel("foo") is channel
+        station_relay._closed(closed)
+        assert station_relay.channels["foo"] is channel
+        channel.task.cancel()
+        await asyncio.gather(channel.task, return_exceptions=True)
+        await asyncio.sleep(0)
+        return station_relay.channels
+
+    assert not asyncio.run(scenario())
+
+
+def test_relay_serve(capsys):
+    """Test that relay listens until it's cancelled."""
+    options = RelayOptions(host="127.0.0.1", port=0)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(asyncio.wait_for(Relay({}, options).serve(), 0.1))
+
+    assert "Relaying stations on 127.0.0.1:0." in capsys.readouterr().out
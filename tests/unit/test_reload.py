@@ -0,0 +1,156 @@
+"""Unit Tests for radio_box/reload.py."""
+import os
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+from radio_box import reload
+from radio_box.reload import ConfigWatcher, StationsDiff, diff_stations
+
+
+class StopLoop(Exception):
+    """Breaks otherwise endless loop of the tested function."""
+
+
+def write_config(path: Path, text: str) -> None:
+    """Replace config file like an editor would, with a new file."""
+    temp_path = path.with_name("conf.yaml.tmp")
+    temp_path.write_text(text)
+    os.replace(temp_path, path)
+
+
+def test_diff_stations():
+    """Test that added, removed and changed stations are detected."""
+    old = {"foo": {"url": "a"}, "bar": {"url": "b"}, "baz": {"url": "c"}}
+    new = {"foo": {"url": "a"}, "bar": {"url": "x"}, "qux": {"url": "d"}}
+
+    diff = diff_stations(old, new)
+
+    assert diff == StationsDiff(added={"qux"}, removed={"baz"}, changed={"bar"})
+    assert diff
+    assert not diff_stations(old, dict(old))
+
+
+def test_inotify_watch(tmp_path: Path):
+    """Test that inotify reports new files in the watched directory."""
+    descriptor = reload.inotify_watch(tmp_path)
+    assert descriptor is not None
+    try:
+        (tmp_path / "conf.yaml").write_text("stations: {}")
+        assert os.read(descriptor, 4096)
+    finally:
+        os.close(descriptor)
+
+    assert reload.inotify_watch(tmp_path / "missing") is None
+
+
+@pytest.mark.parametrize("libc", [OSError("No libc"), MagicMock(return_value=-1)])
+def test_inotify_unavailable(libc, tmp_path: Path, mocker):
+    """Test that missing inotify support is reported as None."""
+    cdll = mocker.patch.object(reload.ctypes, "CDLL")
+    if isinstance(libc, Exception):
+        cdll.side_effect = libc
+    else:
+        cdll.return_value.inotify_init1 = libc
+
+    assert reload.inotify_watch(tmp_path) is None
+
+
+def test_config_watcher_check(tmp_path: Path, capsys):
+    """Test that every change of the config file is reported once."""
+    path = tmp_path / "conf.yaml"
+    path.write_text("stations: {}")
+    callback = MagicMock()
+    watcher = ConfigWatcher(path, callback)
+
+    watcher.check()
+    callback.assert_not_called()
+
+    write_config(path, "stations: {foo: {url: a}}")
+    watcher.check()
+    watcher.check()
+    callback.assert_called_once_with({"stations": {"foo": {"url": "a"}}})
+
+    write_config(path, "stations: [")
+    watcher.check()
+    write_config(path, "socket: /tmp/foo.pipe")
+    watcher.check()
+    path.unlink()
+    watcher.check()
+
+    callback.assert_called_once()
+    output = capsys.readouterr().out
+    assert f"Failed to reload config file {path}" in output
+    assert f"Ignoring config file {path} without stations." in output
+
+
+def test_config_watcher_check_callback_error(tmp_path: Path, capsys):
+    """Test that failure of the callback is logged and watching continues."""
+    path = tmp_path / "conf.yaml"
+    callback = MagicMock(side_effect=[KeyError("url"), None])
+    watcher = ConfigWatcher(path, callback)
+
+    write_config(path, "stations: {foo: {}}")
+    watcher.check()
+    write_config(path, "stations: {foo: {url: a}}")
+    watcher.check()
+
+    assert callback.call_count == 2
+    assert f"Failed to apply config file {path}: KeyError('url')" in (
+        capsys.readouterr().out
+    )
+
+
+def test_config_watcher_check_unreadable(tmp_path: Path, mocker, capsys):
+    """Test that config file that can't be read is only logged."""
+    path = tmp_path / "conf.yaml"
+    watcher = ConfigWatcher(path, MagicMock())
+    path.write_text("stations: {}")
+    mocker.patch("builtins.open", side_effect=PermissionError("Denied"))
+
+    watcher.check()
+
+    assert "Denied" in capsys.readouterr().out
+
+
+def test_config_watcher_wait_inotify(tmp_path: Path):
+    """Test that watcher wakes up on change of the directory, not after interval."""
+    watcher = ConfigWatcher(tmp_path / "conf.yaml", MagicMock(), interval=0.01)
+    watcher._inotify = reload.inotify_watch(tmp_path)
+    watcher.wait()
+
+    watcher.interval = 60
+    write_config(tmp_path / "conf.yaml", "stations: {}")
+    watcher.wait()
+
+    # Events were consumed
+    with pytest.raises(BlockingIOError):
+        os.read(watcher._inotify, 4096)
+    os.close(watcher._inotify)
+
+
+def test_config_watcher_run(tmp_path: Path, mocker):
+    """Test that file is checked after every wait, polling without inotify."""
+    mocker.patch.object(reload, "inotify_watch", return_value=None)
+    sleep = mocker.patch.object(reload.time, "sleep", side_effect=[None, StopLoop])
+    watcher = ConfigWatcher(tmp_path / "conf.yaml", MagicMock(), interval=5)
+    check = mocker.patch.object(watcher, "check")
+
+    with pytest.raises(StopLoop):
+        watcher.run()
+
+    check.assert_called_once()
+    sleep.assert_called_with(5)
+
+
+def test_config_watcher_start(tmp_path: Path, mocker):
+    """Test that watcher runs in a daemon thread."""
+    watcher = ConfigWatcher(tmp_path / "conf.yaml", MagicMock())
+    run = mocker.patch.object(watcher, "run")
+
+    thread = watcher.start()
+    thread.join(1)
+
+    assert thread.daemon
+    run.assert_called_once()
@@ -0,0 +1,353 @@
+"""Unit Tests for radio_box/resolver.py."""
+import http.server
+import ssl
+import subprocess
+import threading
+import urllib.request
+from http.client import HTTPSConnection
+from typing import Dict, Iterator, List, Tuple
+from unittest.mock import MagicMock
+
+import pytest
+
+from radio_box import resolver
+from radio_box.resolver import (
+    DNSCache,
+    ResolverError,
+    ResolverOptions,
+    StreamResolver,
+    TTLCache,
+)
+
+# Path -> (status, headers, body) served by the local HTTP server
+Routes = Dict[str, Tuple[int, Dict[str, str], bytes]]
+
+
+class StationsHandler(http.server.BaseHTTPRequestHandler):
+    """Serves pre-defined responses to GET requests and records requested paths."""
+
+    routes: Routes = {}
+    requests: List[str] = []
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """Respond with the pre-defined response for the path."""
+        self.requests.append(self.path)
+        status, headers, body = self.routes.get(self.path, (404, {}, b""))
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: object) -> None:  # pylint: disable=arguments-differ
+        """Don't log requests."""
+
+
+@pytest.fixture
+def http_server() -> Iterator[Tuple[str, Routes, List[str]]]:
+    """Run local HTTP server, provide its URL, routes and list of requested paths."""
+    routes: Routes = {}
+    requests: List[str] = []
+    handler = type(
+        "Handler", (StationsHandler,), {"routes": routes, "requests": requests}
+    )
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}", routes, requests
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_ttl_cache():
+    """Test expiration and LRU eviction of cache entries."""
+    now = [0.0]
+    cache: TTLCache[str, str] = TTLCache(10, 2, clock=lambda: now[0])
+
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    # "b" is the least recently used entry
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert len(cache) == 2
+
+    now[0] = 10.0
+    assert cache.get("a") is None
+    assert len(cache) == 1
+
+    cache.pop("c")
+    cache.pop("c")
+    assert len(cache) == 0
+
+
+def test_dns_cache(mocker):
+    """Test that host address is looked up only once until invalidated."""
+    getaddrinfo = mocker.patch.object(
+        resolver.socket,
+        "getaddrinfo",
+        return_value=[
+            (10, 1, 6, "", ("2001:db8::1", 80, 0, 0)),
+            (2, 1, 6, "", ("192.0.2.1", 80)),
+        ],
+    )
+    cache = DNSCache(60, 10)
+    expected = [("2001:db8::1", 80), ("192.0.2.1", 80)]
+
+    assert cache.lookup("example.org", 80) == expected
+    assert cache.lookup("example.org", 80) == expected
+    getaddrinfo.assert_called_once_with(
+        "example.org", 80, type=resolver.socket.SOCK_STREAM
+    )
+
+    cache.invalidate("example.org", 80)
+    cache.lookup("example.org", 80)
+    assert getaddrinfo.call_count == 2
+
+
+def test_cached_dns_connection(mocker):
+    """Test that connection is made to the cached address of the host."""
+    create_connection = mocker.patch.object(resolver.socket, "create_connection")
+    dns_cache = MagicMock()
+    dns_cache.lookup.return_value = [("192.0.2.1", 8000)]
+
+    connection = resolver.CachedDNSHTTPConnection(
+        "example.org:8000", dns_cache=dns_cache, timeout=3
+    )
+    connection.connect()
+
+    dns_cache.lookup.assert_called_once_with("example.org", 8000)
+    create_connection.assert_called_once_with(("192.0.2.1", 8000), 3, None)
+    assert connection.sock == create_connection.return_value
+
+
+def test_connect_any(mocker):
+    """Test that addresses are tried in order until one of them connects."""
+    sock = MagicMock()
+    create_connection = mocker.patch.object(
+        resolver.socket,
+        "create_connection",
+        side_effect=[OSError("Network is unreachable"), sock],
+    )
+    addresses = [("2001:db8::1", 80), ("192.0.2.1", 80)]
+
+    assert resolver.connect_any(addresses, 3) is sock
+    assert [args.args[0] for args in create_connection.call_args_list] == addresses
+
+
+def test_connect_any_failure(mocker):
+    """Test that error of the last address is raised if none of them connects."""
+    mocker.patch.object(
+        resolver.socket,
+        "create_connection",
+        side_effect=[OSError("Network is unreachable"), OSError("Refused")],
+    )
+
+    with pytest.raises(OSError, match="Refused"):
+        resolver.connect_any([("2001:db8::1", 80), ("192.0.2.1", 80)], 3)
+    with pytest.raises(OSError, match="no addresses"):
+        resolver.connect_any([], 3)
+
+
+@pytest.fixture
+def https_server(tmp_path) -> Iterator[Tuple[int, str]]:
+    """Run local HTTPS server for host "radio.test", provide its port and certificate."""
+    cert, key = tmp_path / "cert.pem", tmp_path / "key.pem"
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1"]
+        + ["-keyout", str(key), "-out", str(cert), "-subj", "/CN=radio.test"]
+        + ["-addext", "subjectAltName=DNS:radio.test"],
+        check=True,
+        capture_output=True,
+    )
+    handler = type(
+        "Handler",
+        (StationsHandler,),
+        {"routes": {"/stream.mp3": (200, {}, b"audio")}, "requests": []},
+    )
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    try:
+        yield server.server_port, str(cert)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_cached_dns_handler_https(https_server, unused_port: int):
+    """Test that HTTPS URL is opened over TLS to the cached addresses of the host."""
+    port, cert = https_server
+    dns_cache = DNSCache(60, 10)
+    # "radio.test" does not resolve, the connection can only use the cached
+    # addresses, the first one does not accept connections
+    dns_cache.addresses.set(
+        ("radio.test", port), [("127.0.0.1", unused_port), ("127.0.0.1", port)]
+    )
+    context = ssl.create_default_context(cafile=cert)
+    opener = urllib.request.build_opener(
+        urllib.request.ProxyHandler({}),
+        resolver.CachedDNSHandler(dns_cache, context=context),
+    )
+
+    with opener.open(f"https://radio.test:{port}/stream.mp3", timeout=5) as response:
+        assert response.read() == b"audio"
+
+
+def test_cached_dns_https_connection():
+    """Test that HTTPS connection accepts DNS cache next to HTTPSConnection arguments."""
+    dns_cache = DNSCache(60, 10)
+
+    connection = resolver.CachedDNSHTTPSConnection(
+        "example.org", dns_cache=dns_cache, timeout=3
+    )
+
+    assert isinstance(connection, HTTPSConnection)
+    assert connection.dns_cache is dns_cache
+    assert connection.timeout == 3
+
+
+def test_cached_dns_handler_http(http_server):
+    """Test that HTTP URL is opened with connection that uses DNS cache."""
+    url, routes, _ = http_server
+    routes["/stream.mp3"] = (200, {}, b"audio")
+    dns_cache = DNSCache(60, 10)
+    opener = urllib.request.build_opener(
+        urllib.request.ProxyHandler({}), resolver.CachedDNSHandler(dns_cache)
+    )
+
+    with opener.open(f"{url}/stream.mp3", timeout=5) as response:
+        assert response.read() == b"audio"
+    assert len(dns_cache.addresses) == 1
+
+
+def test_resolver_https_station(https_server):
+    """Test that resolver handles HTTPS station URLs instead of crashing."""
+    port, _ = https_server
+    stream_resolver = StreamResolver()
+    stream_resolver.dns_cache.addresses.set(("radio.test", port), [("127.0.0.1", port)])
+    url = f"https://radio.test:{port}/stream.m3u"
+
+    # Self-signed certificate is rejected, resolver falls back to the station URL
+    assert stream_resolver.resolve(url) == url
+
+
+@pytest.mark.parametrize(
+    "data, expected_url",
+    [
+        ("#EXTM3U\n\n#EXTINF:-1,Radio\nhttp://a/1\nhttp://a/2\n", "http://a/1"),
+        ("http://a/1", "http://a/1"),
+    ],
+)
+def test_parse_m3u(data: str, expected_url: str):
+    """Test that first entry of the M3U playlist is returned."""
+    assert resolver.parse_m3u(data) == expected_url
+
+
+@pytest.mark.parametrize(
+    "data, expected_url",
+    [
+        ("[playlist]\nFile2=http://a/2\nFile1=http://a/1\nTitle1=A\n", "http://a/1"),
+        ("[Playlist]\nfile1=http://a/1?x=%1\n", "http://a/1?x=%1"),
+    ],
+)
+def test_parse_pls(data: str, expected_url: str):
+    """Test that first entry of the PLS playlist is returned."""
+    assert resolver.parse_pls(data) == expected_url
+
+
+@pytest.mark.parametrize(
+    "parse, data",
+    [
+        (resolver.parse_m3u, "#EXTM3U\n# nothing here\n"),
+        (resolver.parse_pls, "[playlist]\nNumberOfEntries=0\n"),
+        (resolver.parse_pls, "File1=http://a/1\n"),
+        (resolver.parse_pls, "[playlist]\nFileX=http://a/1\n"),
+    ],
+)
+def test_parse_invalid_playlist(parse, data: str):
+    """Test that empty or invalid playlists raise ResolverError."""
+    with pytest.raises(ResolverError):
+        parse(data)
+
+
+def test_resolver_playlists(http_server):
+    """Test that redirects and nested playlists are resolved and cached."""
+    url, routes, requests = http_server
+    routes["/station"] = (302, {"Location": "/list.pls"}, b"")
+    routes["/list.pls"] = (
+        200,
+        {"Content-Type": "text/plain"},
+        b"[playlist]\nFile1=/list\n",
+    )
+    routes["/list"] = (200, {"Content-Type": "audio/x-mpegurl"}, b"/stream\n")
+    routes["/stream"] = (200, {"Content-Type": "audio/mpeg"}, b"\xff" * 100)
+    stream_resolver = StreamResolver()
+
+    assert stream_resolver.resolve(f"{url}/station") == f"{url}/stream"
+    assert stream_resolver.resolve(f"{url}/station") == f"{url}/stream"
+
+    assert requests == ["/station", "/list.pls", "/list", "/stream"]
+    assert len(stream_resolver.dns_cache.addresses) == 1
+
+
+def test_resolver_invalidate(http_server):
+    """Test that invalidated station is resolved again."""
+    url, routes, requests = http_server
+    routes["/stream"] = (200, {"Content-Type": "audio/mpeg"}, b"")
+    stream_resolver = StreamResolver()
+
+    stream_resolver.resolve(f"{url}/stream")
+    stream_resolver.invalidate(f"{url}/stream")
+    stream_resolver.resolve(f"{url}/stream")
+
+    assert requests == ["/stream", "/stream"]
+    # Invalidation of unknown station is not an error
+    stream_resolver.invalidate("https://example.org/unknown")
+    stream_resolver.invalidate("not a url")
+
+
+@pytest.mark.parametrize(
+    "routes_update",
+    [
+        {"/station": (404, {}, b"")},
+        {"/station": (200, {"Content-Type": "audio/x-scpls"}, b"invalid")},
+        {"/station": (200, {"Content-Type": "audio/mpegurl"}, b"#" * 70000)},
+        {"/station": (200, {"Content-Type": "audio/mpegurl"}, b"/station")},
+    ],
+)
+def test_resolver_failure(routes_update: Routes, http_server, capsys):
+    """Test that station URL is used if the resolution fails."""
+    url, routes, requests = http_server
+    routes.update(routes_update)
+    stream_resolver = StreamResolver()
+
+    assert stream_resolver.resolve(f"{url}/station") == f"{url}/station"
+    assert stream_resolver.resolve(f"{url}/station") == f"{url}/station"
+
+    # Failures are not cached
+    assert requests.count("/station") > 1
+    assert "Failed to resolve stream URL" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(
+    "url, options",
+    [
+        ("http://example.org/stream", ResolverOptions(ttl=0)),
+        ("mms://example.org/stream", ResolverOptions()),
+        ("/home/user/music.mp3", ResolverOptions()),
+    ],
+)
+def test_resolver_skipped(url: str, options: ResolverOptions, mocker):
+    """Test that disabled resolver and non-HTTP URLs don't touch the network."""
+    stream_resolver = StreamResolver(options)
+    open_mock = mocker.patch.object(stream_resolver, "_opener")
+
+    assert stream_resolver.resolve(url) == url
+    open_mock.open.assert_not_called()
@@ -1,29 +1,70 @@
 """Unit Tests for radio_box/rest_api.py"""
+import json
+from pathlib import Path
 from typing import Dict, Union
-from unittest.mock import ANY, MagicMock
+from unittest.mock import ANY, MagicMock, call
 
 import pytest
 from flask.testing import FlaskClient
 
-from radio_box import rest_api
+from radio_box import metrics, rest_api
+from radio_box.catalog import save_catalog
+from radio_box.common import (
+    TRANSPORT_PIPE,
+    TRANSPORT_SOCKET,
+    CommandError,
+    SenderOptions,
+    ServiceUnavailableError,
+)
+from radio_box.metrics import Exporter, Registry
+from radio_box.protocol import controls_pb2 as controls
+from radio_box.status import StatusWriter
 
 URL_ROOT = "/"
 URL_PLAY = "/play"
 URL_STOP = "/stop"
 URL_STATIONS = "/stations"
+URL_SEARCH = "/stations/search"
+URL_METRICS = "/metrics"
+URL_TRACES = "/traces"
+URL_EVENTS = "/events"
+URL_STATUS = "/status"
+URL_VOLUME = "/volume"
+URL_PAUSE = "/pause"
+URL_RESUME = "/resume"
+URL_SEEK = "/seek"
+URL_RECORD = "/record"
+URL_STOP_RECORDING = "/record/stop"
+
 
+@pytest.fixture(autouse=True)
+def config_watcher(mocker):
+    """Prevent apps from watching the config file in background threads."""
+    return mocker.patch.object(rest_api, "ConfigWatcher")
 
-def test_index(mocker, rest_client: FlaskClient):
+
+def test_index(mocker, stations: Dict, tmp_path: Path):
     """Test root URL returning static frontend."""
-    send_from_directory = mocker.patch.object(rest_api, "send_from_directory")
-    rest_client.get(URL_ROOT)
-    send_from_directory.assert_called_once_with("static", "index.html")
+    (tmp_path / "index.html").write_text("<html></html>")
+    mocker.patch.dict(rest_api.os.environ, {"RADIO_BOX_WEB_STATIC": str(tmp_path)})
+    config = {"stations": stations, "socket": "/tmp/foo.pipe"}
+    mocker.patch.object(rest_api, "load_config", return_value=config)
+    mocker.patch.object(rest_api, "create_pipe")
+    mocker.patch.object(rest_api, "Exporter")
+
+    with rest_api.create_app({"TESTING": True}).test_client() as client:
+        assert client.get(URL_ROOT).data == b"<html></html>"
+        assert client.get("/index.html").data == b"<html></html>"
+        assert client.get("/missing.js").status_code == 404
 
 
 @pytest.mark.parametrize(
     "data, status, message",
     [
         ({"station": "example_fm"}, 200, b"OK"),
+        ({"station": "example_fm", "zone": "default"}, 200, b"OK"),
+        ({"station": "example_fm", "zone": "garage"}, 404, b"Zone 'garage' not found."),
+        ({"station": "example_fm", "zone": 1}, 404, b"Zone '1' not found."),
         ({"station": "bad_station"}, 404, b"Station 'bad_station' not found."),
         ("non_json_data", 400, b"Missing json data."),
     ],
@@ -39,46 +80,493 @@ def test_play(
 
     Tested scenarios include:
         * Correctly playing recognized station
-        * Returning 404 for unknown station
+        * Returning 404 for unknown station or zone
         * Returning 400 if request data is not in json format
     """
-    command = MagicMock()
+    command = controls.Command()
     make_message = mocker.patch.object(
         rest_api, "make_message_play", return_value=command
     )
-    send_message = mocker.patch.object(rest_api, "send_message")
+    send_command = mocker.patch.object(rest_api, "send_command")
     response = rest_client.post(URL_PLAY, json=data)
 
     assert response.status_code == status
     assert response.data == message
 
     if response.status_code == 200:
-        make_message.assert_called_once_with(data["station"])
-        send_message.assert_called_once_with(ANY, command)
+        make_message.assert_called_once_with(data["station"], data.get("zone", ""))
+        send_command.assert_called_once_with(
+            ANY, command, TRANSPORT_PIPE, SenderOptions()
+        )
+        assert command.trace_id
+        assert [span.stage for span in command.spans] == ["rest"]
 
 
 def test_stop(rest_client: FlaskClient, mocker):
     """Test that '/stop' endpoint stops current playback."""
-    command = MagicMock()
+    command = controls.Command()
     make_message = mocker.patch.object(
         rest_api, "make_message_stop", return_value=command
     )
-    send_message = mocker.patch.object(rest_api, "send_message")
+    send_command = mocker.patch.object(rest_api, "send_command")
 
     response = rest_client.get(URL_STOP)
 
     assert response.status_code == 200
     assert response.data == b"OK"
-    make_message.assert_called_once()
-    send_message.assert_called_once_with(ANY, command)
+    make_message.assert_called_once_with("")
+    send_command.assert_called_once_with(ANY, command, TRANSPORT_PIPE, SenderOptions())
+    assert [span.stage for span in command.spans] == ["rest"]
+
+    assert rest_client.get(URL_STOP, query_string={"zone": "default"}).data == b"OK"
+    make_message.assert_called_with("default")
+    assert rest_client.get(URL_STOP, query_string={"zone": "garage"}).status_code == (
+        404
+    )
+
+
+@pytest.mark.parametrize(
+    "data, expected_status",
+    [
+        ({"volume": 40}, 200),
+        ({"volume": 40, "zone": "default"}, 200),
+        ({"volume": 40, "zone": "garage"}, 404),
+        ({"volume": 101}, 400),
+        ({"volume": True}, 400),
+        ({"volume": "40"}, 400),
+        ([40], 400),
+    ],
+)
+def test_volume(data: object, expected_status: int, rest_client: FlaskClient, mocker):
+    """Test that '/volume' endpoint sends valid volume level to the service."""
+    send_command = mocker.patch.object(rest_api, "send_command")
+
+    response = rest_client.post(URL_VOLUME, json=data)
+
+    assert response.status_code == expected_status
+    if expected_status == 200:
+        message = send_command.call_args.args[1]
+        assert message.set_volume.volume_level == 40
+        assert message.set_volume.zone == data.get("zone", "")
+    else:
+        send_command.assert_not_called()
+
+
+@pytest.mark.parametrize("url, field", [(URL_PAUSE, "pause"), (URL_RESUME, "resume")])
+def test_pause_resume(url: str, field: str, rest_client: FlaskClient, mocker):
+    """Test that '/pause' and '/resume' endpoints control the time-shift."""
+    send_command = mocker.patch.object(rest_api, "send_command")
+
+    assert rest_client.get(url).data == b"OK"
+    assert rest_client.get(url, query_string={"zone": "default"}).data == b"OK"
+    assert rest_client.get(url, query_string={"zone": "garage"}).status_code == 404
+
+    messages = [sent.args[1] for sent in send_command.call_args_list]
+    assert [message.WhichOneof("sub_command") for message in messages] == [field] * 2
+    assert [getattr(message, field).zone for message in messages] == ["", "default"]
+
+
+@pytest.mark.parametrize(
+    "data, expected_status",
+    [
+        ({"delay": 300}, 200),
+        ({"delay": 300, "zone": "default"}, 200),
+        ({"delay": 300, "zone": "garage"}, 404),
+        ({"delay": -1}, 400),
+        ({"delay": 2**32}, 400),
+        ({"delay": False}, 400),
+        ({"delay": "300"}, 400),
+        ([300], 400),
+    ],
+)
+def test_seek(data: object, expected_status: int, rest_client: FlaskClient, mocker):
+    """Test that '/seek' endpoint sends valid delay to the service."""
+    send_command = mocker.patch.object(rest_api, "send_command")
+
+    response = rest_client.post(URL_SEEK, json=data)
+
+    assert response.status_code == expected_status
+    if expected_status == 200:
+        message = send_command.call_args.args[1]
+        assert message.seek.delay == 300
+        assert message.seek.zone == data.get("zone", "")
+    else:
+        send_command.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "data, expected_status",
+    [
+        ({"station": "example_fm"}, 200),
+        ({"station": "example_fm", "duration": 3600}, 200),
+        ({"station": "example_fm", "duration": -1}, 400),
+        ({"station": "example_fm", "duration": 2**32}, 400),
+        ({"station": "example_fm", "duration": True}, 400),
+        ({"station": "unknown_fm"}, 404),
+        (["example_fm"], 400),
+    ],
+)
+def test_record(data: object, expected_status: int, rest_client: FlaskClient, mocker):
+    """Test that '/record' endpoint sends valid recording to the service."""
+    send_command = mocker.patch.object(rest_api, "send_command")
+
+    response = rest_client.post(URL_RECORD, json=data)
 
+    assert response.status_code == expected_status
+    if expected_status == 200:
+        message = send_command.call_args.args[1]
+        assert message.record.station == "example_fm"
+        assert message.record.duration == data.get("duration", 0)
+    else:
+        send_command.assert_not_called()
 
-def test_stations(rest_client: FlaskClient, stations: Dict):
+
+@pytest.mark.parametrize(
+    "data, expected_status",
+    [({"station": "example_fm"}, 200), ({"station": ""}, 400), ({}, 400), (1, 400)],
+)
+def test_stop_recording(
+    data: object, expected_status: int, rest_client: FlaskClient, mocker
+):
+    """Test that '/record/stop' endpoint stops the recording of the station."""
+    send_command = mocker.patch.object(rest_api, "send_command")
+
+    response = rest_client.post(URL_STOP_RECORDING, json=data)
+
+    assert response.status_code == expected_status
+    if expected_status == 200:
+        assert send_command.call_args.args[1].stop_recording.station == "example_fm"
+    else:
+        send_command.assert_not_called()
+
+
+def test_stations(rest_client: FlaskClient, stations: Dict, mocker):
     """Test '/stations' endpoint that returns list of configured stations."""
+    health = {"reachable": True, "checked": 1.0, "connect_ms": 10.0}
+    load_results = mocker.patch.object(
+        rest_api,
+        "load_results",
+        return_value={"example_fm": health, "removed_fm": health},
+    )
     station_mapping = {key: value["name"] for key, value in stations.items()}
-    expected_response = {"stations": station_mapping}
+    expected_response = {"stations": station_mapping, "health": {"example_fm": health}}
 
     response = rest_client.get(URL_STATIONS)
 
     assert response.status_code == 200
     assert response.json == expected_response
+    load_results.assert_called_once_with(Path("/tmp/foo.health.json"))
+
+    # Precomputed response is revalidated with its ETag
+    etag = response.headers["ETag"]
+    compressed = rest_client.get(URL_STATIONS, headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert compressed.headers["ETag"] == etag
+    revalidated = rest_client.get(URL_STATIONS, headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    load_results.assert_called_once()
+
+
+def test_stations_health_changed(rest_client: FlaskClient, mocker):
+    """Test that precomputed stations are invalidated by new probe results."""
+    mocker.patch.object(rest_api, "load_results", return_value={})
+    results_version = mocker.patch.object(rest_api, "results_version", return_value=1)
+    etag = rest_client.get(URL_STATIONS).headers["ETag"]
+    results_version.return_value = 2
+    rest_api.load_results.return_value = {"example_fm": {"reachable": False}}
+
+    response = rest_client.get(URL_STATIONS, headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.json["health"] == {"example_fm": {"reachable": False}}
+
+
+@pytest.fixture
+def catalog_client(mocker, stations: Dict, tmp_path: Path) -> FlaskClient:
+    """Provide rest client of the app with stations imported into the catalog."""
+    catalog = tmp_path / "catalog.json"
+    save_catalog(
+        catalog,
+        {
+            "jazz": {
+                "url": "a",
+                "name": "Jazz Radio",
+                "tags": ["jazz"],
+                "codec": "MP3",
+            },
+            "rock": {"url": "b", "name": "Rock FM", "country": "SK"},
+        },
+    )
+    config = {"stations": stations, "socket": "/tmp/foo.pipe", "catalog": str(catalog)}
+    mocker.patch.object(rest_api, "load_config", return_value=config)
+    mocker.patch.object(rest_api, "create_pipe")
+    mocker.patch.object(rest_api, "Exporter")
+    mocker.patch.object(rest_api, "load_results", return_value={"rock": {}})
+
+    app = rest_api.create_app({"TESTING": True})
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.mark.parametrize(
+    "query, expected_response",
+    [
+        (
+            {"offset": 1, "limit": 2},
+            {"stations": {"jazz": "Jazz Radio", "rock": "Rock FM"}, "total": 3},
+        ),
+        ({"limit": 0}, {"stations": {"example_fm": "Example FM"}, "total": 3}),
+        ({"offset": -5, "limit": "x"}, {"total": 3}),
+    ],
+)
+def test_stations_page(query: Dict, expected_response: Dict, catalog_client):
+    """Test that '/stations' endpoint returns requested page of the stations."""
+    response = catalog_client.get(URL_STATIONS, query_string=query)
+
+    assert response.status_code == 200
+    assert expected_response.items() <= response.json.items()
+    assert len(response.json["stations"]) == min(response.json["limit"], 3)
+
+
+def test_stations_search(catalog_client):
+    """Test that '/stations/search' endpoint finds catalog stations."""
+    response = catalog_client.get(URL_SEARCH, query_string={"q": "rock", "limit": 5})
+
+    assert response.status_code == 200
+    assert response.json == {
+        "stations": [
+            {"id": "rock", "name": "Rock FM", "tags": [], "country": "SK", "codec": ""}
+        ],
+        "health": {"rock": {}},
+        "total": 1,
+        "offset": 0,
+        "limit": 5,
+    }
+    assert not catalog_client.get(URL_SEARCH).json["stations"]
+
+
+def test_play_catalog_station(catalog_client, mocker):
+    """Test that stations from the catalog can be played."""
+    send_command = mocker.patch.object(rest_api, "send_command")
+
+    response = catalog_client.post(URL_PLAY, json={"station": "jazz"})
+
+    assert response.status_code == 200
+    assert send_command.call_args.args[1].play.station == "jazz"
+
+
+def test_command_error(rest_client: FlaskClient, mocker):
+    """Test that commands refused by the service are reported with error code."""
+    mocker.patch.object(
+        rest_api, "send_command", side_effect=CommandError("Playback failed")
+    )
+
+    response = rest_client.get(URL_STOP)
+
+    assert response.status_code == 500
+    assert response.data == b"Command failed: Playback failed"
+
+
+def test_service_unavailable(rest_client: FlaskClient, mocker):
+    """Test that unreachable service is reported with 503 instead of hanging."""
+    mocker.patch.object(
+        rest_api, "send_command", side_effect=ServiceUnavailableError("Timed out")
+    )
+
+    response = rest_client.post(URL_PLAY, json={"station": "example_fm"})
+
+    assert response.status_code == 503
+    assert response.data == b"Timed out"
+
+
+def test_traces(mocker, stations: Dict):
+    """Test that '/traces' endpoint returns recent traces from the service."""
+    config = {"stations": stations, "socket": "/tmp/foo.sock", "transport": "socket"}
+    mocker.patch.object(rest_api, "load_config", return_value=config)
+    mocker.patch.object(rest_api, "Exporter")
+    trace = controls.Trace(trace_id="a", origin_time=1.5, command="stop")
+    trace.spans.add(stage="rest", start=1.5, duration=0.25)
+    query_traces = mocker.patch.object(rest_api, "query_traces", return_value=[trace])
+
+    app = rest_api.create_app({"TESTING": True})
+    with app.test_client() as client:
+        response = client.get(URL_TRACES, query_string={"limit": 10})
+        client.get(URL_TRACES, query_string={"limit": "x"})
+
+    assert response.status_code == 200
+    assert response.json == {
+        "traces": [
+            {
+                "trace_id": "a",
+                "origin_time": 1.5,
+                "command": "stop",
+                "spans": [{"stage": "rest", "start": 1.5, "duration": 0.25}],
+            }
+        ]
+    }
+    assert query_traces.call_args_list == [
+        call(Path("/tmp/foo.sock"), TRANSPORT_SOCKET, 10, SenderOptions()),
+        call(Path("/tmp/foo.sock"), TRANSPORT_SOCKET, 0, SenderOptions()),
+    ]
+
+
+def test_events(mocker, stations: Dict):
+    """Test that '/events' endpoint streams events from the zone's event hub."""
+    config = {
+        "stations": stations,
+        "socket": "/tmp/foo.sock",
+        "transport": "socket",
+        "zones": {"living_room": {}, "kitchen": {}},
+    }
+    mocker.patch.object(rest_api, "load_config", return_value=config)
+    mocker.patch.object(rest_api, "Exporter")
+    event_hub = mocker.patch.object(
+        rest_api, "EventHub", side_effect=lambda *args, **kwargs: MagicMock()
+    )
+
+    app = rest_api.create_app({"TESTING": True})
+    hubs = app.extensions[rest_api.EVENTS_EXTENSION]
+    hubs["living_room"].stream.return_value = iter(["event: stopped\n\n"])
+    hubs["kitchen"].stream.return_value = iter(["event: playing\n\n"])
+    with app.test_client() as client:
+        response = client.get(URL_EVENTS)
+        kitchen = client.get(URL_EVENTS, query_string={"zone": "kitchen"})
+        unknown = client.get(URL_EVENTS, query_string={"zone": "garage"})
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert response.data == b"event: stopped\n\n"
+    assert kitchen.data == b"event: playing\n\n"
+    assert unknown.status_code == 404
+    assert hubs[""] is hubs["living_room"]
+    assert event_hub.call_args_list == [
+        call(Path("/tmp/foo.sock"), SenderOptions(), zone="living_room"),
+        call(Path("/tmp/foo.sock"), SenderOptions(), zone="kitchen"),
+    ]
+
+
+def test_events_pipe(rest_client: FlaskClient):
+    """Test that events are not available with the pipe transport."""
+    response = rest_client.get(URL_EVENTS)
+
+    assert response.status_code == 501
+
+
+def test_status(tmp_path: Path, stations: Dict, mocker):
+    """Test that '/status' endpoint returns state from the shared status block."""
+    status_block = tmp_path / "radio.status"
+    conf_file = tmp_path / "conf.yaml"
+    conf_file.write_text(
+        json.dumps(
+            {
+                "stations": stations,
+                "socket": "/tmp/foo.pipe",
+                "status_block": str(status_block),
+            }
+        )
+    )
+    mocker.patch.dict(rest_api.os.environ, {"RADIO_BOX_CONF": str(conf_file)})
+    mocker.patch.object(rest_api, "create_pipe")
+    mocker.patch.object(rest_api, "Exporter")
+    app = rest_api.create_app({"TESTING": True})
+
+    with app.test_client() as client:
+        unavailable = client.get(URL_STATUS)
+        StatusWriter(status_block).write(
+            controls.PlayerState(station="foo", status=controls.PLAYING, title="Song")
+        )
+        response = client.get(URL_STATUS)
+
+    assert unavailable.status_code == 503
+    assert response.status_code == 200
+    assert response.json == {
+        "station": "foo",
+        "status": "playing",
+        "error": None,
+        "title": "Song",
+        "volume": None,
+        "delay": None,
+    }
+
+
+def test_reload_stations(rest_client: FlaskClient, config_watcher, mocker, capsys):
+    """Test that stations are replaced when the config file changes."""
+    mocker.patch.object(rest_api, "load_results", return_value={})
+    conf_file, reload = config_watcher.call_args.args
+    stations = {"new_fm": {"url": "http://example.org/new.mp3", "name": "New FM"}}
+
+    reload({"stations": stations})
+    reload({"stations": dict(stations)})
+
+    assert rest_client.get(URL_STATIONS).json["stations"] == {"new_fm": "New FM"}
+    assert rest_client.get(URL_SEARCH, query_string={"q": "new"}).json["total"] == 1
+    assert capsys.readouterr().out.count(f"Reloaded stations from {conf_file}.") == 1
+
+
+def test_socket_transport(mocker, stations: Dict):
+    """Test that app uses socket transport if it's selected in config."""
+    config = {
+        "stations": stations,
+        "socket": "/tmp/foo.sock",
+        "transport": "socket",
+        "connection": {"connect_timeout": 0.1},
+    }
+    mocker.patch.object(rest_api, "load_config", return_value=config)
+    create_pipe = mocker.patch.object(rest_api, "create_pipe")
+    send_command = mocker.patch.object(rest_api, "send_command")
+    mocker.patch.object(rest_api, "Exporter")
+
+    app = rest_api.create_app({"TESTING": True})
+    with app.test_client() as client:
+        response = client.get(URL_STOP)
+
+    assert response.status_code == 200
+    create_pipe.assert_not_called()
+    send_command.assert_called_once_with(
+        Path("/tmp/foo.sock"), ANY, TRANSPORT_SOCKET, SenderOptions(connect_timeout=0.1)
+    )
+
+
+def test_metrics(tmp_path: Path, stations: Dict, mocker):
+    """Test that request durations of all workers are served in Prometheus format."""
+    metrics_dir = tmp_path / "metrics"
+    conf_file = tmp_path / "conf.yaml"
+    conf_file.write_text(
+        json.dumps(
+            {
+                "stations": stations,
+                "socket": "/tmp/foo.sock",
+                "metrics_dir": str(metrics_dir),
+            }
+        )
+    )
+    mocker.patch.dict(rest_api.os.environ, {"RADIO_BOX_CONF": str(conf_file)})
+    mocker.patch.object(rest_api, "create_pipe")
+    mocker.patch.object(rest_api, "send_command")
+    # Metrics of this worker and snapshot of another worker
+    registry, other_worker = Registry(), Registry()
+    mocker.patch.object(metrics, "REGISTRY", registry)
+    for worker in (registry, other_worker):
+        histogram = worker.histogram(
+            "radio_box_http_request_duration_seconds", "", ["route", "method", "status"]
+        )
+    mocker.patch.object(rest_api, "REQUEST_DURATION", registry.metrics[histogram.name])
+    histogram.observe(0.1, route="/stop", method="GET", status="200")
+    Exporter(metrics_dir, "web-1", other_worker).dump()
+
+    app = rest_api.create_app({"TESTING": True})
+    with app.test_client() as client:
+        client.get(URL_STOP)
+        client.get("/missing")
+        client.post("/missing")
+        response = client.get(URL_METRICS)
+
+    assert response.status_code == 200
+    assert response.content_type == rest_api.METRICS_CONTENT_TYPE
+    text = response.data.decode()
+    labels = 'route="/stop",method="GET",status="200"'
+    assert f"radio_box_http_request_duration_seconds_count{{{labels}}} 2" in text
+    assert 'route="/missing"' not in text
+    assert 'route="/<path:filename>",method="GET",status="404"' in text
+    assert 'route="unmatched",method="POST",status="405"' in text
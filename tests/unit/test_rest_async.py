@@ -0,0 +1,342 @@
+"""Unit Tests for radio_box/rest_async.py."""
+import asyncio
+import threading
+from http import HTTPStatus
+from pathlib import Path
+from typing import List
+from unittest.mock import MagicMock
+
+import pytest
+from flask import Flask, Response, request
+
+from radio_box import rest_async
+from radio_box.events import EventHub
+from radio_box.protocol import controls_pb2 as controls
+from radio_box.rest_api import EVENTS_EXTENSION
+from radio_box.rest_async import (
+    AsyncServer,
+    EventQueue,
+    HttpError,
+    Request,
+    call_app,
+    format_response,
+    keep_alive,
+    read_request,
+    wsgi_environ,
+)
+
+
+@pytest.fixture
+def app() -> Flask:
+    """Provide minimal app that echoes requests."""
+    echo_app = Flask(__name__)
+
+    @echo_app.route("/echo", methods=["GET", "POST"])
+    def echo() -> Response:
+        return Response(f"{request.method} {request.query_string!r} {request.data!r}")
+
+    @echo_app.route("/empty", methods=["GET"])
+    def empty() -> Response:
+        return Response(status=204)
+
+    return echo_app
+
+
+async def parse(data: bytes) -> Request:
+    """Parse request from the raw data."""
+    reader = asyncio.StreamReader(limit=rest_async.MAX_LINE_SIZE)
+    reader.feed_data(data)
+    reader.feed_eof()
+    return await read_request(reader)
+
+
+async def exchange(
+    server: AsyncServer, chunks: List[bytes], close: bool = True
+) -> List[bytes]:
+    """Send chunks to the server one by one, return everything received after each.
+
+    Sending side of the connection is closed after the last chunk, unless `close`
+    is False.
+    """
+    listener = await asyncio.start_server(
+        server.handle, "127.0.0.1", 0, limit=rest_async.MAX_LINE_SIZE
+    )
+    port = listener.sockets[0].getsockname()[1]
+    received = []
+    async with listener:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for chunk in chunks:
+            writer.write(chunk)
+            received.append(await reader.read(65536))
+        if close:
+            writer.write_eof()
+        received.append(await reader.read())
+        writer.close()
+    return received
+
+
+def test_read_request():
+    """Test that request line, headers and body are parsed."""
+    request_data = asyncio.run(
+        parse(
+            b"POST /play?x=1 HTTP/1.1\r\nHost: box\r\nAccept: a\r\n"
+            b"accept: b\r\nContent-Length: 4\r\n\r\ntest"
+        )
+    )
+
+    assert request_data == Request(
+        method="POST",
+        path="/play",
+        query="x=1",
+        version="HTTP/1.1",
+        headers={"host": "box", "accept": "a, b", "content-length": "4"},
+        body=b"test",
+    )
+    assert asyncio.run(parse(b"")) is None
+    with pytest.raises(asyncio.IncompleteReadError):
+        asyncio.run(parse(b"GET / HTTP/1.1\r\nHost"))
+    with pytest.raises(asyncio.IncompleteReadError):
+        asyncio.run(parse(b"GET /"))
+
+
+@pytest.mark.parametrize(
+    "data, status",
+    [
+        (b"GET /\r\n\r\n", HTTPStatus.BAD_REQUEST),
+        (b"GET / HTTP/2\r\n\r\n", HTTPStatus.HTTP_VERSION_NOT_SUPPORTED),
+        (b"GET / HTTP/1.1\r\nHost box\r\n\r\n", HTTPStatus.BAD_REQUEST),
+        (b"GET / HTTP/1.1\r\nHost : box\r\n\r\n", HTTPStatus.BAD_REQUEST),
+        (
+            b"GET / HTTP/1.1\r\n" + b"".join(b"A%d: b\r\n" % i for i in range(101)),
+            HTTPStatus(431),
+        ),
+        (b"GET /" + b"a" * 10000 + b" HTTP/1.1\r\n", HTTPStatus(431)),
+        (b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n", HTTPStatus(411)),
+        (b"POST / HTTP/1.1\r\nContent-Length: x\r\n\r\n", HTTPStatus.BAD_REQUEST),
+        (b"POST / HTTP/1.1\r\nContent-Length: 2000000\r\n\r\n", HTTPStatus(413)),
+    ],
+)
+def test_read_request_invalid(data: bytes, status: HTTPStatus):
+    """Test that invalid or unsupported requests are rejected."""
+    with pytest.raises(HttpError) as error:
+        asyncio.run(parse(data))
+
+    assert error.value.status == status
+
+
+@pytest.mark.parametrize(
+    "version, connection, expected",
+    [
+        ("HTTP/1.1", None, True),
+        ("HTTP/1.1", "close", False),
+        ("HTTP/1.0", None, False),
+        ("HTTP/1.0", "Keep-Alive", True),
+    ],
+)
+def test_keep_alive(version: str, connection: str, expected: bool):
+    """Test that HTTP/1.1 connections are persistent unless the client closes them."""
+    headers = {"connection": connection} if connection else {}
+    request_data = Request("GET", "/", "", version, headers, b"")
+
+    assert keep_alive(request_data) is expected
+
+
+def test_wsgi_environ():
+    """Test that request is converted to WSGI environment."""
+    request_data = Request(
+        "POST",
+        "/a%20b",
+        "x=1",
+        "HTTP/1.1",
+        {"content-type": "application/json", "content-length": "2", "x-foo": "bar"},
+        b"{}",
+    )
+
+    environ = wsgi_environ(request_data, ("10.0.0.1", 80), ("10.0.0.2", 5000))
+
+    assert environ["PATH_INFO"] == "/a b"
+    assert environ["QUERY_STRING"] == "x=1"
+    assert environ["SERVER_PORT"] == "80"
+    assert environ["REMOTE_ADDR"] == "10.0.0.2"
+    assert environ["CONTENT_TYPE"] == "application/json"
+    assert environ["CONTENT_LENGTH"] == "2"
+    assert environ["HTTP_X_FOO"] == "bar"
+    assert environ["wsgi.input"].read() == b"{}"
+
+
+def test_call_app():
+    """Test that status, headers and whole body of the response are collected."""
+
+    def wsgi_app(environ, start_response):
+        write = start_response("200 OK", [("Content-Type", "text/plain")])
+        write(b"a")
+        return [b"b", b"c"]
+
+    assert call_app(wsgi_app, {}) == (
+        "200 OK",
+        [("Content-Type", "text/plain")],
+        b"abc",
+    )
+
+
+def test_format_response():
+    """Test that length is added to responses with body, hop-by-hop headers not."""
+    response = format_response(
+        "200 OK", [("Connection", "foo"), ("X-Foo", "bar")], b"body", alive=True
+    )
+    head, body = response.split(b"\r\n\r\n")
+
+    assert head.startswith(b"HTTP/1.1 200 OK\r\nDate: ")
+    assert head.endswith(b"X-Foo: bar\r\nContent-Length: 4\r\nConnection: keep-alive")
+    assert body == b"body"
+
+    response = format_response("304 Not Modified", [], b"", alive=False)
+    assert b"Content-Length" not in response
+    assert response.endswith(b"Connection: close\r\n\r\n")
+
+
+def test_handle(app: Flask):
+    """Test that requests on a persistent connection are passed to the app."""
+    server = AsyncServer(app)
+
+    received = asyncio.run(
+        exchange(
+            server,
+            [
+                b"GET /echo?x=1 HTTP/1.1\r\nHost: box\r\n\r\n",
+                b"GET /empty HTTP/1.1\r\n\r\n",
+                b"POST /echo HTTP/1.1\r\nContent-Length: 2\r\nConnection: close\r\n"
+                b"\r\nhi",
+            ],
+        )
+    )
+
+    assert received[0].startswith(b"HTTP/1.1 200 OK\r\n")
+    assert received[0].endswith(b"\r\n\r\nGET b'x=1' b''")
+    assert b"Connection: keep-alive" in received[0]
+    assert received[1].startswith(b"HTTP/1.1 204 NO CONTENT\r\n")
+    assert received[2].endswith(b"Connection: close\r\n\r\nPOST b'' b'hi'")
+    assert received[3] == b""
+    assert server.connections == 0
+
+
+def test_handle_invalid(app: Flask):
+    """Test that invalid request is answered with error and connection closed."""
+    received = asyncio.run(exchange(AsyncServer(app), [b"GET /\r\n\r\n"]))
+
+    assert received[0].startswith(b"HTTP/1.1 400 Bad Request\r\n")
+    assert received[0].endswith(b"Connection: close\r\n\r\nBad Request")
+
+
+def test_handle_idle(app: Flask):
+    """Test that idle and closed connections are closed by the server."""
+    server = AsyncServer(app, keepalive_timeout=0.01)
+
+    assert asyncio.run(exchange(server, [], close=False)) == [b""]
+    assert asyncio.run(exchange(server, [])) == [b""]
+    assert asyncio.run(exchange(server, [b"GET / HTTP/1.1\r\nHost"])) == [b"", b""]
+    assert server.connections == 0
+
+
+def test_handle_too_many_connections(app: Flask):
+    """Test that connections above the limit are refused."""
+    server = AsyncServer(app, max_connections=0)
+
+    received = asyncio.run(exchange(server, []))
+
+    assert received[0].startswith(b"HTTP/1.1 503 Service Unavailable\r\n")
+
+
+def test_stream_events(app: Flask, mocker):
+    """Test that events are streamed by the loop until the client falls behind."""
+    mocker.patch.object(EventHub, "run")
+    mocker.patch.object(rest_async, "KEEPALIVE_INTERVAL", 0.01)
+    hub = EventHub(Path("/tmp/foo.sock"))
+    app.extensions[EVENTS_EXTENSION] = {"": MagicMock(), "kitchen": hub}
+    server = AsyncServer(app)
+
+    async def stream() -> List[bytes]:
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /events?zone=kitchen HTTP/1.1\r\n\r\n")
+            received = [await reader.readuntil(b"\r\n\r\n")]
+            received.append(await reader.readuntil(b"\n\n"))
+            # States are published from the hub's thread
+            state = controls.PlayerState(station="foo", status=controls.PLAYING)
+            threading.Thread(target=hub.publish, args=(state,)).start()
+            received.append(await reader.readuntil(b"\n\n"))
+            next(iter(hub.clients)).put_nowait(None)
+            received.append(await reader.read())
+            writer.close()
+        return received
+
+    head, keepalive, event, rest = asyncio.run(stream())
+
+    assert head.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert b"Content-Type: text/event-stream; charset=utf-8" in head
+    assert keepalive == b": keepalive\n\n"
+    assert event.startswith(b"event: playing\ndata: {")
+    assert rest == b""
+    assert not hub.clients
+
+
+@pytest.mark.parametrize(
+    "method, path, query, expected",
+    [
+        ("GET", "/events", "", "default"),
+        ("GET", "/events", "zone=kitchen", "kitchen"),
+        ("GET", "/events", "zone=garage", None),
+        ("POST", "/events", "", None),
+        ("GET", "/stations", "", None),
+    ],
+)
+def test_events_hub(app: Flask, method: str, path: str, query: str, expected: str):
+    """Test that only requests for events of known zones are streamed by the loop."""
+    hubs = {"": "default", "kitchen": "kitchen"}
+    app.extensions[EVENTS_EXTENSION] = hubs
+    request_data = Request(method, path, query, "HTTP/1.1", {}, b"")
+
+    assert AsyncServer(app).events_hub(request_data) == expected
+    app.extensions[EVENTS_EXTENSION] = None
+    assert AsyncServer(app).events_hub(request_data) is None
+
+
+def test_event_queue_closed_loop():
+    """Test that events for client of the closed loop are ignored."""
+    loop = asyncio.new_event_loop()
+    loop.close()
+    client = EventQueue(2, loop, asyncio.Event())
+
+    client.put_nowait(None)
+
+    assert client.take_all() == [None]
+
+
+def test_serve(app: Flask, capsys):
+    """Test that server listens until it's cancelled."""
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(asyncio.wait_for(AsyncServer(app).serve("127.0.0.1", 0), 0.1))
+
+    assert "Listening on 127.0.0.1:0" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(
+    "argv, host, port",
+    [([], "0.0.0.0", 80), (["-b", "127.0.0.1:8080"], "127.0.0.1", 8080)],
+)
+def test_main(argv: List[str], host: str, port: int, mocker):
+    """Test that server is started with the app and the requested address."""
+    mocker.patch("sys.argv", ["radio-box-web-async", *argv, "--threads", "2"])
+    create_app = mocker.patch.object(rest_async, "create_app")
+    server = mocker.patch.object(rest_async, "AsyncServer")
+    run = mocker.patch.object(rest_async.asyncio, "run", side_effect=KeyboardInterrupt)
+
+    rest_async.main()
+
+    server.assert_called_once_with(
+        create_app.return_value, 2, rest_async.DEFAULT_MAX_CONNECTIONS
+    )
+    server.return_value.serve.assert_called_once_with(host, port)
+    run.assert_called_once_with(server.return_value.serve.return_value)
@@ -1,11 +1,105 @@
-"""Unit Tests for radio_box/service.py."""
-from typing import Dict
-from unittest.mock import MagicMock, mock_open, patch
+"""Unit Tests for radio_box/service.py."""  # pylint: disable=too-many-lines
+import asyncio
+import os
+import socket
+from pathlib import Path
+from typing import Dict, List
+from unittest.mock import ANY, AsyncMock, MagicMock, call, patch
 
 import pytest
 
 from radio_box import service
+from radio_box.common import (
+    FRAME_HEADER,
+    FramingError,
+    MessageDecoder,
+    create_pipe,
+    encode_message,
+    make_message_get_traces,
+    make_message_pause,
+    make_message_play,
+    make_message_quit,
+    make_message_record,
+    make_message_resume,
+    make_message_seek,
+    make_message_set_volume,
+    make_message_stop,
+    make_message_stop_recording,
+    make_message_subscribe,
+)
+from radio_box.metrics import Histogram
 from radio_box.protocol import controls_pb2 as controls
+from radio_box.reload import StationsDiff
+from radio_box.tracing import OUTCOME_SUPERSEDED, mark, start_trace
+
+
+def test_tuner_invalid_standby(vlc_instance, stations):
+    """Test that favourite standby station must be configured."""
+    with pytest.raises(ValueError):
+        service.Tuner(stations, "bar")
+
+    assert service.Tuner(stations, "example_fm").standby == "example_fm"
+
+
+def test_tuner_stream_url(vlc_instance, stations):
+    """Test that station URL is resolved and can be invalidated."""
+    station_id = list(stations)[0]
+    url = stations[station_id]["url"]
+    resolver = MagicMock()
+    resolver.resolve.return_value = "http://example.org/resolved.mp3"
+
+    service.Tuner(stations)._new_media(station_id, url)
+    vlc_instance.media_new.assert_called_once_with(url)
+    service.Tuner(stations).invalidate_station(station_id)
+
+    vlc_instance.media_new.reset_mock()
+    tuner = service.Tuner(stations, resolver=resolver)
+    tuner._new_media(station_id, url)
+    vlc_instance.media_new.assert_called_once_with("http://example.org/resolved.mp3")
+    resolver.resolve.assert_called_once_with(url)
+
+    tuner.invalidate_station("bar")
+    tuner.invalidate_station(station_id)
+    resolver.invalidate.assert_called_once_with(url)
+
+
+def test_tuner_mirrors(vlc_instance):
+    """Test that the best mirror is played and failed mirrors are failed over."""
+    mirrors = [
+        "http://a.example.org/",
+        "http://b.example.org/",
+        "http://c.example.org/",
+    ]
+    stations = {"foo": {"url": mirrors}, "bar": {"url": "http://d.example.org/"}}
+    resolver = MagicMock()
+    resolver.resolve.side_effect = lambda url: url
+    tuner = service.Tuner(stations, service.STANDBY_OFF, resolver)
+    tuner.mirrors.record_latency(mirrors[1], 10)
+    tuner.mirrors.record_latency(mirrors[2], 20)
+
+    tuner.play("foo")
+    assert tuner.active_url == mirrors[1]
+
+    # Failover goes through every mirror once, by preference
+    assert tuner.failover("foo") is True
+    assert tuner.active_url == mirrors[2]
+    assert tuner.failover("foo") is True
+    assert tuner.active_url == mirrors[0]
+    assert tuner.failover("foo") is False
+    resolver.invalidate.assert_has_calls(
+        [call(url) for url in mirrors[1:] + mirrors[:1]]
+    )
+    assert tuner.player.play.call_count == 3
+
+    # Playing the station again tries all mirrors again
+    tuner.play("foo")
+    assert tuner.active_url == mirrors[1]
+    assert tuner.failover("foo") is True
+
+    # Only active station can fail over
+    assert tuner.failover("bar") is False
+    tuner.stop()
+    assert tuner.failover("foo") is False
 
 
 def test_tuner_set_station(vlc_instance, stations):
@@ -20,6 +114,8 @@ def test_tuner_set_station(vlc_instance, stations):
     tuner._set_station(known_station_id)
 
     assert tuner.active_media == media_mock
+    assert tuner.active_station == known_station_id
+    vlc_instance.media_new.assert_called_once_with(stations[known_station_id]["url"])
     tuner.player.set_media.assert_called_once_with(media_mock)
 
     # Test that setting an unknown station raises an error
@@ -28,17 +124,26 @@ def test_tuner_set_station(vlc_instance, stations):
 
 
 def test_tuner_stop(vlc_instance, stations):
-    """Test that Tuner.stop() stops playback of active media."""
+    """Test that Tuner.stop() stops playback of active and standby media."""
     active_media = MagicMock()
+    standby_media = MagicMock()
 
     tuner = service.Tuner(stations)
     tuner.active_media = active_media
+    tuner.active_station = list(stations)[0]
+    tuner.standby_media = standby_media
+    tuner.standby_station = "bar"
 
     tuner.stop()
 
     tuner.player.stop.assert_called_once()
+    tuner.standby_player.stop.assert_called_once()
     active_media.release.assert_called_once()
+    standby_media.release.assert_called_once()
     assert tuner.active_media is None
+    assert tuner.active_station is None
+    assert tuner.standby_media is None
+    assert tuner.standby_station is None
 
     # Test that if there's no active media, Tuner wont try to release it
     active_media.reset_mock()
@@ -48,31 +153,152 @@ def test_tuner_stop(vlc_instance, stations):
     active_media.release.assert_not_called()
 
 
-def test_tuner_play(mocker, vlc_instance, stations):
+def test_tuner_play(vlc_instance, stations):
     """Test that Tuner.play() starts media playback."""
-    set_station_mock = mocker.patch.object(service.Tuner, "_set_station")
-    stop_mock = mocker.patch.object(service.Tuner, "stop")
     station_id = list(stations)[0]
 
     tuner = service.Tuner(stations)
-    tuner.active_media = None
+    player = tuner.player
 
-    tuner.play(station_id)
+    assert tuner.play(station_id) is False
 
-    stop_mock.assert_not_called()
-    set_station_mock.assert_called_once_with(station_id)
-    tuner.player.play.assert_called_once()
+    assert tuner.player is player
+    assert tuner.active_station == station_id
+    player.set_media.assert_called_once_with(tuner.active_media)
+    player.play.assert_called_once()
+    # There was no previous station to keep in standby
+    tuner.standby_player.play.assert_not_called()
 
-    # Test that if there's active media it's stopped before playing a new one.
-    set_station_mock.reset_mock()
-    tuner.player.reset_mock()
+    # Playing the same station again restarts the playback
+    player.reset_mock()
+    first_media = tuner.active_media
 
-    tuner.active_media = MagicMock()
     tuner.play(station_id)
 
-    stop_mock.assert_called_once()
-    set_station_mock.assert_called_once_with(station_id)
-    tuner.player.play.assert_called_once()
+    player.stop.assert_called_once()
+    first_media.release.assert_called_once()
+    player.play.assert_called_once()
+
+    with pytest.raises(ValueError):
+        tuner.play("bar")
+
+
+def test_tuner_play_recent(vlc_instance, many_stations):
+    """Test that previously played station is kept ready in the standby player."""
+    first, second, third = list(many_stations)
+    tuner = service.Tuner(many_stations, service.STANDBY_RECENT)
+    first_player, second_player = tuner.player, tuner.standby_player
+
+    tuner.play(first)
+    first_media = tuner.active_media
+    first_player.reset_mock()
+    tuner.play(second)
+
+    # First player keeps playing muted, second one starts the new station
+    assert tuner.player is second_player
+    assert (tuner.standby_station, tuner.standby_media) == (first, first_media)
+    first_player.stop.assert_not_called()
+    first_player.audio_set_mute.assert_called_with(True)
+    second_player.play.assert_called_once()
+
+    # Switching back only swaps players
+    second_player.is_playing.return_value = 1
+    first_player.is_playing.return_value = 1
+    assert tuner.play(first) is True
+    assert tuner.player is first_player
+    assert tuner.standby_station == second
+    first_player.audio_set_mute.assert_called_with(False)
+    second_player.audio_set_mute.assert_called_with(True)
+    first_player.play.assert_not_called()
+
+    # Cold start of a new station, active one moves to standby
+    tuner.play(third)
+    assert tuner.player is second_player
+    assert tuner.standby_station == first
+    assert tuner.active_station == third
+
+
+def test_tuner_play_failed_standby(vlc_instance, many_stations):
+    """Test that standby player that failed is not used for playback."""
+    first, second = list(many_stations)[:2]
+    tuner = service.Tuner(many_stations, service.STANDBY_RECENT)
+    tuner.play(first)
+    tuner.play(second)
+    tuner.standby_player.get_state.return_value = service.vlc.State.Error
+    standby_media = tuner.standby_media
+
+    assert tuner.play(first) is False
+
+    # Failed standby player was stopped and restarted with the station
+    assert tuner.active_station == first
+    standby_media.release.assert_called_once()
+    assert tuner.standby_station == second
+
+
+@pytest.mark.parametrize(
+    "standby, active, previous, expected_target",
+    [
+        (service.STANDBY_OFF, "first_fm", "second_fm", None),
+        (service.STANDBY_RECENT, "first_fm", "second_fm", "second_fm"),
+        (service.STANDBY_RECENT, "first_fm", "first_fm", None),
+        (service.STANDBY_RECENT, "first_fm", None, None),
+        # Previous station was removed from the config
+        (service.STANDBY_RECENT, "first_fm", "removed_fm", None),
+        (service.STANDBY_NEXT, "first_fm", "third_fm", "second_fm"),
+        (service.STANDBY_NEXT, "third_fm", None, "first_fm"),
+        (service.STANDBY_NEXT, None, None, "first_fm"),
+        ("third_fm", "first_fm", "second_fm", "third_fm"),
+        ("third_fm", "third_fm", "second_fm", "second_fm"),
+    ],
+)
+@pytest.mark.usefixtures("vlc_instance")
+def test_tuner_standby_target(
+    standby, active, previous, expected_target, many_stations
+):
+    """Test prediction of the next station for different standby strategies."""
+    tuner = service.Tuner(many_stations, standby)
+
+    assert tuner._standby_target(active, previous) == expected_target
+
+
+def test_tuner_prepare_standby(vlc_instance, many_stations):
+    """Test that standby player is started only if predicted station changes."""
+    tuner = service.Tuner(many_stations, service.STANDBY_NEXT)
+    tuner.active_station = "first_fm"
+
+    tuner._prepare_standby(None)
+    tuner._prepare_standby(None)
+
+    assert tuner.standby_station == "second_fm"
+    tuner.standby_player.set_media.assert_called_once_with(tuner.standby_media)
+    tuner.standby_player.audio_set_mute.assert_called_once_with(True)
+    tuner.standby_player.play.assert_called_once()
+
+
+def test_tuner_update_stations(vlc_instance, many_stations):
+    """Test that changed standby station is stopped, active station is kept."""
+    resolver = MagicMock()
+    resolver.resolve.side_effect = lambda url: url
+    tuner = service.Tuner(many_stations, service.STANDBY_NEXT, resolver)
+    tuner.play("first_fm")
+    stations = dict(many_stations, second_fm={"url": "http://example.org/new.mp3"})
+    del stations["third_fm"]
+
+    diff = tuner.update_stations(stations)
+
+    assert diff == StationsDiff(
+        added=set(), removed={"third_fm"}, changed={"second_fm"}
+    )
+    assert tuner.stations is stations
+    assert tuner.active_station == "first_fm"
+    assert tuner.standby_station is None
+    resolver.invalidate.assert_has_calls(
+        [
+            call("http://example.org/second_fm.mp3"),
+            call("http://example.org/third_fm.mp3"),
+        ],
+        any_order=True,
+    )
 
 
 def test_parse_args(mocker):
@@ -101,9 +327,10 @@ def test_process_command_play():
     message.play.type = controls.PLAY
     message.play.station = station
 
-    service.process_command(message, tuner)
+    result = service.process_command(message, tuner)
 
     tuner.play.assert_called_once()
+    assert result == tuner.play.return_value
 
 
 def test_process_command_stop():
@@ -112,60 +339,1578 @@ def test_process_command_stop():
     message = controls.Command()
     message.stop.type = controls.STOP
 
-    service.process_command(message, tuner)
+    assert service.process_command(message, tuner) is False
 
     tuner.stop.assert_called_once()
 
 
-def test_process_command_quit():
-    """Test processing of a QUIT command."""
+def test_process_command_timeshift():
+    """Test processing of PAUSE, RESUME and SEEK commands."""
     tuner = MagicMock()
-    message = controls.Command()
-    message.quit.type = controls.QUIT
+    tuner.resume.return_value = True
 
-    with patch("radio_box.service.QUIT_", False):
-        service.process_command(message, tuner)
-        assert service.QUIT_
+    assert service.process_command(make_message_pause(), tuner) is False
+    assert service.process_command(make_message_resume(), tuner) is True
+    assert service.process_command(make_message_seek(30), tuner) is False
 
+    tuner.pause.assert_called_once_with()
+    tuner.seek.assert_called_once_with(30)
 
-def test_run(stations: Dict, mocker):
-    """Test main execution loop of service.py."""
 
-    def quit_main_loop(*_):
-        quit_control.__bool__.return_value = True
+def test_tuner_attach_events(vlc_instance, stations):
+    """Test that Tuner forwards events of both VLC players to the callback."""
+    callback = MagicMock()
+    tuner = service.Tuner(stations)
 
-    socket_path = "/tmp/foo.pipe"
-    conf_path = "/etc/foo.conf"
+    tuner.attach_events(callback)
 
-    message = controls.Command()
-    message.quit.type = controls.QUIT
+    for player in (tuner.player, tuner.standby_player):
+        player.event_manager.return_value.event_attach.assert_has_calls(
+            [
+                call(vlc_event, tuner._forward_event, event_name, player, callback)
+                for vlc_event, event_name in service.PLAYER_EVENTS.items()
+            ]
+        )
+
+
+@pytest.mark.parametrize(
+    "event_name, expected_value",
+    [(service.EVENT_BUFFERING, 42.0), (service.EVENT_PLAYING, 0.0)],
+)
+def test_tuner_forward_event(
+    event_name: str, expected_value: float, vlc_instance, stations
+):
+    """Test that only plain data are extracted from VLC event for the callback."""
+    callback = MagicMock()
+    event = MagicMock()
+    event.u.new_cache = 42.0
+    tuner = service.Tuner(stations)
+
+    tuner._forward_event(event, event_name, tuner.player, callback)
+
+    callback.assert_called_once_with(event_name, expected_value)
+    tuner.player.audio_set_mute.assert_not_called()
+
+
+def test_tuner_forward_event_standby(vlc_instance, stations):
+    """Test that events of standby player are not forwarded and it's kept muted."""
+    callback = MagicMock()
+    tuner = service.Tuner(stations)
+
+    tuner._forward_event(
+        MagicMock(), service.EVENT_BUFFERING, tuner.standby_player, callback
+    )
+    tuner.standby_player.audio_set_mute.assert_not_called()
+
+    tuner._forward_event(
+        MagicMock(), service.EVENT_PLAYING, tuner.standby_player, callback
+    )
+    tuner.standby_player.audio_set_mute.assert_called_once_with(True)
+
+    callback.assert_not_called()
+
+
+def test_tuner_metadata(vlc_instance, stations):
+    """Test that changes of the now playing title of the active media are reported."""
+    callback = MagicMock()
+    tuner = service.Tuner(stations)
+    tuner.attach_events(callback)
+    tuner._set_station("example_fm", "http://example.org/stream.mp3")
+    media = tuner.active_media
+    media.event_manager.return_value.event_attach.assert_called_once_with(
+        service.vlc.EventType.MediaMetaChanged, tuner._forward_metadata, media, callback
+    )
+
+    media.get_meta.return_value = "Artist - Song"
+    tuner._forward_metadata(MagicMock(), media, callback)
+    tuner._forward_metadata(MagicMock(), media, callback)
+    # Metadata of other media are ignored
+    tuner._forward_metadata(MagicMock(), MagicMock(), callback)
+
+    callback.assert_called_once_with(service.EVENT_METADATA, 0.0)
+    assert tuner.now_playing == "Artist - Song"
+    tuner._set_station("example_fm", "http://example.org/stream.mp3")
+    assert tuner.now_playing == ""
+
+
+def test_tuner_set_volume(vlc_instance, stations):
+    """Test that volume of both players is changed."""
+    tuner = service.Tuner(stations)
+    assert tuner.volume == service.MAX_VOLUME
+
+    tuner.set_volume(40)
+
+    tuner.player.audio_set_volume.assert_called_once_with(40)
+    tuner.standby_player.audio_set_volume.assert_called_once_with(40)
+    assert tuner.volume == 40
+
+
+def test_tuner_output(vlc_instance, stations):
+    """Test that tuner with shared instance plays both players on its output."""
+    instance = MagicMock()
+    instance.media_player_new.side_effect = MagicMock
+
+    tuner = service.Tuner(stations, instance=instance, output="hw:1,0")
+
+    assert tuner.vlc is instance
+    vlc_instance.media_player_new.assert_not_called()
+    tuner.player.audio_output_device_set.assert_called_once_with(None, "hw:1,0")
+    tuner.standby_player.audio_output_device_set.assert_called_once_with(None, "hw:1,0")
+
+
+def test_tuner_timeshift_url(vlc_instance, stations):
+    """Test that stations are played through the relay with time-shift."""
+    resolver = MagicMock()
+    tuner = service.Tuner(
+        stations, resolver=resolver, timeshift_url="http://127.0.0.1:8001"
+    )
+
+    tuner.play("example_fm")
+
+    vlc_instance.media_new.assert_called_once_with("http://127.0.0.1:8001/example_fm")
+    resolver.resolve.assert_not_called()
+
+
+def test_tuner_pause_resume(vlc_instance, stations, mocker):
+    """Test that paused station continues from the buffer where it was paused."""
+    monotonic = mocker.patch.object(service.time, "monotonic", return_value=100.0)
+    tuner = service.Tuner(
+        stations, timeshift_url="http://127.0.0.1:8001", timeshift_window=600
+    )
+    with pytest.raises(ValueError, match="Nothing is playing."):
+        tuner.pause()
+    tuner.play("example_fm")
+    player = tuner.player
+
+    tuner.pause()
+    tuner.pause()
+    monotonic.return_value = 130.5
+    assert tuner.paused
+    assert tuner.current_delay() == 30
+    assert tuner.resume() is True
+
+    player.set_pause.assert_has_calls([call(1), call(0)])
+    assert player.set_pause.call_count == 2
+    assert not tuner.paused
+    assert tuner.current_delay() == 30
+    # Playback that is not paused just continues
+    player.is_playing.return_value = 1
+    assert tuner.resume() is True
+    assert player.set_pause.call_count == 2
+
+    # Station is restarted with new media after the seek
+    vlc_instance.media_new.reset_mock()
+    tuner.seek(90)
+    vlc_instance.media_new.assert_called_once_with(
+        "http://127.0.0.1:8001/example_fm?delay=90"
+    )
+    assert tuner.current_delay() == 90
+    # Play returns to the live stream
+    tuner.play("example_fm")
+    assert tuner.current_delay() == 0
+    # Paused player is not kept as standby
+    tuner.pause()
+    tuner.player.stop.reset_mock()
+    tuner.play("example_fm")
+    tuner.player.stop.assert_called()
+    assert not tuner.paused
+
+
+def test_tuner_resume_expired(vlc_instance, stations, mocker):
+    """Test that station paused for longer than the window resumes at its start."""
+    monotonic = mocker.patch.object(service.time, "monotonic", return_value=100.0)
+    tuner = service.Tuner(
+        stations, timeshift_url="http://127.0.0.1:8001", timeshift_window=600
+    )
+    tuner.play("example_fm")
+    tuner.pause()
+    monotonic.return_value = 1000.0
+    assert tuner.current_delay() == 600
+    vlc_instance.media_new.reset_mock()
+
+    assert tuner.resume() is False
+
+    vlc_instance.media_new.assert_called_once_with(
+        "http://127.0.0.1:8001/example_fm?delay=600"
+    )
+    assert not tuner.paused
+    # Seek is limited by the window
+    tuner.seek(7200)
+    assert tuner.current_delay() == 600
+
+
+def test_tuner_timeshift_disabled(vlc_instance, stations):
+    """Test that time-shift commands are refused without the time-shift."""
+    tuner = service.Tuner(stations)
+    tuner.play("example_fm")
+
+    for command in (tuner.pause, tuner.resume, lambda: tuner.seek(10)):
+        with pytest.raises(ValueError, match="Time-shift is not enabled."):
+            command()
+
+
+def test_create_tuners(vlc_instance, many_stations, mocker, tmp_path: Path):
+    """Test that tuner is created for every zone, all with the same instance."""
+    instance_class = mocker.patch.object(
+        service.vlc, "Instance", return_value=vlc_instance
+    )
+    config = {
+        "standby": "first_fm",
+        "zones": {
+            "living_room": None,
+            "kitchen": {"output": "hw:1,0", "standby": service.STANDBY_OFF},
+        },
+    }
+
+    tuners = service.create_tuners(config, many_stations, MagicMock())
+
+    assert list(tuners) == ["living_room", "kitchen"]
+    instance_class.assert_called_once_with(*service.VLC_OPTIONS)
+    assert tuners["living_room"].vlc is tuners["kitchen"].vlc is vlc_instance
+    assert tuners["living_room"].mirrors is tuners["kitchen"].mirrors
+    assert tuners["living_room"].standby == "first_fm"
+    assert tuners["kitchen"].standby == service.STANDBY_OFF
+    assert tuners["living_room"].output is None
+    assert tuners["kitchen"].output == "hw:1,0"
+    assert tuners["kitchen"].timeshift_url is None
+
+    config["timeshift"] = {"minutes": 10, "directory": str(tmp_path)}
+    relay = service.relay_options(config)
+    tuners = service.create_tuners(config, many_stations, MagicMock(), relay)
+    assert tuners["kitchen"].timeshift_url == "http://127.0.0.1:8001"
+    assert tuners["kitchen"].timeshift_window == 600
+
+
+def test_relay_options(tmp_path: Path, mocker):
+    """Test that relay runs for the LAN or the time-shift."""
+    directory = tmp_path / "timeshift"
+    makedirs = mocker.patch.object(service.os, "makedirs")
+
+    assert service.relay_options({}) is None
+    assert service.relay_options({"relay": {"port": 8002}}) == service.RelayOptions(
+        port=8002
+    )
+    options = service.relay_options({"timeshift": {"directory": str(directory)}})
+    assert options.host == "127.0.0.1"
+    assert options.buffer_dir == str(directory)
+    makedirs.assert_called_once_with(str(directory), exist_ok=True)
+    # Buffers are kept on disk by default, not in the (often tmpfs) temp directory
+    options = service.relay_options({"timeshift": {}})
+    assert options.buffer_dir == "/var/lib/radio-box/timeshift"
+    makedirs.assert_called_with("/var/lib/radio-box/timeshift", exist_ok=True)
+    # Temporary directory is used when the directory is empty
+    options = service.relay_options(
+        {"relay": {"port": 8002}, "timeshift": {"directory": ""}}
+    )
+    assert (options.host, options.port, options.buffer_dir) == ("0.0.0.0", 8002, "")
+
+
+def test_relay_options_timeshift_directory_failure(tmp_path: Path, capsys):
+    """Test that time-shift falls back to the temporary directory if needed."""
+    blocker = tmp_path / "file"
+    blocker.touch()
+    directory = blocker / "timeshift"
+
+    options = service.relay_options({"timeshift": {"directory": str(directory)}})
+
+    assert options.buffer_dir == ""
+    assert f"Failed to create time-shift directory {directory}" in (
+        capsys.readouterr().out
+    )
+
+
+def test_state_publisher():
+    """Test that state changes are published to all subscribers."""
+
+    async def scenario():
+        publisher = service.StatePublisher()
+        publisher_task = asyncio.ensure_future(publisher.run())
+        first = publisher.subscribe()
+        second = publisher.subscribe()
+
+        publisher.update("foo", controls.OPENING)
+        await asyncio.sleep(0)
+        # Unchanged state is not published again
+        publisher.update("foo", controls.OPENING)
+        await asyncio.sleep(0)
+        publisher.unsubscribe(second)
+        publisher.update(None, controls.STOPPED)
+        await asyncio.sleep(0)
+
+        publisher_task.cancel()
+        return [first.get_nowait() for _ in range(first.qsize())], second.qsize()
+
+    first_states, second_count = asyncio.run(scenario())
+
+    assert first_states == [
+        controls.PlayerState(station="foo", status=controls.OPENING),
+        controls.PlayerState(status=controls.STOPPED),
+    ]
+    assert second_count == 1
+
+
+def test_state_publisher_slow_subscriber():
+    """Test that slow subscribers loose the oldest states."""
+
+    async def scenario():
+        publisher = service.StatePublisher()
+        publisher_task = asyncio.ensure_future(publisher.run())
+        queue = publisher.subscribe()
+        for index in range(service.SUBSCRIBER_QUEUE_SIZE + 1):
+            publisher.update(f"station_{index}", controls.PLAYING)
+            await asyncio.sleep(0)
+        publisher_task.cancel()
+        return [queue.get_nowait().station for _ in range(queue.qsize())]
+
+    stations = asyncio.run(scenario())
+
+    assert len(stations) == service.SUBSCRIBER_QUEUE_SIZE
+    assert stations[0] == "station_1"
+    assert stations[-1] == f"station_{service.SUBSCRIBER_QUEUE_SIZE}"
+
+
+def test_state_publisher_title():
+    """Test that title is kept only while station does not change."""
+    publisher = service.StatePublisher()
+    publisher.state.volume = 50
+
+    publisher.update("foo", controls.PLAYING)
+    publisher.update_title("Artist - Song")
+    publisher.update("foo", controls.BUFFERING)
+    assert publisher.state == controls.PlayerState(
+        station="foo", status=controls.BUFFERING, title="Artist - Song", volume=50
+    )
+
+    publisher.update_title("")
+    assert not publisher.state.HasField("title")
+
+    publisher.update_title("Artist - Song")
+    publisher.update("bar", controls.FAILED, "Stream error")
+    assert publisher.state == controls.PlayerState(
+        station="bar", status=controls.FAILED, error="Stream error", volume=50
+    )
+
+
+def test_state_publisher_delay():
+    """Test that delay is kept only while station does not change."""
+    publisher = service.StatePublisher()
+
+    publisher.update("foo", controls.OPENING)
+    publisher.update_delay(30)
+    publisher.update("foo", controls.PLAYING)
+    assert publisher.state == controls.PlayerState(
+        station="foo", status=controls.PLAYING, delay=30
+    )
+
+    publisher.update_delay(0)
+    assert not publisher.state.HasField("delay")
+
+    publisher.update_delay(30)
+    publisher.update("bar", controls.OPENING)
+    assert not publisher.state.HasField("delay")
+
+
+def test_state_publisher_volume():
+    """Test that requested volume is kept across changes of the station."""
+    publisher = service.StatePublisher()
+
+    publisher.update_volume(40)
+    publisher.update("foo", controls.OPENING)
+
+    assert publisher.state == controls.PlayerState(
+        station="foo", status=controls.OPENING, volume=40
+    )
+
+
+def test_pipe_server(tmp_path: Path, mocker):
+    """Test that commands written to the pipe are submitted for execution."""
+    pipe_path = create_pipe(tmp_path / "radio.pipe")
+    messages = [make_message_play("foo"), make_message_stop()]
+    start_trace(messages[1])
+    received: List[controls.Command] = []
+    real_read = os.read
+
+    def read_after_spurious_wakeup(pipe: int, size: int) -> bytes:
+        if read_mock.call_count == 1:
+            raise BlockingIOError()
+        return real_read(pipe, size)
+
+    read_mock = mocker.patch.object(
+        service.os, "read", side_effect=read_after_spurious_wakeup
+    )
+
+    async def scenario():
+        all_received = asyncio.Event()
 
-    config = {"stations": stations, "socket": socket_path}
+        async def submit(message: controls.Command):
+            received.append(message)
+            if len(received) == len(messages):
+                all_received.set()
 
+        server_task = asyncio.ensure_future(service.PipeServer(pipe_path).serve(submit))
+        await asyncio.sleep(0)
+        with open(pipe_path, "wb", buffering=0) as pipe:
+            pipe.write(FRAME_HEADER.pack(0xFFFFFFFF))
+            await asyncio.sleep(0.05)
+            pipe.write(b"".join(encode_message(message) for message in messages))
+            await asyncio.wait_for(all_received.wait(), 1)
+        server_task.cancel()
+        await asyncio.gather(server_task, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+    assert [message.WhichOneof("sub_command") for message in received] == [
+        "play",
+        "stop",
+    ]
+    # Only traced commands receive timing of the stages
+    assert not received[0].spans
+    assert [span.stage for span in received[1].spans] == ["transport", "decode"]
+
+
+def test_socket_server(tmp_path: Path):
+    """Test that socket server replies to commands from multiple clients."""
+    socket_path = tmp_path / "radio.sock"
+    server = service.SocketServer(socket_path)
+    received: List[controls.Command] = []
+
+    async def submit(message: controls.Command):
+        received.append(message)
+        result = asyncio.get_running_loop().create_future()
+        reply = controls.Reply(status=controls.OK)
+        reply.state.station = message.play.station
+        result.set_result(reply)
+        return result
+
+    async def client(*messages: controls.Command):
+        reader, writer = await asyncio.open_unix_connection(str(socket_path))
+        writer.write(b"".join(encode_message(message) for message in messages))
+        decoder = MessageDecoder(controls.Reply)
+        replies = []
+        while len(replies) < len(messages):
+            replies.extend(decoder.feed(await reader.read(4096)))
+        writer.close()
+        return replies
+
+    async def scenario():
+        server_task = asyncio.ensure_future(server.serve(submit))
+        while not socket_path.exists():
+            await asyncio.sleep(0.01)
+        traced = make_message_play("baz")
+        start_trace(traced)
+        replies = await asyncio.gather(
+            client(make_message_play("foo"), make_message_play("bar")),
+            client(traced),
+        )
+        server_task.cancel()
+        await asyncio.gather(server_task, return_exceptions=True)
+        return replies
+
+    first, second = asyncio.run(scenario())
+
+    assert [reply.state.station for reply in first] == ["foo", "bar"]
+    assert [reply.state.station for reply in second] == ["baz"]
+    assert len(received) == 3
+    assert [len(message.spans) for message in received] == [0, 0, 2]
+
+
+def test_socket_server_subscribe(tmp_path: Path):
+    """Test that subscribed client receives current state and all its changes."""
+    socket_path = tmp_path / "radio.sock"
+    server = service.SocketServer(socket_path)
+    publisher = service.StatePublisher()
+    publisher.update("foo", controls.OPENING)
+
+    async def submit(_message):
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(controls.Reply(status=controls.ERROR, error="Unknown zone."))
+        return future
+
+    async def scenario():
+        publisher_task = asyncio.ensure_future(publisher.run())
+        server_task = asyncio.ensure_future(server.serve(submit, {"": publisher}.get))
+        while not socket_path.exists():
+            await asyncio.sleep(0.01)
+        reader, writer = await asyncio.open_unix_connection(str(socket_path))
+        # Subscription to unknown zone is answered with error
+        writer.write(encode_message(make_message_subscribe("kitchen")))
+        decoder = MessageDecoder(controls.Reply)
+        replies = list(decoder.feed(await reader.read(4096)))
+        writer.write(encode_message(make_message_subscribe()))
+        replies.extend(decoder.feed(await reader.read(4096)))
+        # Further data from the client are ignored
+        writer.write(b"ignored")
+        publisher.update("foo", controls.PLAYING)
+        while len(replies) < 3:
+            replies.extend(decoder.feed(await reader.read(4096)))
+        writer.close()
+        while publisher.subscribers:
+            await asyncio.sleep(0.01)
+        server_task.cancel()
+        publisher_task.cancel()
+        await asyncio.gather(server_task, publisher_task, return_exceptions=True)
+        return replies
+
+    replies = asyncio.run(scenario())
+
+    assert replies[0].status == controls.ERROR
+    assert [reply.state.status for reply in replies[1:]] == [
+        controls.OPENING,
+        controls.PLAYING,
+    ]
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        FramingError("Frame too big"),
+        ConnectionResetError("Reset"),
+        asyncio.CancelledError(),
+    ],
+)
+def test_socket_server_connection_error(error: Exception):
+    """Test that broken client connection is closed."""
+    reader = MagicMock()
+    reader.read = AsyncMock(return_value=b"data")
+    writer = MagicMock()
+
+    with patch.object(service.MessageDecoder, "feed", side_effect=error):
+        asyncio.run(service.SocketServer.handle_connection(AsyncMock(), reader, writer))
+
+    writer.close.assert_called_once()
+
+
+def test_remove_stale_socket(tmp_path: Path):
+    """Test that socket file left by previous run is removed."""
+    socket_path = tmp_path / "radio.sock"
+    server = service.SocketServer(socket_path)
+
+    # Missing socket file is not an error
+    server.remove_stale_socket()
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(str(socket_path))
+    server.remove_stale_socket()
+    assert not socket_path.exists()
+
+    # Regular files are not removed
+    socket_path.touch()
+    with pytest.raises(FileExistsError):
+        server.remove_stale_socket()
+    assert socket_path.exists()
+
+
+def mock_tuner() -> MagicMock:
+    """Create mock of the Tuner that plays the live stream."""
     tuner = MagicMock()
+    tuner.paused = False
+    # Not recorded among the calls of the tuner
+    tuner.current_delay = lambda: 0
+    return tuner
+
+
+def make_service(tuner: MagicMock = None, server: MagicMock = None):
+    """Create RadioBoxService instance with single zone in the running event loop."""
+    if tuner is None:
+        tuner = mock_tuner()
+        tuner.active_station = None
+        tuner.failover.return_value = False
+    return service.RadioBoxService({"default": tuner}, server or MagicMock())
+
+
+def make_zone(tuner: MagicMock = None):
+    """Create default zone of the service in the running event loop."""
+    return make_service(tuner).default_zone
+
+
+def test_zone_execute_play():
+    """Test that PLAY command is executed in player thread and reported as OPENING."""
+    tuner = mock_tuner()
+    tuner.active_station = "foo"
+    tuner.play.return_value = False
+
+    async def scenario():
+        zone = make_zone(tuner)
+        return await zone.execute(make_message_play("foo"))
+
+    reply = asyncio.run(scenario())
+
+    tuner.play.assert_called_once_with("foo")
+    assert reply.status == controls.OK
+    assert reply.state == controls.PlayerState(station="foo", status=controls.OPENING)
+
+
+def test_zone_execute_play_standby(capsys):
+    """Test that switch to already playing standby station is reported immediately."""
+    tuner = mock_tuner()
+    tuner.active_station = "foo"
+    tuner.play.return_value = True
+
+    async def scenario():
+        zone = make_zone(tuner)
+        return await zone.execute(make_message_play("foo")), zone
+
+    reply, zone = asyncio.run(scenario())
+
+    assert reply.state == controls.PlayerState(station="foo", status=controls.PLAYING)
+    assert zone.switch_started is None
+    assert "Switched to foo in " in capsys.readouterr().out
+
+
+def test_zone_report_switch(capsys):
+    """Test that time from PLAY command until the playback starts is logged once."""
+    tuner = mock_tuner()
+    tuner.active_station = "foo"
+    tuner.play.return_value = False
+
+    async def scenario():
+        zone = make_zone(tuner)
+        await zone.execute(make_message_play("foo"))
+        zone.switch_started -= 0.25
+        zone.on_player_event(service.EVENT_PLAYING, 0)
+        zone.on_player_event(service.EVENT_PLAYING, 0)
+
+    asyncio.run(scenario())
+
+    output = capsys.readouterr().out
+    assert output.count("Switched to foo in") == 1
+    assert "Switched to foo in 25" in output
+
+
+def histogram_sum(histogram: Histogram, *labels: str) -> float:
+    """Return sum of values observed by the histogram."""
+    return histogram.values.get(labels, ([], 0.0))[1]
+
+
+def test_zone_metrics():
+    """Test that latency of the switch and playback interruptions are measured."""
+    tuner = mock_tuner()
+    tuner.active_station = "foo"
+    tuner.play.return_value = False
+    trigger = service.SWITCH_COMMAND
+    commands = service.COMMANDS.values.get(("play", "ok"), 0)
+    buffering = service.BUFFERING_EVENTS.values.get(("foo",), 0)
+    command_duration = histogram_sum(service.COMMAND_DURATION, "play")
+    playing_delay = histogram_sum(service.PLAYING_DELAY, trigger)
+    time_to_audio = histogram_sum(service.TIME_TO_AUDIO, "foo", trigger)
+
+    async def scenario():
+        zone = make_zone(tuner)
+        received = zone.loop.time() - 0.25
+        await zone.execute(make_message_play("foo"), received)
+        zone.player_started -= 0.5
+        zone.on_player_event(service.EVENT_PLAYING, 0)
+        # Single interruption of the playback
+        zone.on_player_event(service.EVENT_BUFFERING, 10.0)
+        zone.on_player_event(service.EVENT_BUFFERING, 50.0)
+        zone.on_player_event(service.EVENT_PLAYING, 0)
+
+    asyncio.run(scenario())
+
+    assert service.COMMANDS.values[("play", "ok")] == commands + 1
+    assert service.BUFFERING_EVENTS.values[("foo",)] == buffering + 1
+    assert 0.25 <= histogram_sum(service.COMMAND_DURATION, "play") - command_duration
+    assert 0.5 <= histogram_sum(service.PLAYING_DELAY, trigger) - playing_delay < 1
+    assert 0.25 <= histogram_sum(service.TIME_TO_AUDIO, "foo", trigger) - time_to_audio
+    assert histogram_sum(service.TIME_TO_AUDIO, "foo", trigger) - time_to_audio < 0.5
+
+
+def traced(message: controls.Command) -> controls.Command:
+    """Start trace of the command, as if it was sent by the REST API."""
+    start_trace(message)
+    mark(message, "rest")
+    return message
+
+
+def test_zone_traces():
+    """Test that traces of commands are completed when their processing ends."""
+    tuner = mock_tuner()
+    tuner.active_station = "foo"
+    tuner.play.return_value = False
+
+    async def scenario():
+        zone = make_zone(tuner)
+        await zone.execute(traced(make_message_play("foo")))
+        # PLAY command is completed when the station starts playing
+        assert not zone.service.traces.latest()
+        zone.on_player_event(service.EVENT_PLAYING, 0)
+        # Next PLAY command is superseded by STOP before the station plays
+        await zone.execute(traced(make_message_play("foo")))
+        await zone.execute(traced(make_message_stop()))
+        # Untraced commands are not recorded
+        await zone.execute(make_message_stop())
+        tuner.play.side_effect = ValueError("Unknown station bar")
+        await zone.execute(traced(make_message_play("bar")))
+        return await zone.execute(make_message_get_traces(0))
+
+    reply = asyncio.run(scenario())
+
+    assert [(trace.command, trace.outcome) for trace in reply.traces] == [
+        ("play foo", "ok"),
+        ("play foo", "superseded"),
+        ("stop", "ok"),
+        ("play bar", "error"),
+    ]
+    assert [span.stage for span in reply.traces[0].spans] == [
+        "rest",
+        "queue",
+        "tuner",
+        "playback",
+    ]
+    assert [span.stage for span in reply.traces[2].spans] == ["rest", "queue", "tuner"]
+
+
+def test_zone_trace_failed():
+    """Test that trace of the station that failed to play is completed."""
+    tuner = mock_tuner()
+    tuner.active_station = "foo"
+    tuner.play.return_value = False
+    tuner.failover.return_value = False
+
+    async def scenario():
+        zone = make_zone(tuner)
+        await zone.execute(traced(make_message_play("foo")))
+        await zone.fail_over("foo")
+        return zone.service.traces.latest(1)
+
+    (trace,) = asyncio.run(scenario())
+
+    assert trace.outcome == "failed"
+    assert trace.spans[-1].stage == "playback"
+
+
+def test_zone_execute_timeshift():
+    """Test that paused and sought playback is reported with its delay."""
+    tuner = mock_tuner()
+    tuner.active_station = "foo"
+    tuner.current_delay = lambda: 30
+
+    async def scenario():
+        zone = make_zone(tuner)
+        tuner.paused = True
+        paused = await zone.execute(make_message_pause())
+        tuner.paused = False
+        sought = await zone.execute(make_message_seek(30))
+        return paused, sought
+
+    paused, sought = asyncio.run(scenario())
+
+    assert paused.state == controls.PlayerState(
+        station="foo", status=controls.PAUSED, delay=30
+    )
+    assert sought.state == controls.PlayerState(
+        station="foo", status=controls.OPENING, delay=30
+    )
+
+
+def test_zone_execute_recording():
+    """Test that recorder commands start and stop the recordings of the service."""
+    recorder = MagicMock()
+    recorder.stop.side_effect = ValueError("Station foo is not being recorded.")
+
+    async def scenario():
+        zone = make_zone()
+        disabled = await zone.execute(make_message_record("foo"))
+        zone.service.recorder = recorder
+        recorded = await zone.execute(make_message_record("foo", 3600))
+        stopped = await zone.execute(make_message_stop_recording("foo"))
+        return disabled, recorded, stopped
+
+    disabled, recorded, stopped = asyncio.run(scenario())
+
+    assert (disabled.status, disabled.error) == (
+        controls.ERROR,
+        "Recorder is not enabled.",
+    )
+    assert recorded.status == controls.OK
+    recorder.start.assert_called_once_with("foo", 3600)
+    assert (stopped.status, stopped.error) == (
+        controls.ERROR,
+        "Station foo is not being recorded.",
+    )
+    recorder.stop.assert_called_once_with("foo")
+
+
+def test_zone_execute_stop():
+    """Test that STOP command is executed and reported as STOPPED."""
+    tuner = mock_tuner()
+    tuner.active_station = None
+
+    async def scenario():
+        zone = make_zone(tuner)
+        zone.publisher.update("foo", controls.PLAYING)
+        return await zone.execute(make_message_stop())
+
+    reply = asyncio.run(scenario())
+
+    tuner.stop.assert_called_once()
+    assert reply.status == controls.OK
+    assert reply.state == controls.PlayerState(status=controls.STOPPED)
+
+
+def test_zone_execute_error():
+    """Test that command that fails to execute produces error reply."""
+    tuner = mock_tuner()
+    tuner.active_station = None
+    tuner.play.side_effect = ValueError("Unknown station foo.")
+
+    async def scenario():
+        return await make_zone(tuner).execute(make_message_play("foo"))
+
+    reply = asyncio.run(scenario())
+
+    assert reply.status == controls.ERROR
+    assert reply.error == "Unknown station foo."
+    assert reply.state.status == controls.STOPPED
+
+
+def test_zone_process_commands_unexpected_error(capsys):
+    """Test that unexpected player failure is reported and queue keeps running."""
+    tuner = mock_tuner()
+    tuner.active_station = None
+    tuner.play.side_effect = [RuntimeError("libvlc failed"), False]
+
+    async def scenario():
+        zone = make_zone(tuner)
+        worker = zone.service.add_task(zone.process_commands())
+        failed = await asyncio.wait_for(await zone.submit(make_message_play("foo")), 1)
+        played = await asyncio.wait_for(await zone.submit(make_message_play("foo")), 1)
+        worker.cancel()
+        return failed, played
+
+    failed, played = asyncio.run(scenario())
+
+    assert failed.status == controls.ERROR
+    assert failed.error == "Failed to execute command: libvlc failed"
+    assert failed.state.status == controls.STOPPED
+    assert played.status == controls.OK
+    assert "Unexpected error while executing command" in capsys.readouterr().out
+
+
+def test_zone_execute_quit():
+    """Test that QUIT command signals service to quit."""
+
+    async def scenario():
+        zone = make_zone()
+        reply = await zone.execute(make_message_quit())
+        return reply, zone.service.quit_event.is_set()
+
+    reply, quit_requested = asyncio.run(scenario())
+
+    assert reply.status == controls.OK
+    assert quit_requested
+
+
+def test_zone_execute_subscribe():
+    """Test that subscription over transport without replies is refused."""
+
+    async def scenario():
+        return await make_zone().execute(make_message_subscribe())
+
+    reply = asyncio.run(scenario())
+
+    assert reply.status == controls.ERROR
+    assert "socket transport" in reply.error
+
+
+def test_zone_set_volume():
+    """Test that volume is ramped in small steps towards the latest requested level."""
+    tuner = mock_tuner()
+    tuner.volume = 100
+
+    def set_volume(level: int):
+        tuner.volume = level
+
+    tuner.set_volume.side_effect = set_volume
+
+    async def scenario():
+        zone = make_zone(tuner)
+        await zone.execute(make_message_set_volume(20))
+        await asyncio.sleep(service.VOLUME_RAMP_INTERVAL * 1.5)
+        # Levels requested during the ramp redirect it, only the last one is reached
+        await zone.execute(make_message_set_volume(90))
+        reply = await zone.execute(make_message_set_volume(60))
+        await zone.volume_ramp
+        return reply
+
+    reply = asyncio.run(scenario())
+
+    assert reply.state.volume == 60
+    levels = [level for (level,), _ in tuner.set_volume.call_args_list]
+    # First step of the ramp from 100 to 20
+    assert levels[0] == 80
+    assert levels[-1] == 60
+    assert len(levels) <= 2 * service.VOLUME_RAMP_STEPS
+
+
+def test_zone_set_volume_invalid():
+    """Test that volume above maximum is refused."""
+    tuner = mock_tuner()
+    tuner.volume = 100
+
+    async def scenario():
+        return await make_zone(tuner).execute(make_message_set_volume(150))
+
+    reply = asyncio.run(scenario())
+
+    assert reply.status == controls.ERROR
+    assert not reply.state.HasField("volume")
+    tuner.set_volume.assert_not_called()
+
+
+def test_zone_process_commands():
+    """Test that submitted commands are executed in order."""
+    tuner = mock_tuner()
+    tuner.active_station = None
+
+    async def scenario():
+        zone = make_zone(tuner)
+        worker = zone.service.add_task(zone.process_commands())
+        replies = [
+            await (await zone.submit(make_message_play("foo"))),
+            await (await zone.submit(make_message_stop())),
+        ]
+        # Result that was already resolved (e.g. cancelled) is not touched
+        cancelled = await zone.submit(make_message_stop())
+        cancelled.cancel()
+        await asyncio.sleep(0.05)
+        worker.cancel()
+        return replies
+
+    replies = asyncio.run(scenario())
+
+    assert [reply.status for reply in replies] == [controls.OK, controls.OK]
+    assert tuner.method_calls == [call.play("foo"), call.stop(), call.stop()]
+
+
+def test_zone_process_commands_coalescing():
+    """Test that commands superseded while the player is busy are skipped."""
+    tuner = mock_tuner()
+    tuner.active_station = None
+    # Volume is already at the requested level, the player is not touched
+    tuner.volume = 50
+    coalesced = service.COALESCED_COMMANDS.values.get(("play",), 0)
+
+    async def scenario():
+        zone = make_zone(tuner)
+        worker = zone.service.add_task(zone.process_commands())
+        traced = make_message_play("bar")
+        start_trace(traced)
+        messages = [
+            make_message_play("foo"),
+            traced,
+            make_message_set_volume(50),
+            make_message_get_traces(),
+            make_message_stop(),
+            make_message_play("baz"),
+        ]
+        results = [await zone.submit(message) for message in messages]
+        replies = await asyncio.gather(*results)
+        worker.cancel()
+        return replies, zone.service.traces.latest()
+
+    replies, traces = asyncio.run(scenario())
+
+    assert all(reply.status == controls.OK for reply in replies)
+    assert [method[0] for method in tuner.method_calls] == ["play"]
+    tuner.play.assert_called_once_with("baz")
+    assert service.COALESCED_COMMANDS.values[("play",)] == coalesced + 2
+    assert [trace.outcome for trace in traces] == [OUTCOME_SUPERSEDED]
+    assert [span.stage for span in traces[0].spans] == ["queue"]
+
+
+@pytest.mark.parametrize(
+    "diff, expected_command",
+    [
+        (StationsDiff(set(), set(), set()), None),
+        (StationsDiff({"bar"}, set(), set()), None),
+        (StationsDiff(set(), {"foo"}, set()), "stop"),
+        (StationsDiff(set(), set(), {"foo"}), "play"),
+    ],
+)
+def test_service_reload_stations(diff: StationsDiff, expected_command, capsys):
+    """Test that active station is stopped or restarted only if it changed."""
+    tuner = mock_tuner()
+    tuner.update_stations.return_value = diff
+    prober = MagicMock()
+    relay = MagicMock()
+    recorder = MagicMock()
+    stations = {"bar": {"url": "http://example.org/bar.mp3"}}
+
+    async def scenario():
+        radio_service = service.RadioBoxService(
+            {"default": tuner, "kitchen": MagicMock()},
+            MagicMock(),
+            prober,
+            relay=relay,
+            recorder=recorder,
+        )
+        zone = radio_service.default_zone
+        zone.publisher.update("foo", controls.PLAYING)
+        await radio_service.reload_stations(stations)
+        return zone.commands
+
+    commands = asyncio.run(scenario())
+
+    tuner.update_stations.assert_called_once_with(stations)
+    queued = [commands.get_nowait()[0] for _ in range(commands.qsize())]
+    assert [message.WhichOneof("sub_command") for message in queued] == (
+        [expected_command] if expected_command else []
+    )
+    if expected_command == "play":
+        assert queued[0].play.station == "foo"
+        assert queued[0].play.zone == "default"
+    if diff:
+        assert prober.stations is stations
+        assert relay.stations is stations
+        assert recorder.relay.stations is stations
+        assert "Reloaded stations, added: " in capsys.readouterr().out
+
+
+def test_service_reload_config_from_thread(tmp_path: Path):
+    """Test that config reported by the watcher thread is applied in the loop."""
+    tuner = mock_tuner()
+    tuner.update_stations.return_value = StationsDiff({"foo"}, set(), set())
+    prober = MagicMock()
+    stations = {"foo": {"url": "http://example.org/foo.mp3"}}
+    catalog = tmp_path / "catalog.json"
+    catalog.write_text('{"bar": {"url": "http://example.org/bar.mp3"}}')
+    config = {"stations": stations, "catalog": str(catalog)}
+
+    async def scenario():
+        radio_service = service.RadioBoxService({"default": tuner}, MagicMock(), prober)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None, radio_service._reload_config_threadsafe, config
+        )
+        await asyncio.sleep(0.01)
+        return radio_service
+
+    radio_service = asyncio.run(scenario())
+
+    tuner.update_stations.assert_called_once_with(
+        {"bar": {"url": "http://example.org/bar.mp3"}, **stations}
+    )
+    assert prober.stations is stations
+    # Changes reported after the loop is closed are dropped
+    radio_service._reload_config_threadsafe(config)
+
+
+@pytest.mark.parametrize(
+    "event, value, expected_status",
+    [
+        (service.EVENT_OPENING, 0, controls.OPENING),
+        (service.EVENT_BUFFERING, 20.0, controls.BUFFERING),
+        (service.EVENT_BUFFERING, 100.0, controls.PLAYING),
+        (service.EVENT_PLAYING, 0, controls.PLAYING),
+        (service.EVENT_ERROR, 0, controls.FAILED),
+        (service.EVENT_END, 0, controls.FAILED),
+    ],
+)
+def test_zone_on_player_event(event: str, value: float, expected_status: int):
+    """Test that player events update state of the active station."""
+
+    async def scenario():
+        zone = make_zone()
+        zone.publisher.update("foo", controls.BUFFERING)
+        zone.on_player_event(event, value)
+        await asyncio.gather(*zone.service.tasks)
+        return zone.publisher.state, zone.tuner
+
+    state, tuner = asyncio.run(scenario())
+
+    expected_state = controls.PlayerState(station="foo", status=expected_status)
+    if expected_status == controls.FAILED:
+        expected_state.error = service.FAILURE_REASONS[event]
+    assert state == expected_state
+    if expected_status == controls.FAILED:
+        tuner.failover.assert_called_once_with("foo")
+        tuner.invalidate_station.assert_called_once_with("foo")
+    else:
+        tuner.invalidate_station.assert_not_called()
+
+
+def test_zone_on_player_event_metadata():
+    """Test that now playing title of the active station is published."""
+    tuner = mock_tuner()
+    tuner.now_playing = "Artist - Song"
+
+    async def scenario():
+        zone = make_zone(tuner)
+        zone.publisher.update("foo", controls.PLAYING)
+        zone.on_player_event(service.EVENT_METADATA, 0.0)
+        return zone.publisher.state
+
+    assert asyncio.run(scenario()).title == "Artist - Song"
+
+
+def test_zone_fail_over(capsys):
+    """Test that failed station continues on the next mirror."""
+    tuner = mock_tuner()
+    tuner.failover.return_value = True
+    reconnects = service.RECONNECTS.values.get(("foo", "switched"), 0)
+
+    async def scenario():
+        zone = make_zone(tuner)
+        zone.publisher.update("foo", controls.PLAYING)
+        # Failed over station plays the live stream
+        zone.publisher.update_delay(30)
+        await asyncio.gather(zone.fail_over("foo"), zone.fail_over("foo"))
+        state = zone.publisher.state
+        zone.on_player_event(service.EVENT_PLAYING, 0)
+        return state
+
+    state = asyncio.run(scenario())
+
+    tuner.failover.assert_called_once_with("foo")
+    assert state == controls.PlayerState(station="foo", status=controls.OPENING)
+    assert service.RECONNECTS.values[("foo", "switched")] == reconnects + 1
+    assert "Failed over foo in " in capsys.readouterr().out
+
+
+def test_zone_fail_over_station_changed():
+    """Test that result of the failover is ignored if station changed meanwhile."""
+    tuner = mock_tuner()
+    tuner.failover.return_value = False
+
+    async def scenario():
+        zone = make_zone(tuner)
+        zone.publisher.update("foo", controls.PLAYING)
+        failover = zone.service.add_task(zone.fail_over("foo"))
+        zone.publisher.update("bar", controls.OPENING)
+        await failover
+        return zone.publisher.state
+
+    state = asyncio.run(scenario())
+
+    assert state == controls.PlayerState(station="bar", status=controls.OPENING)
+    tuner.invalidate_station.assert_not_called()
+
+
+def test_zone_watch_stalls(capsys):
+    """Test that station that does not start playing in time is failed over."""
+
+    async def scenario():
+        radio_service = service.RadioBoxService(
+            {"default": MagicMock()}, MagicMock(), None, 0.05
+        )
+        zone = radio_service.default_zone
+        zone.fail_over = AsyncMock()
+        publisher = radio_service.add_task(zone.publisher.run())
+        watcher = radio_service.add_task(zone.watch_stalls())
+        # Station that starts playing in time is fine
+        zone.publisher.update("foo", controls.OPENING)
+        await asyncio.sleep(0.01)
+        zone.publisher.update("foo", controls.PLAYING)
+        await asyncio.sleep(0.1)
+        zone.fail_over.assert_not_called()
+        # Stalled station
+        zone.publisher.update("bar", controls.BUFFERING)
+        await asyncio.sleep(0.08)
+        publisher.cancel()
+        watcher.cancel()
+        return zone.fail_over
+
+    fail_over = asyncio.run(scenario())
+
+    fail_over.assert_awaited_once_with("bar", "Playback stalled")
+    assert "Playback of bar stalled." in capsys.readouterr().out
+
+
+def test_zone_on_player_event_stopped():
+    """Test that late player events are ignored if playback is stopped."""
+
+    async def scenario():
+        zone = make_zone()
+        zone.on_player_event(service.EVENT_PLAYING, 0)
+        return zone.publisher.state
+
+    assert asyncio.run(scenario()) == controls.PlayerState(status=controls.STOPPED)
+
+
+def test_zone_player_event_from_thread():
+    """Test that events from libvlc thread are processed in the event loop."""
+
+    async def scenario():
+        zone = make_zone()
+        zone.publisher.update("foo", controls.OPENING)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None,
+            zone._on_player_event_threadsafe,
+            service.EVENT_PLAYING,
+            0.0,
+        )
+        await asyncio.sleep(0)
+        return zone
+
+    zone = asyncio.run(scenario())
+
+    assert zone.publisher.state.status == controls.PLAYING
+    # Events arriving after the loop is closed are dropped
+    zone._on_player_event_threadsafe(service.EVENT_PLAYING, 0.0)
+
+
+def test_service_add_task(capsys):
+    """Test that failures of background tasks are logged."""
+
+    async def failing():
+        raise RuntimeError("Boom")
+
+    async def scenario():
+        radio_service = make_service()
+        task = radio_service.add_task(failing())
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0)
+        return radio_service.tasks
+
+    assert not asyncio.run(scenario())
+    assert "Background task failed: RuntimeError('Boom')" in capsys.readouterr().out
+
+
+def test_service_zones(capsys):
+    """Test that commands are routed to their zone and unknown zones are refused."""
+    default, kitchen = mock_tuner(), mock_tuner()
+    default.active_station, default.standby_station = "foo", None
+    kitchen.active_station, kitchen.standby_station = "bar", "baz"
+    kitchen.play.return_value = True
+
+    async def scenario():
+        radio_service = service.RadioBoxService(
+            {"default": default, "kitchen": kitchen}, MagicMock()
+        )
+        for zone in radio_service.zones.values():
+            zone.start()
+        replies = [
+            await (await radio_service.submit(make_message_play("bar", "kitchen"))),
+            await (await radio_service.submit(make_message_stop())),
+            await (await radio_service.submit(make_message_stop("garage"))),
+        ]
+        return radio_service, replies
+
+    radio_service, replies = asyncio.run(scenario())
+
+    kitchen.play.assert_called_once_with("bar")
+    default.play.assert_not_called()
+    default.stop.assert_called_once()
+    assert [reply.status for reply in replies] == [
+        controls.OK,
+        controls.OK,
+        controls.ERROR,
+    ]
+    assert replies[2].error == "Unknown zone garage."
+    assert radio_service.busy_stations() == {"foo", "bar", "baz", None}
+    assert radio_service.zone_publisher("") is radio_service.default_zone.publisher
+    assert radio_service.zone_publisher("kitchen") is not None
+    assert radio_service.zone_publisher("garage") is None
+    assert "[kitchen] Switched to bar in " in capsys.readouterr().out
+
+
+def test_service_run(capsys, mocker):
+    """Test complete lifecycle of the service from start until QUIT command."""
+    config_watcher = mocker.patch.object(service, "ConfigWatcher")
+    tuner = mock_tuner()
+    tuner.active_station = "foo"
+    tuner.play.return_value = False
+    server = MagicMock()
+
+    async def serve(submit, _publishers):
+        await (await submit(make_message_play("foo")))
+        await asyncio.sleep(0.01)
+        await submit(make_message_quit())
+        await asyncio.sleep(10)
+
+    server.serve.side_effect = serve
+
+    async def scenario():
+        radio_service = service.RadioBoxService(
+            {"default": tuner}, server, config_path=Path("/etc/radio-box/conf.yaml")
+        )
+        await asyncio.wait_for(radio_service.run(), 1)
+        return radio_service
+
+    radio_service = asyncio.run(scenario())
+
+    tuner.attach_events.assert_called_once_with(
+        radio_service.default_zone._on_player_event_threadsafe
+    )
+    tuner.play.assert_called_once_with("foo")
+    tuner.stop.assert_called_once()
+    config_watcher.assert_called_once_with(
+        Path("/etc/radio-box/conf.yaml"), radio_service._reload_config_threadsafe
+    )
+    config_watcher.return_value.start.assert_called_once()
+    assert not radio_service.tasks
+    assert "Player state: OPENING foo" in capsys.readouterr().out
+
+
+def test_service_export_metrics(mocker):
+    """Test that service metrics are stored periodically and on shutdown."""
+    mocker.patch.object(service, "METRICS_INTERVAL", 0.01)
+    server = MagicMock()
+
+    async def serve(submit, _publishers):
+        await asyncio.sleep(0.05)
+        await submit(make_message_quit())
+
+    server.serve.side_effect = serve
+    exporter = MagicMock()
+
+    async def scenario():
+        radio_service = service.RadioBoxService(
+            {"default": MagicMock()}, server, stall_timeout=0, exporter=exporter
+        )
+        await asyncio.wait_for(radio_service.run(), 1)
+
+    asyncio.run(scenario())
+
+    exporter.clear.assert_called_once()
+    assert exporter.dump.call_count > 2
+    assert exporter.method_calls[-1] == call.dump()
+
+
+def test_service_publish_status():
+    """Test that player states are written into status block until shutdown."""
+    server = MagicMock()
+
+    async def serve(submit, publishers):
+        await asyncio.sleep(0.01)
+        publishers("").update("foo", controls.OPENING)
+        await asyncio.sleep(0.01)
+        await submit(make_message_quit())
+
+    server.serve.side_effect = serve
+    status_block = MagicMock()
+
+    async def scenario():
+        radio_service = service.RadioBoxService(
+            {"default": MagicMock()}, server, stall_timeout=0, status_block=status_block
+        )
+        await asyncio.wait_for(radio_service.run(), 1)
+
+    asyncio.run(scenario())
+
+    assert status_block.method_calls == [
+        call.write(controls.PlayerState(status=controls.STOPPED)),
+        call.write(controls.PlayerState(station="foo", status=controls.OPENING)),
+        call.write(controls.PlayerState(status=controls.STOPPED)),
+        call.close(),
+    ]
+
+
+def test_service_run_relay():
+    """Test that relay and recorder run as background tasks until shutdown."""
+    server = MagicMock()
+    served = []
+
+    async def serve(submit, _publishers):
+        await asyncio.sleep(0.01)
+        await submit(make_message_quit())
+
+    async def relay_serve():
+        served.append(True)
+        await asyncio.sleep(10)
+
+    server.serve.side_effect = serve
+    relay = MagicMock()
+    relay.serve.side_effect = relay_serve
+    recorder = MagicMock()
+    recorder.run.side_effect = relay_serve
+
+    async def scenario():
+        radio_service = service.RadioBoxService(
+            {"default": MagicMock()},
+            server,
+            stall_timeout=0,
+            relay=relay,
+            recorder=recorder,
+        )
+        await asyncio.wait_for(radio_service.run(), 1)
+
+    asyncio.run(scenario())
+
+    assert served == [True, True]
+
+
+def test_service_run_prober():
+    """Test that prober runs as a background task and skips busy stations."""
+    tuner = mock_tuner()
+    tuner.active_station = "foo"
+    tuner.standby_station = None
+    server = MagicMock()
+    server.serve = AsyncMock()
+    prober = MagicMock()
+
+    async def probe(busy_stations):
+        assert busy_stations() == {"foo", None}
+        await radio_service.submit(make_message_quit())
+
+    prober.run.side_effect = probe
+
+    async def scenario():
+        nonlocal radio_service
+        radio_service = service.RadioBoxService({"default": tuner}, server, prober)
+        await asyncio.wait_for(radio_service.run(), 1)
+
+    radio_service = None
+    asyncio.run(scenario())
+
+    prober.run.assert_called_once_with(radio_service.busy_stations)
+
+
+@pytest.mark.parametrize(
+    "transport, server_class",
+    [("socket", "SocketServer"), ("pipe", "PipeServer"), (None, "PipeServer")],
+)
+def test_run(transport, server_class, stations: Dict, mocker):
+    """Test that service is started with server for configured transport."""
+    socket_path = "/tmp/foo.sock"
     args = MagicMock()
-    args.socket = socket_path
-    args.config = conf_path
+    args.socket = None
+    args.config = "/etc/radio-box/conf.yaml"
     mocker.patch.object(service, "parse_args", return_value=args)
+    config = {"stations": stations, "socket": socket_path, "resolver": {"ttl": 60}}
+    if transport:
+        config["transport"] = transport
+    mocker.patch.object(service, "load_config", return_value=config)
+    resolver_class = mocker.patch.object(service, "StreamResolver")
+    tuner_class = mocker.patch.object(service, "Tuner")
+    instance_class = mocker.patch.object(service.vlc, "Instance")
+    mocker.patch.object(service, "create_pipe", side_effect=Path)
+    server = mocker.patch.object(service, server_class)
+    start_service = mocker.patch.object(
+        service, "start_service", new_callable=MagicMock
+    )
+    asyncio_run = mocker.patch.object(service.asyncio, "run")
+    exporter_class = mocker.patch.object(service, "Exporter")
+    status_writer_class = mocker.patch.object(service, "StatusWriter")
 
-    create_pipe_mock = mocker.patch.object(
-        service, "create_pipe", return_value=socket_path
+    service.run()
+
+    resolver_class.assert_called_once_with(service.ResolverOptions(ttl=60))
+    exporter_class.assert_called_once_with(Path("/tmp/foo.metrics"), "service")
+    status_writer_class.assert_called_once_with(Path("/tmp/foo.status"))
+    tuner_class.assert_called_once_with(
+        stations,
+        service.STANDBY_RECENT,
+        resolver_class.return_value,
+        ANY,
+        instance=instance_class.return_value,
+        output=None,
+        timeshift_url=None,
+        timeshift_window=0.0,
+    )
+    server.assert_called_once_with(Path(socket_path))
+    start_service.assert_called_once_with(
+        {"default": tuner_class.return_value},
+        server.return_value,
+        None,
+        15,
+        exporter_class.return_value,
+        status_block=status_writer_class.return_value,
+        config_path=Path("/etc/radio-box/conf.yaml"),
+        relay=None,
+        recorder=None,
+    )
+    asyncio_run.assert_called_once_with(start_service.return_value)
+
+
+def test_run_prober(stations: Dict, tmp_path: Path, mocker):
+    """Test that station prober and relay are started if they are configured."""
+    args = MagicMock()
+    args.socket = None
+    mocker.patch.object(service, "parse_args", return_value=args)
+    catalog = tmp_path / "catalog.json"
+    catalog.write_text('{"imported_fm": {"url": "http://example.org/imported"}}')
+    config = {
+        "stations": stations,
+        "socket": "/tmp/foo.pipe",
+        "prober": {"interval": 60},
+        "relay": {"port": 8002},
+        "recorder": {"directory": str(tmp_path)},
+        "stall_timeout": 0,
+        "catalog": str(catalog),
+    }
+    mocker.patch.object(service, "load_config", return_value=config)
+    resolver_class = mocker.patch.object(service, "StreamResolver")
+    tuner_class = mocker.patch.object(service, "Tuner")
+    prober_class = mocker.patch.object(service, "StationProber")
+    relay_class = mocker.patch.object(service, "Relay")
+    recorder_class = mocker.patch.object(service, "Recorder")
+    mocker.patch.object(service.vlc, "Instance")
+    mocker.patch.object(service, "create_pipe", side_effect=Path)
+    server = mocker.patch.object(service, "PipeServer")
+    start_service = mocker.patch.object(
+        service, "start_service", new_callable=MagicMock
+    )
+    mocker.patch.object(service.asyncio, "run")
+    mocker.patch.object(service, "StatusWriter")
+
+    service.run()
+
+    # Catalog stations can be played, but they are not probed
+    assert set(tuner_class.call_args.args[0]) == {"imported_fm", *stations}
+    prober_class.assert_called_once_with(
+        stations,
+        Path("/tmp/foo.health.json"),
+        service.ProberOptions(interval=60),
+        resolver_class.return_value,
+        tuner_class.return_value.mirrors,
+    )
+    # Catalog stations can be relayed too
+    relay_class.assert_called_once_with(
+        tuner_class.call_args.args[0],
+        service.RelayOptions(port=8002),
+        resolver_class.return_value,
+        tuner_class.return_value.mirrors,
+    )
+    start_service.assert_called_once_with(
+        {"default": tuner_class.return_value},
+        server.return_value,
+        prober_class.return_value,
+        0,
+        ANY,
+        status_block=ANY,
+        config_path=ANY,
+        relay=relay_class.return_value,
+        recorder=recorder_class.return_value,
     )
-    mocker.patch.object(service.yaml, "safe_load", return_value=config)
-    tuner_mock = mocker.patch.object(service, "Tuner", return_value=tuner)
-    process_command_mock = mocker.patch.object(
-        service, "process_command", side_effect=quit_main_loop
+    # Recordings share upstreams with the served relay
+    recorder_class.assert_called_once_with(
+        relay_class.return_value, service.RecorderOptions(directory=str(tmp_path))
     )
 
-    quit_control = mocker.patch.object(service, "QUIT_")
-    quit_control.__bool__.return_value = False
 
-    with patch("builtins.open", mock_open(read_data=message.SerializeToString())):
-        service.run()
+def test_run_recorder(stations: Dict, mocker):
+    """Test that recorder gets its own relay if the service does not serve one."""
+    args = MagicMock()
+    args.socket = None
+    mocker.patch.object(service, "parse_args", return_value=args)
+    config = {"stations": stations, "socket": "/tmp/foo.pipe", "recorder": {}}
+    mocker.patch.object(service, "load_config", return_value=config)
+    resolver_class = mocker.patch.object(service, "StreamResolver")
+    tuner_class = mocker.patch.object(service, "Tuner")
+    relay_class = mocker.patch.object(service, "Relay")
+    recorder_class = mocker.patch.object(service, "Recorder")
+    mocker.patch.object(service.vlc, "Instance")
+    mocker.patch.object(service, "create_pipe", side_effect=Path)
+    mocker.patch.object(service, "PipeServer")
+    start_service = mocker.patch.object(
+        service, "start_service", new_callable=MagicMock
+    )
+    mocker.patch.object(service.asyncio, "run")
+    mocker.patch.object(service, "StatusWriter")
 
-    create_pipe_mock.assert_called_once_with(socket_path)
-    tuner_mock.assert_called_once_with(config["stations"])
-    process_command_mock.assert_called_once_with(message, tuner)
+    service.run()
+
+    relay_class.assert_called_once_with(
+        stations, None, resolver_class.return_value, tuner_class.return_value.mirrors
+    )
+    recorder_class.assert_called_once_with(
+        relay_class.return_value, service.RecorderOptions()
+    )
+    assert start_service.call_args.kwargs["relay"] is None
+    assert start_service.call_args.kwargs["recorder"] is recorder_class.return_value
 
 
 def test_run_socket_from_args(stations: Dict, mocker):
@@ -180,14 +1925,37 @@ def test_run_socket_from_args(stations: Dict, mocker):
 
     config = {"stations": stations, "socket": socket_path_conf}
 
-    mocker.patch.object(service.yaml, "safe_load", return_value=config)
+    mocker.patch.object(service, "load_config", return_value=config)
     mocker.patch.object(service, "Tuner")
+    mocker.patch.object(service.vlc, "Instance")
+    mocker.patch.object(service, "PipeServer")
+    mocker.patch.object(service, "start_service", new_callable=MagicMock)
+    mocker.patch.object(service.asyncio, "run")
+    mocker.patch.object(service, "StatusWriter")
     create_pipe_mock = mocker.patch.object(service, "create_pipe")
 
-    quit_control = mocker.patch.object(service, "QUIT_")
-    quit_control.__bool__.return_value = True
-
-    with patch("builtins.open"):
-        service.run()
+    service.run()
 
     create_pipe_mock.assert_called_once_with(socket_path_args)
+
+
+def test_start_service(mocker):
+    """Test that service is created within running event loop."""
+    service_class = mocker.patch.object(service, "RadioBoxService")
+    service_class.return_value.run = AsyncMock()
+    tuners, server = {"default": MagicMock()}, MagicMock()
+
+    asyncio.run(service.start_service(tuners, server))
+
+    service_class.assert_called_once_with(
+        tuners,
+        server,
+        None,
+        service.STALL_TIMEOUT,
+        exporter=None,
+        status_block=None,
+        config_path=None,
+        relay=None,
+        recorder=None,
+    )
+    service_class.return_value.run.assert_awaited_once()
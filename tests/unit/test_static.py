@@ -0,0 +1,113 @@
+"""Unit Tests for radio_box/static.py."""
+from pathlib import Path
+from typing import Dict, Optional
+
+import pytest
+from flask import Flask
+
+from radio_box import static
+from radio_box.static import StaticFiles
+
+APP_JS = "js/app.3f2a1b9c.js"
+
+
+@pytest.fixture
+def web_ui(tmp_path: Path) -> Path:
+    """Provide built web UI with precompressed variants of some files."""
+    (tmp_path / "js").mkdir()
+    (tmp_path / "index.html").write_text("<html></html>")
+    (tmp_path / APP_JS).write_text("console.log('app');")
+    (tmp_path / f"{APP_JS}.gz").write_bytes(b"gzip")
+    (tmp_path / f"{APP_JS}.br").write_bytes(b"brotli")
+    (tmp_path / "font.bin").write_bytes(bytes(16))
+    return tmp_path
+
+
+def serve(static_files: StaticFiles, filename: str, headers: Optional[Dict] = None):
+    """Serve the file to the request with headers."""
+    with Flask(__name__).test_request_context(headers=headers or {}):
+        return static_files.response(filename)
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected_encoding, expected_data",
+    [
+        ("gzip, deflate, br", "br", b"brotli"),
+        ("gzip, br;q=0", "gzip", b"gzip"),
+        ("deflate", None, b"console.log('app');"),
+    ],
+)
+def test_response_precompressed(
+    accept_encoding: str, expected_encoding, expected_data: bytes, web_ui: Path
+):
+    """Test that the best precompressed variant accepted by the client is served."""
+    response = serve(
+        StaticFiles(str(web_ui)), APP_JS, {"Accept-Encoding": accept_encoding}
+    )
+
+    assert response.status_code == 200
+    assert response.get_data() == expected_data
+    assert response.content_encoding == expected_encoding
+    assert response.content_type.startswith("text/javascript")
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.headers["Cache-Control"] == static.CACHE_IMMUTABLE
+
+
+def test_response_revalidated(web_ui: Path):
+    """Test that files without content hash are revalidated with their ETag."""
+    static_files = StaticFiles(str(web_ui))
+
+    response = serve(static_files, "index.html")
+    assert response.headers["Cache-Control"] == static.CACHE_REVALIDATE
+    assert "Vary" not in response.headers
+    etag = response.headers["ETag"]
+
+    revalidated = serve(static_files, "index.html", {"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["ETag"] == etag
+    # Compressed variant has its own ETag
+    compressed = serve(
+        static_files, APP_JS, {"If-None-Match": etag, "Accept-Encoding": "gzip"}
+    )
+    assert compressed.status_code == 200
+    assert compressed.get_etag()[0].endswith("-gzip")
+    not_modified = serve(
+        static_files,
+        APP_JS,
+        {"If-None-Match": compressed.headers["ETag"], "Accept-Encoding": "gzip"},
+    )
+    assert not_modified.status_code == 304
+    assert not_modified.content_encoding is None
+
+
+def test_response_large_file(web_ui: Path, mocker):
+    """Test that large files are streamed from the disk."""
+    mocker.patch.object(static, "MAX_CACHED_SIZE", 8)
+
+    response = serve(StaticFiles(str(web_ui)), "font.bin")
+
+    assert response.content_length == 16
+    response.direct_passthrough = False
+    assert response.get_data() == bytes(16)
+    response.close()
+
+
+@pytest.mark.parametrize("filename", ["missing.js", "js", "../secret", "/etc/passwd"])
+def test_response_not_found(filename: str, web_ui: Path):
+    """Test that only files inside of the folder are served."""
+    assert serve(StaticFiles(str(web_ui)), filename) is None
+
+
+def test_lookup_cached(web_ui: Path, mocker):
+    """Test that filesystem is accessed only on the first request of the file."""
+    lookup = mocker.spy(static, "lookup")
+    static_files = StaticFiles(str(web_ui), max_entries=2)
+
+    for filename in ["index.html", "index.html", "missing.js", "missing.js"]:
+        static_files.get(filename)
+    assert lookup.call_count == 2
+
+    # Cache is not allowed to grow indefinitely
+    static_files.get(APP_JS)
+    static_files.get("index.html")
+    assert lookup.call_count == 4
@@ -0,0 +1,151 @@
+"""Unit Tests for radio_box/status.py."""
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+from radio_box import status
+from radio_box.protocol import controls_pb2 as controls
+from radio_box.status import StatusReader, StatusWriter
+
+
+@pytest.mark.parametrize(
+    "config, expected_path",
+    [
+        ({"socket": "/run/radio-box.sock"}, "/run/radio-box.status"),
+        ({"socket": "/run/radio-box.sock", "status_block": "/tmp/s"}, "/tmp/s"),
+    ],
+)
+def test_status_block_path(config: Dict, expected_path: str):
+    """Test that status block is placed next to the socket unless configured."""
+    assert status.status_block_path(config) == Path(expected_path)
+
+
+def test_write_and_read(tmp_path: Path):
+    """Test that reader sees every state written by the service."""
+    path = tmp_path / "radio.status"
+    reader = StatusReader(path)
+    assert reader.read() is None
+
+    writer = StatusWriter(path)
+    # Service did not publish any state yet
+    assert reader.read() is None
+
+    writer.write(controls.PlayerState(status=controls.STOPPED))
+    assert reader.read() == controls.PlayerState(status=controls.STOPPED)
+
+    # Long texts are truncated without producing broken characters
+    state = controls.PlayerState(
+        station="foo", status=controls.PLAYING, title="é" * 200, volume=0
+    )
+    writer.write(state)
+    first = reader.read()
+    assert first == controls.PlayerState(
+        station="foo", status=controls.PLAYING, title="é" * 128, volume=0
+    )
+    # Unchanged state is not decoded again
+    assert reader.read() is first
+    writer.close()
+
+
+def test_write_and_read_timeshift(tmp_path: Path):
+    """Test that time-shift delay of paused and shifted playback is published."""
+    path = tmp_path / "radio.status"
+    writer = StatusWriter(path)
+    reader = StatusReader(path)
+
+    # Live stream was just paused
+    paused = controls.PlayerState(station="foo", status=controls.PAUSED)
+    writer.write(paused)
+    assert reader.read() == paused
+    paused.delay = 12
+    writer.write(paused)
+    assert reader.read() == paused
+
+    shifted = controls.PlayerState(station="foo", status=controls.PLAYING, delay=90)
+    writer.write(shifted)
+    assert reader.read() == shifted
+
+    # Back at live, delay is not reported
+    writer.write(controls.PlayerState(station="foo", status=controls.PLAYING))
+    assert not reader.read().HasField("delay")
+    writer.close()
+
+
+def test_read_not_a_status_block(tmp_path: Path):
+    """Test that empty file is not a status block."""
+    path = tmp_path / "radio.status"
+    path.touch()
+
+    assert StatusReader(path).read() is None
+
+
+def test_read_during_write(tmp_path: Path, mocker):
+    """Test that payload changed during the read is read again."""
+    path = tmp_path / "radio.status"
+    writer = StatusWriter(path)
+    writer.write(controls.PlayerState(station="foo", status=controls.OPENING))
+    reader = StatusReader(path)
+    payload = status.PAYLOAD
+    payload_range = slice(status.PAYLOAD_OFFSET, status.STATUS_SIZE)
+    playing = status.encode_state(
+        controls.PlayerState(station="foo", status=controls.PLAYING)
+    )
+
+    def concurrent_write(buffer, offset):
+        fields = payload.unpack_from(buffer, offset)
+        if unpack_from.call_count == 1:
+            writer._map[payload_range] = playing
+            writer.sequence += 2
+            status.HEADER.pack_into(
+                writer._map, 0, status.MAGIC, status.LAYOUT_VERSION, writer.sequence
+            )
+        return fields
+
+    unpack_from = mocker.patch.object(status, "PAYLOAD").unpack_from
+    unpack_from.side_effect = concurrent_write
+
+    assert reader.read().status == controls.PLAYING
+    assert unpack_from.call_count == 2
+
+
+def test_read_unfinished_write(tmp_path: Path):
+    """Test that the last consistent state is returned while writer is stuck."""
+    path = tmp_path / "radio.status"
+    writer = StatusWriter(path)
+    writer.write(controls.PlayerState(station="foo", status=controls.OPENING))
+    reader = StatusReader(path)
+    reader.read()
+
+    status.HEADER.pack_into(
+        writer._map, 0, status.MAGIC, status.LAYOUT_VERSION, writer.sequence + 1
+    )
+
+    assert reader.read() == controls.PlayerState(station="foo", status=controls.OPENING)
+
+
+def test_writer_reuses_file(tmp_path: Path):
+    """Test that restarted service continues sequence of the previous run."""
+    path = tmp_path / "radio.status"
+    writer = StatusWriter(path)
+    writer.write(controls.PlayerState(status=controls.STOPPED))
+    # Previous run was interrupted in the middle of the write
+    status.HEADER.pack_into(writer._map, 0, status.MAGIC, status.LAYOUT_VERSION, 3)
+    writer.close()
+
+    assert StatusWriter(path).sequence == 4
+
+
+def test_writer_replaces_old_layout(tmp_path: Path):
+    """Test that status block with the previous layout is resized and restarted."""
+    path = tmp_path / "radio.status"
+    path.write_bytes(status.HEADER.pack(status.MAGIC, 1, 8) + bytes(580))
+
+    writer = StatusWriter(path)
+    writer.write(controls.PlayerState(status=controls.PAUSED, delay=5))
+
+    assert writer.sequence == 2
+    assert path.stat().st_size == status.STATUS_SIZE
+    assert StatusReader(path).read() == controls.PlayerState(
+        status=controls.PAUSED, delay=5
+    )
@@ -0,0 +1,63 @@
+"""Unit Tests for radio_box/timeshift.py."""
+import pytest
+
+from radio_box.relay import RelayOptions
+from radio_box.timeshift import (
+    TimeShiftOptions,
+    relay_url,
+    station_url,
+    timeshift_relay_options,
+)
+
+
+def test_timeshift_options():
+    """Test that buffer holds the whole window at the highest bitrate."""
+    options = TimeShiftOptions(minutes=10, bitrate=128)
+
+    assert options.window == 600
+    assert options.buffer_size == 600 * 16000
+
+
+def test_timeshift_relay_options():
+    """Test that time-shift enlarges buffers of the relay and backs them by files."""
+    options = TimeShiftOptions(minutes=2, bitrate=128, directory="/var/cache/rb")
+
+    local = timeshift_relay_options(options)
+    lan = timeshift_relay_options(
+        options, RelayOptions(port=8002, buffer_size=2**30, linger=60)
+    )
+
+    assert (local.host, local.port) == ("127.0.0.1", 8001)
+    assert (local.buffer_size, local.buffer_dir, local.linger) == (
+        1920000,
+        "/var/cache/rb",
+        10.0,
+    )
+    assert (lan.host, lan.port) == ("0.0.0.0", 8002)
+    assert (lan.buffer_size, lan.linger) == (2**30, 60)
+    assert (
+        timeshift_relay_options(TimeShiftOptions()).buffer_dir
+        == "/var/lib/radio-box/timeshift"
+    )
+    assert timeshift_relay_options(TimeShiftOptions(directory="")).buffer_dir == ""
+
+
+@pytest.mark.parametrize(
+    "host, expected",
+    [
+        ("0.0.0.0", "http://127.0.0.1:8001"),
+        ("::", "http://127.0.0.1:8001"),
+        ("192.168.1.10", "http://192.168.1.10:8001"),
+    ],
+)
+def test_relay_url(host: str, expected: str):
+    """Test that service reaches the relay on the loopback, if it listens there."""
+    assert relay_url(RelayOptions(host=host)) == expected
+
+
+def test_station_url():
+    """Test that station ID is quoted and delay is added for time-shift."""
+    base = "http://127.0.0.1:8001"
+
+    assert station_url(base, "best radio") == f"{base}/best%20radio"
+    assert station_url(base, "foo/fm", 300) == f"{base}/foo%2Ffm?delay=300"
@@ -0,0 +1,104 @@
+"""Unit Tests for radio_box/tracing.py."""
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from radio_box import tracing
+from radio_box.common import (
+    TRANSPORT_PIPE,
+    TRANSPORT_SOCKET,
+    CommandError,
+    make_message_play,
+    make_message_stop,
+)
+from radio_box.protocol import controls_pb2 as controls
+from radio_box.tracing import TraceBuffer, format_trace, mark, start_trace
+
+
+def test_mark():
+    """Test that spans follow each other from the origin of the trace."""
+    message = make_message_play("foo")
+    start_trace(message, 100.0)
+
+    mark(message, "rest", 100.5)
+    tracing.mark_received(message, 100.75)
+    # Clock going backwards does not produce negative durations
+    mark(message, "queue", 50.0)
+
+    assert [(span.stage, span.start) for span in message.spans[:3]] == [
+        ("rest", 100.0),
+        ("transport", 100.5),
+        ("decode", 100.75),
+    ]
+    assert message.spans[0].duration == 0.5
+    assert message.spans[3].duration == 0
+    assert len(message.trace_id) == 16
+
+
+def test_mark_untraced():
+    """Test that commands without trace ID are not traced."""
+    message = make_message_stop()
+
+    mark(message, "rest")
+
+    assert not message.spans
+
+
+def test_to_trace():
+    """Test that trace contains description of the command and its spans."""
+    message = make_message_play("foo")
+    start_trace(message, 100.0)
+    mark(message, "rest", 101.0)
+
+    trace = tracing.to_trace(message)
+
+    assert trace.trace_id == message.trace_id
+    assert trace.origin_time == 100.0
+    assert trace.command == "play foo"
+    assert list(trace.spans) == list(message.spans)
+    assert tracing.describe(make_message_stop()) == "stop"
+
+
+def test_trace_buffer():
+    """Test that buffer keeps only the most recent traces."""
+    buffer = TraceBuffer(3)
+
+    for trace_id in "abcd":
+        buffer.add(controls.Trace(trace_id=trace_id), tracing.OUTCOME_OK)
+
+    assert [trace.trace_id for trace in buffer.latest()] == ["b", "c", "d"]
+    assert [trace.trace_id for trace in buffer.latest(2)] == ["c", "d"]
+    assert buffer.latest()[0].outcome == "ok"
+
+
+def test_format_trace():
+    """Test that trace is formatted with total and per-stage durations."""
+    trace = controls.Trace(trace_id="abc", origin_time=1000.0, command="play foo")
+    trace.outcome = "ok"
+    trace.spans.add(stage="rest", start=1000.0, duration=0.0012)
+    trace.spans.add(stage="playback", start=1000.0012, duration=0.5)
+    origin = datetime.fromtimestamp(1000.0).isoformat(" ", "milliseconds")
+
+    assert format_trace(trace) == (
+        f"{origin} abc play foo ok 501.2 ms (rest 1.2, playback 500.0)"
+    )
+
+
+def test_query_traces(mocker):
+    """Test that traces are requested from the service over the socket."""
+    reply = controls.Reply(status=controls.OK)
+    reply.traces.add(trace_id="abc")
+    send_command = mocker.patch.object(tracing, "send_command", return_value=reply)
+
+    traces = tracing.query_traces(Path("/tmp/foo.sock"), TRANSPORT_SOCKET, 5)
+
+    assert [trace.trace_id for trace in traces] == ["abc"]
+    message = send_command.call_args.args[1]
+    assert message.get_traces.limit == 5
+
+
+def test_query_traces_pipe():
+    """Test that traces can't be queried over the named pipe."""
+    with pytest.raises(CommandError):
+        tracing.query_traces(Path("/tmp/foo.pipe"), TRANSPORT_PIPE)